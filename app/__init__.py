@@ -1,5 +1,51 @@
+import logging
+import threading
+
 from flask import Flask
 
-app = Flask(__name__)
 
-from app import routes
+def create_app(config=None):
+    """
+    Creates a Flask application with the chat routes registered.
+
+    Settings are read from the environment when `app.routes` is first imported.
+    The name index and sentiment aggregates it loads are shared by every app in
+    the process. Each app gets its own `routes.ChatState` (corpus store,
+    embedding index, analytics, trending terms, LLM batcher and admission
+    controller, cancellation registry) in `app.extensions['chat']`. Both are
+    shared copy-on-write by forked workers. Network clients and thread pools
+    are per process instead: they are created here and again in every worker
+    forked afterwards (see `routes.init_worker_resources`), so the app can be
+    created before a preforking server forks.
+
+    Args:
+        config (dict, optional): Flask configuration values (e.g., {'TESTING': True}).
+            CORPUS_DB_PATH, EMBEDDING_INDEX_PATH, COLUMNAR_STORE_PATH and the
+            LLM_* limits override the environment settings for this app.
+
+    Returns:
+        Flask: The new application.
+    """
+    # Configure basic server-side logging
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    application = Flask(__name__)
+    application.config.update(config or {})
+    from app import routes
+    routes.ChatState(application.config).init_app(application)
+    application.register_blueprint(routes.bp)
+    routes.init_worker_resources()
+    return application
+
+
+_default_app_lock = threading.Lock()
+
+
+def __getattr__(name):
+    # `from app import app` returns a default application, created on first use,
+    # so importing a submodule (app.storage, app.batch, ...) has no side effects.
+    if name == 'app':
+        with _default_app_lock:
+            if 'app' not in globals():
+                globals()['app'] = create_app()
+        return globals()['app']
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
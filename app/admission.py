@@ -0,0 +1,140 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from app import metrics
+
+
+class AdmissionRejected(Exception):
+    """
+    Raised when a request is shed instead of admitted.
+
+    Attributes:
+        reason (str): 'queue_full' if the wait queue had no room, or
+                      'queue_timeout' if the request waited past its queue deadline.
+    """
+
+    def __init__(self, reason):
+        super().__init__(f"Request shed by admission control ({reason}).")
+        self.reason = reason
+
+
+class AdmissionController:
+    """
+    Caps the number of concurrent calls to a backend (e.g., the LLM).
+
+    Up to `max_in_flight` callers run at once. Further callers wait in a bounded
+    FIFO queue of at most `max_queue` entries for up to `queue_timeout` seconds.
+    A caller arriving while the queue is full, or whose queue deadline passes, is
+    rejected immediately with AdmissionRejected so the server can answer with a
+    fast "busy" response instead of piling up threads that all time out.
+
+    Usage:
+        with controller.admit():
+            call_the_backend()
+
+    or, when the slot must be held beyond the current function, pair
+    `acquire()` with `release()`.
+
+    Its metrics are named after `name` and registered in `registry` (a
+    `metrics.Registry`), or in the process-wide registry by default.
+    """
+
+    def __init__(self, max_in_flight=16, max_queue=64, queue_timeout=2.0, name='admission', registry=None):
+        if max_in_flight < 1:
+            raise ValueError("max_in_flight must be at least 1.")
+        if max_queue < 0:
+            raise ValueError("max_queue must not be negative.")
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.name = name
+
+        self._in_flight = 0
+        self._waiters = deque()  # FIFO of waiter tokens
+        self._condition = threading.Condition()
+
+        registry = metrics if registry is None else registry
+        self.in_flight_gauge = registry.gauge(f'{name}_in_flight', 'Requests currently admitted.')
+        self.queue_length_gauge = registry.gauge(f'{name}_queue_length', 'Requests waiting for admission.')
+        self.shed_counter = registry.counter(f'{name}_shed', 'Requests rejected by admission control.')
+        self.wait_histogram = registry.histogram(f'{name}_wait_ms', metrics.LATENCY_MS_BUCKETS,
+                                                'Time admitted requests spent queued (ms).')
+
+    @contextmanager
+    def admit(self):
+        """
+        Context manager that holds an in-flight slot for the duration of the block.
+
+        Raises:
+            AdmissionRejected: If the request is shed.
+        """
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self):
+        """Returns the current in-flight count, queue length and total shed count."""
+        with self._condition:
+            return {
+                'in_flight': self._in_flight,
+                'queue_length': len(self._waiters),
+                'shed': self.shed_counter.value,
+                'max_in_flight': self.max_in_flight,
+                'max_queue': self.max_queue,
+            }
+
+    def acquire(self):
+        """
+        Takes an in-flight slot, waiting in the queue if necessary. Every
+        successful call must be paired with `release()`; prefer `admit()` unless
+        the slot outlives the calling function (e.g., a streamed response).
+
+        Raises:
+            AdmissionRejected: If the request is shed.
+        """
+        started = time.monotonic()
+        with self._condition:
+            # Fast path: a free slot and nobody queued ahead of us.
+            if self._in_flight < self.max_in_flight and not self._waiters:
+                self._admit_locked(started)
+                return
+
+            if len(self._waiters) >= self.max_queue:
+                self._shed_locked('queue_full')
+
+            token = object()
+            self._waiters.append(token)
+            self.queue_length_gauge.set(len(self._waiters))
+            deadline = started + self.queue_timeout
+            try:
+                while not (self._waiters[0] is token and self._in_flight < self.max_in_flight):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._shed_locked('queue_timeout')
+                    self._condition.wait(remaining)
+            finally:
+                self._waiters.remove(token)
+                self.queue_length_gauge.set(len(self._waiters))
+                # Whoever is now at the head of the queue may be able to proceed.
+                self._condition.notify_all()
+            self._admit_locked(started)
+
+    def _admit_locked(self, started):
+        self._in_flight += 1
+        self.in_flight_gauge.set(self._in_flight)
+        self.wait_histogram.observe((time.monotonic() - started) * 1000.0)
+
+    def _shed_locked(self, reason):
+        self.shed_counter.inc()
+        raise AdmissionRejected(reason)
+
+    def release(self):
+        """Returns a slot taken with `acquire()`."""
+        with self._condition:
+            self._in_flight -= 1
+            self.in_flight_gauge.set(self._in_flight)
+            self._condition.notify_all()
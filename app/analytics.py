@@ -0,0 +1,293 @@
+import datetime
+import threading
+import time
+from collections import Counter
+from numbers import Real
+
+import numpy as np
+
+from app.columnar import KIND_COMMENT, KIND_SUBMISSION
+
+SECONDS_PER_DAY = 86400
+SECONDS_PER_HOUR = 3600
+
+# Daily rollups older than this (relative to the newest day seen) are dropped.
+RETENTION_DAYS = 400
+
+DEFAULT_WINDOW_DAYS = 30
+TOP_CONTRIBUTORS = 10
+WEEKDAYS = ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday')
+
+# Upper (exclusive) edges of the score histogram buckets. Bucket 0 holds scores
+# below the first edge and the last bucket scores at or above the last edge.
+# Percentiles are interpolated inside a bucket, so they are approximate.
+SCORE_BUCKET_EDGES = np.array([-100, -10, 0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000,
+                               10000, 20000, 50000, 100000], dtype=np.float64)
+
+
+def _day_number(timestamp):
+    return int(timestamp // SECONDS_PER_DAY)
+
+
+def _iso_day(day_number):
+    return (datetime.date(1970, 1, 1) + datetime.timedelta(days=day_number)).isoformat()
+
+
+class DayRollup:
+    """Pre-aggregated activity of one subreddit during one UTC day."""
+
+    def __init__(self):
+        self.hourly = np.zeros((2, 24), dtype=np.int64)  # [kind][hour of day] -> items
+        self.score_histogram = np.zeros(len(SCORE_BUCKET_EDGES) + 1, dtype=np.int64)
+        self.score_sum = 0
+        self.authors = Counter()
+        self.subscribers = None
+        self.item_ids = set()
+
+    def add(self, kind, hour, score, author):
+        self.hourly[kind, hour] += 1
+        self.add_score(score)
+        if author:
+            self.authors[author] += 1
+
+    def add_score(self, score, sign=1):
+        self.score_histogram[np.searchsorted(SCORE_BUCKET_EDGES, score, side='right')] += sign
+        self.score_sum += sign * score
+
+
+class _SubredditRollups:
+    def __init__(self):
+        self.days = {}   # day number -> DayRollup
+        self.items = {}  # item id -> (day number, last seen score)
+        self.newest_day = None
+
+
+def score_percentiles(histogram, quantiles):
+    """
+    Approximate score percentiles from a SCORE_BUCKET_EDGES histogram.
+
+    Args:
+        histogram (numpy.ndarray): Item counts per bucket.
+        quantiles (list): Quantiles in [0, 1].
+
+    Returns:
+        list: One score per quantile (None if the histogram is empty).
+    """
+    total = histogram.sum()
+    if not total:
+        return [None] * len(quantiles)
+    cumulative = np.cumsum(histogram)
+    lower_edges = np.concatenate([[SCORE_BUCKET_EDGES[0]], SCORE_BUCKET_EDGES])
+    upper_edges = np.concatenate([SCORE_BUCKET_EDGES, [SCORE_BUCKET_EDGES[-1]]])
+    results = []
+    for quantile in quantiles:
+        target = quantile * total
+        bucket = min(int(np.searchsorted(cumulative, target, side='left')), len(histogram) - 1)
+        before = cumulative[bucket] - histogram[bucket]
+        fraction = (target - before) / histogram[bucket] if histogram[bucket] else 0.0
+        results.append(float(lower_edges[bucket] + fraction * (upper_edges[bucket] - lower_edges[bucket])))
+    return results
+
+
+class AnalyticsStore:
+    """
+    Incrementally maintained activity rollups per subreddit.
+
+    Every ingested submission or comment updates one `DayRollup` (items per
+    kind and hour of day, a score histogram and author counts). Items seen
+    again (e.g. a re-fetched hot listing) only move their score from the old
+    to the new value. Reports are computed from the rollups of the requested
+    window, so their cost depends on the number of days, never on the number
+    of items.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subreddits = {}
+
+    @classmethod
+    def from_columnar(cls, columnar_store):
+        """Builds rollups from every item of a `ColumnarStore`."""
+        try:
+            return cls._from_partitions(columnar_store)
+        except FileNotFoundError: # A writer replaced a partition after the store's last refresh
+            columnar_store.refresh()
+            return cls._from_partitions(columnar_store)
+
+    @classmethod
+    def _from_partitions(cls, columnar_store):
+        analytics = cls()
+        for partition in columnar_store.partitions():
+            authors = columnar_store.decode('author', partition.column('author'))
+            items = [{'id': item_id, 'created_utc': created, 'score': score, 'author': author}
+                     for item_id, created, score, author in zip(
+                         partition.column('id').tolist(), partition.column('created_utc').tolist(),
+                         partition.column('score').tolist(), authors)]
+            kinds = partition.column('kind')
+            analytics._add(partition.subreddit, KIND_SUBMISSION, [i for i, k in zip(items, kinds) if k == KIND_SUBMISSION])
+            analytics._add(partition.subreddit, KIND_COMMENT, [i for i, k in zip(items, kinds) if k == KIND_COMMENT])
+        return analytics
+
+    def __contains__(self, subreddit):
+        return subreddit.lower() in self._subreddits
+
+    def add_submissions(self, subreddit_name, submissions):
+        """
+        Adds submissions (dicts with 'id', 'created_utc', 'score' and optional
+        'author') to the rollups. Items without a numeric 'created_utc' are skipped.
+
+        Returns:
+            int: The number of items that were new.
+        """
+        return self._add(subreddit_name, KIND_SUBMISSION, submissions)
+
+    def add_comments(self, subreddit_name, comments):
+        """Adds comments to the rollups (see `add_submissions`)."""
+        return self._add(subreddit_name, KIND_COMMENT, comments)
+
+    def _add(self, subreddit_name, kind, items):
+        added = 0
+        with self._lock:
+            rollups = self._subreddits.setdefault(subreddit_name.lower(), _SubredditRollups())
+            for item in items:
+                created, score = item.get('created_utc'), item.get('score') or 0
+                if not isinstance(created, Real) or not isinstance(score, Real):
+                    continue
+                previous = rollups.items.get(item['id'])
+                if previous is not None:
+                    previous_day, previous_score = previous
+                    day = rollups.days.get(previous_day)
+                    if day is not None and score != previous_score:
+                        day.add_score(previous_score, sign=-1)
+                        day.add_score(score)
+                    rollups.items[item['id']] = (previous_day, score)
+                    continue
+                day_number = _day_number(created)
+                if rollups.newest_day is not None and day_number <= rollups.newest_day - RETENTION_DAYS:
+                    continue
+                day = rollups.days.get(day_number)
+                if day is None:
+                    day = rollups.days[day_number] = DayRollup()
+                    if rollups.newest_day is None or day_number > rollups.newest_day:
+                        rollups.newest_day = day_number
+                        self._prune(rollups)
+                day.add(kind, int(created % SECONDS_PER_DAY) // SECONDS_PER_HOUR, score, item.get('author'))
+                day.item_ids.add(item['id'])
+                rollups.items[item['id']] = (day_number, score)
+                added += 1
+        return added
+
+    @staticmethod
+    def _prune(rollups):
+        for day_number in [d for d in rollups.days if d <= rollups.newest_day - RETENTION_DAYS]:
+            for item_id in rollups.days.pop(day_number).item_ids:
+                rollups.items.pop(item_id, None)
+
+    def record_subscribers(self, subreddit_name, subscribers, timestamp=None):
+        """Records the subscriber count observed at `timestamp` (default now)."""
+        if not isinstance(subscribers, Real):
+            return
+        day_number = _day_number(time.time() if timestamp is None else timestamp)
+        with self._lock:
+            rollups = self._subreddits.setdefault(subreddit_name.lower(), _SubredditRollups())
+            day = rollups.days.get(day_number)
+            if day is None:
+                day = rollups.days[day_number] = DayRollup()
+                rollups.newest_day = max(day_number, rollups.newest_day or day_number)
+            day.subscribers = int(subscribers)
+
+    def report(self, subreddit_name, days=DEFAULT_WINDOW_DAYS, now=None):
+        """
+        Summarizes a subreddit's activity over the last `days` UTC days.
+
+        Args:
+            subreddit_name (str): The subreddit.
+            days (int): Window length in days (ending today).
+            now (float, optional): Unix time treated as "now".
+
+        Returns:
+            dict or None: 'window', 'totals', 'activity' (items per UTC hour of
+                day, per weekday and per day), 'growth', 'scores' (mean and
+                approximate percentiles) and 'top_contributors'; None if
+                nothing was recorded for the subreddit.
+        """
+        last_day = _day_number(time.time() if now is None else now)
+        first_day = last_day - days + 1
+        with self._lock:
+            rollups = self._subreddits.get(subreddit_name.lower())
+            if rollups is None:
+                return None
+            window = sorted((d, r) for d, r in rollups.days.items() if first_day <= d <= last_day)
+
+        hourly = np.zeros((2, 24), dtype=np.int64)
+        weekday = np.zeros(7, dtype=np.int64)
+        histogram = np.zeros(len(SCORE_BUCKET_EDGES) + 1, dtype=np.int64)
+        score_sum = 0
+        authors = Counter()
+        daily = []
+        subscribers = []
+        for day_number, rollup in window:
+            hourly += rollup.hourly
+            count = int(rollup.hourly.sum())
+            # 1970-01-01 was a Thursday (weekday 3).
+            weekday[(day_number + 3) % 7] += count
+            histogram += rollup.score_histogram
+            score_sum += rollup.score_sum
+            authors.update(rollup.authors)
+            daily.append({'date': _iso_day(day_number), 'submissions': int(rollup.hourly[KIND_SUBMISSION].sum()),
+                          'comments': int(rollup.hourly[KIND_COMMENT].sum())})
+            if rollup.subscribers is not None:
+                subscribers.append((day_number, rollup.subscribers))
+
+        per_hour = hourly.sum(axis=0)
+        total = int(per_hour.sum())
+        counts_by_day = {entry['date']: entry['submissions'] + entry['comments'] for entry in daily}
+        last_week = sum(counts_by_day.get(_iso_day(d), 0) for d in range(last_day - 6, last_day + 1))
+        previous_week = sum(counts_by_day.get(_iso_day(d), 0) for d in range(last_day - 13, last_day - 6))
+        p50, p90, p99 = score_percentiles(histogram, [0.5, 0.9, 0.99])
+        return {
+            'subreddit': subreddit_name,
+            'window': {'since': _iso_day(first_day), 'until': _iso_day(last_day), 'days': days},
+            'totals': {'submissions': int(hourly[KIND_SUBMISSION].sum()), 'comments': int(hourly[KIND_COMMENT].sum())},
+            'activity': {
+                'hour_of_day_utc': per_hour.tolist(),
+                'day_of_week': dict(zip(WEEKDAYS, weekday.tolist())),
+                'daily': daily,
+                'peak_hour_utc': int(np.argmax(per_hour)) if total else None,
+                'peak_weekday': WEEKDAYS[int(np.argmax(weekday))] if total else None,
+            },
+            'growth': {
+                'items_last_7_days': last_week,
+                'items_previous_7_days': previous_week,
+                'activity_change': (last_week - previous_week) / previous_week if previous_week else None,
+                'subscribers': subscribers[-1][1] if subscribers else None,
+                'subscribers_per_day': ((subscribers[-1][1] - subscribers[0][1]) / (subscribers[-1][0] - subscribers[0][0])
+                                        if len(subscribers) > 1 else None),
+            },
+            'scores': {
+                'mean': score_sum / total if total else None,
+                'p50': p50,
+                'p90': p90,
+                'p99': p99,
+            },
+            'top_contributors': [{'author': author, 'items': count}
+                                 for author, count in authors.most_common(TOP_CONTRIBUTORS)],
+        }
+
+    def summary(self, subreddit_name, days=DEFAULT_WINDOW_DAYS, now=None):
+        """
+        A compact version of `report` for the LLM context, or None when there is
+        no recorded activity in the window.
+        """
+        report = self.report(subreddit_name, days=days, now=now)
+        if not report or not (report['totals']['submissions'] or report['totals']['comments']):
+            return None
+        return {
+            'window_days': days,
+            'items': report['totals'],
+            'peak_hour_utc': report['activity']['peak_hour_utc'],
+            'peak_weekday': report['activity']['peak_weekday'],
+            'growth': report['growth'],
+            'median_score': report['scores']['p50'],
+            'top_contributors': [entry['author'] for entry in report['top_contributors'][:5]],
+        }
@@ -0,0 +1,263 @@
+import argparse
+import json
+import logging
+import os
+
+import numpy as np
+
+from app.embeddings import EmbeddingIndex, _top_k, content_hash
+
+# File names inside an IVF index directory (may share the embedding index directory).
+CENTROIDS_FILE = 'ivf_centroids.npy'
+IVF_VECTORS_FILE = 'ivf_vectors.npy'
+IVF_ITEM_IDS_FILE = 'ivf_item_ids.npy'
+IVF_OFFSETS_FILE = 'ivf_offsets.npy'
+# Row of each stored vector in the source embedding index, for subreddit filters.
+IVF_SOURCE_ROWS_FILE = 'ivf_source_rows.npy'
+# Row count and content hash of the source embedding index, to detect a rebuilt source.
+IVF_META_FILE = 'ivf_meta.json'
+
+# Upper bound on the temporary (rows x centroids) score matrix during assignment.
+ASSIGN_BLOCK_CELLS = 1 << 24
+
+# Rows copied at a time when writing the list-ordered vector matrix.
+WRITE_CHUNK_ROWS = 262144
+
+DEFAULT_NPROBE = 8
+KMEANS_ITERATIONS = 10
+# k-means is trained on a sample of at most this many points per centroid.
+KMEANS_SAMPLES_PER_CENTROID = 64
+
+
+def default_num_lists(num_vectors):
+    """The usual IVF sizing rule of thumb: about 4 * sqrt(n) inverted lists."""
+    return max(1, int(4 * np.sqrt(num_vectors)))
+
+
+def assign_to_centroids(vectors, centroids):
+    """
+    Returns the index of the nearest (highest inner product) centroid for each
+    row, computed in blocks so the score matrix stays bounded.
+    """
+    block_rows = max(1, ASSIGN_BLOCK_CELLS // len(centroids))
+    assignments = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), block_rows):
+        end = min(start + block_rows, len(vectors))
+        assignments[start:end] = np.argmax(np.asarray(vectors[start:end], dtype=np.float32) @ centroids.T, axis=1)
+    return assignments
+
+
+def train_kmeans(vectors, num_centroids, iterations=KMEANS_ITERATIONS, seed=0):
+    """
+    Trains spherical k-means centroids with NumPy.
+
+    A random sample of the vectors is clustered; centroids are re-normalized to
+    unit length after each update, matching inner-product search over
+    unit-length embeddings. Empty clusters are re-seeded from random samples.
+
+    Args:
+        vectors (numpy.ndarray): (n, dim) unit-length vectors (may be memory-mapped).
+        num_centroids (int): Number of centroids (inverted lists).
+        iterations (int): Lloyd iterations.
+        seed (int): Random seed.
+
+    Returns:
+        numpy.ndarray: (num_centroids, dim) float32 centroids.
+    """
+    rng = np.random.default_rng(seed)
+    num_centroids = min(num_centroids, len(vectors))
+    sample_size = min(len(vectors), num_centroids * KMEANS_SAMPLES_PER_CENTROID)
+    sample_rows = np.sort(rng.choice(len(vectors), size=sample_size, replace=False))
+    sample = np.asarray(vectors[sample_rows], dtype=np.float32)
+
+    centroids = sample[rng.choice(sample_size, size=num_centroids, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = assign_to_centroids(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, sample)
+        counts = np.bincount(assignments, minlength=num_centroids)
+        empty = counts == 0
+        if empty.any():
+            sums[empty] = sample[rng.choice(sample_size, size=int(empty.sum()), replace=False)]
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        centroids = sums / np.where(norms > 0, norms, 1.0)
+    return centroids.astype(np.float32)
+
+
+def build_ivf(directory, vectors, item_ids, num_lists=None, iterations=KMEANS_ITERATIONS, seed=0):
+    """
+    Builds an IVF index and writes it to `directory`.
+
+    Every vector is assigned to its nearest centroid, and the vectors are stored
+    grouped by list in one contiguous matrix: list `i` occupies rows
+    `offsets[i]:offsets[i + 1]`. Probing a list is then a zero-copy slice of the
+    memory-mapped matrix. The source's row count and `content_hash` are
+    recorded, so `IVFIndex.built_from` can tell whether the source has changed.
+
+    Args:
+        directory (str): Output directory (created if needed).
+        vectors (numpy.ndarray): (n, dim) unit-length vectors (may be memory-mapped),
+            the source embedding index's rows in its row order.
+        item_ids (numpy.ndarray): n item ids.
+        num_lists (int, optional): Number of inverted lists (default ~4*sqrt(n)).
+        iterations (int): k-means iterations.
+        seed (int): Random seed.
+    """
+    os.makedirs(directory, exist_ok=True)
+    if len(vectors):
+        num_lists = num_lists or default_num_lists(len(vectors))
+        centroids = train_kmeans(vectors, num_lists, iterations=iterations, seed=seed)
+        assignments = assign_to_centroids(vectors, centroids)
+    else: # An empty index: no lists, and every search returns []
+        centroids = np.empty((0, vectors.shape[1]), dtype=np.float32)
+        assignments = np.empty(0, dtype=np.int32)
+    order = np.argsort(assignments, kind='stable')
+    offsets = np.zeros(len(centroids) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(assignments, minlength=len(centroids)), out=offsets[1:])
+
+    out = np.lib.format.open_memmap(os.path.join(directory, IVF_VECTORS_FILE), mode='w+',
+                                    dtype=np.float32, shape=(len(vectors), vectors.shape[1]))
+    for start in range(0, len(order), WRITE_CHUNK_ROWS):
+        rows = order[start:start + WRITE_CHUNK_ROWS]
+        # Read the source rows in ascending order (sequential I/O on a memory map),
+        # then put them back into list order.
+        sorted_rows = np.sort(rows)
+        out[start:start + len(rows)] = vectors[sorted_rows][np.searchsorted(sorted_rows, rows)]
+    out.flush()
+    del out
+    np.save(os.path.join(directory, CENTROIDS_FILE), centroids)
+    np.save(os.path.join(directory, IVF_OFFSETS_FILE), offsets)
+    np.save(os.path.join(directory, IVF_ITEM_IDS_FILE), np.asarray(item_ids)[order])
+    np.save(os.path.join(directory, IVF_SOURCE_ROWS_FILE), order.astype(np.int64))
+    with open(os.path.join(directory, IVF_META_FILE), 'w') as f:
+        json.dump({'source_rows': len(vectors), 'source_hash': content_hash(vectors, item_ids)}, f)
+
+
+class IVFIndex:
+    """
+    An inverted-file (IVF) approximate nearest neighbour index in pure NumPy.
+
+    A query is compared with the coarse centroids first; only the vectors in the
+    `nprobe` closest inverted lists are then scored exactly. Raising `nprobe`
+    trades latency for recall (nprobe == number of lists is exact search).
+    """
+
+    def __init__(self, centroids, vectors, item_ids, offsets, source_rows=None, source_meta=None):
+        self.centroids = centroids
+        self.vectors = vectors
+        self.item_ids = item_ids
+        self.offsets = offsets
+        self.source_rows = source_rows
+        self.source_meta = source_meta or {} # 'source_rows' and 'source_hash' of the source index
+
+    @staticmethod
+    def exists(directory):
+        """True if `directory` holds an IVF index."""
+        return os.path.exists(os.path.join(directory, CENTROIDS_FILE))
+
+    @classmethod
+    def open(cls, directory, mmap=True):
+        """Opens an index written by `build_ivf` (vectors memory-mapped by default)."""
+        mode = 'r' if mmap else None
+        source_rows_path = os.path.join(directory, IVF_SOURCE_ROWS_FILE)
+        meta_path = os.path.join(directory, IVF_META_FILE)
+        source_meta = None
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                source_meta = json.load(f)
+        return cls(
+            np.load(os.path.join(directory, CENTROIDS_FILE)),
+            np.load(os.path.join(directory, IVF_VECTORS_FILE), mmap_mode=mode),
+            np.load(os.path.join(directory, IVF_ITEM_IDS_FILE), mmap_mode=mode),
+            np.load(os.path.join(directory, IVF_OFFSETS_FILE)),
+            # Indexes built before source rows were recorded cannot be filtered.
+            np.load(source_rows_path, mmap_mode=mode) if os.path.exists(source_rows_path) else None,
+            source_meta,
+        )
+
+    def built_from(self, embedding_index):
+        """
+        True if this index was built from exactly the rows of `embedding_index`,
+        so its source rows still refer to the same items. False after the
+        embedding index was rebuilt, and for indexes (or embedding indexes)
+        written before the source was recorded.
+        """
+        source_hash = self.source_meta.get('source_hash')
+        return (self.source_rows is not None and source_hash is not None
+                and self.source_meta.get('source_rows') == len(embedding_index)
+                and source_hash == embedding_index.content_hash)
+
+    def __len__(self):
+        return self.vectors.shape[0]
+
+    @property
+    def num_lists(self):
+        return len(self.centroids)
+
+    def search(self, query_vector, k=10, nprobe=DEFAULT_NPROBE, source_range=None):
+        """
+        Returns approximately the `k` rows most similar to `query_vector`.
+
+        Args:
+            query_vector (numpy.ndarray): A (dim,) unit-length query embedding.
+            k (int): Number of results.
+            nprobe (int): Number of inverted lists to scan.
+            source_range (tuple, optional): Only rows whose source embedding
+                index row is in [start, end) (e.g., one subreddit's rows). The
+                probed lists may then hold fewer than `k` matches.
+
+        Returns:
+            list: (item_id, score) tuples, best first.
+        """
+        if len(self) == 0 or self.num_lists == 0 or k <= 0:
+            return []
+        if source_range is not None and self.source_rows is None:
+            raise ValueError("This IVF index has no source rows; rebuild it to filter by source row.")
+        query_vector = np.asarray(query_vector, dtype=np.float32)
+        probe_lists, _ = _top_k(self.centroids @ query_vector, min(nprobe, self.num_lists))
+        rows, scores = [], []
+        for list_id in probe_lists:
+            start, end = int(self.offsets[list_id]), int(self.offsets[list_id + 1])
+            if end <= start:
+                continue
+            if source_range is None:
+                scores.append(self.vectors[start:end] @ query_vector) # Zero-copy slice of the list
+                rows.append(np.arange(start, end))
+                continue
+            source = self.source_rows[start:end]
+            list_rows = start + np.flatnonzero((source >= source_range[0]) & (source < source_range[1]))
+            if list_rows.size:
+                scores.append(self.vectors[list_rows] @ query_vector)
+                rows.append(list_rows)
+        if not rows:
+            return []
+        best, best_scores = _top_k(np.concatenate(scores), k)
+        best_rows = np.concatenate(rows)[best]
+        return [(str(self.item_ids[row]), float(score)) for row, score in zip(best_rows, best_scores)]
+
+
+def main(argv=None):
+    """
+    Command-line entry point: builds an IVF index next to an embedding index.
+
+    Example:
+        python -m app.ann --index embedding_index --lists 4096
+    """
+    parser = argparse.ArgumentParser(description="Build an IVF approximate nearest neighbour index.")
+    parser.add_argument('--index', default=os.getenv('EMBEDDING_INDEX_PATH', 'embedding_index'),
+                        help="Embedding index directory (the IVF files are written there too).")
+    parser.add_argument('--lists', type=int, default=None, help="Number of inverted lists (default ~4*sqrt(n)).")
+    parser.add_argument('--iterations', type=int, default=KMEANS_ITERATIONS, help="k-means iterations.")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    embedding_index = EmbeddingIndex.open(args.index)
+    if embedding_index.vectors is None:
+        parser.error("The embedding index has no float32 vectors to cluster.")
+    build_ivf(args.index, embedding_index.vectors, embedding_index.item_ids,
+              num_lists=args.lists, iterations=args.iterations)
+    logging.info(f"Wrote IVF index for {len(embedding_index)} vectors to {args.index}.")
+
+
+if __name__ == '__main__':
+    main()
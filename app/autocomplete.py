@@ -0,0 +1,265 @@
+import argparse
+import csv
+import logging
+import os
+import re
+
+import numpy as np
+
+from app.spelling import build_deletion_dictionaries
+
+# File names inside a subreddit name index directory.
+KEYS_FILE = 'name_keys.npy'
+NAMES_FILE = 'names.npy'
+SUBSCRIBERS_FILE = 'subscribers.npy'
+SHORT_PREFIXES_FILE = 'short_prefixes.npy'
+SHORT_PREFIX_TOP_FILE = 'short_prefix_top.npy'
+
+# A (partial) subreddit name: up to 21 ASCII letters, digits or underscores.
+SUBREDDIT_NAME_RE = re.compile(r'\w{1,21}', re.ASCII)
+
+# The most popular names of every prefix up to this length are precomputed:
+# a one-letter prefix matches hundreds of thousands of names, too many to rank
+# per keystroke. Longer prefixes match few enough names to rank on the fly.
+SHORT_PREFIX_LENGTH = 2
+MAX_SUGGESTIONS = 20
+
+
+def _normalize_prefix(prefix):
+    """Returns the lowercase ASCII search key of a typed prefix ("@r/Py" -> b"py"), or None if invalid."""
+    prefix = (prefix or '').strip()
+    for tag in ('@r/', 'r/', '/r/'):
+        if prefix.lower().startswith(tag):
+            prefix = prefix[len(tag):]
+            break
+    if not SUBREDDIT_NAME_RE.fullmatch(prefix):
+        return None
+    return prefix.lower().encode('ascii')
+
+
+def _top_rows(subscribers, start, end, k):
+    """Rows in [start, end) with the most subscribers, most popular first (ties by name)."""
+    counts = np.asarray(subscribers[start:end])
+    if len(counts) > k:
+        candidates = np.argpartition(-counts, k - 1)[:k]
+    else:
+        candidates = np.arange(len(counts))
+    # Sorting by (-subscribers, row) keeps equally popular names in alphabetical order.
+    order = np.lexsort((candidates, -counts[candidates]))
+    return candidates[order] + start
+
+
+def prepare_name_index(names, subscribers):
+    """
+    Builds the arrays of a subreddit name index.
+
+    Names are deduplicated case-insensitively (keeping the entry with the most
+    subscribers) and sorted by their lowercase key, so a prefix matches one
+    contiguous range of rows. Names that are not valid subreddit names are
+    skipped.
+
+    Args:
+        names (sequence): Subreddit names (with or without an "r/" prefix).
+        subscribers (sequence): Subscriber count per name.
+
+    Returns:
+        dict: Arrays keyed by file name (see `build_name_index`).
+    """
+    keys, display_names, counts = [], [], []
+    for name, count in zip(names, subscribers):
+        key = _normalize_prefix(name)
+        if key is None:
+            continue
+        keys.append(key)
+        display_names.append(name.strip().rsplit('/', 1)[-1].encode('ascii'))
+        counts.append(int(count or 0))
+    keys = np.array(keys, dtype='S21')
+    display_names = np.array(display_names, dtype='S21')
+    counts = np.array(counts, dtype=np.int64)
+
+    order = np.lexsort((-counts, keys))
+    keys, display_names, counts = keys[order], display_names[order], counts[order]
+    first = np.ones(len(keys), dtype=bool)
+    first[1:] = keys[1:] != keys[:-1]
+    keys, display_names, counts = keys[first], display_names[first], counts[first]
+
+    short_prefixes, short_top = [], []
+    for length in range(1, SHORT_PREFIX_LENGTH + 1):
+        prefixes, starts = np.unique(keys.astype(f'S{length}'), return_index=True)
+        ends = np.append(starts[1:], len(keys))
+        for prefix, start, end in zip(prefixes, starts, ends):
+            if len(prefix) < length: # Names shorter than the prefix length are already covered
+                continue
+            rows = np.full(MAX_SUGGESTIONS, -1, dtype=np.int64)
+            top = _top_rows(counts, start, end, MAX_SUGGESTIONS)
+            rows[:len(top)] = top
+            short_prefixes.append(prefix)
+            short_top.append(rows)
+    order = np.argsort(np.array(short_prefixes, dtype=f'S{SHORT_PREFIX_LENGTH}'), kind='stable')
+    return {
+        KEYS_FILE: keys,
+        NAMES_FILE: display_names,
+        SUBSCRIBERS_FILE: counts,
+        SHORT_PREFIXES_FILE: np.array(short_prefixes, dtype=f'S{SHORT_PREFIX_LENGTH}')[order],
+        SHORT_PREFIX_TOP_FILE: np.array(short_top, dtype=np.int64).reshape(-1, MAX_SUGGESTIONS)[order],
+    }
+
+
+def build_name_index(directory, names, subscribers):
+    """
+    Builds a subreddit name index, with the deletion dictionaries used for
+    spelling correction (see app.spelling), and writes it to `directory`.
+
+    Args:
+        directory (str): Output directory (created if needed).
+        names (sequence): Subreddit names.
+        subscribers (sequence): Subscriber count per name.
+
+    Returns:
+        int: Number of distinct names written.
+    """
+    os.makedirs(directory, exist_ok=True)
+    arrays = prepare_name_index(names, subscribers)
+    arrays.update(build_deletion_dictionaries(arrays[KEYS_FILE], arrays[SUBSCRIBERS_FILE]))
+    for file_name, values in arrays.items():
+        np.save(os.path.join(directory, file_name), values)
+    return len(arrays[KEYS_FILE])
+
+
+class SubredditNameIndex:
+    """
+    Prefix lookup over a sorted array of subreddit names, for autocomplete.
+
+    The lowercase names are one sorted fixed-width byte array, so the names
+    starting with a prefix are the rows between two binary searches
+    (`np.searchsorted`). Opened with `open()`, the arrays are memory-mapped:
+    millions of names cost no load time, and a lookup touches only the pages
+    its binary search and result rows land on.
+    """
+
+    def __init__(self, keys, names, subscribers, short_prefixes, short_prefix_top):
+        self.keys = keys
+        self.names = names
+        self.subscribers = subscribers
+        self.short_prefixes = short_prefixes
+        self.short_prefix_top = short_prefix_top
+
+    @classmethod
+    def open(cls, directory, mmap=True):
+        """Opens an index written by `build_name_index`."""
+        mode = 'r' if mmap else None
+        return cls(*(np.load(os.path.join(directory, file_name), mmap_mode=mode)
+                     for file_name in (KEYS_FILE, NAMES_FILE, SUBSCRIBERS_FILE,
+                                       SHORT_PREFIXES_FILE, SHORT_PREFIX_TOP_FILE)))
+
+    @classmethod
+    def from_entries(cls, names, subscribers):
+        """Builds an in-memory index (e.g., from the subreddits in the corpus store)."""
+        arrays = prepare_name_index(names, subscribers)
+        return cls(arrays[KEYS_FILE], arrays[NAMES_FILE], arrays[SUBSCRIBERS_FILE],
+                   arrays[SHORT_PREFIXES_FILE], arrays[SHORT_PREFIX_TOP_FILE])
+
+    def __len__(self):
+        return len(self.keys)
+
+    def prefix_range(self, prefix):
+        """
+        Returns the rows (start, end) whose names start with `prefix`.
+
+        Args:
+            prefix (bytes): A lowercase ASCII prefix.
+        """
+        start = int(np.searchsorted(self.keys, prefix, side='left'))
+        end = int(np.searchsorted(self.keys, prefix + b'\xff', side='left'))
+        return start, end
+
+    def complete(self, prefix, k=10):
+        """
+        Returns the most popular subreddits whose names start with `prefix`.
+
+        Args:
+            prefix (str): What the user typed so far ("py", "r/py" or "@r/py").
+            k (int): Maximum number of suggestions (at most MAX_SUGGESTIONS).
+
+        Returns:
+            list: Dicts with 'name' and 'subscribers', most subscribers first.
+                  Empty if the prefix is not a valid (partial) subreddit name.
+        """
+        key = _normalize_prefix(prefix)
+        k = max(0, min(k, MAX_SUGGESTIONS))
+        if key is None or k == 0:
+            return []
+        if len(key) <= SHORT_PREFIX_LENGTH:
+            slot = int(np.searchsorted(self.short_prefixes, key))
+            if slot == len(self.short_prefixes) or self.short_prefixes[slot] != key:
+                return []
+            rows = np.asarray(self.short_prefix_top[slot][:k])
+            rows = rows[rows >= 0]
+        else:
+            start, end = self.prefix_range(key)
+            if start == end:
+                return []
+            rows = _top_rows(self.subscribers, start, end, k)
+        return [{'name': self.names[row].decode('ascii'), 'subscribers': int(self.subscribers[row])} for row in rows]
+
+    def contains(self, name):
+        """Returns whether `name` is a known subreddit (case-insensitive)."""
+        key = _normalize_prefix(name)
+        if key is None:
+            return False
+        start = int(np.searchsorted(self.keys, key))
+        return start < len(self.keys) and self.keys[start] == key
+
+
+def read_name_list(path):
+    """
+    Reads (names, subscribers) from a CSV file with a name column and an
+    optional subscriber count column. A header row is skipped.
+    """
+    names, subscribers = [], []
+    with open(path, newline='', encoding='utf-8') as f:
+        for row in csv.reader(f):
+            if not row or not row[0].strip():
+                continue
+            count = row[1].strip() if len(row) > 1 else '0'
+            if not count.isdigit():
+                if not names: # Header row
+                    continue
+                count = '0'
+            names.append(row[0].strip())
+            subscribers.append(int(count))
+    return names, subscribers
+
+
+def main(argv=None):
+    """
+    Command-line entry point: builds the subreddit name index used by /autocomplete.
+
+    Example:
+        python -m app.autocomplete subreddits.csv --index subreddit_index
+    """
+    parser = argparse.ArgumentParser(description="Build the subreddit name index used for autocomplete.")
+    parser.add_argument('names', nargs='?', help="CSV file of subreddit names and subscriber counts.")
+    parser.add_argument('--index', default=os.getenv('SUBREDDIT_INDEX_PATH', 'subreddit_index'),
+                        help="Output directory.")
+    parser.add_argument('--db', default=None,
+                        help="Also include the subreddits of this corpus store (e.g., corpus.db).")
+    args = parser.parse_args(argv)
+    if not args.names and not args.db:
+        parser.error("Give a CSV file of names, --db, or both.")
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    names, subscribers = read_name_list(args.names) if args.names else ([], [])
+    if args.db:
+        from app.storage import CorpusStore
+        store = CorpusStore(args.db)
+        for name, count in store.subreddit_names():
+            names.append(name)
+            subscribers.append(count)
+        store.close()
+    count = build_name_index(args.index, names, subscribers)
+    logging.info(f"Wrote a name index of {count} subreddits to {args.index}.")
+
+
+if __name__ == '__main__':
+    main()
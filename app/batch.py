@@ -0,0 +1,364 @@
+import argparse
+import copy
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+import numpy as np
+
+from app import routes
+from app.admission import AdmissionRejected
+from app.cancellation import RequestCancelled
+from app.core_utils import parse_query
+
+# Stages timed for every message (milliseconds, in each result's 'timings').
+STAGES = ('parse', 'context', 'answer')
+
+# Messages handed to a worker at a time. Larger chunks amortize inter-process
+# overhead; smaller ones keep the output flowing and resume points close.
+DEFAULT_CHUNK_SIZE = 64
+
+
+class ContextCache:
+    """
+    Fetched subreddit contexts shared by the threads of a batch worker, so
+    thousands of questions about the same subreddit fetch it once.
+
+    Concurrent requests for a key that is being fetched wait for that fetch
+    instead of starting their own. The fetch runs on its own thread, so one
+    caller's cancellation or deadline only ends that caller's wait: the others
+    still get the context. Failed fetches are not cached. Callers get a deep
+    copy, since the context stage prepares contexts in place.
+    Bounded to `capacity` keys (least recently used evicted).
+    """
+
+    def __init__(self, capacity=256):
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> Future of the fetched context
+        self._lock = threading.Lock()
+
+    def get(self, key, fetch, cancel_token=None, timeout=None):
+        """
+        Returns a copy of the context cached under `key`, starting `fetch()` on
+        a miss. `fetch` is shared by every caller of the key, so it must not
+        use a caller's cancellation token or deadline.
+
+        Args:
+            key: The cache key.
+            fetch (callable): Fetches the context (no arguments).
+            cancel_token (CancellationToken, optional): Ends this caller's wait.
+            timeout (float, optional): Seconds this caller waits.
+
+        Raises:
+            RequestCancelled: If `cancel_token` is cancelled while waiting.
+            concurrent.futures.TimeoutError: If the fetch takes longer than `timeout`.
+        """
+        with self._lock:
+            future = self._entries.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._entries[key] = future
+                while len(self._entries) > self.capacity:
+                    self._entries.popitem(last=False)
+                self.misses += 1
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        if owner:
+            threading.Thread(target=self._fill, args=(key, future, fetch), name='context-cache-fetch',
+                             daemon=True).start()
+        if cancel_token is not None:
+            ready = threading.Event()
+            future.add_done_callback(lambda _: ready.set())
+            cancel_token.add_callback(ready.set)
+            ready.wait(timeout)
+            cancel_token.raise_if_cancelled()
+        return copy.deepcopy(future.result(timeout=0 if cancel_token is not None else timeout))
+
+    def _fill(self, key, future, fetch):
+        try:
+            future.set_result(fetch())
+        except BaseException as e:
+            with self._lock:
+                if self._entries.get(key) is future:
+                    del self._entries[key]
+            future.set_exception(e)
+
+
+def _cache_key(subreddit_name, question, filters):
+    """Cache key of a fetched context. Store-backed contexts are retrieved per question, so it is part of the key."""
+    question_key = question if routes._resolve(routes.corpus_store) is not None and routes.CONTEXT_SOURCE == 'store' else None
+    filters_key = json.dumps(filters.to_dict(), sort_keys=True) if filters else None
+    return subreddit_name.lower(), filters_key, question_key
+
+
+def answer_message(message, mode='llm', cache=None, cancel_token=None, admission=None):
+    """
+    Runs one message through the chat pipeline: parsing, then
+    `routes.answer_question` (the context and answer stages), as
+    /send_message does. Offline batches skip admission control, which is
+    bounded by the batch's own parallelism; /send_messages passes the server's.
+
+    Args:
+        message (str): The user's message (e.g., "@r/learnpython how do I start?").
+        mode (str): 'llm', or 'extractive' to answer from the fetched posts
+            when any post matches.
+        cache (ContextCache, optional): Cache of fetched subreddit contexts.
+        cancel_token (CancellationToken, optional): Stops the message's fetches
+            and LLM call when cancelled.
+        admission (AdmissionController, optional): Admits the LLM call.
+
+    Returns:
+        dict: 'reply' and 'error' (one of them None), 'sources' for extractive
+              answers, 'suggestions' for misspelled subreddits, and 'timings'
+              (milliseconds per stage reached).
+    """
+    timings = {}
+    started = time.perf_counter()
+
+    def lap(stage):
+        nonlocal started
+        now = time.perf_counter()
+        timings[stage] = (now - started) * 1000
+        started = now
+
+    def result(reply=None, error=None, **extra):
+        return {'reply': reply, 'error': error, **extra, 'timings': timings}
+
+    message = (message or '').strip()
+    if not message:
+        return result(error="Please enter a question.")
+    query = parse_query(message)
+    lap('parse')
+
+    fetch = None
+    if cache is not None:
+        def fetch(name, question, cancel_token=None, filters=None):
+            # The shared fetch runs without this message's token; the token
+            # and the fetch deadline only bound this message's wait.
+            shared_fetch = routes._with_app_context(lambda: routes.fetch_subreddit_context(name, question, None, filters))
+            try:
+                return cache.get(_cache_key(name, question, filters), shared_fetch, cancel_token,
+                                 timeout=routes.SUBREDDIT_FETCH_DEADLINE_SECONDS)
+            except FutureTimeoutError:
+                logging.warning(f"Fetching r/{name} missed the {routes.SUBREDDIT_FETCH_DEADLINE_SECONDS}s deadline.")
+                raise routes.SubredditUnavailable(f"Sorry, r/{name} took too long to respond.")
+    try:
+        return result(**routes.answer_question(query, mode, cancel_token, admission, fetch=fetch, lap=lap))
+    except RequestCancelled:
+        return result(error="Request was cancelled.")
+    except AdmissionRejected:
+        return result(error="The assistant is busy right now. Please try again in a moment.")
+
+
+class BatchWorker:
+    """
+    Answers chunks of input lines with a pool of threads that share one
+    `ContextCache`. One worker runs in each process of a batch.
+    """
+
+    def __init__(self, threads, mode='llm', cache_capacity=256):
+        routes.init_worker_resources() # This process's PRAW client and fetch pool
+        self.mode = mode
+        self.cache = ContextCache(cache_capacity)
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='batch')
+
+    def answer_line(self, line_number, line):
+        """Answers one JSONL input line ({"message": ..., "id": ..., "mode": ...})."""
+        try:
+            payload = json.loads(line)
+        except json.JSONDecodeError:
+            payload = None
+        if not isinstance(payload, dict) or 'message' not in payload:
+            return {'line': line_number, 'reply': None, 'error': "Invalid request: No message provided.", 'timings': {}}
+        answer = answer_message(payload['message'], payload.get('mode', self.mode), self.cache)
+        head = {'line': line_number}
+        if 'id' in payload:
+            head['id'] = payload['id']
+        head['message'] = payload['message']
+        return {**head, **answer}
+
+    def run(self, numbered_lines):
+        """
+        Answers a chunk of (line_number, line) pairs.
+
+        Returns:
+            tuple: (results in input order, (process id, cache hits, cache misses)).
+        """
+        results = list(self.executor.map(lambda item: self.answer_line(*item), numbered_lines))
+        return results, (os.getpid(), self.cache.hits, self.cache.misses)
+
+
+_worker = None
+
+def _init_process_worker(threads, mode, cache_capacity):
+    global _worker
+    _worker = BatchWorker(threads, mode, cache_capacity)
+
+def _run_process_chunk(numbered_lines):
+    return _worker.run(numbered_lines)
+
+
+def _chunks(lines, start, chunk_size):
+    """Yields lists of (line_number, line) pairs of the non-empty input lines from line `start` on."""
+    chunk = []
+    for line_number, line in enumerate(lines):
+        if line_number < start or not line.strip():
+            continue
+        chunk.append((line_number, line))
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def resume_offset(output_path):
+    """
+    Returns the input line to resume a batch from: one past the last line
+    answered in `output_path`. A partially written last result (the previous
+    run was interrupted mid-write) is truncated.
+    """
+    if not os.path.exists(output_path):
+        return 0
+    with open(output_path, 'rb+') as f:
+        data = f.read()
+        end = data.rfind(b'\n') + 1
+        if end < len(data):
+            f.truncate(end)
+    last = data[:end].rstrip(b'\n').rsplit(b'\n', 1)[-1]
+    return json.loads(last)['line'] + 1 if last else 0
+
+
+def run_batch(input_path, output_path, threads=8, processes=0, mode='llm', start=0, resume=False,
+              chunk_size=DEFAULT_CHUNK_SIZE, cache_capacity=256):
+    """
+    Answers every message of a JSONL file and writes one JSON result per line.
+
+    Results are written in input order, each with its input 'line' number, so
+    an interrupted run can be resumed from the end of its output.
+
+    Args:
+        input_path (str): JSONL file of {"message", "id"?, "mode"?} objects.
+        output_path (str): JSONL output file.
+        threads (int): Threads per worker.
+        processes (int): Worker processes; 0 answers in this process.
+        mode (str): Default mode ('llm' or 'extractive').
+        start (int): First input line (0-based) to answer.
+        resume (bool): Append to `output_path`, starting after its last answered line.
+        chunk_size (int): Lines handed to a worker at a time.
+        cache_capacity (int): Fetched contexts cached per worker.
+
+    Returns:
+        dict: Summary - 'messages', 'errors', 'seconds', 'messages_per_second',
+              'cache_hits', 'cache_misses', and per stage the 'p50', 'p90',
+              'p99' and 'mean' latency in milliseconds under 'stages'.
+    """
+    if resume:
+        start = max(start, resume_offset(output_path))
+    if processes:
+        executor = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('spawn'),
+                                       initializer=_init_process_worker, initargs=(threads, mode, cache_capacity))
+        run_chunk = _run_process_chunk
+        max_in_flight = 2 * processes
+    else:
+        # Two chunks in flight, so the threads start on the next chunk while the last answers of one finish.
+        worker = BatchWorker(threads, mode, cache_capacity)
+        executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='batch-chunk')
+        run_chunk = worker.run
+        max_in_flight = 2
+
+    timings = {stage: [] for stage in STAGES}
+    counts = {'messages': 0, 'errors': 0}
+    cache_counters = {}  # process id -> (hits, misses), cumulative
+    started = time.perf_counter()
+    try:
+        with open(input_path, encoding='utf-8') as lines, \
+                open(output_path, 'a' if resume else 'w', encoding='utf-8') as out:
+            in_flight = deque()
+
+            def write_oldest():
+                results, (pid, hits, misses) = in_flight.popleft().result()
+                cache_counters[pid] = max(cache_counters.get(pid, (0, 0)), (hits, misses))
+                for result in results:
+                    out.write(json.dumps(result) + "\n")
+                    counts['messages'] += 1
+                    counts['errors'] += result['error'] is not None
+                    for stage, milliseconds in result['timings'].items():
+                        timings[stage].append(milliseconds)
+                out.flush()
+
+            for chunk in _chunks(lines, start, chunk_size):
+                in_flight.append(executor.submit(run_chunk, chunk))
+                if len(in_flight) >= max_in_flight:
+                    write_oldest()
+            while in_flight:
+                write_oldest()
+    finally:
+        executor.shutdown(cancel_futures=True)
+    seconds = time.perf_counter() - started
+
+    summary = {
+        'messages': counts['messages'],
+        'errors': counts['errors'],
+        'seconds': seconds,
+        'messages_per_second': counts['messages'] / seconds if seconds else 0.0,
+        'cache_hits': sum(hits for hits, _ in cache_counters.values()),
+        'cache_misses': sum(misses for _, misses in cache_counters.values()),
+        'stages': {},
+    }
+    for stage, values in timings.items():
+        if values:
+            p50, p90, p99 = np.percentile(values, [50, 90, 99])
+            summary['stages'][stage] = {'p50': p50, 'p90': p90, 'p99': p99, 'mean': float(np.mean(values))}
+    return summary
+
+
+def format_summary(summary):
+    """Formats a `run_batch` summary as the text printed at the end of a run."""
+    lines = [f"{summary['messages']} messages in {summary['seconds']:.1f} s "
+             f"({summary['messages_per_second']:.1f} messages/s), {summary['errors']} errors",
+             f"context cache: {summary['cache_hits']} hits, {summary['cache_misses']} misses",
+             f"{'stage':<10}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'mean ms':>10}"]
+    for stage, latency in summary['stages'].items():
+        lines.append(f"{stage:<10}{latency['p50']:>10.2f}{latency['p90']:>10.2f}{latency['p99']:>10.2f}{latency['mean']:>10.2f}")
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    """
+    Command-line entry point: answers a JSONL file of messages offline.
+
+    Example:
+        python -m app.batch questions.jsonl --output answers.jsonl --processes 4 --threads 8
+    """
+    parser = argparse.ArgumentParser(description="Answer a JSONL file of chat messages through the pipeline.")
+    parser.add_argument('input', help="JSONL file of {\"message\": ..., \"id\": ...} objects.")
+    parser.add_argument('--output', required=True, help="JSONL file the results are written to.")
+    parser.add_argument('--threads', type=int, default=8, help="Threads per worker.")
+    parser.add_argument('--processes', type=int, default=0,
+                        help="Worker processes, each with its own threads and caches; 0 answers in this process.")
+    parser.add_argument('--mode', choices=('llm', 'extractive'), default='llm',
+                        help="Default answer mode for messages without one.")
+    parser.add_argument('--start', type=int, default=0, help="First input line (0-based) to answer.")
+    parser.add_argument('--resume', action='store_true',
+                        help="Append to --output, continuing after the last line it answered.")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help="Lines handed to a worker at a time.")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    summary = run_batch(args.input, args.output, threads=args.threads, processes=args.processes, mode=args.mode,
+                        start=args.start, resume=args.resume, chunk_size=args.chunk_size)
+    print(format_summary(summary))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from app import metrics
+
+
+class MicroBatcher:
+    """
+    Collects concurrently submitted items and dispatches them as batches.
+
+    Callers submit one item at a time and receive a Future. A single background
+    dispatcher thread waits for the first item, then keeps collecting until
+    either `max_batch_size` items are gathered or `max_wait_ms` milliseconds have
+    passed since that first item, and hands the whole batch to `batch_fn` on a
+    pool of `max_concurrent_batches` threads. Each result is then delivered back
+    to the Future of the request that submitted it.
+
+    Up to `max_concurrent_batches` batches are in flight at once, so a slow
+    backend call does not hold up the batches formed behind it. When all of
+    them are busy, the dispatcher waits for one to finish; items keep queuing
+    meanwhile and go out in fuller batches.
+
+    `batch_fn` receives a list of items and must return a list of results of the
+    same length and order. A result that is an exception instance is raised to
+    that item's caller only, so one bad item does not fail its batch-mates.
+
+    The dispatcher thread and the batch pool are started lazily on the first
+    submit (and again in a forked child), so creating a MicroBatcher at import
+    time is safe in preforking servers.
+
+    Its histograms are named after `name` and registered in `registry` (a
+    `metrics.Registry`), or in the process-wide registry by default.
+    """
+
+    def __init__(self, batch_fn, max_batch_size=8, max_wait_ms=5, max_concurrent_batches=4, name='batch',
+                 registry=None):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1.")
+        if max_wait_ms < 0:
+            raise ValueError("max_wait_ms must not be negative.")
+        if max_concurrent_batches < 1:
+            raise ValueError("max_concurrent_batches must be at least 1.")
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.max_concurrent_batches = max_concurrent_batches
+        self.name = name
+
+        self._queue = queue.Queue()
+        self._thread = None
+        self._executor = None
+        self._slots = None # Free batch slots; the dispatcher takes one per batch
+        self._thread_lock = threading.Lock()
+        self._closed = False
+
+        registry = metrics if registry is None else registry
+        self.batch_size_histogram = registry.histogram(
+            f'{name}_batch_size', metrics.SIZE_BUCKETS,
+            description='Number of items per dispatched batch.')
+        self.queue_wait_histogram = registry.histogram(
+            f'{name}_queue_wait_ms', metrics.LATENCY_MS_BUCKETS,
+            description='Time an item waited before its batch was dispatched (ms).')
+
+    def submit(self, item):
+        """
+        Queues an item for the next batch.
+
+        Args:
+            item: Any value accepted by `batch_fn`.
+
+        Returns:
+            concurrent.futures.Future: Resolves to this item's result.
+        """
+        if self._closed:
+            raise RuntimeError(f"MicroBatcher '{self.name}' is closed.")
+        self._ensure_started()
+        future = Future()
+        self._queue.put((item, future, time.monotonic()))
+        return future
+
+    def close(self):
+        """Stops the dispatcher after the already queued items are processed."""
+        self._closed = True
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                # Threads do not survive a fork, so the pool is recreated with the dispatcher.
+                self._slots = threading.BoundedSemaphore(self.max_concurrent_batches)
+                self._executor = ThreadPoolExecutor(max_workers=self.max_concurrent_batches,
+                                                    thread_name_prefix=f'{self.name}-batch')
+                self._thread = threading.Thread(target=self._run, name=f'{self.name}-dispatcher', daemon=True)
+                self._thread.start()
+
+    def _collect_batch(self):
+        """
+        Blocks for the first item, then gathers more until the batch is full or
+        the wait window closes. Returns (batch, stop_requested).
+        """
+        first = self._queue.get()
+        if first is None:
+            return [], True
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait_ms / 1000.0
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                entry = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if entry is None:
+                return batch, True
+            batch.append(entry)
+        return batch, False
+
+    def _run(self):
+        while True:
+            batch, stop_requested = self._collect_batch()
+            if batch:
+                self._slots.acquire() # Waits while max_concurrent_batches batches are in flight
+                self._executor.submit(self._dispatch_in_slot, batch)
+            if stop_requested:
+                return
+
+    def _dispatch_in_slot(self, batch):
+        try:
+            self._dispatch(batch)
+        finally:
+            self._slots.release()
+
+    def _dispatch(self, batch):
+        dispatched_at = time.monotonic()
+        # Skip items whose caller already gave up (e.g., a cancelled Future).
+        live = [(item, future, queued_at) for item, future, queued_at in batch
+                if future.set_running_or_notify_cancel()]
+        if not live:
+            return
+
+        self.batch_size_histogram.observe(len(live))
+        for _, _, queued_at in live:
+            self.queue_wait_histogram.observe((dispatched_at - queued_at) * 1000.0)
+
+        try:
+            results = self.batch_fn([item for item, _, _ in live])
+            if len(results) != len(live):
+                raise RuntimeError(f"Batch function returned {len(results)} results for {len(live)} items.")
+        except Exception as e:
+            logging.error(f"MicroBatcher '{self.name}': batch of {len(live)} failed: {e}")
+            for _, future, _ in live:
+                future.set_exception(e)
+            return
+
+        for (_, future, _), result in zip(live, results):
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
@@ -0,0 +1,196 @@
+import re
+
+import numpy as np
+
+# Lowercased alphanumeric runs. Apostrophes are dropped so "don't" -> "don", "t".
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+# Very common English words that carry no signal for ranking.
+STOPWORDS = frozenset("""
+a about an and are as at be but by can do does for from has have how i if in is it its
+me my of on or so that the their there this to was what when where which who why will
+with you your
+""".split())
+
+# Standard BM25 parameters.
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+
+def tokenize(text):
+    """
+    Splits text into lowercased tokens, dropping stopwords.
+
+    Args:
+        text (str): Any text (question, title, post body...).
+
+    Returns:
+        list: The list of tokens, in order of appearance.
+    """
+    return [token for token in TOKEN_PATTERN.findall((text or '').lower()) if token not in STOPWORDS]
+
+
+def bm25_idf(num_docs, doc_freqs):
+    """Okapi BM25 inverse document frequency (the non-negative "+1" variant)."""
+    doc_freqs = np.asarray(doc_freqs, dtype=np.float32)
+    return np.log1p((num_docs - doc_freqs + 0.5) / (doc_freqs + 0.5)).astype(np.float32)
+
+
+class BM25Index:
+    """
+    An immutable in-memory Okapi BM25 index over a list of documents.
+
+    Terms are mapped to integer vocabulary ids and the postings are stored in
+    CSR layout: for term id `t`, its postings occupy
+    `postings_docs[indptr[t]:indptr[t + 1]]`. Instead of raw term frequencies
+    each posting stores its precomputed BM25 "impact"
+    (tf * (k1 + 1) / (tf + k1 * (1 - b + b * doc_len / avg_doc_len))), so a query
+    score is simply sum(idf[t] * impact) over the query's postings. Scoring is
+    vectorized with NumPy: the postings of all query terms are gathered with one
+    fancy index and summed per document with `np.bincount`.
+    """
+
+    def __init__(self, documents, k1=BM25_K1, b=BM25_B):
+        """
+        Args:
+            documents (list): Document texts (str), in the order results refer to.
+            k1 (float): BM25 term-frequency saturation.
+            b (float): BM25 length normalization.
+        """
+        self.num_docs = len(documents)
+        self.vocabulary = {}
+
+        doc_ids, term_ids = [], []
+        for doc_index, text in enumerate(documents):
+            for token in tokenize(text):
+                term_ids.append(self.vocabulary.setdefault(token, len(self.vocabulary)))
+                doc_ids.append(doc_index)
+        doc_ids = np.asarray(doc_ids, dtype=np.int64)
+        term_ids = np.asarray(term_ids, dtype=np.int64)
+
+        doc_lengths = np.bincount(doc_ids, minlength=self.num_docs).astype(np.float32)
+        avg_length = float(doc_lengths.mean()) if self.num_docs and doc_lengths.sum() else 1.0
+
+        # Collapse (term, doc) pairs into term frequencies, sorted term-major.
+        num_terms = len(self.vocabulary)
+        pair_keys, term_freqs = np.unique(term_ids * max(self.num_docs, 1) + doc_ids, return_counts=True)
+        posting_terms = pair_keys // max(self.num_docs, 1)
+        self.postings_docs = (pair_keys % max(self.num_docs, 1)).astype(np.int32)
+
+        self.indptr = np.zeros(num_terms + 1, dtype=np.int64)
+        np.cumsum(np.bincount(posting_terms, minlength=num_terms), out=self.indptr[1:])
+
+        doc_freqs = np.diff(self.indptr).astype(np.float32)
+        self.idf = bm25_idf(self.num_docs, doc_freqs)
+
+        tf = term_freqs.astype(np.float32)
+        norm = k1 * (1 - b + b * doc_lengths[self.postings_docs] / avg_length)
+        self.impacts = (tf * (k1 + 1) / (tf + norm)).astype(np.float32)
+
+    def query_term_ids(self, query):
+        """Returns the unique vocabulary ids of the query's known terms."""
+        ids = {self.vocabulary[token] for token in tokenize(query) if token in self.vocabulary}
+        return np.fromiter(ids, dtype=np.int64, count=len(ids))
+
+    def score(self, query):
+        """
+        Scores every document against the query.
+
+        Args:
+            query (str): The query text.
+
+        Returns:
+            numpy.ndarray: float32 array of length `num_docs` (0 for documents
+                           sharing no term with the query).
+        """
+        term_ids = self.query_term_ids(query)
+        return self.score_terms(term_ids, self.idf[term_ids])
+
+    def score_terms(self, term_ids, term_weights):
+        """
+        Scores every document for the given vocabulary ids, weighting each
+        term's impacts by `term_weights` (normally its idf). Segmented indexes
+        pass collection-wide idf values here so scores are comparable across
+        segments.
+
+        Args:
+            term_ids (numpy.ndarray): Unique vocabulary ids (int64).
+            term_weights (numpy.ndarray): One weight per term id.
+
+        Returns:
+            numpy.ndarray: float32 array of length `num_docs`.
+        """
+        if term_ids.size == 0 or self.num_docs == 0:
+            return np.zeros(self.num_docs, dtype=np.float32)
+
+        starts = self.indptr[term_ids]
+        lengths = self.indptr[term_ids + 1] - starts
+        total = int(lengths.sum())
+        # Positions of every posting of every query term, without a Python loop:
+        # arange(total) shifted, per term, from its offset in the output to its CSR start.
+        offsets = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+        positions = np.arange(total, dtype=np.int64) + offsets
+        weights = np.repeat(np.asarray(term_weights, dtype=np.float32), lengths) * self.impacts[positions]
+        return np.bincount(self.postings_docs[positions], weights=weights,
+                           minlength=self.num_docs).astype(np.float32)
+
+    def top_k(self, query, k=10, tie_breaker=None):
+        """
+        Returns the `k` best matching documents.
+
+        Args:
+            query (str): The query text.
+            k (int): Number of results.
+            tie_breaker (numpy.ndarray, optional): Secondary sort key per document
+                (higher first) for documents with equal BM25 scores.
+
+        Returns:
+            list: (doc_index, score) tuples with a positive score, best first.
+        """
+        scores = self.score(query)
+        candidates = np.flatnonzero(scores > 0)
+        if candidates.size > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+            # argpartition may cut through a run of tied scores; include the whole run.
+            threshold = scores[candidates].min()
+            candidates = np.flatnonzero(scores >= threshold)
+        if tie_breaker is not None:
+            order = np.lexsort((-np.asarray(tie_breaker)[candidates], -scores[candidates]))
+        else:
+            order = np.argsort(-scores[candidates], kind='stable')
+        return [(int(i), float(scores[i])) for i in candidates[order][:k]]
+
+
+def select_context_posts(question, posts, limit, index=None, ranked_ids=None):
+    """
+    Retrieval stage: picks which posts go into the LLM context.
+
+    The `limit` posts most relevant to the question (BM25) are kept; if fewer
+    than `limit` posts match, the remaining slots are filled in listing order.
+    The selection is returned in the original listing order, so that questions
+    selecting the same posts produce a byte-identical prompt prefix.
+
+    Args:
+        question (str): The user's question.
+        posts (list): Candidate post dicts, in listing order.
+        limit (int): Maximum number of posts to keep.
+        index (BM25Index, optional): A prebuilt index over `posts`.
+        ranked_ids (list, optional): Ids of the posts matching the question,
+            best first (e.g. from a `SegmentedIndex`); used instead of `index`.
+
+    Returns:
+        list: The selected post dicts.
+    """
+    if len(posts) <= limit:
+        return posts
+    if ranked_ids is not None:
+        positions = {post.get('id'): i for i, post in enumerate(posts)}
+        chosen = [positions[item_id] for item_id in ranked_ids if item_id in positions][:limit]
+    else:
+        if index is None:
+            index = BM25Index([f"{post.get('title', '')}\n{post.get('selftext') or ''}" for post in posts])
+        chosen = [doc_index for doc_index, _ in index.top_k(question, limit)]
+    if len(chosen) < limit:
+        chosen_set = set(chosen)
+        chosen += [i for i in range(len(posts)) if i not in chosen_set][:limit - len(chosen)]
+    return [posts[i] for i in sorted(chosen)]
@@ -0,0 +1,108 @@
+import threading
+
+
+class RequestCancelled(Exception):
+    """Raised inside the chat pipeline when its request has been cancelled."""
+
+
+class CancellationToken:
+    """
+    A thread-safe flag shared by every stage working on one chat request.
+
+    Stages poll `raise_if_cancelled()` between units of work (e.g., between
+    fetched posts or streamed LLM chunks). Work that cannot poll, such as a
+    queued LLM batch item, registers a callback that runs once on cancellation.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def cancel(self):
+        """Cancels the request and runs the registered callbacks (once)."""
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def add_callback(self, callback):
+        """Registers `callback` to run on cancellation; runs it now if already cancelled."""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise RequestCancelled()
+
+
+class DuplicateRequest(Exception):
+    """Raised when a request id is registered while a request with that id is still in flight."""
+
+    def __init__(self, request_id):
+        super().__init__(f"Request '{request_id}' is already in progress.")
+        self.request_id = request_id
+
+
+class CancellationRegistry:
+    """
+    Maps client-supplied request ids to their CancellationTokens, so that a
+    later `/cancel` call (or a newer message from the same tab) can stop an
+    in-flight request.
+
+    Ids are scoped by an owner (e.g., the client's address, or a WebSocket
+    connection): a request can only be cancelled through the owner that
+    registered it, so one client cannot cancel another's requests by guessing
+    their ids.
+    """
+
+    def __init__(self):
+        self._tokens = {} # (owner, request_id) -> CancellationToken
+        self._lock = threading.Lock()
+
+    def register(self, request_id, owner=None):
+        """
+        Returns a new token for `request_id`. Requests without an id get a token
+        that is simply not reachable through the registry.
+        Raises DuplicateRequest if the owner already has a request with this id
+        in flight.
+        """
+        token = CancellationToken()
+        if request_id:
+            with self._lock:
+                if (owner, request_id) in self._tokens:
+                    raise DuplicateRequest(request_id)
+                self._tokens[(owner, request_id)] = token
+        return token
+
+    def cancel(self, request_id, owner=None):
+        """Cancels the owner's request with this id. Returns False if it is unknown or finished."""
+        with self._lock:
+            token = self._tokens.pop((owner, request_id), None)
+        if token is None:
+            return False
+        token.cancel()
+        return True
+
+    def unregister(self, request_id, token, owner=None):
+        """
+        Removes `token`, the token `register` returned for this request. A newer
+        request that reused the id after this one was cancelled keeps its token.
+        """
+        if request_id:
+            with self._lock:
+                if self._tokens.get((owner, request_id)) is token:
+                    del self._tokens[(owner, request_id)]
+
+    def __len__(self):
+        return len(self._tokens)
@@ -0,0 +1,501 @@
+import contextlib
+import datetime
+import json
+import os
+import shutil
+import threading
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError: # Not POSIX: only one process may write to a store
+    fcntl = None
+
+# --- Layout ---
+# <root>/<subreddit>/<YYYY-MM>.v<N>/<column>.npy   one immutable directory per partition version
+# <root>/_dictionaries/<column>.jsonl              one JSON string per line; the line number is its code
+# <root>/.lock                                     held (flock) by the writing process during a flush
+#
+# Partitions span a UTC month, with rows sorted by 'created_utc'. A flush writes
+# a partition's new version into a temporary directory and renames it into
+# place, then deletes the old version, so readers never see a partition with
+# some columns old and some new. Stores written before that have unversioned
+# month directories (<YYYY-MM>, version 0) or one partition per day
+# (<YYYY-MM-DD>); they are still read, and a month's day partitions are merged
+# into its month partition by the next flush of that month or by `compact()`.
+#
+# Strings with few distinct values (author, flair, domain) are dictionary-encoded:
+# the partition stores int32 codes (-1 for missing) into a store-wide dictionary,
+# so aggregations can run np.bincount over codes across partitions. Dictionary
+# files are append-only, and new codes are assigned only under the store's file
+# lock after reading every code other writers appended, so two writers never
+# give one code two meanings. Codes are appended before the partitions using
+# them are published.
+
+KIND_SUBMISSION = 0
+KIND_COMMENT = 1
+
+NUMERIC_COLUMNS = {
+    'kind': np.int8,
+    'created_utc': np.float64,
+    'score': np.int32,
+    'num_comments': np.int32,
+}
+DICTIONARY_COLUMNS = ('author', 'flair', 'domain')
+COLUMNS = ('id',) + tuple(NUMERIC_COLUMNS) + DICTIONARY_COLUMNS
+
+DICTIONARIES_DIR = '_dictionaries'
+LOCK_FILE = '.lock'
+MISSING_CODE = -1
+
+# Column files at least this large are memory-mapped rather than read.
+MMAP_MIN_BYTES = 1 << 20
+
+
+def day_of(timestamp):
+    """Returns the UTC date of a Unix timestamp."""
+    return datetime.datetime.fromtimestamp(timestamp, tz=datetime.timezone.utc).date()
+
+
+def month_of(timestamp):
+    """Returns the first day of the UTC month of a Unix timestamp."""
+    return day_of(timestamp).replace(day=1)
+
+
+def _next_month(month):
+    return month.replace(year=month.year + 1, month=1) if month.month == 12 else month.replace(month=month.month + 1)
+
+
+def _parse_partition_name(name):
+    """
+    Returns (start, end, version) for a partition directory name: 'YYYY-MM.vN',
+    'YYYY-MM' (version 0) or 'YYYY-MM-DD' (a day partition). None for other
+    names, e.g. a temporary directory.
+    """
+    base, _, version = name.partition('.v')
+    try:
+        if len(base) == len('YYYY-MM'):
+            start = datetime.date.fromisoformat(f'{base}-01')
+            return start, _next_month(start), int(version or 0)
+        if len(base) == len('YYYY-MM-DD') and not version:
+            start = datetime.date.fromisoformat(base)
+            return start, start + datetime.timedelta(days=1), 0
+    except ValueError:
+        pass
+    return None
+
+
+def _day_start(day):
+    return datetime.datetime.combine(day, datetime.time(), tzinfo=datetime.timezone.utc).timestamp()
+
+
+class StringDictionary:
+    """Maps strings to dense int32 codes (None is encoded as -1)."""
+
+    def __init__(self, values=()):
+        self.values = list(values)
+        self.codes = {value: code for code, value in enumerate(self.values)}
+
+    def __len__(self):
+        return len(self.values)
+
+    def encode(self, value):
+        if value is None:
+            return MISSING_CODE
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def encode_many(self, values):
+        return np.fromiter((self.encode(value) for value in values), dtype=np.int32, count=len(values))
+
+    def append(self, value):
+        """Appends a value read from the dictionary file (its code is the next one)."""
+        self.codes.setdefault(value, len(self.values))
+        self.values.append(value)
+
+    def decode(self, code):
+        return None if code < 0 else self.values[code]
+
+
+class Partition:
+    """
+    The columns of one (subreddit, month) partition, loaded lazily.
+
+    Column files are immutable (a flush writes a new version of the partition
+    in another directory), so loaded columns are cached. Files of at least `MMAP_MIN_BYTES` are memory
+    mapped; smaller ones are read once, since opening and mapping a file costs
+    more than reading a few kilobytes and every open map holds a file descriptor.
+    """
+
+    def __init__(self, subreddit, start, end, directory, version=0):
+        """
+        Args:
+            subreddit (str): Lowercased subreddit name.
+            start (datetime.date): First UTC day covered.
+            end (datetime.date): Day after the last UTC day covered.
+            directory (str): Directory holding the column files.
+            version (int): Version of a month partition (0 for older stores).
+        """
+        self.subreddit = subreddit
+        self.start = start
+        self.end = end
+        self.directory = directory
+        self.version = version
+        self._columns = {}
+
+    @property
+    def is_day(self):
+        """True for a one-day partition written by an older version of the store."""
+        return self.end - self.start == datetime.timedelta(days=1)
+
+    def column(self, name):
+        """Returns a column as a read-only NumPy array."""
+        values = self._columns.get(name)
+        if values is None:
+            path = os.path.join(self.directory, f'{name}.npy')
+            if os.path.getsize(path) >= MMAP_MIN_BYTES:
+                values = np.load(path, mmap_mode='r')
+            else:
+                values = np.load(path)
+                values.flags.writeable = False
+            self._columns[name] = values
+        return values
+
+    def __len__(self):
+        loaded = next(iter(self._columns.values()), None)
+        return len(loaded if loaded is not None else self.column('kind'))
+
+
+class ColumnarStore:
+    """
+    A columnar store of ingested submissions and comments for analytics scans.
+
+    Each field is a typed NumPy array, partitioned by (subreddit, UTC month) and
+    persisted as `.npy` files. Reads memory-map large column files, so a scan
+    touches only the columns and partitions it needs and the pages are shared
+    by all processes. Writes are buffered; `flush()` writes a new version of
+    each affected partition (replacing items with the same id) and renames it
+    into place, so readers see either the old or the new partition, never a mix.
+    Several processes may write to one store: flushes take a file lock.
+    """
+
+    def __init__(self, root):
+        """
+        Args:
+            root (str): Store directory (created if needed).
+        """
+        self.root = root
+        self._lock = threading.Lock()
+        self._pending = {}  # (subreddit, month) -> list of row dicts
+        os.makedirs(os.path.join(root, DICTIONARIES_DIR), exist_ok=True)
+        self.dictionaries = {name: StringDictionary() for name in DICTIONARY_COLUMNS}
+        self._dictionary_lines = dict.fromkeys(DICTIONARY_COLUMNS, 0)  # Lines of each .jsonl file read so far
+        self._dictionary_offsets = dict.fromkeys(DICTIONARY_COLUMNS, 0)  # ... and their length in bytes
+        self._partitions = {}
+        self.refresh()
+
+    def _dictionary_path(self, name):
+        return os.path.join(self.root, DICTIONARIES_DIR, f'{name}.jsonl')
+
+    def _load_dictionaries_locked(self):
+        """Reads the dictionary codes appended (by any writer) since the last call."""
+        for name, dictionary in self.dictionaries.items():
+            path = self._dictionary_path(name)
+            if not os.path.exists(path):
+                legacy_path = os.path.join(self.root, DICTIONARIES_DIR, f'{name}.json')
+                if not len(dictionary) and os.path.exists(legacy_path): # Written before dictionaries were append-only
+                    with open(legacy_path) as f:
+                        for value in json.load(f):
+                            dictionary.append(value)
+                continue
+            with open(path, 'rb') as f:
+                f.seek(self._dictionary_offsets[name])
+                data = f.read()
+            data = data[:data.rfind(b'\n') + 1] # A line still being appended is read next time
+            for line in data.splitlines():
+                if self._dictionary_lines[name] >= len(dictionary): # Values read from a legacy file are skipped
+                    dictionary.append(json.loads(line))
+                self._dictionary_lines[name] += 1
+            self._dictionary_offsets[name] += len(data)
+
+    def _append_dictionaries_locked(self):
+        """Appends the codes assigned by this store to the dictionary files (under the file lock)."""
+        for name, dictionary in self.dictionaries.items():
+            path = self._dictionary_path(name)
+            if not os.path.exists(path):
+                # A new store, or one with a legacy dictionary: write every value, then drop the legacy file.
+                lines = ''.join(json.dumps(value) + '\n' for value in dictionary.values).encode('utf-8')
+                self._atomic_write(path, lambda f, lines=lines: f.write(lines))
+                legacy_path = os.path.join(self.root, DICTIONARIES_DIR, f'{name}.json')
+                if os.path.exists(legacy_path):
+                    os.remove(legacy_path)
+            elif len(dictionary) > self._dictionary_lines[name]:
+                lines = ''.join(json.dumps(value) + '\n' for value in dictionary.values[self._dictionary_lines[name]:])
+                with open(path, 'ab') as f:
+                    f.write(lines.encode('utf-8'))
+                    f.flush()
+                    os.fsync(f.fileno())
+            else:
+                continue
+            self._dictionary_lines[name] = len(dictionary)
+            self._dictionary_offsets[name] = os.path.getsize(path)
+
+    @contextlib.contextmanager
+    def _file_lock(self):
+        """Holds the store's exclusive write lock (shared by all processes writing to it)."""
+        with open(os.path.join(self.root, LOCK_FILE), 'a') as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def refresh(self):
+        """
+        Re-reads the partition list and the dictionaries from disk (e.g. after
+        another process flushed).
+        """
+        with self._lock:
+            self._refresh_locked()
+
+    def _refresh_locked(self):
+        self._load_dictionaries_locked()
+        partitions = {}
+        for subreddit in os.listdir(self.root):
+            subreddit_dir = os.path.join(self.root, subreddit)
+            if subreddit == DICTIONARIES_DIR or not os.path.isdir(subreddit_dir):
+                continue
+            for name in os.listdir(subreddit_dir):
+                parsed = _parse_partition_name(name)
+                if parsed is None or not os.path.exists(os.path.join(subreddit_dir, name, 'kind.npy')):
+                    continue
+                start, end, version = parsed
+                current = partitions.get((subreddit, start, end))
+                if current is None or current.version < version:
+                    partitions[(subreddit, start, end)] = Partition(subreddit, start, end,
+                                                                    os.path.join(subreddit_dir, name), version)
+        # A month partition already holds the rows of its day partitions (left
+        # behind if a merge was interrupted before deleting them).
+        months = {(subreddit, start) for subreddit, start, end in partitions if end == _next_month(start)}
+        self._partitions = {key: partition for key, partition in partitions.items()
+                            if not (partition.is_day and (partition.subreddit, partition.start.replace(day=1)) in months)}
+
+    # --- Writes ---
+
+    def add_submissions(self, subreddit_name, submissions):
+        """
+        Buffers normalized submission dicts (see `app.ingest.normalize_submission`).
+
+        Returns:
+            int: The number of submissions buffered.
+        """
+        return self._add(subreddit_name, KIND_SUBMISSION, submissions)
+
+    def add_comments(self, subreddit_name, comments):
+        """
+        Buffers normalized comment dicts (see `app.ingest.normalize_comment`).
+
+        Returns:
+            int: The number of comments buffered.
+        """
+        return self._add(subreddit_name, KIND_COMMENT, comments)
+
+    def _add(self, subreddit_name, kind, items):
+        subreddit = subreddit_name.lower()
+        with self._lock:
+            for item in items:
+                created = item.get('created_utc') or 0.0
+                self._pending.setdefault((subreddit, month_of(created)), []).append({
+                    'id': item['id'],
+                    'kind': kind,
+                    'created_utc': created,
+                    'score': item.get('score') or 0,
+                    'num_comments': item.get('num_comments') or 0,
+                    'author': item.get('author'),
+                    'flair': item.get('flair'),
+                    'domain': item.get('domain'),
+                })
+        return len(items)
+
+    def flush(self):
+        """
+        Writes buffered items to their partitions.
+
+        Returns:
+            int: The number of partitions written.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            if not pending:
+                return 0
+            with self._file_lock():
+                self._refresh_locked() # Other writers' partitions and codes
+                for rows in pending.values():
+                    for name in DICTIONARY_COLUMNS:
+                        self.dictionaries[name].encode_many([row[name] for row in rows])
+                self._append_dictionaries_locked() # Before any partition refers to the new codes
+                for (subreddit, month), rows in pending.items():
+                    self._write_partition(subreddit, month, rows)
+        return len(pending)
+
+    def compact(self):
+        """
+        Merges the day partitions of older stores into month partitions.
+
+        Returns:
+            int: The number of month partitions written.
+        """
+        with self._lock, self._file_lock():
+            self._refresh_locked()
+            months = sorted({(p.subreddit, p.start.replace(day=1)) for p in self._partitions.values() if p.is_day})
+            for subreddit, month in months:
+                self._write_partition(subreddit, month, [])
+        return len(months)
+
+    def _write_partition(self, subreddit, month, rows):
+        columns = {
+            'id': np.array([row['id'] for row in rows], dtype=str),
+            **{name: np.array([row[name] for row in rows], dtype=dtype) for name, dtype in NUMERIC_COLUMNS.items()},
+            **{name: self.dictionaries[name].encode_many([row[name] for row in rows]) for name in DICTIONARY_COLUMNS},
+        }
+        end = _next_month(month)
+        existing = [p for p in self._partitions.values()
+                    if p.subreddit == subreddit and month <= p.start and p.end <= end]
+        existing.sort(key=lambda p: not p.is_day) # Day partitions are older than the month's
+        if existing:
+            old = {name: np.concatenate([partition.column(name) for partition in existing]) for name in COLUMNS}
+            keep = ~np.isin(old['id'], columns['id'])
+            columns = {name: np.concatenate([old[name][keep], columns[name]]) for name in COLUMNS}
+        # Keep the last version of ids repeated within the batch.
+        _, last = np.unique(columns['id'][::-1], return_index=True)
+        keep = np.sort(len(columns['id']) - 1 - last)
+        keep = keep[np.argsort(columns['created_utc'][keep], kind='stable')]
+        columns = {name: values[keep] for name, values in columns.items()}
+
+        # The new version is written to a temporary directory and renamed into
+        # place in one step, so no reader sees a partly written partition.
+        version = max((p.version for p in existing if not p.is_day), default=0) + 1
+        name = f"{month.strftime('%Y-%m')}.v{version}"
+        subreddit_dir = os.path.join(self.root, subreddit)
+        directory = os.path.join(subreddit_dir, name)
+        tmp_directory = os.path.join(subreddit_dir, f'.{name}.tmp')
+        shutil.rmtree(tmp_directory, ignore_errors=True) # Left over by an interrupted flush
+        os.makedirs(tmp_directory)
+        for column in COLUMNS:
+            np.save(os.path.join(tmp_directory, f'{column}.npy'), columns[column])
+        os.rename(tmp_directory, directory)
+        # Older versions (and day partitions merged into this one) are deleted.
+        # Readers that loaded the partition list before this flush re-read it
+        # if a column they had not loaded yet is gone (see `scan`).
+        for partition in existing:
+            del self._partitions[(subreddit, partition.start, partition.end)]
+            shutil.rmtree(partition.directory, ignore_errors=True)
+        self._partitions[(subreddit, month, end)] = Partition(subreddit, month, end, directory, version)
+
+    @staticmethod
+    def _atomic_write(path, write):
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'wb') as f:
+            write(f)
+        os.replace(tmp_path, path)
+
+    # --- Reads ---
+
+    def partitions(self, subreddit=None, since=None, until=None):
+        """
+        Returns the partitions overlapping the filters, ordered by subreddit and time.
+
+        Args:
+            subreddit (str, optional): Only this subreddit.
+            since (float, optional): Unix timestamp; partitions ending before it are skipped.
+            until (float, optional): Unix timestamp; partitions starting after it are skipped.
+        """
+        with self._lock:
+            partitions = list(self._partitions.values())
+        if subreddit:
+            partitions = [p for p in partitions if p.subreddit == subreddit.lower()]
+        if since is not None:
+            partitions = [p for p in partitions if _day_start(p.end) > since]
+        if until is not None:
+            partitions = [p for p in partitions if _day_start(p.start) <= until]
+        return sorted(partitions, key=lambda p: (p.subreddit, p.start))
+
+    def scan(self, columns, subreddit=None, since=None, until=None, kind=None):
+        """
+        Reads columns across the matching partitions.
+
+        Partitions outside the subreddit/time filters are never opened; rows
+        inside the boundary months are filtered on 'created_utc'.
+
+        Args:
+            columns (list): Column names to return.
+            subreddit (str, optional): Only this subreddit.
+            since (float, optional): Only items created at or after this Unix time.
+            until (float, optional): Only items created before this Unix time.
+            kind (int, optional): KIND_SUBMISSION or KIND_COMMENT.
+
+        Returns:
+            dict: Column name -> NumPy array (concatenated over partitions).
+        """
+        try:
+            return self._scan(columns, subreddit, since, until, kind)
+        except FileNotFoundError: # Another process replaced a partition after our last refresh
+            self.refresh()
+            return self._scan(columns, subreddit, since, until, kind)
+
+    def _scan(self, columns, subreddit, since, until, kind):
+        selections, total = [], 0
+        for partition in self.partitions(subreddit, since, until):
+            mask = None
+            if since is not None or until is not None:
+                created = partition.column('created_utc')
+                mask = np.ones(len(created), dtype=bool)
+                if since is not None:
+                    mask &= created >= since
+                if until is not None:
+                    mask &= created < until
+            if kind is not None:
+                kind_mask = partition.column('kind') == kind
+                mask = kind_mask if mask is None else mask & kind_mask
+            count = len(partition) if mask is None else int(np.count_nonzero(mask))
+            selections.append((partition, mask, total, total + count))
+            total += count
+
+        result = {}
+        for name in columns:
+            if name == 'id':
+                # String widths differ between partitions, so let NumPy pick the result dtype.
+                chunks = [np.array(p.column(name)) if m is None else p.column(name)[m] for p, m, _, _ in selections]
+                result[name] = np.concatenate(chunks) if chunks else self._empty(name)
+                continue
+            # Copy each partition straight into one preallocated output array.
+            out = self._empty(name, total)
+            for partition, mask, start, end in selections:
+                values = partition.column(name)
+                out[start:end] = values if mask is None else values[mask]
+            result[name] = out
+        return result
+
+    @staticmethod
+    def _empty(name, size=0):
+        if name == 'id':
+            return np.array([], dtype=str)
+        return np.empty(size, dtype=NUMERIC_COLUMNS.get(name, np.int32))
+
+    def decode(self, column, codes):
+        """Decodes dictionary codes of `column` back to strings (None for missing)."""
+        dictionary = self.dictionaries[column]
+        codes = [int(code) for code in codes]
+        if codes and max(codes) >= len(dictionary): # Assigned by another writer since our last refresh
+            with self._lock:
+                self._load_dictionaries_locked()
+        return [dictionary.decode(code) for code in codes]
+
+    def __len__(self):
+        return sum(len(partition) for partition in self.partitions())
@@ -1,19 +1,12 @@
 import re
-
-# Regex to extract just the name from a subreddit tag like "@r/learnpython" -> "learnpython"
-SUBREDDIT_NAME_EXTRACTOR_PATTERN = r'@r/(\w+)'
-
-# Regex to identify a subreddit tag at the beginning of a message and capture the rest as the question.
-# It captures two groups:
-# 1. The full subreddit tag (e.g., "@r/learnpython")
-# 2. The remainder of the message after the tag and any intermediate whitespace (e.g., "what is flask?")
-MESSAGE_SPLIT_PATTERN = r'(@r/\w+\b)\s*(.*)'
+import time
 
 def parse_subreddit_and_question(user_message):
     """
     Parses a user message to extract a subreddit mention (e.g., @r/learnpython)
     and the subsequent question. The subreddit mention must be at the beginning
-    of the message.
+    of the message. A thin wrapper over `parse_query`: inline filters are
+    dropped from the question, and only the first of several tags is returned.
 
     Args:
         user_message (str): The raw message from the user, which might include
@@ -27,26 +20,276 @@ def parse_subreddit_and_question(user_message):
                - If no valid @r/subreddit tag is found at the start:
                  (None, original_message_after_stripping_whitespace)
     """
-    user_message = user_message.strip() # Remove leading/trailing whitespace
+    query = parse_query(user_message)
+    return (query.subreddits[0] if query.subreddits else None), query.question
 
-    # Attempt to match the pattern for "@r/subreddit_tag question_text"
-    match = re.match(MESSAGE_SPLIT_PATTERN, user_message)
+def parse_subreddits_and_question(user_message):
+    """
+    Parses a user message that starts with one or more subreddit mentions
+    (e.g., "@r/python @r/golang which is better for CLIs?"). A thin wrapper
+    over `parse_query`.
 
-    if match:
-        subreddit_tag_full = match.group(1)  # Full tag, e.g., "@r/learnpython"
-        question_text = match.group(2).strip() # The rest of the message, stripped
+    Args:
+        user_message (str): The raw message from the user.
 
-        # Extract just the subreddit name (e.g., "learnpython") from the full tag
-        subreddit_name_match = re.match(SUBREDDIT_NAME_EXTRACTOR_PATTERN, subreddit_tag_full)
-        if subreddit_name_match:
-            subreddit_name = subreddit_name_match.group(1)
-            return subreddit_name, question_text
-        else:
-            # This case should ideally not be reached if MESSAGE_SPLIT_PATTERN matched correctly,
-            # as @r/\w+\b implies a valid tag format.
-            # However, as a defensive fallback, return no subreddit and the original message.
-            return None, user_message
+    Returns:
+        tuple: (subreddit_names, question_text)
+               - subreddit_names: every subreddit tagged at the start of the
+                 message, in order, without duplicates (case-insensitive).
+                 Empty if the message does not start with a tag.
+               - question_text: the rest of the message (stripped), or the whole
+                 stripped message if there are no tags.
+    """
+    query = parse_query(user_message)
+    return query.subreddits, query.question
+
+def subreddit_contexts(subreddit_info):
+    """
+    Returns the per-subreddit context dicts of a chat context: the dict itself
+    for a single subreddit, or the entries of its 'subreddits' list when the
+    question mentioned several.
+    """
+    if not subreddit_info:
+        return []
+    if 'subreddits' in subreddit_info:
+        return list(subreddit_info['subreddits'])
+    return [subreddit_info]
+
+def describe_subreddits(subreddit_info):
+    """
+    Returns a readable list of the subreddits in a chat context, e.g.
+    "r/python" or "r/python and r/golang".
+    """
+    names = [f"r/{context.get('display_name', context.get('name', 'unknown'))}"
+             for context in subreddit_contexts(subreddit_info)]
+    if len(names) <= 1:
+        return names[0] if names else "r/unknown"
+    return f"{', '.join(names[:-1])} and {names[-1]}"
+
+# --- Structured queries ---
+# Besides subreddit tags, a message may carry inline filters that narrow which
+# posts are loaded as context:
+#   new / hot / rising / top     listing order (bare words, only before the question)
+#   top:week                     top posts of the hour/day/week/month/year/all
+#   flair:"Help" or flair:Help   only posts with this flair (case-insensitive)
+#   since:24h                    only posts newer than 24 hours (h, d, w, mo, y)
+# `key:value` filters are recognized anywhere in the message. A bare listing word
+# is only a filter in the leading run of tags and filters, after at least one
+# tag, and only when it is followed by a comma, another filter, or the end of
+# the message, so "@r/python new features in 3.13?" keeps "new" in the
+# question and "new" alone is a question.
+SORT_ORDERS = ('hot', 'new', 'rising', 'top')
+TIME_FILTERS = {'hour': 3600, 'day': 86400, 'week': 7 * 86400, 'month': 30 * 86400,
+                'year': 365 * 86400, 'all': None}
+SINCE_UNITS = {'h': 3600, 'd': 86400, 'w': 7 * 86400, 'mo': 30 * 86400, 'y': 365 * 86400}
+
+# QUERY_RE parses a message that starts with a tag in one match: the run of
+# tags (the first name, and the other tags as text), then the run of valid
+# filters (as text, and the key of _HEADER_FILTERS), then the question (the
+# rest of the message). Its other groups hold the
+# last value of each filter, which is the value that applies; a quoted flair
+# keeps its quotes. An invalid filter (e.g. "top:fortnight") or a tag after a
+# filter starts the question. Messages without a leading tag are not matched,
+# so a bare listing word is only a filter after a tag. The question is only
+# searched for `key:value` filters (QUESTION_FILTER_RE) if it contains a colon.
+QUERY_RE = re.compile(r'''
+    @r/(?P<subreddit>\w+)(?:[\s,]+@r/(?P<second>\w+)(?P<more_tags>(?:[\s,]+@r/\w+)*+))?
+    (?P<filters>(?:
+        [\s,]++(?=[fhnrst]) # Only filters start with these letters; other words fail fast
+        (?:
+            top:(?P<top_quote>"?)(?P<window>hour|day|week|month|year|all)(?P=top_quote)(?![^\s,])
+          | flair:(?P<flair>"[^"]+"|(?!"")[^\s,]+)
+          | since:(?P<since_quote>"?)(?P<amount>\d+)(?P<unit>h|d|w|mo|y)(?P=since_quote)(?![^\s,])
+          | (?P<sort>hot|new|rising|top)(?=\s*(?:,|\Z|(?:top|flair|since):))
+        )
+    )*+)
+    [\s,]*(?P<question>.*)
+''', re.VERBOSE | re.IGNORECASE | re.DOTALL)
+QUESTION_FILTER_RE = re.compile(r'(?<!\S)(?P<key>top|flair|since):(?:"(?P<quoted>[^"]*)"|(?P<value>[^\s,]+))',
+                                re.IGNORECASE)
+SINCE_VALUE_RE = re.compile(r'(\d+)(h|d|w|mo|y)', re.IGNORECASE)
+WHITESPACE_RUN_RE = re.compile(r'\s{2,}')
+
+class QueryFilters:
+    """
+    Inline filters of a structured query. A filter left at None is not applied;
+    an empty QueryFilters is falsy.
+
+    Attributes:
+        sort (str or None): Listing order ('hot', 'new', 'rising' or 'top').
+        time_filter (str or None): Window of a 'top' listing (a TIME_FILTERS key).
+        flair (str or None): Required post flair, compared case-insensitively.
+        since_seconds (int or None): Maximum post age in seconds.
+    """
+
+    def __init__(self, sort=None, time_filter=None, flair=None, since_seconds=None):
+        self.sort = sort
+        self.time_filter = time_filter
+        self.flair = flair
+        self.since_seconds = since_seconds
+
+    def __bool__(self):
+        return any(value is not None for value in (self.sort, self.time_filter, self.flair, self.since_seconds))
+
+    def __eq__(self, other):
+        return isinstance(other, QueryFilters) and self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        return f"QueryFilters({self.to_dict()})"
+
+    def cutoff(self, now=None):
+        """
+        Returns the oldest creation time (epoch seconds) a post may have, combining
+        `since:` and the window of `top:`, or None if posts of any age qualify.
+        """
+        windows = [self.since_seconds, TIME_FILTERS.get(self.time_filter)]
+        windows = [window for window in windows if window is not None]
+        if not windows:
+            return None
+        return (time.time() if now is None else now) - min(windows)
+
+    def matches(self, post, now=None):
+        """Returns whether a post dict ('flair', 'created_utc') passes the flair and age filters."""
+        if self.flair is not None and (post.get('flair') or '').lower() != self.flair.lower():
+            return False
+        cutoff = self.cutoff(now)
+        if cutoff is not None and (post.get('created_utc') or 0) < cutoff:
+            return False
+        return True
+
+    def to_dict(self):
+        """Returns the filters that are set, e.g. {'sort': 'top', 'time_filter': 'week'}."""
+        return {key: value for key, value in (('sort', self.sort), ('time_filter', self.time_filter),
+                                              ('flair', self.flair), ('since_seconds', self.since_seconds))
+                if value is not None}
+
+# The filters of a query without any (shared; never modified).
+NO_FILTERS = QueryFilters()
+# The filters of recently parsed headers, by the header's filter text (e.g.
+# ' top:week flair:"Help"'). Most messages with filters repeat a few common
+# ones, and building QueryFilters costs more than matching them. Shared by the
+# queries that use them, so never modified.
+_HEADER_FILTERS = {}
+HEADER_FILTERS_CACHE_SIZE = 1024
+
+class ParsedQuery:
+    """
+    A user message parsed by `parse_query`.
+
+    Attributes:
+        subreddits (list): Subreddits tagged at the start of the message, in order,
+            without duplicates (case-insensitive).
+        question (str): The message without its tags and filters.
+        filters (QueryFilters): The inline filters (`NO_FILTERS` if there are none).
+    """
+    __slots__ = ('subreddits', 'question', 'filters')
+
+    def __init__(self, subreddits, question, filters):
+        self.subreddits = subreddits
+        self.question = question
+        self.filters = filters
+
+    def __repr__(self):
+        return f"ParsedQuery(subreddits={self.subreddits!r}, question={self.question!r}, filters={self.filters!r})"
+
+def parse_query(user_message):
+    """
+    Parses a user message into subreddits, question and inline filters
+    (see QUERY_RE and QUESTION_FILTER_RE).
+
+    Examples:
+        "@r/python top:week flair:\"Help\" how do I package an app?"
+            -> subreddits ['python'], question 'how do I package an app?',
+               filters sort='top', time_filter='week', flair='Help'
+        "@r/rust new, since:24h what broke?"
+            -> subreddits ['rust'], question 'what broke?',
+               filters sort='new', since_seconds=86400
+
+    A filter with an invalid value (e.g. "top:fortnight") is left in the question.
+
+    Args:
+        user_message (str): The raw message from the user.
+
+    Returns:
+        ParsedQuery: The parsed query.
+    """
+    user_message = user_message.strip()
+    match = QUERY_RE.match(user_message) if user_message[:1] == '@' else None
+    if match is None:
+        subreddits, filters, question, position = [], NO_FILTERS, user_message, 0
     else:
-        # No @r/subreddit tag was found at the beginning of the message.
-        # Return None for subreddit_name and the original (stripped) message as the question.
-        return None, user_message
+        groups = match.groups()
+        subreddit, second, more_tags, header = groups[:4] # The tags and the filter run
+        question = groups[-1]
+        if second is None:
+            subreddits = [subreddit]
+        elif more_tags:
+            # Only tags and separators: split them without another match.
+            tags = more_tags.replace(',', ' ').replace('@r/', ' ').replace('@R/', ' ').split()
+            subreddits = _unique_names([subreddit, second, *tags])
+        else:
+            subreddits = [subreddit] if second.lower() == subreddit.lower() else [subreddit, second]
+        filters, position = NO_FILTERS, None
+        if header:
+            filters = _HEADER_FILTERS.get(header)
+            if filters is None:
+                filters = _header_filters(match)
+
+    if ':' not in question:
+        return ParsedQuery(subreddits, question, filters)
+    if position is None:
+        position = match.start('question')
+    # The header's filters are shared (see _HEADER_FILTERS); these are a copy.
+    filters = QueryFilters(filters.sort, filters.time_filter, filters.flair, filters.since_seconds)
+    pieces = []
+    for match in QUESTION_FILTER_RE.finditer(user_message, position):
+        if _apply_filter(filters, match.group('key').lower(), _filter_value(match)):
+            pieces.append(user_message[position:match.start()])
+            position = match.end()
+    if not pieces:
+        return ParsedQuery(subreddits, question, filters)
+    pieces.append(user_message[position:])
+    return ParsedQuery(subreddits, WHITESPACE_RUN_RE.sub(' ', ''.join(pieces)).strip(), filters)
+
+def _header_filters(match):
+    """Builds the QueryFilters of a header from its QUERY_RE groups, and caches them."""
+    window, flair, amount, unit, sort = match.group('window', 'flair', 'amount', 'unit', 'sort')
+    if sort and window and match.start('window') > match.start('sort'):
+        sort = None # "new top:week" reads the top listing
+    if flair and len(flair) > 1 and flair[0] == flair[-1] == '"':
+        flair = flair[1:-1]
+    filters = QueryFilters(sort.lower() if sort else 'top' if window else None, window.lower() if window else None,
+                           flair, int(amount) * SINCE_UNITS[unit.lower()] if amount else None)
+    if len(_HEADER_FILTERS) >= HEADER_FILTERS_CACHE_SIZE:
+        _HEADER_FILTERS.clear()
+    _HEADER_FILTERS[match.group('filters')] = filters
+    return filters
+
+def _unique_names(names):
+    """Drops empty and repeated subreddit names (case-insensitive), keeping the first spelling."""
+    seen, unique = set(), []
+    for name in names:
+        if name and name.lower() not in seen:
+            seen.add(name.lower())
+            unique.append(name)
+    return unique
+
+def _filter_value(match):
+    return match.group('quoted') if match.group('quoted') is not None else match.group('value')
+
+def _apply_filter(filters, key, value):
+    """Sets one `key:value` filter; returns False (leaving `filters` unchanged) if the value is invalid."""
+    if key == 'top':
+        if value.lower() not in TIME_FILTERS:
+            return False
+        filters.sort, filters.time_filter = 'top', value.lower()
+    elif key == 'flair':
+        if not value:
+            return False
+        filters.flair = value
+    else: # since
+        match = SINCE_VALUE_RE.fullmatch(value)
+        if not match:
+            return False
+        filters.since_seconds = int(match.group(1)) * SINCE_UNITS[match.group(2).lower()]
+    return True
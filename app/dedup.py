@@ -0,0 +1,275 @@
+import string
+import threading
+
+import numpy as np
+
+# MinHash signature length and its LSH banding: NUM_BANDS bands of
+# NUM_PERMUTATIONS / NUM_BANDS rows. Two items whose shingle sets have Jaccard
+# similarity s share at least one band with probability 1 - (1 - s**rows)**bands,
+# which is about 0.98 for s = 0.8 and 0.05 for s = 0.4.
+NUM_PERMUTATIONS = 128
+NUM_BANDS = 16
+
+# Items are compared as sets of word SHINGLE_SIZE-grams.
+SHINGLE_SIZE = 3
+
+# Candidate pairs are only reported when the estimated Jaccard similarity
+# (fraction of equal signature entries) reaches this threshold.
+DEFAULT_THRESHOLD = 0.8
+
+# Texts are hashed in chunks of about this many characters, which bounds the
+# (permutations x shingles) matrix of a chunk to roughly 10 MB.
+CHUNK_CHARS = 1 << 17
+
+# Signature entry of an item without any words: it never matches anything.
+EMPTY_HASH = np.iinfo(np.uint32).max
+
+# Bytes that belong to words: ASCII letters, digits and '_', plus every byte of
+# a multi-byte UTF-8 character (so non-ASCII text is split on ASCII separators).
+_WORD_BYTES = np.zeros(256, dtype=bool)
+_WORD_BYTES[[ord(c) for c in string.ascii_lowercase + string.ascii_uppercase + string.digits + '_']] = True
+_WORD_BYTES[0x80:] = True
+
+# Words are hashed with a polynomial hash modulo 2**64 (sum of byte * BASE**i
+# over the word's bytes), computed for every word of a batch at once.
+_POLYNOMIAL_BASE = 0x100000001B3
+
+# Odd multipliers used to combine word hashes into shingle hashes and
+# signature rows into band keys (arithmetic wraps modulo 2**64).
+_MULTIPLIERS = np.array([0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9,
+                         0xD6E8FEB86659FD93, 0xFF51AFD7ED558CCD, 0xC4CEB9FE1A85EC53], dtype=np.uint64)
+
+
+def word_hashes(texts):
+    """
+    Hashes the lower-cased words of a batch of texts.
+
+    Args:
+        texts (list): The texts.
+
+    Returns:
+        tuple: (hashes, text_of_word): uint64 arrays with one entry per word,
+            in order.
+    """
+    encoded = [(text or '').lower().encode('utf-8') for text in texts]
+    data = np.frombuffer(b' '.join(encoded), dtype=np.uint8)
+    is_word = _WORD_BYTES[data]
+    word_bytes = data[is_word].astype(np.uint64)
+    if not len(word_bytes):
+        return np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=np.int64)
+    edges = np.diff(np.concatenate(([False], is_word, [False])).view(np.int8))
+    starts = np.flatnonzero(edges == 1)
+    lengths = np.flatnonzero(edges == -1) - starts
+    # Position of each word byte inside its word, over the word bytes only.
+    first_byte = np.zeros(len(starts), dtype=np.int64)
+    np.cumsum(lengths[:-1], out=first_byte[1:])
+    offset_in_word = np.arange(len(word_bytes)) - np.repeat(first_byte, lengths)
+    powers = np.full(int(lengths.max()), _POLYNOMIAL_BASE, dtype=np.uint64)
+    powers[0] = 1
+    hashes = np.add.reduceat(word_bytes * np.cumprod(powers, dtype=np.uint64)[offset_in_word], first_byte,
+                             dtype=np.uint64)
+    # Texts are joined with one separator byte.
+    text_ends = np.cumsum([len(part) + 1 for part in encoded])
+    return hashes, np.searchsorted(text_ends, starts, side='right')
+
+
+def shingle_hashes(hashes, text_of_word, shingle_size=SHINGLE_SIZE):
+    """
+    Combines consecutive word hashes of the same text into 32-bit shingle hashes.
+
+    Args:
+        hashes (numpy.ndarray): Word hashes (see `word_hashes`).
+        text_of_word (numpy.ndarray): The text each word belongs to.
+        shingle_size (int): Words per shingle.
+
+    Returns:
+        tuple: (shingles, text_of_shingle). A text shorter than `shingle_size`
+            (but not empty) is a single shingle.
+    """
+    count = len(hashes)
+    if not count:
+        return np.zeros(0, dtype=np.uint32), text_of_word
+    padded_text = np.concatenate((text_of_word, np.full(shingle_size, -1)))
+    padded_hashes = np.concatenate((hashes, np.zeros(shingle_size, dtype=np.uint64)))
+    combined = np.zeros(count, dtype=np.uint64)
+    for offset in range(shingle_size):
+        same_text = padded_text[offset:offset + count] == text_of_word
+        combined ^= np.where(same_text, padded_hashes[offset:offset + count] * _MULTIPLIERS[offset], np.uint64(0))
+    complete = padded_text[shingle_size - 1:shingle_size - 1 + count] == text_of_word
+    first_of_text = np.concatenate(([True], text_of_word[1:] != text_of_word[:-1]))
+    short_text = np.bincount(text_of_word)[text_of_word] < shingle_size
+    valid = complete | (first_of_text & short_text)
+    combined = combined[valid]
+    return ((combined >> np.uint64(32)) ^ combined).astype(np.uint32), text_of_word[valid]
+
+
+class MinHasher:
+    """
+    Computes MinHash signatures of texts.
+
+    Each of the `num_permutations` hash functions is a random affine
+    permutation h(x) = (a * x + b) mod 2**32 (a odd) of the 32-bit shingle
+    hashes, which keeps the arithmetic in uint32 lanes. A batch is processed
+    without a Python loop over words or texts: the words of a chunk of texts
+    are hashed from prefix sums, combined into shingles, hashed by every
+    function as one matrix and reduced to per-text minimums with
+    `numpy.minimum.reduceat`.
+    """
+
+    def __init__(self, num_permutations=NUM_PERMUTATIONS, seed=1):
+        rng = np.random.default_rng(seed)
+        self.num_permutations = num_permutations
+        self._a = rng.integers(0, 2 ** 32, size=num_permutations, dtype=np.uint32) | np.uint32(1)
+        self._b = rng.integers(0, 2 ** 32, size=num_permutations, dtype=np.uint32)
+
+    def signatures(self, texts):
+        """
+        Args:
+            texts (list): The texts.
+
+        Returns:
+            numpy.ndarray: A (len(texts), num_permutations) uint32 matrix.
+        """
+        result = np.full((len(texts), self.num_permutations), EMPTY_HASH, dtype=np.uint32)
+        start = 0
+        while start < len(texts):
+            end, chars = start, 0
+            while end < len(texts) and (end == start or chars < CHUNK_CHARS):
+                chars += len(texts[end] or '')
+                end += 1
+            shingles, text_of_shingle = shingle_hashes(*word_hashes(texts[start:end]))
+            if len(shingles):
+                rows, offsets = np.unique(text_of_shingle, return_index=True)
+                hashed = self._a[:, None] * shingles[None, :]
+                hashed += self._b[:, None]
+                result[start + rows] = np.minimum.reduceat(hashed, offsets, axis=1).T
+            start = end
+        return result
+
+    def signature(self, text):
+        return self.signatures([text])[0]
+
+
+def estimate_similarity(signature, others):
+    """
+    Estimated Jaccard similarity between one signature and each row of `others`
+    (the fraction of equal entries). Empty items are similar to nothing.
+    """
+    others = np.atleast_2d(others)
+    similarity = (others == signature[None, :]).mean(axis=1)
+    if signature[0] == EMPTY_HASH and np.all(signature == EMPTY_HASH):
+        similarity[:] = 0.0
+    return similarity
+
+
+def band_keys(signatures, num_bands=NUM_BANDS):
+    """
+    Hashes each band of each signature to a signed 64-bit key (distinct bands
+    of equal content get distinct keys, so one table can hold every band).
+
+    Args:
+        signatures (numpy.ndarray): (n, num_permutations) signatures.
+        num_bands (int): Bands per signature; must divide num_permutations.
+
+    Returns:
+        numpy.ndarray: An (n, num_bands) int64 matrix.
+    """
+    signatures = np.atleast_2d(signatures)
+    rows = signatures.shape[1] // num_bands
+    bands = signatures.reshape(len(signatures), num_bands, rows).astype(np.uint64)
+    multipliers = (np.arange(1, rows + 1, dtype=np.uint64) * _MULTIPLIERS[0]) | np.uint64(1)
+    keys = (bands * multipliers).sum(axis=2, dtype=np.uint64)
+    keys ^= (np.arange(num_bands, dtype=np.uint64) + np.uint64(1)) * _MULTIPLIERS[-1]
+    return keys.view(np.int64)
+
+
+class LSHIndex:
+    """
+    In-memory LSH banding index over MinHash signatures. Items sharing a band
+    key with a query are candidates; candidates whose estimated similarity
+    reaches the threshold are near-duplicates.
+    """
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD, num_bands=NUM_BANDS):
+        self.threshold = threshold
+        self.num_bands = num_bands
+        self._lock = threading.Lock()
+        self._buckets = {}     # band key -> set of item ids
+        self._signatures = {}  # item id -> signature
+
+    def __len__(self):
+        return len(self._signatures)
+
+    def add(self, item_id, signature):
+        """Adds (or replaces) an item's signature."""
+        keys = band_keys(signature, self.num_bands)[0].tolist()
+        with self._lock:
+            self._remove(item_id)
+            self._signatures[item_id] = signature
+            for key in keys:
+                self._buckets.setdefault(key, set()).add(item_id)
+
+    def remove(self, item_id):
+        with self._lock:
+            self._remove(item_id)
+
+    def _remove(self, item_id):
+        signature = self._signatures.pop(item_id, None)
+        if signature is None:
+            return
+        for key in band_keys(signature, self.num_bands)[0].tolist():
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(item_id)
+                if not bucket:
+                    del self._buckets[key]
+
+    def query(self, signature, exclude=None):
+        """
+        Returns:
+            list: (item_id, estimated_similarity) pairs of the near-duplicates
+                of `signature`, most similar first.
+        """
+        keys = band_keys(signature, self.num_bands)[0].tolist()
+        with self._lock:
+            candidates = sorted({item_id for key in keys for item_id in self._buckets.get(key, ())
+                                 if item_id != exclude}, key=str)
+            if not candidates:
+                return []
+            similarities = estimate_similarity(signature, np.stack([self._signatures[c] for c in candidates]))
+        matches = [(item_id, float(s)) for item_id, s in zip(candidates, similarities) if s >= self.threshold]
+        return sorted(matches, key=lambda match: -match[1])
+
+
+def collapse_near_duplicates(items, texts, threshold=DEFAULT_THRESHOLD, hasher=None):
+    """
+    Drops items that are near-duplicates of an earlier item in the list (so the
+    caller's ranking decides which copy is kept).
+
+    Args:
+        items (list): The items, best first.
+        texts (list): The text of each item.
+        threshold (float): Minimum estimated Jaccard similarity of a duplicate.
+        hasher (MinHasher, optional): Defaults to a `MinHasher()`.
+
+    Returns:
+        tuple: (kept_items, duplicates) where duplicates maps the index of each
+            dropped item to the index of the kept item it duplicates.
+    """
+    if len(items) < 2:
+        return list(items), {}
+    signatures = (hasher or MinHasher()).signatures(texts)
+    buckets = {}  # band key -> positions of kept items
+    kept, duplicates = [], {}
+    for position, keys in enumerate(band_keys(signatures).tolist()):
+        candidates = sorted({other for key in keys for other in buckets.get(key, ())})
+        if candidates:
+            similarities = estimate_similarity(signatures[position], signatures[candidates])
+            best = int(np.argmax(similarities))
+            if similarities[best] >= threshold:
+                duplicates[position] = candidates[best]
+                continue
+        for key in keys:
+            buckets.setdefault(key, []).append(position)
+        kept.append(items[position])
+    return kept, duplicates
@@ -0,0 +1,398 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import zlib
+
+import numpy as np
+
+from app.bm25 import tokenize
+
+# Default embedding width of the hashing embedder.
+DEFAULT_DIM = 256
+
+# Rows scored per matrix multiplication when scanning the whole index, so that
+# the temporary score buffer stays small (~1 MB) regardless of index size.
+SEARCH_BLOCK_ROWS = 262144
+
+# int8 rows are widened to float32 in cache-sized sub-blocks (NumPy has no
+# int8 GEMM), reusing one small buffer instead of converting a large block.
+INT8_WIDEN_ROWS = 8192
+
+# Quantized searches re-score this many times k int8 candidates at full precision.
+DEFAULT_RESCORE_FACTOR = 4
+
+# File names inside an index directory.
+VECTORS_FILE = 'vectors.npy'
+INT8_VECTORS_FILE = 'vectors_int8.npy'
+SCALES_FILE = 'scales.npy'
+ITEM_IDS_FILE = 'item_ids.npy'
+CREATED_UTC_FILE = 'created_utc.npy'
+SUBREDDIT_OFFSETS_FILE = 'subreddit_offsets.npy'
+SUBREDDITS_FILE = 'subreddits.json'
+# Row count and content hash, so indexes derived from this one can check they still match it.
+INDEX_META_FILE = 'index_meta.json'
+# Derived indexes written into the same directory (app.ann's IVF files) start
+# with this prefix; rewriting the embedding index deletes them.
+DERIVED_FILE_PREFIX = 'ivf_'
+
+# Rows hashed at a time by `content_hash`.
+HASH_CHUNK_ROWS = 65536
+
+
+class HashingEmbedder:
+    """
+    A dependency-free stand-in for a sentence-embedding model.
+
+    Tokens (and adjacent token pairs) are hashed into `dim` signed buckets and
+    the result is L2-normalized, so the dot product of two embeddings is their
+    cosine similarity. It captures lexical rather than semantic similarity; any
+    model returning unit-length float32 vectors can replace it.
+    """
+
+    def __init__(self, dim=DEFAULT_DIM):
+        self.dim = dim
+
+    def embed(self, text):
+        """Returns the unit-length float32 embedding of `text` (all zeros if it has no tokens)."""
+        tokens = tokenize(text)
+        features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+        vector = np.zeros(self.dim, dtype=np.float32)
+        if not features:
+            return vector
+        hashes = np.fromiter((zlib.crc32(feature.encode('utf-8')) for feature in features),
+                             dtype=np.uint32, count=len(features))
+        signs = np.where(hashes & 0x80000000, -1.0, 1.0).astype(np.float32)
+        np.add.at(vector, (hashes % self.dim).astype(np.int64), signs)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def embed_batch(self, texts):
+        """Returns a (len(texts), dim) float32 matrix of embeddings."""
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            matrix[row] = self.embed(text)
+        return matrix
+
+
+def quantize_int8(vectors):
+    """
+    Scalar-quantizes float vectors to int8 with one scale factor per vector.
+
+    Each row is divided by max(|row|) / 127 and rounded, so that
+    `codes[i] * scales[i]` approximates `vectors[i]` with an error of at most
+    half a quantization step per component.
+
+    Args:
+        vectors (numpy.ndarray): (n, dim) float vectors.
+
+    Returns:
+        tuple: (codes, scales) as an (n, dim) int8 array and an (n,) float32 array.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    max_abs = np.abs(vectors).max(axis=1) if vectors.size else np.zeros(len(vectors), dtype=np.float32)
+    scales = np.where(max_abs > 0, max_abs / 127.0, 1.0).astype(np.float32)
+    codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales
+
+
+def content_hash(vectors, item_ids):
+    """
+    Returns a hex digest of an index's rows: its item ids and float32 vectors,
+    in row order. An index derived from the rows (e.g., an IVF index, which
+    refers to them by row number) records it to detect a rebuilt source.
+    """
+    digest = hashlib.sha256()
+    digest.update('\n'.join(str(item_id) for item_id in item_ids).encode('utf-8'))
+    for start in range(0, len(vectors), HASH_CHUNK_ROWS):
+        digest.update(np.ascontiguousarray(vectors[start:start + HASH_CHUNK_ROWS], dtype=np.float32).tobytes())
+    return digest.hexdigest()
+
+
+def write_index(directory, vectors, item_ids, subreddits, created_utc, quantize=False, keep_float32=True):
+    """
+    Writes an embedding index to `directory` as `.npy` files.
+
+    Rows are sorted by (subreddit, created_utc), so that every subreddit occupies
+    one contiguous row range (recorded in `subreddit_offsets.npy`) and, within
+    it, rows are in time order. Subreddit and time-window filters then become
+    zero-copy slices of the memory-mapped matrix.
+
+    Args:
+        directory (str): Output directory (created if needed).
+        vectors (numpy.ndarray): (n, dim) unit-length embeddings.
+        item_ids (sequence): n item ids (e.g., Reddit submission ids).
+        subreddits (sequence): n subreddit names.
+        created_utc (sequence): n creation timestamps (seconds since the epoch).
+        quantize (bool): Also write int8 codes and per-vector scales; searches
+            then scan the int8 data (4x less memory than float32).
+        keep_float32 (bool): With `quantize`, keep the float32 matrix on disk so
+            the top candidates can be re-scored at full precision. Only the
+            candidate rows are ever read from it.
+
+    Derived indexes already in `directory` (IVF files) are deleted, since their
+    row numbers refer to the old rows. The metadata file is written last, so a
+    partly written index has none.
+    """
+    if not quantize and not keep_float32:
+        raise ValueError("An index without quantization must keep its float32 vectors.")
+    os.makedirs(directory, exist_ok=True)
+    for name in os.listdir(directory):
+        if name.startswith(DERIVED_FILE_PREFIX) or name == INDEX_META_FILE:
+            os.remove(os.path.join(directory, name))
+    vectors = np.asarray(vectors, dtype=np.float32)
+    names = sorted({name.lower() for name in subreddits})
+    name_ids = {name: i for i, name in enumerate(names)}
+    subreddit_ids = np.fromiter((name_ids[name.lower()] for name in subreddits), dtype=np.int32, count=len(subreddits))
+    created_utc = np.asarray(created_utc, dtype=np.float64)
+
+    order = np.lexsort((created_utc, subreddit_ids))
+    offsets = np.zeros(len(names) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(subreddit_ids, minlength=len(names)), out=offsets[1:])
+
+    sorted_vectors = vectors[order]
+    if keep_float32:
+        np.save(os.path.join(directory, VECTORS_FILE), sorted_vectors)
+    if quantize:
+        codes, scales = quantize_int8(sorted_vectors)
+        np.save(os.path.join(directory, INT8_VECTORS_FILE), codes)
+        np.save(os.path.join(directory, SCALES_FILE), scales)
+    sorted_item_ids = np.asarray(item_ids, dtype=str)[order]
+    np.save(os.path.join(directory, ITEM_IDS_FILE), sorted_item_ids)
+    np.save(os.path.join(directory, CREATED_UTC_FILE), created_utc[order])
+    np.save(os.path.join(directory, SUBREDDIT_OFFSETS_FILE), offsets)
+    with open(os.path.join(directory, SUBREDDITS_FILE), 'w') as f:
+        json.dump(names, f)
+    with open(os.path.join(directory, INDEX_META_FILE), 'w') as f:
+        json.dump({'rows': len(order), 'content_hash': content_hash(sorted_vectors, sorted_item_ids)}, f)
+
+
+class EmbeddingIndex:
+    """
+    A dense embedding index searched by inner product.
+
+    The arrays are opened with `np.load(mmap_mode='r')`, so worker processes
+    that open the same index share the page cache instead of each holding a
+    private copy. Top-k search is a matrix-vector product over the candidate
+    rows followed by `np.argpartition`.
+
+    If the index was written with `quantize=True`, searches scan the int8 codes
+    (scores are `(codes @ q) * scales`) and, when the float32 matrix is also
+    present, re-score the best `k * rescore_factor` candidates exactly.
+    """
+
+    def __init__(self, vectors, item_ids, created_utc, subreddit_offsets, subreddits, codes=None, scales=None,
+                 content_hash=None):
+        if vectors is None and codes is None:
+            raise ValueError("An embedding index needs float32 vectors or int8 codes.")
+        self.vectors = vectors
+        self.codes = codes
+        self.scales = scales
+        self.item_ids = item_ids
+        self.created_utc = created_utc
+        self.subreddit_offsets = subreddit_offsets
+        self.subreddits = list(subreddits)
+        self._subreddit_ids = {name: i for i, name in enumerate(self.subreddits)}
+        self.content_hash = content_hash # Recorded by `write_index`; None for older indexes
+
+    @classmethod
+    def open(cls, directory, mmap=True):
+        """
+        Opens an index written by `write_index`.
+
+        Args:
+            directory (str): The index directory.
+            mmap (bool): Memory-map the arrays (default) instead of reading them.
+        """
+        mode = 'r' if mmap else None
+
+        def load_optional(name):
+            path = os.path.join(directory, name)
+            return np.load(path, mmap_mode=mode) if os.path.exists(path) else None
+
+        with open(os.path.join(directory, SUBREDDITS_FILE)) as f:
+            subreddits = json.load(f)
+        meta_path = os.path.join(directory, INDEX_META_FILE)
+        meta = {}
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+        return cls(
+            load_optional(VECTORS_FILE),
+            np.load(os.path.join(directory, ITEM_IDS_FILE), mmap_mode=mode),
+            np.load(os.path.join(directory, CREATED_UTC_FILE), mmap_mode=mode),
+            np.load(os.path.join(directory, SUBREDDIT_OFFSETS_FILE)),
+            subreddits,
+            codes=load_optional(INT8_VECTORS_FILE),
+            scales=load_optional(SCALES_FILE),
+            content_hash=meta.get('content_hash'),
+        )
+
+    def __len__(self):
+        return self.item_ids.shape[0]
+
+    @property
+    def dim(self):
+        return (self.codes if self.codes is not None else self.vectors).shape[1]
+
+    @property
+    def quantized(self):
+        return self.codes is not None
+
+    @property
+    def scan_nbytes(self):
+        """Bytes of vector data a full scan touches (int8 codes + scales if quantized)."""
+        if self.quantized:
+            return self.codes.nbytes + self.scales.nbytes
+        return self.vectors.nbytes
+
+    def subreddit_rows(self, subreddit):
+        """Returns the contiguous [start, end) row range of a subreddit ((0, 0) if unknown)."""
+        return self._row_range(subreddit, None, None)
+
+    def _row_range(self, subreddit, since, until):
+        """Returns the contiguous [start, end) row range for a subreddit/time filter."""
+        subreddit_id = self._subreddit_ids.get(subreddit.lower())
+        if subreddit_id is None:
+            return 0, 0
+        start, end = int(self.subreddit_offsets[subreddit_id]), int(self.subreddit_offsets[subreddit_id + 1])
+        times = self.created_utc[start:end]
+        if since is not None:
+            start += int(np.searchsorted(times, since, side='left'))
+        if until is not None:
+            end = int(self.subreddit_offsets[subreddit_id]) + int(np.searchsorted(times, until, side='left'))
+        return start, max(start, end)
+
+    def search(self, query_vector, k=10, subreddit=None, since=None, until=None, rescore=True,
+               rescore_factor=DEFAULT_RESCORE_FACTOR):
+        """
+        Returns the `k` rows most similar to `query_vector`.
+
+        Args:
+            query_vector (numpy.ndarray): A (dim,) unit-length query embedding.
+            k (int): Number of results.
+            subreddit (str, optional): Only search this subreddit.
+            since (float, optional): Only rows created at or after this timestamp.
+            until (float, optional): Only rows created before this timestamp.
+            rescore (bool): For quantized indexes with float32 vectors, re-score
+                the best `k * rescore_factor` int8 candidates at full precision.
+            rescore_factor (int): Candidate over-fetch factor for re-scoring.
+
+        Returns:
+            list: (item_id, score) tuples, best first.
+        """
+        query_vector = np.asarray(query_vector, dtype=np.float32)
+        if subreddit is not None:
+            start, end = self._row_range(subreddit, since, until)
+            since = until = None  # Already applied by the row range
+        else:
+            start, end = 0, len(self)
+
+        rescoring = self.quantized and rescore and self.vectors is not None
+        rows, scores = self._scan(query_vector, k * rescore_factor if rescoring else k, start, end, since, until)
+        if rescoring and rows.size:
+            exact = self.vectors[np.sort(rows)] @ query_vector
+            keep, scores = _top_k(exact, k)
+            rows = np.sort(rows)[keep]
+        return self._results(rows, scores)
+
+    def _scan(self, query_vector, k, start, end, since, until):
+        """Block-wise top-k over rows [start, end), optionally restricted to a time window."""
+        best_rows = np.empty(0, dtype=np.int64)
+        best_scores = np.empty(0, dtype=np.float32)
+        widen_buffer = np.empty((INT8_WIDEN_ROWS, self.dim), dtype=np.float32) if self.quantized else None
+        for block_start in range(start, end, SEARCH_BLOCK_ROWS):
+            block_end = min(block_start + SEARCH_BLOCK_ROWS, end)
+            if self.quantized:
+                scores = self._int8_scores(query_vector, block_start, block_end, widen_buffer)
+            else:
+                scores = self.vectors[block_start:block_end] @ query_vector
+            if since is not None or until is not None:
+                times = self.created_utc[block_start:block_end]
+                in_window = np.ones(block_end - block_start, dtype=bool)
+                if since is not None:
+                    in_window &= times >= since
+                if until is not None:
+                    in_window &= times < until
+                scores = np.where(in_window, scores, -np.inf)
+            rows, block_scores = _top_k(scores, k)
+            best_rows = np.concatenate([best_rows, rows + block_start])
+            best_scores = np.concatenate([best_scores, block_scores])
+            keep, best_scores = _top_k(best_scores, k)
+            best_rows = best_rows[keep]
+        finite = np.isfinite(best_scores)
+        return best_rows[finite], best_scores[finite]
+
+    def _int8_scores(self, query_vector, start, end, widen_buffer):
+        """Returns (codes[start:end] @ q) * scales[start:end], widening one sub-block at a time."""
+        scores = np.empty(end - start, dtype=np.float32)
+        for sub_start in range(start, end, INT8_WIDEN_ROWS):
+            sub_end = min(sub_start + INT8_WIDEN_ROWS, end)
+            widened = widen_buffer[:sub_end - sub_start]
+            np.copyto(widened, self.codes[sub_start:sub_end], casting='unsafe')
+            np.matmul(widened, query_vector, out=scores[sub_start - start:sub_end - start])
+        scores *= self.scales[start:end]
+        return scores
+
+    def _results(self, rows, scores):
+        return [(str(self.item_ids[row]), float(score)) for row, score in zip(rows, scores)]
+
+
+def _top_k(scores, k):
+    """Returns (indices, scores) of the k largest scores, best first."""
+    if scores.size > k:
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(scores.size)
+    order = np.argsort(-scores[candidates], kind='stable')
+    return candidates[order], scores[candidates][order]
+
+
+def build_from_corpus(store, directory, embedder=None, quantize=False):
+    """
+    Embeds every stored submission (title + body) and writes the index.
+
+    Args:
+        store (app.storage.CorpusStore): The corpus to index.
+        directory (str): Output index directory.
+        embedder (HashingEmbedder, optional): The embedding function.
+        quantize (bool): Also store int8-quantized vectors (see `write_index`).
+
+    Returns:
+        int: The number of indexed submissions.
+    """
+    embedder = embedder or HashingEmbedder()
+    rows = store.connection.execute(
+        """SELECT sub.id, s.name, sub.title, sub.selftext, COALESCE(sub.created_utc, 0)
+           FROM submissions sub JOIN subreddits s ON s.id = sub.subreddit_id""").fetchall()
+    vectors = embedder.embed_batch([f"{title}\n{selftext or ''}" for _, _, title, selftext, _ in rows])
+    write_index(directory, vectors.reshape(len(rows), embedder.dim),
+                [row[0] for row in rows], [row[1] for row in rows], [row[4] for row in rows], quantize=quantize)
+    return len(rows)
+
+
+def main(argv=None):
+    """
+    Command-line entry point: builds an embedding index from a corpus store.
+
+    Example:
+        python -m app.embeddings --db corpus.db --out embedding_index
+    """
+    from app.storage import CorpusStore
+
+    parser = argparse.ArgumentParser(description="Build the memory-mapped embedding index from the corpus store.")
+    parser.add_argument('--db', default=os.getenv('CORPUS_DB_PATH', 'corpus.db'), help="SQLite corpus path.")
+    parser.add_argument('--out', default=os.getenv('EMBEDDING_INDEX_PATH', 'embedding_index'),
+                        help="Output index directory.")
+    parser.add_argument('--dim', type=int, default=DEFAULT_DIM, help="Embedding width.")
+    parser.add_argument('--quantize', action='store_true', help="Also store int8-quantized vectors.")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    count = build_from_corpus(CorpusStore(args.db), args.out, HashingEmbedder(args.dim), quantize=args.quantize)
+    logging.info(f"Wrote embedding index with {count} vectors to {args.out}.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+import re
+
+import numpy as np
+
+from app.bm25 import BM25Index, tokenize
+from app.core_utils import describe_subreddits, subreddit_contexts
+
+# Sentence boundaries used to pick the most relevant snippet of a passage.
+SENTENCE_SPLIT_PATTERN = re.compile(r'(?<=[.!?])\s+|\n+')
+
+SNIPPET_MAX_CHARS = 240
+
+
+def passages_from_subreddit_info(subreddit_info):
+    """
+    Turns the context fetched for a subreddit into rankable passages.
+
+    Args:
+        subreddit_info (dict): The context dict built by `send_message`. Posts are
+            read from its optional 'posts' list (dicts with 'title', 'selftext',
+            'permalink' and 'score'). A context for several subreddits
+            contributes the posts of each of them.
+
+    Returns:
+        list: Passage dicts with 'title', 'text', 'permalink' and 'score' keys.
+    """
+    passages = []
+    for context in subreddit_contexts(subreddit_info):
+        for post in context.get('posts') or []:
+            title = post.get('title', '')
+            body = post.get('selftext', '')
+            passages.append({
+                'title': title,
+                'text': f"{title}\n{body}" if body else title,
+                'permalink': post.get('permalink'),
+                'score': post.get('score', 0),
+            })
+    return passages
+
+
+def rank_passages(question, passages, top_k=3):
+    """
+    Ranks passages against a question with Okapi BM25.
+
+    Args:
+        question (str): The user's question.
+        passages (list): Passage dicts with a 'text' key.
+        top_k (int): Maximum number of passages to return.
+
+    Returns:
+        list: Up to `top_k` (bm25_score, passage) tuples with a positive score,
+              best first. Ties are broken by the passage's Reddit score.
+    """
+    if not passages:
+        return []
+    index = BM25Index([passage['text'] for passage in passages])
+    reddit_scores = np.array([passage.get('score') or 0 for passage in passages])
+    return [(score, passages[i]) for i, score in index.top_k(question, top_k, tie_breaker=reddit_scores)]
+
+
+def best_snippet(question, text, max_chars=SNIPPET_MAX_CHARS):
+    """
+    Returns the sentence of `text` that shares the most terms with the question,
+    truncated to `max_chars`.
+    """
+    query_terms = set(tokenize(question))
+    sentences = [s.strip() for s in SENTENCE_SPLIT_PATTERN.split(text or '') if s.strip()]
+    if not sentences:
+        return ''
+    best = max(sentences, key=lambda sentence: len(query_terms.intersection(tokenize(sentence))))
+    if len(best) > max_chars:
+        best = best[:max_chars - 3].rstrip() + '...'
+    return best
+
+
+def extractive_answer(question, subreddit_info, top_k=3):
+    """
+    Answers a question without an LLM by quoting the best matching posts.
+
+    This runs in milliseconds over the context `send_message` already fetched,
+    so it is used both as an explicit fast path and as the fallback when the
+    LLM misses its deadline.
+
+    Args:
+        question (str): The user's question.
+        subreddit_info (dict): The fetched subreddit context (see
+            `passages_from_subreddit_info`).
+        top_k (int): Number of snippets to return.
+
+    Returns:
+        dict or None: {'reply': str, 'sources': list} where each source has
+                      'title', 'snippet', 'permalink' and 'score', or None if no
+                      passage matches the question.
+    """
+    ranked = rank_passages(question, passages_from_subreddit_info(subreddit_info), top_k=top_k)
+    if not ranked:
+        return None
+
+    sources = []
+    lines = [f"Top matching posts from {describe_subreddits(subreddit_info)} for '{question}':"]
+    for i, (_, passage) in enumerate(ranked, start=1):
+        snippet = best_snippet(question, passage['text'])
+        sources.append({
+            'title': passage['title'],
+            'snippet': snippet,
+            'permalink': passage['permalink'],
+            'score': passage['score'],
+        })
+        line = f"{i}. {passage['title']}"
+        if snippet and snippet != passage['title']:
+            line += f" - {snippet}"
+        if passage['permalink']:
+            line += f" ({passage['permalink']})"
+        lines.append(line)
+    return {'reply': "\n".join(lines), 'sources': sources}
@@ -0,0 +1,200 @@
+import argparse
+import logging
+import os
+
+import praw
+
+from app.analytics import AnalyticsStore
+from app.columnar import ColumnarStore
+from app.dedup import DEFAULT_THRESHOLD, MinHasher
+from app.sentiment import SentimentStore
+from app.storage import CorpusStore
+from app.trends import TrendDetector
+
+# Comments fetched per submission when crawling. Only already loaded comments are
+# kept ("load more comments" stubs are not expanded) to bound API calls.
+DEFAULT_COMMENTS_PER_SUBMISSION = 20
+
+
+def normalize_submission(submission):
+    """
+    Converts a PRAW Submission into the plain dict stored in the corpus.
+
+    Args:
+        submission (praw.models.Submission): The submission.
+
+    Returns:
+        dict: 'id', 'title', 'selftext', 'score', 'num_comments', 'permalink'
+              (absolute URL), 'author', 'created_utc', 'flair' and 'domain'.
+    """
+    return {
+        'id': submission.id,
+        'title': submission.title,
+        'selftext': submission.selftext or '',
+        'score': submission.score,
+        'num_comments': submission.num_comments,
+        'permalink': f"https://www.reddit.com{submission.permalink}",
+        'author': submission.author.name if submission.author else None,
+        'created_utc': submission.created_utc,
+        'flair': submission.link_flair_text,
+        'domain': submission.domain,
+    }
+
+
+def normalize_comment(comment, submission_id):
+    """
+    Converts a PRAW Comment into the plain dict stored in the corpus.
+
+    Args:
+        comment (praw.models.Comment): The comment.
+        submission_id (str): Id of the submission the comment belongs to.
+
+    Returns:
+        dict: 'id', 'submission_id', 'parent_id', 'author', 'body', 'score',
+              'created_utc' and 'permalink' (absolute URL).
+    """
+    return {
+        'id': comment.id,
+        'submission_id': submission_id,
+        'parent_id': comment.parent_id,
+        'author': comment.author.name if comment.author else None,
+        'body': comment.body,
+        'score': comment.score,
+        'created_utc': comment.created_utc,
+        'permalink': f"https://www.reddit.com{comment.permalink}",
+    }
+
+
+def crawl_subreddit(reddit, subreddit_name, store, post_limit=100, comments_per_submission=DEFAULT_COMMENTS_PER_SUBMISSION,
+                    index=None, columnar=None, sinks=(), near_duplicate_threshold=DEFAULT_THRESHOLD):
+    """
+    Fetches a subreddit's details, hot posts and their top comments from the
+    Reddit API and writes them to the corpus store.
+
+    Args:
+        reddit (praw.Reddit): An initialized PRAW client.
+        subreddit_name (str): The subreddit to crawl.
+        store (CorpusStore): Destination store.
+        post_limit (int): Number of hot posts to fetch.
+        comments_per_submission (int): Maximum comments kept per post.
+        index (SegmentedIndex, optional): A live search index that the crawled
+            submissions are also added to (re-crawled posts replace their old
+            version).
+        columnar (ColumnarStore, optional): A columnar store that the crawled
+            items are also written to, for analytics scans.
+        sinks (iterable): Streaming consumers (e.g. AnalyticsStore,
+            TrendDetector) whose add_submissions(subreddit, submissions) and
+            add_comments(subreddit, comments) receive the crawled items.
+        near_duplicate_threshold (float): Items whose estimated Jaccard
+            similarity (MinHash) to an earlier item of the subreddit reaches
+            this are collapsed: kept in the store but left out of its search
+            index and of `index`. 0 disables the check.
+
+    Returns:
+        tuple: (number_of_submissions, number_of_comments) written.
+    """
+    subreddit_obj = reddit.subreddit(subreddit_name)
+    store.upsert_subreddit({
+        'name': subreddit_name,
+        'display_name': subreddit_obj.display_name,
+        'public_description': subreddit_obj.public_description,
+        'subscribers': subreddit_obj.subscribers,
+    })
+
+    submissions, comments = [], []
+    for submission in subreddit_obj.hot(limit=post_limit):
+        submissions.append(normalize_submission(submission))
+        submission.comment_sort = 'top'
+        submission.comments.replace_more(limit=0)
+        for comment in submission.comments.list()[:comments_per_submission]:
+            comments.append(normalize_comment(comment, submission.id))
+
+    store.add_submissions(subreddit_name, submissions)
+    store.add_comments(subreddit_name, comments)
+    duplicate_ids = set()
+    if near_duplicate_threshold:
+        hasher = MinHasher()
+        duplicate_ids.update(store.collapse_near_duplicates(
+            subreddit_name, 'submission', [submission['id'] for submission in submissions],
+            hasher.signatures([f"{submission['title']}\n{submission['selftext']}" for submission in submissions]),
+            threshold=near_duplicate_threshold))
+        collapsed_comments = store.collapse_near_duplicates(
+            subreddit_name, 'comment', [comment['id'] for comment in comments],
+            hasher.signatures([comment['body'] for comment in comments]), threshold=near_duplicate_threshold)
+        if duplicate_ids or collapsed_comments:
+            logging.info(f"r/{subreddit_name}: collapsed {len(duplicate_ids)} near-duplicate submissions and "
+                         f"{len(collapsed_comments)} near-duplicate comments.")
+    if index is not None:
+        index.add_many([{'id': submission['id'], 'text': f"{submission['title']}\n{submission['selftext']}",
+                         'subreddit': subreddit_name} for submission in submissions
+                        if submission['id'] not in duplicate_ids])
+        for item_id in duplicate_ids:
+            index.delete(item_id)  # A re-crawled post may have become a duplicate
+    if columnar is not None:
+        columnar.add_submissions(subreddit_name, submissions)
+        columnar.add_comments(subreddit_name, comments)
+        columnar.flush()
+    for sink in sinks:
+        sink.add_submissions(subreddit_name, submissions)
+        sink.add_comments(subreddit_name, comments)
+    logging.info(f"Ingested r/{subreddit_name}: {len(submissions)} submissions, {len(comments)} comments.")
+    return len(submissions), len(comments)
+
+
+def log_crawl_summary(subreddit_name, analytics, trends, sentiment):
+    """Logs what the streaming sinks saw of a crawled subreddit."""
+    activity = analytics.summary(subreddit_name)
+    trending = trends.trending(subreddit_name, k=5)
+    overall = sentiment.summary(subreddit_name)
+    logging.info(f"r/{subreddit_name}: "
+                 f"peak hour (UTC) {activity['peak_hour_utc'] if activity else 'n/a'}, "
+                 f"trending {[entry['term'] for entry in trending['terms']] if trending else []}, "
+                 f"mean sentiment {overall['mean'] if overall else 'n/a'}.")
+
+
+def main(argv=None, sinks=()):
+    """
+    Command-line entry point: crawls one or more subreddits into a corpus store.
+
+    The crawled items also stream into an AnalyticsStore, a TrendDetector and a
+    SentimentStore, whose view of each subreddit is logged, and into `sinks`
+    (e.g. the aggregates of a server running the crawl in-process). A separate
+    server process rebuilds its aggregates from the corpus store on startup.
+
+    Example:
+        python -m app.ingest --db corpus.db learnpython python --posts 200
+    """
+    parser = argparse.ArgumentParser(description="Ingest subreddit posts and comments into the local corpus store.")
+    parser.add_argument('subreddits', nargs='+', help="Subreddit names (without the r/ prefix).")
+    parser.add_argument('--db', default=os.getenv('CORPUS_DB_PATH', 'corpus.db'), help="SQLite corpus path.")
+    parser.add_argument('--posts', type=int, default=100, help="Hot posts to fetch per subreddit.")
+    parser.add_argument('--comments', type=int, default=DEFAULT_COMMENTS_PER_SUBMISSION,
+                        help="Comments kept per post.")
+    parser.add_argument('--columnar', default=os.getenv('COLUMNAR_STORE_PATH'),
+                        help="Also write the items to a columnar store in this directory.")
+    parser.add_argument('--near-duplicate-threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="Collapse items at least this similar (MinHash Jaccard estimate) to an earlier one; 0 disables.")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    reddit = praw.Reddit(
+        client_id=os.getenv('REDDIT_CLIENT_ID'),
+        client_secret=os.getenv('REDDIT_CLIENT_SECRET'),
+        user_agent=os.getenv('REDDIT_USER_AGENT'),
+        check_for_async=False,
+    )
+    store = CorpusStore(args.db)
+    columnar = ColumnarStore(args.columnar) if args.columnar else None
+    if columnar is not None and columnar.compact():
+        logging.info(f"Merged the day partitions of {args.columnar} into month partitions.")
+    analytics, trends, sentiment = AnalyticsStore(), TrendDetector(), SentimentStore()
+    for name in args.subreddits:
+        crawl_subreddit(reddit, name, store, post_limit=args.posts, comments_per_submission=args.comments,
+                        columnar=columnar, sinks=(analytics, trends, sentiment, *sinks),
+                        near_duplicate_threshold=args.near_duplicate_threshold)
+        log_crawl_summary(name, analytics, trends, sentiment)
+    store.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,147 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+from app import metrics
+from app.core_utils import describe_subreddits
+
+# System prompt shared by every request. It is the first part of the canonical
+# prompt prefix, so it must stay byte-identical across requests.
+SYSTEM_PROMPT = (
+    "You are a helpful assistant that answers questions about Reddit communities. "
+    "Use the subreddit context below when it is relevant, and say so when it is not."
+)
+
+# Separators between prompt sections. The question always comes last so that
+# everything before it (system prompt + subreddit context) forms a stable prefix.
+CONTEXT_HEADER = "\n\n### Subreddit context\n"
+RETRIEVED_HEADER = "\n\n### Retrieved for this question\n"
+QUESTION_HEADER = "\n\n### Question\n"
+
+# Context fields that depend on the question: the posts retrieved for it and the
+# filters it set. The sentiment of those posts ('sentiment' -> 'posts') does too.
+QUESTION_CONTEXT_KEYS = ('posts', 'filters')
+
+
+def _split_subreddit_context(context):
+    stable = {key: value for key, value in context.items() if key not in QUESTION_CONTEXT_KEYS and key != 'sentiment'}
+    retrieved = {key: context[key] for key in QUESTION_CONTEXT_KEYS if key in context}
+    sentiment = dict(context.get('sentiment') or {})
+    if 'posts' in sentiment:
+        retrieved['posts_sentiment'] = sentiment.pop('posts')
+    if sentiment:
+        stable['sentiment'] = sentiment
+    if retrieved:
+        retrieved['subreddit'] = context.get('display_name', context.get('name'))
+    return stable, retrieved
+
+
+def split_context(subreddit_info):
+    """
+    Splits a subreddit context into its per-subreddit part (about, rules,
+    activity, trending terms, subreddit-wide sentiment) and the part retrieved
+    for the question (posts, filters, sentiment of those posts).
+
+    Args:
+        subreddit_info (dict): A single subreddit's context, or {'subreddits': [...]}.
+
+    Returns:
+        tuple: (stable, retrieved) dicts; `retrieved` is empty if nothing was
+               retrieved for the question.
+    """
+    if 'subreddits' not in subreddit_info:
+        return _split_subreddit_context(subreddit_info)
+    parts = [_split_subreddit_context(context) for context in subreddit_info['subreddits']]
+    stable = {key: value for key, value in subreddit_info.items() if key != 'subreddits'}
+    stable['subreddits'] = [part for part, _ in parts]
+    retrieved = [part for _, part in parts if part]
+    return stable, ({'subreddits': retrieved} if retrieved else {})
+
+
+def _canonical_json(value):
+    return json.dumps(value, sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=str)
+
+
+def build_prompt(question, subreddit_info=None):
+    """
+    Builds the LLM prompt with a deterministic, canonical prefix.
+
+    The prefix contains the system prompt followed by the per-subreddit part of
+    the context, serialized as JSON with sorted keys and fixed separators. Every
+    question about the same subreddit therefore shares a byte-identical prefix,
+    regardless of the order in which the context dict was populated, which lets
+    providers and local servers reuse their cached prefix (KV) computation. The
+    posts retrieved for the question and the question itself follow the prefix.
+
+    Args:
+        question (str): The user's question.
+        subreddit_info (dict, optional): Context about the queried subreddit.
+
+    Returns:
+        tuple: (prefix, prompt) where `prompt` starts with `prefix`.
+    """
+    prefix = SYSTEM_PROMPT
+    prompt_tail = ''
+    if subreddit_info:
+        stable, retrieved = split_context(subreddit_info)
+        prefix += CONTEXT_HEADER + _canonical_json(stable)
+        if retrieved:
+            prompt_tail = RETRIEVED_HEADER + _canonical_json(retrieved)
+    prompt = prefix + prompt_tail + QUESTION_HEADER + question
+    return prefix, prompt
+
+
+class PrefixCacheTracker:
+    """
+    Tracks how often prompt prefixes could be served from a prefix (KV) cache.
+
+    Backends that report cached prompt tokens should pass that figure to
+    `record`; for the mock backend the tracker simulates a provider-side cache
+    locally with an LRU of prefix hashes. Hits, misses and the running hit rate
+    are published as metrics (`<name>_hits`, `<name>_misses`, `<name>_hit_rate`).
+    """
+
+    def __init__(self, capacity=1024, name='llm_prefix_cache'):
+        self.capacity = capacity
+        self._entries = OrderedDict()  # prefix hash -> None, in LRU order
+        self._lock = threading.Lock()
+        self.hits = metrics.counter(f'{name}_hits', 'Prompts whose prefix was already cached.')
+        self.misses = metrics.counter(f'{name}_misses', 'Prompts whose prefix had to be computed.')
+        self.hit_rate = metrics.gauge(f'{name}_hit_rate', 'Fraction of prompts with a cached prefix.')
+
+    def record(self, prefix, backend_cached_tokens=None):
+        """
+        Records one prompt and returns True if its prefix was a cache hit.
+
+        Args:
+            prefix (str): The canonical prompt prefix.
+            backend_cached_tokens (int, optional): Cached token count reported by
+                the backend. When given, it decides hit/miss instead of the local
+                simulation.
+        """
+        if backend_cached_tokens is not None:
+            hit = backend_cached_tokens > 0
+        else:
+            key = hashlib.sha256(prefix.encode('utf-8')).digest()
+            with self._lock:
+                hit = key in self._entries
+                if hit:
+                    self._entries.move_to_end(key)
+                else:
+                    self._entries[key] = None
+                    if len(self._entries) > self.capacity:
+                        self._entries.popitem(last=False)
+
+        (self.hits if hit else self.misses).inc()
+        total = self.hits.value + self.misses.value
+        self.hit_rate.set(self.hits.value / total if total else 0.0)
+        return hit
+
+
+prefix_cache = PrefixCacheTracker()
+
+
 def get_llm_response(question, subreddit_info=None, praw_available_for_llm=True):
     """
     Generates a mock response simulating an LLM's answer.
@@ -12,7 +156,9 @@ def get_llm_response(question, subreddit_info=None, praw_available_for_llm=True)
         question (str): The user's question (potentially stripped of subreddit tags).
         subreddit_info (dict, optional): A dictionary containing details about the
             queried subreddit (e.g., 'display_name', 'public_description',
-            'subscribers'). Defaults to None if no info was fetched or applicable.
+            'subscribers'), or {'subreddits': [...]} holding one such dict per
+            subreddit when the question mentioned several. Defaults to None if
+            no info was fetched or applicable.
         praw_available_for_llm (bool): Flag indicating if PRAW was considered
             available/functional at the time of the call. This helps tailor
             the mock response.
@@ -20,7 +166,18 @@ def get_llm_response(question, subreddit_info=None, praw_available_for_llm=True)
     Returns:
         str: A string representing the LLM's (mocked) answer.
     """
-    if subreddit_info:
+    # Build the prompt a real backend would receive. The mock stands in for the
+    # provider's prefix cache by tracking the canonical prefix locally.
+    prefix, _prompt = build_prompt(question, subreddit_info)
+    prefix_cache.record(prefix)
+
+    if subreddit_info and 'subreddits' in subreddit_info:
+        # Case 1a: The question mentioned several subreddits; some may have been unavailable.
+        unavailable = ''.join(f" r/{entry['name']} could not be fetched." for entry in subreddit_info.get('unavailable', []))
+        return (f"LLM mock response: Based on live info from {describe_subreddits(subreddit_info)}, "
+                f"the answer to '{question}' is [mocked answer comparing these subreddits].{unavailable}")
+
+    elif subreddit_info:
         # Case 1: Subreddit context was successfully fetched.
         subreddit_name = subreddit_info.get('display_name', subreddit_info.get('name', 'unknown'))
         description = subreddit_info.get('public_description', 'No description available.')
@@ -43,3 +200,61 @@ def get_llm_response(question, subreddit_info=None, praw_available_for_llm=True)
         # The response reflects that no live Reddit data could be accessed.
         return (f"LLM mock response: I currently don't have access to live Reddit data. "
                 f"Regarding your question '{question}', the general answer without subreddit context is [mocked generic answer, PRAW was INACTIVE].")
+
+
+def get_llm_responses(batch):
+    """
+    Generates responses for a batch of questions in one backend call.
+
+    This is the entry point used by the micro-batching dispatcher
+    (`app.batching.MicroBatcher`). A real LLM backend would submit all prompts
+    in a single batched request; the mock simply answers each one in turn.
+
+    Args:
+        batch (list): A list of (question, subreddit_info, praw_available_for_llm)
+            tuples, with the same meaning as the arguments of `get_llm_response`.
+
+    Returns:
+        list: One entry per request, in the same order. Each entry is either the
+              response string or the exception raised while generating it, so
+              that a failure is reported only to the request that caused it.
+    """
+    responses = []
+    for question, subreddit_info, praw_available_for_llm in batch:
+        try:
+            responses.append(get_llm_response(question, subreddit_info, praw_available_for_llm=praw_available_for_llm))
+        except Exception as e:
+            responses.append(e)
+    return responses
+
+
+def stream_llm_response(question, subreddit_info=None, praw_available_for_llm=True, cancel_token=None, words_per_chunk=4):
+    """
+    Streams a (mock) LLM response as a sequence of text chunks.
+
+    A real backend would yield tokens as they are generated; the mock splits the
+    full mock response into small chunks. Before each chunk the cancellation
+    token is checked, so generation stops as soon as the client goes away.
+
+    Args:
+        question, subreddit_info, praw_available_for_llm: As for `get_llm_response`.
+        cancel_token (app.cancellation.CancellationToken, optional): Token checked
+            before each chunk.
+        words_per_chunk (int): Number of words per yielded chunk.
+
+    Yields:
+        str: The next chunk of the response. Concatenating all chunks gives the
+             full response.
+
+    Raises:
+        app.cancellation.RequestCancelled: If the token is cancelled mid-stream.
+    """
+    reply = get_llm_response(question, subreddit_info, praw_available_for_llm=praw_available_for_llm)
+    words = reply.split(' ')
+    for i in range(0, len(words), words_per_chunk):
+        if cancel_token is not None:
+            cancel_token.raise_if_cancelled()
+        chunk = ' '.join(words[i:i + words_per_chunk])
+        if i + words_per_chunk < len(words):
+            chunk += ' '
+        yield chunk
@@ -0,0 +1,178 @@
+import threading
+
+# Default histogram bucket boundaries.
+# Latency buckets are in milliseconds; size buckets count items.
+LATENCY_MS_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+
+class Counter:
+    """
+    A monotonically increasing counter (e.g., number of shed requests).
+    """
+
+    def __init__(self, name, description=''):
+        self.name = name
+        self.description = description
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self):
+        return self._value
+
+    def snapshot(self):
+        return {'type': 'counter', 'description': self.description, 'value': self._value}
+
+
+class Gauge:
+    """
+    A value that can go up and down (e.g., current queue length).
+    """
+
+    def __init__(self, name, description=''):
+        self.name = name
+        self.description = description
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def set(self, value):
+        with self._lock:
+            self._value = value
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount=1):
+        with self._lock:
+            self._value -= amount
+
+    @property
+    def value(self):
+        return self._value
+
+    def snapshot(self):
+        return {'type': 'gauge', 'description': self.description, 'value': self._value}
+
+
+class Histogram:
+    """
+    A cumulative bucketed histogram, in the style of Prometheus histograms.
+
+    Each observation increments every bucket whose upper bound ('le') is
+    greater than or equal to the observed value, plus the implicit '+Inf' bucket.
+    """
+
+    def __init__(self, name, buckets, description=''):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)  # Last slot is the '+Inf' bucket
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self._sum += value
+            self._count += 1
+            for i, upper_bound in enumerate(self.buckets):
+                if value <= upper_bound:
+                    self._counts[i] += 1
+            self._counts[-1] += 1
+
+    @property
+    def count(self):
+        return self._count
+
+    @property
+    def sum(self):
+        return self._sum
+
+    def snapshot(self):
+        with self._lock:
+            buckets = {str(upper_bound): self._counts[i] for i, upper_bound in enumerate(self.buckets)}
+            buckets['+Inf'] = self._counts[-1]
+            return {
+                'type': 'histogram',
+                'description': self.description,
+                'buckets': buckets,
+                'count': self._count,
+                'sum': self._sum,
+            }
+
+
+# --- Metric registries ---
+# Metrics are registered by name so that modules can share them without
+# passing objects around. Re-registering a name returns the existing metric.
+# Components that belong to one app take that app's Registry; the module-level
+# functions below use the process-wide one.
+
+class Registry:
+    """
+    A set of metrics keyed by name.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, name, factory):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = factory()
+                self._metrics[name] = metric
+            return metric
+
+    def counter(self, name, description=''):
+        """Returns the registered Counter called `name`, creating it if needed."""
+        return self._get_or_create(name, lambda: Counter(name, description))
+
+    def gauge(self, name, description=''):
+        """Returns the registered Gauge called `name`, creating it if needed."""
+        return self._get_or_create(name, lambda: Gauge(name, description))
+
+    def histogram(self, name, buckets=LATENCY_MS_BUCKETS, description=''):
+        """Returns the registered Histogram called `name`, creating it if needed."""
+        return self._get_or_create(name, lambda: Histogram(name, buckets, description))
+
+    def snapshot(self):
+        """
+        Returns a JSON-serializable snapshot of every registered metric,
+        keyed by metric name.
+        """
+        with self._lock:
+            metrics = list(self._metrics.items())
+        return {name: metric.snapshot() for name, metric in sorted(metrics)}
+
+
+_registry = Registry()
+
+
+def counter(name, description=''):
+    """Returns the process-wide Counter called `name`, creating it if needed."""
+    return _registry.counter(name, description)
+
+
+def gauge(name, description=''):
+    """Returns the process-wide Gauge called `name`, creating it if needed."""
+    return _registry.gauge(name, description)
+
+
+def histogram(name, buckets=LATENCY_MS_BUCKETS, description=''):
+    """Returns the process-wide Histogram called `name`, creating it if needed."""
+    return _registry.histogram(name, buckets, description)
+
+
+def snapshot():
+    """
+    Returns a JSON-serializable snapshot of every process-wide metric,
+    keyed by metric name.
+    """
+    return _registry.snapshot()
@@ -1,17 +1,86 @@
 import os
+import json
+import socket
+import sqlite3
+import threading
+from contextlib import nullcontext
+from concurrent.futures import CancelledError, ThreadPoolExecutor, TimeoutError as FutureTimeoutError, as_completed, wait
 import praw
 import prawcore # For more specific PRAW exceptions
-from flask import render_template, request, jsonify
-from app import app # The Flask application instance
-from app.llm_utils import get_llm_response
-from app.core_utils import parse_subreddit_and_question
+import requests
+from flask import Blueprint, current_app, has_app_context, render_template, request, jsonify, Response
+from flask_sock import Sock
+from simple_websocket import ConnectionClosed
+from werkzeug.local import LocalProxy
+from app import llm_utils, metrics
+from app.admission import AdmissionController, AdmissionRejected
+from app.analytics import AnalyticsStore, RETENTION_DAYS
+from app.autocomplete import MAX_SUGGESTIONS, SubredditNameIndex
+from app.batching import MicroBatcher
+from app.bm25 import select_context_posts
+from app.cancellation import CancellationRegistry, CancellationToken, DuplicateRequest, RequestCancelled
+from app.columnar import ColumnarStore
+from app.core_utils import parse_query
+from app.dedup import MinHasher, collapse_near_duplicates
+from app.extractive import extractive_answer
+from app.ann import DEFAULT_NPROBE, IVFIndex
+from app.embeddings import EmbeddingIndex, HashingEmbedder
+from app.segments import SegmentedIndexCache
+from app.sentiment import SentimentStore, summarize_scores
+from app.spelling import SubredditSpeller
+from app.storage import CorpusStore
+from app.trends import TrendDetector
 import logging
 
-# Configure basic server-side logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# The chat routes, registered on each application by `app.create_app`.
+bp = Blueprint('chat', __name__)
+sock = Sock() # WebSocket routes, registered on `bp`
+
+# --- Per-App State ---
+# The corpus store, embedding index, analytics rollups, trending terms,
+# sentiment aggregates, LLM batcher, LLM admission controller, cancellation
+# registry, live index and their metrics belong to each application (a `ChatState`, see below, built by `app.create_app`). The
+# module-level names below are proxies to the current app's state, so the code
+# reads them like module globals (and tests can still patch them). Outside an
+# application context (offline batches, tests inspecting the registry) they
+# resolve to the default application's state (`from app import app`).
+
+def current_state():
+    """Returns the `ChatState` of the current application, or of the default one outside an app context."""
+    if has_app_context():
+        return current_app.extensions['chat']
+    from app import app as default_app # Created on first use
+    return default_app.extensions['chat']
+
+class _StateProxy(LocalProxy):
+    # Not awaitable (LocalProxy forwards __await__), so unittest.mock patches
+    # these names with a MagicMock rather than an AsyncMock.
+    __await__ = None
+
+def _state_proxy(name):
+    return _StateProxy(lambda: getattr(current_state(), name))
+
+def _resolve(value):
+    """The object behind a state proxy (so `is None` checks see the app's value); other values as they are."""
+    return value._get_current_object() if isinstance(value, LocalProxy) else value
+
+def _request_owner():
+    """The owner a request's cancellation registration is scoped to: the client's address."""
+    return request.remote_addr
+
+def _with_app_context(fn):
+    """Wraps `fn` to run in the current application's context, for pool threads."""
+    if not has_app_context():
+        return fn
+    application = current_app._get_current_object()
+
+    def run(*args, **kwargs):
+        with application.app_context():
+            return fn(*args, **kwargs)
+    return run
 
 # --- PRAW (Reddit API) Initialization ---
-# Attempt to initialize PRAW if credentials are available in environment variables.
+# PRAW is used if credentials are available in environment variables.
 # This allows the application to run without PRAW if not configured,
 # falling back to LLM responses without Reddit context.
 
@@ -21,53 +90,881 @@ REDDIT_USER_AGENT = os.getenv('REDDIT_USER_AGENT')
 
 # Global flag indicating if PRAW client is available and initialized.
 praw_available = bool(REDDIT_CLIENT_ID and REDDIT_CLIENT_SECRET and REDDIT_USER_AGENT)
-reddit = None  # PRAW Reddit instance
+reddit = None  # PRAW Reddit instance, created per process by init_worker_resources()
 
-if praw_available:
+def create_reddit_client(verify=True):
+    """
+    Creates a PRAW client with its own HTTP session.
+
+    Args:
+        verify (bool): Make a lightweight test call to check the credentials and
+            connectivity. It is made once, by the process that creates the app;
+            forked workers reuse its verdict.
+
+    Returns:
+        praw.Reddit or None: The client, or None if PRAW is not configured or
+              the test call failed (praw_available is then set to False).
+    """
+    global praw_available
+    if not praw_available:
+        if verify:
+            logging.warning("PRAW credentials (REDDIT_CLIENT_ID, REDDIT_CLIENT_SECRET, REDDIT_USER_AGENT) "
+                            "not found or incomplete in environment variables. Reddit integration will be skipped.")
+        return None
     try:
-        reddit = praw.Reddit(
+        client = praw.Reddit(
             client_id=REDDIT_CLIENT_ID,
             client_secret=REDDIT_CLIENT_SECRET,
             user_agent=REDDIT_USER_AGENT,
-            check_for_async=False  # Suitable for synchronous Flask app
+            check_for_async=False,  # Suitable for synchronous Flask app
+            requestor_kwargs={'session': requests.Session()},
         )
-        # Perform a lightweight test call to verify API credentials and connectivity.
-        logging.info("PRAW client configured. Attempting a test call to Reddit API...")
-        reddit.random_subreddit(nsfw=False) # Fetches a random SFW subreddit.
-        logging.info("PRAW initialized and Reddit API connection seems OK.")
+        if verify:
+            # Perform a lightweight test call to verify API credentials and connectivity.
+            logging.info("PRAW client configured. Attempting a test call to Reddit API...")
+            client.random_subreddit(nsfw=False) # Fetches a random SFW subreddit.
+            logging.info("PRAW initialized and Reddit API connection seems OK.")
+        return client
     except prawcore.exceptions.OAuthException as e:
         logging.error(f"PRAW OAuthException during initialization: {e}. "
                       "Please check REDDIT_CLIENT_ID, REDDIT_CLIENT_SECRET, and REDDIT_USER_AGENT.")
         praw_available = False # Mark PRAW as unavailable if auth fails
-        reddit = None
+        return None
     except Exception as e: # Catch other potential errors during PRAW initialization
         logging.error(f"An unexpected error occurred during PRAW initialization: {e}")
         praw_available = False
-        reddit = None
-else:
-    logging.warning("PRAW credentials (REDDIT_CLIENT_ID, REDDIT_CLIENT_SECRET, REDDIT_USER_AGENT) "
-                    "not found or incomplete in environment variables. Reddit integration will be skipped.")
+        return None
+
+# Number of hot posts fetched per subreddit as candidate context (100 is one page
+# of the Reddit API). The retrieval stage then keeps the LLM_CONTEXT_POST_LIMIT
+# posts most relevant to the question (BM25) for the LLM and the extractive answerer.
+REDDIT_CONTEXT_POST_LIMIT = int(os.getenv('REDDIT_CONTEXT_POST_LIMIT', '100'))
+LLM_CONTEXT_POST_LIMIT = int(os.getenv('LLM_CONTEXT_POST_LIMIT', '10'))
+# Post bodies are truncated to this many characters to bound prompt size.
+REDDIT_CONTEXT_SELFTEXT_CHARS = 1000
+
+def fetch_context_posts(subreddit_obj, limit=REDDIT_CONTEXT_POST_LIMIT, cancel_token=None, filters=None):
+    """
+    Fetches the current hot posts of a subreddit as plain dicts for use as
+    question context.
+
+    Args:
+        subreddit_obj (praw.models.Subreddit): The subreddit to read from.
+        limit (int): Maximum number of posts to fetch.
+        cancel_token (CancellationToken, optional): Checked before each post, so a
+            cancelled request stops paging through the listing.
+        filters (QueryFilters, optional): Inline query filters. They pick the
+            listing ('new', 'rising' or 'top' with its time window instead of
+            'hot') and drop posts with another flair or older than the cutoff.
+
+    Returns:
+        list: Dicts with 'id', 'title', 'selftext', 'score', 'num_comments',
+              'permalink' (an absolute URL), 'author', 'created_utc' and 'flair'
+              for each post.
+
+    Raises:
+        RequestCancelled: If the request is cancelled while fetching.
+    """
+    sort = filters.sort if filters else None
+    if sort == 'new':
+        listing = subreddit_obj.new(limit=limit)
+    elif sort == 'rising':
+        listing = subreddit_obj.rising(limit=limit)
+    elif sort == 'top':
+        listing = subreddit_obj.top(time_filter=filters.time_filter or 'all', limit=limit)
+    else:
+        listing = subreddit_obj.hot(limit=limit)
+    cutoff = filters.cutoff() if filters else None
+
+    posts = []
+    for submission in listing:
+        if cancel_token is not None:
+            cancel_token.raise_if_cancelled()
+        post = {
+            'id': submission.id,
+            'title': submission.title,
+            'selftext': (submission.selftext or '')[:REDDIT_CONTEXT_SELFTEXT_CHARS],
+            'score': submission.score,
+            'num_comments': submission.num_comments,
+            'permalink': f"https://www.reddit.com{submission.permalink}",
+            'author': submission.author.name if submission.author else None,
+            'created_utc': submission.created_utc,
+            'flair': submission.link_flair_text,
+        }
+        if filters and not filters.matches(post):
+            if sort == 'new' and cutoff is not None and post['created_utc'] < cutoff:
+                break # The 'new' listing is newest first: every later post is older still
+            continue
+        posts.append(post)
+    return posts
+
+# Candidate posts whose estimated Jaccard similarity (MinHash over word 3-grams)
+# to a higher-ranked candidate reaches NEAR_DUPLICATE_THRESHOLD are dropped
+# before retrieval, so reposts don't take several context slots (0 disables).
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv('NEAR_DUPLICATE_THRESHOLD', '0.8'))
+context_minhasher = MinHasher()
+
+# Live text search indexes of the candidate posts seen (fetched from Reddit or
+# loaded from the corpus store), one per subreddit. New and edited posts are
+# added incrementally, and the retrieval stage ranks a question's candidates
+# with one BM25 query instead of rebuilding an index whenever a subreddit's
+# listing changes. Each subreddit keeps its LIVE_INDEX_MAX_POSTS most recently
+# seen posts, and LIVE_INDEX_MAX_SUBREDDITS subreddits are kept (least recently
+# used dropped). A small seal threshold keeps the mutable buffer, re-indexed on
+# the next query after every add, cheap.
+LIVE_INDEX_SEAL_THRESHOLD = int(os.getenv('LIVE_INDEX_SEAL_THRESHOLD', '64'))
+LIVE_INDEX_MAX_POSTS = int(os.getenv('LIVE_INDEX_MAX_POSTS', '1000'))
+LIVE_INDEX_MAX_SUBREDDITS = int(os.getenv('LIVE_INDEX_MAX_SUBREDDITS', '256'))
+
+live_index = _state_proxy('live_index')
+
+# --- Local Corpus Store ---
+# Posts and comments ingested with `python -m app.ingest` are kept in a SQLite
+# store at CORPUS_DB_PATH, which backs /search. With CONTEXT_SOURCE=store the chat
+# pipeline reads subreddit context from the store instead of calling the Reddit
+# API during the request (falling back to the API for subreddits not ingested yet).
+CORPUS_DB_PATH = os.getenv('CORPUS_DB_PATH')
+CONTEXT_SOURCE = os.getenv('CONTEXT_SOURCE', 'reddit')
+SEARCH_MAX_LIMIT = 50
+
+corpus_store = _state_proxy('corpus_store') # CorpusStore or None, per app
+
+# The process-wide subreddit name index below is bootstrapped from the store
+# once, at import.
+_bootstrap_store = CorpusStore(CORPUS_DB_PATH) if CORPUS_DB_PATH else None
+
+# Optional memory-mapped embedding index (built with `python -m app.embeddings`).
+# In store mode its nearest neighbours to the question are added to the context.
+# If the directory also holds an IVF index (`python -m app.ann`), searches probe
+# IVF_NPROBE of its inverted lists instead of scanning the subreddit's rows.
+EMBEDDING_INDEX_PATH = os.getenv('EMBEDDING_INDEX_PATH')
+SEMANTIC_CONTEXT_LIMIT = 10
+IVF_NPROBE = int(os.getenv('IVF_NPROBE', str(DEFAULT_NPROBE)))
+
+embedding_index = _state_proxy('embedding_index')
+ivf_index = _state_proxy('ivf_index')
+embedder = _state_proxy('embedder')
+
+def open_embedding_index(path):
+    """
+    Opens the embedding index at `path` and the IVF index next to it, if any.
+
+    Returns:
+        tuple: (EmbeddingIndex, IVFIndex, HashingEmbedder), with None for
+               what could not be opened.
+    """
+    if not path:
+        return None, None, None
+    try:
+        index = EmbeddingIndex.open(path)
+    except (OSError, ValueError) as e:
+        logging.error(f"Could not open embedding index at {path}: {e}")
+        return None, None, None
+    logging.info(f"Opened embedding index at {path} ({len(index)} vectors).")
+    ivf = None
+    try:
+        if IVFIndex.exists(path):
+            ivf = IVFIndex.open(path)
+            if not ivf.built_from(index):
+                # Its source rows would point at the wrong posts (and subreddits).
+                logging.warning("The IVF index was not built from this embedding index (or predates its "
+                                "content hash); rebuild it with `python -m app.ann`. Using exact search.")
+                ivf = None
+            else:
+                logging.info(f"Opened IVF index ({ivf.num_lists} lists, nprobe {IVF_NPROBE}).")
+    except (OSError, ValueError) as e:
+        logging.error(f"Could not open the IVF index at {path}: {e}")
+        ivf = None
+    return index, ivf, HashingEmbedder(index.dim)
+
+def semantic_search(question, subreddit_name, k=SEMANTIC_CONTEXT_LIMIT):
+    """
+    Returns the ids of the `k` posts of a subreddit nearest to the question,
+    from the IVF index when there is one. If the probed lists hold fewer than
+    `k` of the subreddit's posts, the subreddit's rows are scanned exactly.
+    """
+    query_vector = embedder.embed(question)
+    ivf = _resolve(ivf_index)
+    if ivf is not None:
+        results = ivf.search(query_vector, k, nprobe=IVF_NPROBE,
+                                   source_range=embedding_index.subreddit_rows(subreddit_name))
+        if len(results) >= k:
+            return [item_id for item_id, _ in results]
+    return [item_id for item_id, _ in embedding_index.search(query_vector, k, subreddit=subreddit_name)]
+
+# --- Subreddit Analytics ---
+# Hourly/daily activity rollups per subreddit, served by /analytics/<subreddit>
+# and summarized into the LLM context. They are bootstrapped from the columnar
+# store at COLUMNAR_STORE_PATH (written by `python -m app.ingest --columnar`) and
+# updated incrementally with every hot listing fetched from Reddit.
+COLUMNAR_STORE_PATH = os.getenv('COLUMNAR_STORE_PATH')
+
+analytics = _state_proxy('analytics')
+
+def load_analytics(path):
+    """Returns the analytics rollups built from the columnar store at `path` (empty without one)."""
+    if path:
+        try:
+            rollups = AnalyticsStore.from_columnar(ColumnarStore(path))
+            logging.info(f"Built analytics rollups from the columnar store at {path}.")
+            return rollups
+        except (OSError, ValueError) as e:
+            logging.error(f"Could not load the columnar store at {path}: {e}")
+    return AnalyticsStore()
+
+# --- Trending Terms ---
+# Streaming burst detection over the terms of every hot listing fetched from
+# Reddit (fixed memory per subreddit), served by /trends/<subreddit>. Each app
+# rebuilds the recent buckets from the items ingested into its corpus store. The top TRENDING_CONTEXT_TERMS terms are added to the
+# LLM context (0 disables this).
+TRENDING_CONTEXT_TERMS = int(os.getenv('TRENDING_CONTEXT_TERMS', '5'))
+TRENDS_MAX_TERMS = 50
+
+trend_detector = _state_proxy('trend_detector')
+
+def load_trend_detector(store):
+    """Returns a TrendDetector with the recent buckets rebuilt from `store` (empty without one)."""
+    if store is not None:
+        try:
+            detector = TrendDetector.from_corpus(store)
+            logging.info(f"Rebuilt trending-term buckets from the corpus store at {store.path}.")
+            return detector
+        except sqlite3.Error as e:
+            logging.error(f"Could not rebuild trending-term buckets from {store.path}: {e}")
+    return TrendDetector()
+
+# --- Sentiment ---
+# Lexicon-based sentiment aggregates per subreddit and per thread, maintained
+# incrementally from each app's corpus store (on startup) and every hot listing
+# fetched from Reddit, served by /sentiment/<subreddit>. The LLM context gets the
+# sentiment of the selected posts and of the subreddit overall.
+SENTIMENT_MAX_THREADS = 50
+
+sentiment = _state_proxy('sentiment')
+
+def load_sentiment(store):
+    """Returns a SentimentStore with the aggregates built from `store` (empty without one)."""
+    if store is not None:
+        try:
+            aggregates = SentimentStore.from_corpus(store)
+            logging.info(f"Built sentiment aggregates from the corpus store at {store.path}.")
+            return aggregates
+        except sqlite3.Error as e:
+            logging.error(f"Could not build sentiment aggregates from {store.path}: {e}")
+    return SentimentStore()
+
+# --- Subreddit Autocomplete ---
+# Known subreddit names with subscriber counts, served by /autocomplete as the
+# user types "@r/...". A large list (millions of names, built with
+# `python -m app.autocomplete names.csv --index subreddit_index`) is opened
+# memory-mapped from SUBREDDIT_INDEX_PATH; otherwise the subreddits of the
+# corpus store are indexed in memory.
+SUBREDDIT_INDEX_PATH = os.getenv('SUBREDDIT_INDEX_PATH')
+AUTOCOMPLETE_MAX_LIMIT = MAX_SUGGESTIONS
+
+subreddit_name_index = None
+if SUBREDDIT_INDEX_PATH:
+    try:
+        subreddit_name_index = SubredditNameIndex.open(SUBREDDIT_INDEX_PATH)
+        logging.info(f"Opened subreddit name index at {SUBREDDIT_INDEX_PATH} ({len(subreddit_name_index)} names).")
+    except (OSError, ValueError) as e:
+        logging.error(f"Could not open subreddit name index at {SUBREDDIT_INDEX_PATH}: {e}")
+if subreddit_name_index is None and _bootstrap_store is not None:
+    try:
+        stored_names = _bootstrap_store.subreddit_names()
+        if stored_names:
+            subreddit_name_index = SubredditNameIndex.from_entries(*zip(*stored_names))
+    except sqlite3.Error as e:
+        logging.error(f"Could not index the subreddit names of {CORPUS_DB_PATH}: {e}")
+if _bootstrap_store is not None:
+    _bootstrap_store.close()
+
+# --- Subreddit Name Correction ---
+# Misspelled subreddit names are corrected offline against the name index. With
+# a full name list (SUBREDDIT_INDEX_PATH), a name that is not in it but is close
+# to known names is answered with "Did you mean ...?" before any Reddit API
+# call. With only the corpus store's names, unknown names still go to Reddit
+# and the suggestions are added if Reddit reports the name as not found.
+SPELLING_SUGGESTIONS = int(os.getenv('SPELLING_SUGGESTIONS', '3'))
+
+subreddit_speller = None
+check_names_before_fetch = False
+if subreddit_name_index is not None and SUBREDDIT_INDEX_PATH:
+    try:
+        subreddit_speller = SubredditSpeller.open(SUBREDDIT_INDEX_PATH, subreddit_name_index)
+        check_names_before_fetch = True
+    except (OSError, ValueError) as e:
+        logging.error(f"Subreddit name correction disabled: no spelling dictionaries in {SUBREDDIT_INDEX_PATH} "
+                      f"(rebuild it with `python -m app.autocomplete`): {e}")
+elif subreddit_name_index is not None:
+    subreddit_speller = SubredditSpeller.from_name_index(subreddit_name_index)
+
+def suggest_subreddit_names(subreddit_name):
+    """
+    Returns the known subreddit names closest to a misspelled one.
+
+    Args:
+        subreddit_name (str): The name as typed.
+
+    Returns:
+        list: Up to SPELLING_SUGGESTIONS names (closest, then most popular,
+              first); empty if correction is disabled or the name is known.
+    """
+    if subreddit_speller is None or SPELLING_SUGGESTIONS <= 0:
+        return []
+    suggestions = subreddit_speller.suggest(subreddit_name, k=SPELLING_SUGGESTIONS)
+    return [suggestion['name'] for suggestion in suggestions if suggestion['distance'] > 0]
+
+def subreddit_not_found_message(subreddit_name, suggestions):
+    """Builds the "could not be found" message, with a "Did you mean ...?" if there are suggestions."""
+    message = f"Sorry, the subreddit r/{subreddit_name} could not be found."
+    if suggestions:
+        names = [f"r/{name}" for name in suggestions]
+        alternatives = names[0] if len(names) == 1 else f"{', '.join(names[:-1])} or {names[-1]}"
+        message += f" Did you mean {alternatives}?"
+    return message
+
+# --- LLM Micro-Batching ---
+# Concurrent LLM calls are funnelled through a dispatcher that groups them into
+# batches of up to LLM_BATCH_MAX_SIZE items, waiting at most LLM_BATCH_MAX_WAIT_MS
+# milliseconds for a batch to fill. A max wait of 0 dispatches whatever is queued
+# immediately. Up to LLM_MAX_CONCURRENT_BATCHES batches call the backend at once.
+
+LLM_BATCH_MAX_SIZE = int(os.getenv('LLM_BATCH_MAX_SIZE', '8'))
+LLM_BATCH_MAX_WAIT_MS = float(os.getenv('LLM_BATCH_MAX_WAIT_MS', '5'))
+LLM_MAX_CONCURRENT_BATCHES = int(os.getenv('LLM_MAX_CONCURRENT_BATCHES', '4'))
+
+llm_batcher = _state_proxy('llm_batcher')
+
+# --- LLM Admission Control ---
+# At most LLM_MAX_IN_FLIGHT requests call the LLM at once. Up to LLM_MAX_QUEUE more
+# wait (for at most LLM_QUEUE_TIMEOUT_SECONDS); anything beyond that is shed with a
+# fast 503 "busy" response rather than queuing unbounded threads.
+
+LLM_MAX_IN_FLIGHT = int(os.getenv('LLM_MAX_IN_FLIGHT', '16'))
+LLM_MAX_QUEUE = int(os.getenv('LLM_MAX_QUEUE', '64'))
+LLM_QUEUE_TIMEOUT_SECONDS = float(os.getenv('LLM_QUEUE_TIMEOUT_SECONDS', '2'))
+
+llm_admission = _state_proxy('llm_admission')
+
+# --- LLM Deadline ---
+# If the LLM has not answered within LLM_DEADLINE_SECONDS, the request falls back
+# to the extractive answerer over the already fetched subreddit posts.
+LLM_DEADLINE_SECONDS = float(os.getenv('LLM_DEADLINE_SECONDS', '10'))
+
+# --- Request Cancellation ---
+# Clients tag each message with a 'request_id'. A later POST to /cancel with that
+# id, or the client disconnecting from a streamed reply, cancels the request's
+# token, which stops pending Reddit fetches and LLM generation.
+cancellation_registry = _state_proxy('cancellation_registry')
+
+# Not a registered HTTP status; follows the nginx convention for
+# "client closed request". The client has gone away, so it rarely sees it.
+CLIENT_CLOSED_REQUEST_STATUS = 499
+
+class ChatState:
+    """
+    The per-application state of the chat routes, stored in
+    `app.extensions['chat']` by `init_app`. Paths and LLM limits are read from
+    the app's config, defaulting to the environment settings above. Metrics of
+    the app's components are kept in its own registry (`metrics`).
+    """
+
+    def __init__(self, config=None):
+        config = config or {}
+        corpus_db_path = config.get('CORPUS_DB_PATH', CORPUS_DB_PATH)
+        self.corpus_store = CorpusStore(corpus_db_path) if corpus_db_path else None
+        self.embedding_index, self.ivf_index, self.embedder = open_embedding_index(
+            config.get('EMBEDDING_INDEX_PATH', EMBEDDING_INDEX_PATH))
+        self.analytics = load_analytics(config.get('COLUMNAR_STORE_PATH', COLUMNAR_STORE_PATH))
+        self.trend_detector = load_trend_detector(self.corpus_store)
+        self.sentiment = load_sentiment(self.corpus_store)
+        self.metrics = metrics.Registry()
+        self.llm_batcher = MicroBatcher(
+            lambda batch: llm_utils.get_llm_responses(batch),
+            max_batch_size=config.get('LLM_BATCH_MAX_SIZE', LLM_BATCH_MAX_SIZE),
+            max_wait_ms=config.get('LLM_BATCH_MAX_WAIT_MS', LLM_BATCH_MAX_WAIT_MS),
+            max_concurrent_batches=config.get('LLM_MAX_CONCURRENT_BATCHES', LLM_MAX_CONCURRENT_BATCHES),
+            name='llm',
+            registry=self.metrics,
+        )
+        self.llm_admission = AdmissionController(
+            max_in_flight=config.get('LLM_MAX_IN_FLIGHT', LLM_MAX_IN_FLIGHT),
+            max_queue=config.get('LLM_MAX_QUEUE', LLM_MAX_QUEUE),
+            queue_timeout=config.get('LLM_QUEUE_TIMEOUT_SECONDS', LLM_QUEUE_TIMEOUT_SECONDS),
+            name='llm_admission',
+            registry=self.metrics,
+        )
+        self.cancellation_registry = CancellationRegistry()
+        self.live_index = SegmentedIndexCache(
+            capacity=config.get('LIVE_INDEX_MAX_SUBREDDITS', LIVE_INDEX_MAX_SUBREDDITS),
+            max_documents=config.get('LIVE_INDEX_MAX_POSTS', LIVE_INDEX_MAX_POSTS),
+            seal_threshold=config.get('LIVE_INDEX_SEAL_THRESHOLD', LIVE_INDEX_SEAL_THRESHOLD),
+            name='live_index',
+            registry=self.metrics,
+        )
+
+    def init_app(self, application):
+        application.extensions['chat'] = self
+
+# --- Subreddit Context ---
+# A message may mention several subreddits ("@r/python @r/golang ..."). Their
+# contexts are fetched concurrently on a shared pool, all under one
+# SUBREDDIT_FETCH_DEADLINE_SECONDS deadline. Each subreddit fails on its own: the
+# answer uses the contexts that arrived in time and lists the others as unavailable.
+MAX_SUBREDDITS_PER_MESSAGE = int(os.getenv('MAX_SUBREDDITS_PER_MESSAGE', '5'))
+SUBREDDIT_FETCH_DEADLINE_SECONDS = float(os.getenv('SUBREDDIT_FETCH_DEADLINE_SECONDS', '8'))
+SUBREDDIT_FETCH_WORKERS = int(os.getenv('SUBREDDIT_FETCH_WORKERS', '8'))
+
+subreddit_fetch_executor = None # Created per process by init_worker_resources()
+
+class SubredditUnavailable(Exception):
+    """Raised when a subreddit's context cannot be fetched; the message is shown to the user."""
+
+    def __init__(self, message, suggestions=None):
+        super().__init__(message)
+        self.suggestions = suggestions or []
+
+def fetch_subreddit_context(subreddit_name, question, cancel_token=None, filters=None):
+    """
+    Fetches the context of one subreddit: from the corpus store in store mode,
+    otherwise (or if the subreddit has not been ingested) from the Reddit API.
+
+    Args:
+        subreddit_name (str): The subreddit.
+        question (str): The user's question (used for store-side retrieval).
+        cancel_token (CancellationToken, optional): Checked while fetching posts.
+        filters (QueryFilters, optional): Inline query filters narrowing the posts.
+
+    Returns:
+        dict or None: The context dict, or None if no source is available.
+
+    Raises:
+        SubredditUnavailable: If the subreddit does not exist, is not accessible
+            or the Reddit API failed.
+        RequestCancelled: If the request is cancelled while fetching.
+    """
+    store = _resolve(corpus_store)
+    if store is not None and CONTEXT_SOURCE == 'store':
+        semantic_ids = None
+        if _resolve(embedding_index) is not None:
+            semantic_ids = semantic_search(question, subreddit_name)
+        subreddit_info = store.get_subreddit_context(
+            subreddit_name, question, post_limit=REDDIT_CONTEXT_POST_LIMIT, preferred_ids=semantic_ids, filters=filters)
+        if subreddit_info:
+            logging.info(f"Loaded context for r/{subreddit_name} from the corpus store.")
+            return subreddit_info
+
+    # A misspelled name is answered with suggestions without asking Reddit.
+    if check_names_before_fetch and not subreddit_name_index.contains(subreddit_name):
+        suggestions = suggest_subreddit_names(subreddit_name)
+        if suggestions:
+            logging.info(f"Subreddit r/{subreddit_name} is not a known name; suggesting {suggestions}.")
+            raise SubredditUnavailable(subreddit_not_found_message(subreddit_name, suggestions), suggestions)
+
+    if not praw_available:
+        logging.warning(f"PRAW not available. Cannot fetch r/{subreddit_name} for question: '{question}'.")
+        return None
+    if not reddit: # Should not happen if praw_available is True, but as a safeguard
+        logging.error("PRAW was marked as available, but the Reddit instance is None. This indicates an issue during PRAW setup.")
+        raise SubredditUnavailable("Sorry, Reddit API access is not configured correctly on the server.")
+
+    try:
+        logging.info(f"Fetching info for subreddit: r/{subreddit_name}...")
+        subreddit_obj = reddit.subreddit(subreddit_name)
+        # Access an attribute to confirm subreddit exists and is accessible (triggers PRAW exception if not)
+        subreddit_obj.created_utc
+        subreddit_info = {
+            'display_name': subreddit_obj.display_name,
+            'public_description': subreddit_obj.public_description,
+            'subscribers': subreddit_obj.subscribers,
+            'name': subreddit_name, # Pass original parsed name for context
+            'posts': fetch_context_posts(subreddit_obj, cancel_token=cancel_token, filters=filters)
+        }
+        analytics.add_submissions(subreddit_name, subreddit_info['posts'])
+        analytics.record_subscribers(subreddit_name, subreddit_info['subscribers'])
+        trend_detector.add_submissions(subreddit_name, subreddit_info['posts'])
+        sentiment.add_submissions(subreddit_name, subreddit_info['posts'])
+        logging.info(f"Successfully fetched info for r/{subreddit_name}.")
+        return subreddit_info
+    except RequestCancelled:
+        raise
+    except prawcore.exceptions.Redirect: # Subreddit does not exist or was redirected (e.g. mistyped)
+        logging.warning(f"Subreddit r/{subreddit_name} not found (PRAW Redirect).")
+        suggestions = suggest_subreddit_names(subreddit_name)
+        raise SubredditUnavailable(subreddit_not_found_message(subreddit_name, suggestions), suggestions)
+    except prawcore.exceptions.NotFound: # Subreddit is banned, private, or quarantined
+        logging.warning(f"Subreddit r/{subreddit_name} not accessible (PRAW NotFound - e.g., private, banned).")
+        raise SubredditUnavailable(f"Sorry, r/{subreddit_name} is private, banned, or quarantined.")
+    except prawcore.exceptions.PrawcoreException as e: # Other PRAW-related errors (API limits, network, etc.)
+        logging.error(f"PRAW Core error while fetching r/{subreddit_name}: {e}")
+        raise SubredditUnavailable(f"Sorry, an error occurred with the Reddit API while trying to fetch r/{subreddit_name}.")
+    except Exception as e: # Catch any other unexpected errors during PRAW interaction
+        logging.error(f"Unexpected error while fetching data for r/{subreddit_name}: {e}")
+        raise SubredditUnavailable(f"An unexpected error occurred while fetching data for r/{subreddit_name}.")
+
+def fetch_subreddit_contexts(subreddit_names, question, cancel_token, filters=None, fetch=None):
+    """
+    Fetches the contexts of several subreddits concurrently, all under one
+    SUBREDDIT_FETCH_DEADLINE_SECONDS deadline. Fetches still running at the
+    deadline are cancelled (they stop paging through posts).
+
+    Args:
+        subreddit_names (list): The subreddits, in the order they were mentioned.
+        question (str): The user's question.
+        cancel_token (CancellationToken): The request's token; cancelling it
+            cancels every fetch.
+        filters (QueryFilters, optional): Inline query filters, applied to every subreddit.
+        fetch (callable, optional): Fetches one subreddit's context, with the
+            arguments of `fetch_subreddit_context` (the default).
+
+    Returns:
+        tuple: (contexts, unavailable) - a list of (name, context dict) pairs in
+            mention order, and a list of {'name', 'error'} dicts for the
+            subreddits that failed or missed the deadline.
+
+    Raises:
+        RequestCancelled: If the request is cancelled while fetching.
+    """
+    fetch = fetch or fetch_subreddit_context
+    fanout_token = CancellationToken()
+    cancel_token.add_callback(fanout_token.cancel)
+    fetch = _with_app_context(fetch)
+    futures = {name: subreddit_fetch_executor.submit(fetch, name, question, fanout_token, filters)
+               for name in subreddit_names}
+    _, pending = wait(futures.values(), timeout=SUBREDDIT_FETCH_DEADLINE_SECONDS)
+    fanout_token.cancel() # Stops fetches that missed the deadline
+    cancel_token.raise_if_cancelled()
+
+    contexts, unavailable = [], []
+    for name, future in futures.items():
+        if future in pending:
+            future.cancel()
+            logging.warning(f"Fetching r/{name} missed the {SUBREDDIT_FETCH_DEADLINE_SECONDS}s deadline.")
+            unavailable.append({'name': name, 'error': f"Sorry, r/{name} took too long to respond."})
+            continue
+        try:
+            context = future.result()
+        except SubredditUnavailable as e:
+            entry = {'name': name, 'error': str(e)}
+            if e.suggestions:
+                entry['suggestions'] = e.suggestions
+            unavailable.append(entry)
+        except RequestCancelled: # Cancelled by the deadline between the wait and the check
+            unavailable.append({'name': name, 'error': f"Sorry, r/{name} took too long to respond."})
+        else:
+            if context:
+                contexts.append((name, context))
+    return contexts, unavailable
+
+def prepare_subreddit_context(subreddit_name, question, subreddit_info, filters=None):
+    """
+    Finishes a fetched subreddit context in place: drops near-duplicate posts
+    and posts outside the query's filters, keeps the posts most relevant to the
+    question (BM25), and adds activity, trending terms and sentiment.
+    """
+    if filters:
+        subreddit_info['filters'] = filters.to_dict()
+    # Retrieval stage: keep only the posts most relevant to the question.
+    if subreddit_info.get('posts'):
+        candidate_posts = subreddit_info['posts']
+        if filters:
+            candidate_posts = [post for post in candidate_posts if filters.matches(post)]
+        if NEAR_DUPLICATE_THRESHOLD:
+            candidate_posts, duplicates = collapse_near_duplicates(
+                candidate_posts, [f"{post.get('title', '')}\n{post.get('selftext') or ''}" for post in candidate_posts],
+                threshold=NEAR_DUPLICATE_THRESHOLD, hasher=context_minhasher)
+            if duplicates:
+                logging.info(f"Collapsed {len(duplicates)} near-duplicate posts of r/{subreddit_name}.")
+        ranked_ids = None
+        if len(candidate_posts) > LLM_CONTEXT_POST_LIMIT and all(post.get('id') for post in candidate_posts):
+            ranked_ids = live_index.rank(subreddit_name, [
+                {'id': post['id'], 'text': f"{post.get('title', '')}\n{post.get('selftext') or ''}"}
+                for post in candidate_posts], question, LLM_CONTEXT_POST_LIMIT)
+        subreddit_info['posts'] = select_context_posts(question, candidate_posts, LLM_CONTEXT_POST_LIMIT,
+                                                       ranked_ids=ranked_ids)
+
+    # Activity statistics from the rollups, so questions like "when is this sub
+    # most active?" are answered from data.
+    activity = analytics.summary(subreddit_name)
+    if activity:
+        subreddit_info['activity'] = activity
+    if TRENDING_CONTEXT_TERMS:
+        trends = trend_detector.trending(subreddit_name, k=TRENDING_CONTEXT_TERMS)
+        if trends and trends['terms']:
+            subreddit_info['trending_terms'] = [entry['term'] for entry in trends['terms']]
+    # "How does r/X feel about Y?": the selected posts are the ones about Y.
+    context_sentiment = {}
+    if subreddit_info.get('posts'):
+        context_sentiment['posts'] = summarize_scores(sentiment.lexicon.score(
+            [f"{post.get('title', '')}\n{post.get('selftext') or ''}" for post in subreddit_info['posts']]))
+    overall_sentiment = sentiment.summary(subreddit_name)
+    if overall_sentiment:
+        context_sentiment['subreddit'] = overall_sentiment
+    if context_sentiment:
+        subreddit_info['sentiment'] = context_sentiment
+
+def build_subreddit_context(subreddit_names, question, cancel_token, filters=None, fetch=None):
+    """
+    Context stage of a question: fetches and prepares the contexts of the
+    mentioned subreddits, as passed to the LLM and the extractive answerer.
+
+    Args:
+        subreddit_names (list): The mentioned subreddits (may be empty).
+        question (str): The user's question.
+        cancel_token (CancellationToken): The request's token.
+        filters (QueryFilters, optional): Inline query filters.
+        fetch (callable, optional): Fetches one subreddit's context, with the
+            arguments of `fetch_subreddit_context` (the default).
+
+    Returns:
+        dict or None: The context of a single subreddit, {'subreddits': [...]}
+              (plus 'unavailable') for several, or None without subreddits or
+              without a context source.
+
+    Raises:
+        SubredditUnavailable: If a single subreddit, or every one of several,
+            could not be fetched.
+        RequestCancelled: If the request is cancelled while fetching.
+    """
+    if len(subreddit_names) == 1:
+        subreddit_info = (fetch or fetch_subreddit_context)(subreddit_names[0], question, cancel_token, filters)
+        if subreddit_info:
+            prepare_subreddit_context(subreddit_names[0], question, subreddit_info, filters)
+        return subreddit_info
+    if not subreddit_names:
+        return None
+    contexts, unavailable = fetch_subreddit_contexts(subreddit_names, question, cancel_token, filters, fetch=fetch)
+    if not contexts:
+        if unavailable:
+            raise SubredditUnavailable(' '.join(entry['error'] for entry in unavailable))
+        return None
+    for name, context in contexts:
+        prepare_subreddit_context(name, question, context, filters)
+    subreddit_info = {'subreddits': [context for _, context in contexts]}
+    if unavailable:
+        subreddit_info['unavailable'] = unavailable
+    return subreddit_info
+
+# --- Answering ---
+# /send_message, /send_messages, the /ws channel and offline batches
+# (`app.batch`) all answer a parsed message through answer_question(); they
+# differ only in how they report the result.
+
+class ReplyStream:
+    """
+    The chunks of a streamed LLM reply. Holds the LLM admission slot taken
+    for it until `close()`, which the consumer must call once the stream ends
+    or is abandoned (closing twice is harmless).
+    """
+
+    def __init__(self, chunks, admission=None):
+        self._chunks = chunks
+        self._admission = admission
+        self._closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._chunks)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._chunks.close()
+        if self._admission is not None:
+            self._admission.release()
+
+def answer_question(query, mode='llm', cancel_token=None, admission=None, fetch=None, stream=False, lap=None):
+    """
+    Answers a parsed chat message: the context stage (fetching and preparing
+    the mentioned subreddits), then the answer stage (extractive, or the LLM
+    with an extractive fallback when it misses its deadline).
+
+    Args:
+        query (ParsedQuery): The parsed message.
+        mode (str): 'llm', or 'extractive' to answer from the fetched posts
+            when any post matches.
+        cancel_token (CancellationToken, optional): Stops the fetches and the
+            LLM call when cancelled.
+        admission (AdmissionController, optional): Admits the LLM call
+            (offline batches, bounded by their own parallelism, pass none).
+        fetch (callable, optional): Fetches one subreddit's context (see
+            `build_subreddit_context`).
+        stream (bool): Stream an LLM reply instead of waiting for it.
+        lap (callable, optional): Called with 'context', then 'answer', as
+            each stage ends (also when it fails).
+
+    Returns:
+        dict: 'reply' and 'error' (one of them None), plus 'sources' for
+              extractive answers or 'suggestions' for misspelled subreddits.
+              With `stream`, an LLM reply is instead a `ReplyStream` under
+              'stream' (with 'reply' and 'error' None).
+
+    Raises:
+        RequestCancelled: If the request is cancelled.
+        AdmissionRejected: If admission control sheds the LLM call.
+    """
+    lap = lap or (lambda stage: None)
+    cancel_token = cancel_token or CancellationToken()
+    admission = _resolve(admission) # A ReplyStream may be closed outside the app context
+    subreddit_names, question, filters = query.subreddits, query.question, query.filters
+
+    # Validate if a question exists when a subreddit is specified
+    if subreddit_names and not question:
+        mentioned = ', '.join(f"r/{name}" for name in subreddit_names)
+        logging.info(f"Subreddits {subreddit_names} mentioned, but question is empty.")
+        return {'reply': None, 'error': f"You mentioned {mentioned}, but what is your question?"}
+    if len(subreddit_names) > MAX_SUBREDDITS_PER_MESSAGE:
+        return {'reply': None, 'error': f"Please mention at most {MAX_SUBREDDITS_PER_MESSAGE} subreddits per question."}
+
+    try:
+        subreddit_info = build_subreddit_context(subreddit_names, question, cancel_token, filters, fetch=fetch)
+    except SubredditUnavailable as e:
+        if e.suggestions:
+            return {'reply': None, 'error': str(e), 'suggestions': e.suggestions}
+        return {'reply': None, 'error': str(e)}
+    finally:
+        lap('context')
+    try:
+        return _answer_stage(question, subreddit_info, mode, cancel_token, admission, stream)
+    finally:
+        lap('answer')
+
+def _answer_stage(question, subreddit_info, mode, cancel_token, admission, stream):
+    # Fast path: answer from the fetched posts without calling the LLM.
+    if mode == 'extractive' and subreddit_info:
+        extractive = extractive_answer(question, subreddit_info)
+        if extractive:
+            logging.info(f"Answered '{question}' extractively (fast path).")
+            return {'reply': extractive['reply'], 'error': None, 'sources': extractive['sources']}
+
+    if stream:
+        if admission is not None:
+            admission.acquire()
+        chunks = llm_utils.stream_llm_response(question, subreddit_info, praw_available_for_llm=praw_available,
+                                               cancel_token=cancel_token)
+        return {'reply': None, 'error': None, 'stream': ReplyStream(chunks, admission)}
+
+    # Call the (mock) LLM to get a response
+    with admission.admit() if admission is not None else nullcontext():
+        try:
+            llm_future = llm_batcher.submit((question, subreddit_info, praw_available))
+            cancel_token.add_callback(llm_future.cancel) # Drops the item if its batch hasn't been dispatched yet
+            llm_reply_text = llm_future.result(timeout=LLM_DEADLINE_SECONDS)
+        except CancelledError:
+            raise RequestCancelled()
+        except FutureTimeoutError:
+            llm_future.cancel()
+            logging.warning(f"LLM missed its {LLM_DEADLINE_SECONDS}s deadline for '{question}'.")
+            extractive = extractive_answer(question, subreddit_info) if subreddit_info else None
+            if extractive:
+                return {'reply': extractive['reply'], 'error': None, 'sources': extractive['sources']}
+            return {'reply': None, 'error': "Sorry, the assistant took too long to respond. Please try again."}
+        except Exception as e:
+            logging.error(f"Error during LLM interaction (mock or real): {e}")
+            return {'reply': None, 'error': "Sorry, there was an issue getting a response from the assistant."}
+    logging.info(f"Generated LLM reply for question '{question}'.")
+    return {'reply': llm_reply_text, 'error': None}
+
+# --- Batch Messages ---
+# /send_messages answers up to SEND_MESSAGES_MAX messages per request on a pool
+# of SEND_MESSAGES_WORKERS threads shared by all such requests. The messages of
+# one request share their subreddit fetches; each LLM call still goes through
+# admission control.
+SEND_MESSAGES_MAX = int(os.getenv('SEND_MESSAGES_MAX', '50'))
+SEND_MESSAGES_WORKERS = int(os.getenv('SEND_MESSAGES_WORKERS', '8'))
+
+send_messages_executor = None # Created per process by init_worker_resources()
+
+# --- WebSocket Chat Channel ---
+# /ws carries the chat over one persistent connection. Each question is
+# answered on a pool of SOCKET_WORKERS threads shared by all connections, so a
+# connection can have up to SOCKET_MAX_IN_FLIGHT questions in flight at once.
+SOCKET_MAX_IN_FLIGHT = int(os.getenv('SOCKET_MAX_IN_FLIGHT', '8'))
+SOCKET_WORKERS = int(os.getenv('SOCKET_WORKERS', '32'))
+
+socket_question_executor = None # Created per process by init_worker_resources()
+
+# An open WebSocket holds one server thread for as long as it stays open (a
+# gthread worker has GUNICORN_THREADS of them). At most SOCKET_MAX_CONNECTIONS
+# sockets are open per process, so threads stay free for HTTP requests (and
+# /metrics); further connections are closed with code 1013 ("try again
+# later") and the client uses HTTP meanwhile. gunicorn.conf.py defaults it to
+# one less than the worker's threads; unset, the number is not capped (the
+# development server starts a thread per connection), and 0 disables /ws.
+SOCKET_TRY_AGAIN_LATER = 1013
+SOCKET_MAX_CONNECTIONS = os.getenv('SOCKET_MAX_CONNECTIONS')
+SOCKET_MAX_CONNECTIONS = int(SOCKET_MAX_CONNECTIONS) if SOCKET_MAX_CONNECTIONS else None
+
+_socket_slots = threading.BoundedSemaphore(SOCKET_MAX_CONNECTIONS) if SOCKET_MAX_CONNECTIONS else None
+socket_rejected_counter = metrics.counter('socket_rejected', 'WebSocket connections closed because the worker had no free slot.')
+
+# --- Per-Worker Resources ---
+# Network clients and thread pools must not cross a fork: a preforked worker
+# would share its parent's sockets, and threads do not survive fork. They are
+# created by init_worker_resources(), which create_app() calls, and created
+# again in every process forked after that. Data loaded above and each app's
+# ChatState (indexes, stores, rollups) are shared copy-on-write instead.
+_worker_pid = None
+
+def init_worker_resources():
+    """
+    Creates this process's PRAW client and its subreddit fetch, batch message
+    and WebSocket question pools, once per process. The PRAW test call is only
+    made by the first process.
+    """
+    global reddit, subreddit_fetch_executor, send_messages_executor, socket_question_executor, _worker_pid
+    if _worker_pid == os.getpid():
+        return
+    first_process = _worker_pid is None
+    _worker_pid = os.getpid()
+    reddit = create_reddit_client(verify=first_process)
+    subreddit_fetch_executor = ThreadPoolExecutor(max_workers=SUBREDDIT_FETCH_WORKERS, thread_name_prefix='subreddit-fetch')
+    send_messages_executor = ThreadPoolExecutor(max_workers=SEND_MESSAGES_WORKERS, thread_name_prefix='send-messages')
+    socket_question_executor = ThreadPoolExecutor(max_workers=SOCKET_WORKERS, thread_name_prefix='socket-question')
+
+def _init_forked_worker():
+    if _worker_pid is not None: # Only processes forked from an initialized app
+        init_worker_resources()
+
+os.register_at_fork(after_in_child=_init_forked_worker)
 
 # --- Flask Routes ---
 
-@app.route('/')
+@bp.route('/')
 def index():
     """
     Serves the main HTML page of the chat application.
     """
     return render_template('index.html')
 
-@app.route('/send_message', methods=['POST'])
+@bp.route('/send_message', methods=['POST'])
 def send_message():
     """
     Handles incoming chat messages from the user.
 
-    It expects a JSON payload with a 'message' key.
+    It expects a JSON payload with a 'message' key, and optional 'mode',
+    'request_id' and 'stream' keys.
     The message is parsed for a subreddit tag (e.g., @r/learnpython).
-    If a tag is found and PRAW is available, it attempts to fetch subreddit info.
-    Then, it calls a (currently mock) LLM to generate a response.
-    Returns a JSON response with either a 'reply' or an 'error' key.
+    If a tag is found and PRAW is available, it attempts to fetch subreddit info
+    and its hot posts.
+    With 'mode': 'extractive', the answer is built directly from the best
+    matching posts without calling the LLM (when any post matches). Otherwise it
+    calls a (currently mock) LLM to generate a response, falling back to the
+    extractive answer if the LLM misses its deadline.
+    Returns a JSON response with either a 'reply' or an 'error' key; extractive
+    answers also carry a 'sources' list of snippets with permalinks.
+    With 'stream': true, the LLM reply is instead streamed as NDJSON lines
+    ({'request_id', 'delta'} chunks, then {'request_id', 'done': true}).
+    A request tagged with 'request_id' can be cancelled via /cancel (an id
+    still in flight is rejected with 409); a streamed request is also
+    cancelled when the client disconnects.
     """
+    request_id = None
+    keep_registered = False # A streamed reply unregisters itself when the stream closes
     try:
         # Basic request validation
         data = request.get_json()
@@ -80,60 +977,462 @@ def send_message():
             logging.info("/send_message: Received empty message.")
             return jsonify({'reply': None, 'error': "Please enter a question."})
 
-        # Parse the user's message to separate subreddit and question
-        subreddit_name_from_query, question_for_llm = parse_subreddit_and_question(user_message)
-        logging.info(f"/send_message: Parsed query: subreddit='{subreddit_name_from_query}', question='{question_for_llm}'")
-
-        # Validate if a question exists when a subreddit is specified
-        if subreddit_name_from_query and not question_for_llm:
-            logging.info(f"/send_message: Subreddit '{subreddit_name_from_query}' mentioned, but question is empty.")
-            return jsonify({'reply': None, 'error': f"You mentioned r/{subreddit_name_from_query}, but what is your question?"})
-
-        subreddit_info_dict = None
-        if subreddit_name_from_query:
-            # Attempt to fetch subreddit info only if a subreddit was specified
-            if not praw_available:
-                logging.warning(f"PRAW not available. Cannot fetch r/{subreddit_name_from_query} for question: '{question_for_llm}'.")
-            elif not reddit: # Should not happen if praw_available is True, but as a safeguard
-                 logging.error("PRAW was marked as available, but the Reddit instance is None. This indicates an issue during PRAW setup.")
-                 return jsonify({'reply': None, 'error': "Sorry, Reddit API access is not configured correctly on the server."})
-            else:
-                # PRAW is available and initialized, try to get subreddit data
-                try:
-                    logging.info(f"Fetching info for subreddit: r/{subreddit_name_from_query}...")
-                    subreddit_obj = reddit.subreddit(subreddit_name_from_query)
-                    # Access an attribute to confirm subreddit exists and is accessible (triggers PRAW exception if not)
-                    subreddit_obj.created_utc
-                    subreddit_info_dict = {
-                        'display_name': subreddit_obj.display_name,
-                        'public_description': subreddit_obj.public_description,
-                        'subscribers': subreddit_obj.subscribers,
-                        'name': subreddit_name_from_query # Pass original parsed name for context
-                    }
-                    logging.info(f"Successfully fetched info for r/{subreddit_name_from_query}.")
-                except prawcore.exceptions.Redirect: # Subreddit does not exist or was redirected (e.g. mistyped)
-                    logging.warning(f"Subreddit r/{subreddit_name_from_query} not found (PRAW Redirect).")
-                    return jsonify({'reply': None, 'error': f"Sorry, the subreddit r/{subreddit_name_from_query} could not be found."})
-                except prawcore.exceptions.NotFound: # Subreddit is banned, private, or quarantined
-                    logging.warning(f"Subreddit r/{subreddit_name_from_query} not accessible (PRAW NotFound - e.g., private, banned).")
-                    return jsonify({'reply': None, 'error': f"Sorry, r/{subreddit_name_from_query} is private, banned, or quarantined."})
-                except prawcore.exceptions.PrawcoreException as e: # Other PRAW-related errors (API limits, network, etc.)
-                    logging.error(f"PRAW Core error while fetching r/{subreddit_name_from_query}: {e}")
-                    return jsonify({'reply': None, 'error': f"Sorry, an error occurred with the Reddit API while trying to fetch r/{subreddit_name_from_query}."})
-                except Exception as e: # Catch any other unexpected errors during PRAW interaction
-                    logging.error(f"Unexpected error while fetching data for r/{subreddit_name_from_query}: {e}")
-                    return jsonify({'reply': None, 'error': f"An unexpected error occurred while fetching data for r/{subreddit_name_from_query}."})
-
-        # Call the (mock) LLM to get a response
+        request_id = data.get('request_id')
+        owner = _request_owner()
         try:
-            llm_reply_text = get_llm_response(question_for_llm, subreddit_info_dict, praw_available_for_llm=praw_available)
-            logging.info(f"Generated LLM reply for question '{question_for_llm}'.")
-            return jsonify({'reply': llm_reply_text, 'error': None})
-        except Exception as e:
-            logging.error(f"Error during LLM interaction (mock or real): {e}")
-            return jsonify({'reply': None, 'error': "Sorry, there was an issue getting a response from the assistant."})
+            cancel_token = cancellation_registry.register(request_id, owner)
+        except DuplicateRequest as e:
+            request_id = None # The request in flight under this id stays registered
+            return jsonify({'reply': None, 'error': str(e)}), 409
+
+        # Parse the user's message into the mentioned subreddits, the question and inline filters
+        query = parse_query(user_message)
+        logging.info(f"/send_message: Parsed query: {query!r}")
+
+        try:
+            result = answer_question(query, data.get('mode', 'llm'), cancel_token, llm_admission,
+                                     stream=bool(data.get('stream')))
+        except AdmissionRejected as e:
+            logging.warning(f"/send_message: LLM request shed by admission control ({e.reason}).")
+            return jsonify({'reply': None, 'error': "The assistant is busy right now. Please try again in a moment."}), 503
+        reply_stream = result.pop('stream', None)
+        if reply_stream is not None:
+            keep_registered = True
+            return _stream_llm_reply(reply_stream, request_id, cancel_token, owner)
+        return jsonify(result)
+
+    except RequestCancelled:
+        logging.info(f"/send_message: Request '{request_id}' was cancelled.")
+        return jsonify({'reply': None, 'error': "Request was cancelled."}), CLIENT_CLOSED_REQUEST_STATUS
 
     except Exception as e:
         # Catch-all for any other unexpected errors in the route
         logging.exception("An unexpected error occurred in the /send_message route:") # Logs full traceback
         return jsonify({'reply': None, 'error': "An unexpected error occurred on the server. Please try again later."}), 500
+
+    finally:
+        if request_id and not keep_registered:
+            cancellation_registry.unregister(request_id, cancel_token, owner)
+
+def _stream_llm_reply(reply_stream, request_id, cancel_token, owner):
+    """
+    Builds the NDJSON streaming response for an LLM reply.
+
+    The reply stream is closed (releasing its LLM admission slot) when the
+    response closes. If the response closes before the reply is complete (the
+    client disconnected), the request's cancellation token is cancelled so
+    generation stops.
+    """
+    state = {'finished': False}
+    registry = _resolve(cancellation_registry) # The response is closed outside the app context
+
+    def generate():
+        try:
+            for chunk in reply_stream:
+                yield json.dumps({'request_id': request_id, 'delta': chunk}) + "\n"
+        except RequestCancelled:
+            logging.info(f"/send_message: Streamed request '{request_id}' was cancelled.")
+            state['finished'] = True
+            yield json.dumps({'request_id': request_id, 'error': "Request was cancelled."}) + "\n"
+            return
+        except Exception as e:
+            logging.error(f"Error during streamed LLM interaction (mock or real): {e}")
+            state['finished'] = True
+            yield json.dumps({'request_id': request_id, 'error': "Sorry, there was an issue getting a response from the assistant."}) + "\n"
+            return
+        state['finished'] = True
+        yield json.dumps({'request_id': request_id, 'done': True}) + "\n"
+
+    def on_close():
+        if not state['finished']:
+            logging.info(f"/send_message: Client disconnected from streamed request '{request_id}'; cancelling.")
+            cancel_token.cancel()
+        registry.unregister(request_id, cancel_token, owner)
+        reply_stream.close()
+
+    response = Response(generate(), mimetype='application/x-ndjson')
+    response.call_on_close(on_close)
+    return response
+
+@bp.route('/send_messages', methods=['POST'])
+def send_messages():
+    """
+    Answers many chat messages in one request, concurrently.
+
+    Expects a JSON payload with a 'messages' list, whose items are message
+    strings or {'message', 'id', 'mode'} objects, and optional 'mode' (the
+    default for all items), 'request_id' and 'stream' keys.
+    Each message is answered as /send_message answers it; messages about the
+    same subreddit share one fetch.
+    Returns {'results': [...], 'error': None} with one result per message, in
+    order: the /send_message response ('reply' or 'error', plus 'sources' or
+    'suggestions') with the item's 'index' and 'id'.
+    With 'stream': true, the results are instead streamed as NDJSON lines as
+    each message is answered (in completion order), then {'request_id',
+    'done': true}.
+    The whole request can be cancelled via /cancel with its 'request_id'; a
+    streamed request is also cancelled when the client disconnects.
+    """
+    from app.batch import ContextCache, answer_message # app.batch imports this module
+
+    data = request.get_json(silent=True)
+    messages = data.get('messages') if isinstance(data, dict) else None
+    if not isinstance(messages, list) or not messages:
+        logging.warning("/send_messages: Received invalid request (no JSON data or 'messages' list).")
+        return jsonify({'results': None, 'error': "Invalid request: No messages provided."}), 400
+    if len(messages) > SEND_MESSAGES_MAX:
+        return jsonify({'results': None, 'error': f"Please send at most {SEND_MESSAGES_MAX} messages per request."}), 400
+
+    default_mode = data.get('mode', 'llm')
+    request_id = data.get('request_id')
+    owner = _request_owner()
+    try:
+        cancel_token = cancellation_registry.register(request_id, owner)
+    except DuplicateRequest as e:
+        return jsonify({'results': None, 'error': str(e)}), 409
+    cache = ContextCache(capacity=len(messages) * MAX_SUBREDDITS_PER_MESSAGE)
+
+    def answer(index):
+        item = messages[index]
+        if isinstance(item, str):
+            item = {'message': item}
+        head = {'index': index}
+        if isinstance(item, dict) and 'id' in item:
+            head['id'] = item['id']
+        if not isinstance(item, dict) or not isinstance(item.get('message'), str):
+            return {**head, 'reply': None, 'error': "Invalid request: No message provided."}
+        try:
+            result = answer_message(item['message'], item.get('mode', default_mode), cache, cancel_token, llm_admission)
+        except Exception:
+            logging.exception("An unexpected error occurred answering a /send_messages item:")
+            return {**head, 'reply': None, 'error': "An unexpected error occurred on the server. Please try again later."}
+        del result['timings']
+        return {**head, **result}
+
+    answer = _with_app_context(answer)
+    futures = [send_messages_executor.submit(answer, index) for index in range(len(messages))]
+    logging.info(f"/send_messages: Answering {len(messages)} messages.")
+
+    if data.get('stream'):
+        state = {'finished': False}
+        registry = _resolve(cancellation_registry) # The response is closed outside the app context
+
+        def generate():
+            for future in as_completed(futures):
+                yield json.dumps(future.result()) + "\n"
+            state['finished'] = True
+            yield json.dumps({'request_id': request_id, 'done': True}) + "\n"
+
+        def on_close():
+            if not state['finished']:
+                logging.info(f"/send_messages: Client disconnected from streamed request '{request_id}'; cancelling.")
+                cancel_token.cancel()
+            registry.unregister(request_id, cancel_token, owner)
+
+        response = Response(generate(), mimetype='application/x-ndjson')
+        response.call_on_close(on_close)
+        return response
+
+    try:
+        results = [future.result() for future in futures]
+    finally:
+        cancellation_registry.unregister(request_id, cancel_token, owner)
+    return jsonify({'results': results, 'error': None})
+
+def answer_socket_question(payload, cancel_token):
+    """
+    Answers one question sent over the WebSocket channel, as /send_message
+    answers it with 'stream': true.
+
+    Args:
+        payload (dict): The question: 'message' and optional 'mode'.
+        cancel_token (CancellationToken): The question's token.
+
+    Yields:
+        dict: Events for the client, without the 'request_id': {'delta'} chunks
+              of a streamed LLM reply, then {'done': True}; or a single
+              {'reply', 'error', 'done': True} event (plus 'sources' or
+              'suggestions') for errors and extractive answers.
+    """
+    def final(reply=None, error=None, **extra):
+        return {'reply': reply, 'error': error, **extra, 'done': True}
+
+    user_message = payload.get('message')
+    if not isinstance(user_message, str):
+        yield final(error="Invalid request: No message provided.")
+        return
+    user_message = user_message.strip()
+    if not user_message:
+        yield final(error="Please enter a question.")
+        return
+
+    query = parse_query(user_message)
+    logging.info(f"/ws: Parsed query: {query!r}")
+    try:
+        result = answer_question(query, payload.get('mode', 'llm'), cancel_token, llm_admission, stream=True)
+    except RequestCancelled:
+        yield final(error="Request was cancelled.")
+        return
+    except AdmissionRejected as e:
+        logging.warning(f"/ws: LLM request shed by admission control ({e.reason}).")
+        yield final(error="The assistant is busy right now. Please try again in a moment.")
+        return
+    reply_stream = result.pop('stream', None)
+    if reply_stream is None:
+        yield final(**result)
+        return
+    try:
+        for chunk in reply_stream:
+            yield {'delta': chunk}
+    except RequestCancelled:
+        yield final(error="Request was cancelled.")
+        return
+    except Exception as e:
+        logging.error(f"Error during streamed LLM interaction (mock or real): {e}")
+        yield final(error="Sorry, there was an issue getting a response from the assistant.")
+        return
+    finally:
+        reply_stream.close()
+    yield {'done': True}
+
+@sock.route('/ws', bp=bp)
+def chat_socket(ws):
+    """
+    WebSocket chat channel: many questions over one persistent connection.
+
+    The client sends JSON text messages:
+    {'type': 'ask', 'request_id', 'message', 'mode'} to ask a question and
+    {'type': 'cancel', 'request_id'} to cancel one.
+    Several questions may be in flight at once; the answers are multiplexed as
+    JSON events tagged with the question's 'request_id' (see
+    `answer_socket_question`). The last event of each question has
+    'done': true. A question can only be cancelled over its own connection,
+    and all of a connection's questions are cancelled when it closes.
+    Connections beyond SOCKET_MAX_CONNECTIONS are closed with code 1013.
+    """
+    slots = _socket_slots
+    if SOCKET_MAX_CONNECTIONS is not None and (slots is None or not slots.acquire(blocking=False)):
+        logging.warning(f"/ws: Rejecting connection: {SOCKET_MAX_CONNECTIONS} WebSockets are already open.")
+        socket_rejected_counter.inc()
+        ws.close(reason=SOCKET_TRY_AGAIN_LATER, message="Too many open connections; try again later.")
+        return
+    try:
+        _serve_socket(ws)
+    finally:
+        if slots is not None:
+            slots.release()
+
+def _serve_socket(ws):
+    try:
+        # Answers are many small frames; without this, Nagle's algorithm holds
+        # each one back until the client acknowledges the previous one.
+        ws.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    except (AttributeError, OSError): # Not a TCP socket (e.g., gunicorn bound to a Unix socket)
+        pass
+    send_lock = threading.Lock()
+    connection = object() # Owns this connection's registrations, so only it can cancel them
+    in_flight = {} # request_id -> CancellationToken
+    in_flight_lock = threading.Lock()
+
+    def send(event):
+        with send_lock:
+            ws.send(json.dumps(event))
+
+    def answer(request_id, payload, cancel_token):
+        try:
+            for event in answer_socket_question(payload, cancel_token):
+                send({'request_id': request_id, **event})
+        except ConnectionClosed:
+            cancel_token.cancel()
+        except Exception:
+            logging.exception("An unexpected error occurred answering a /ws question:")
+            try:
+                send({'request_id': request_id, 'reply': None, 'done': True,
+                      'error': "An unexpected error occurred on the server. Please try again later."})
+            except ConnectionClosed:
+                pass
+        finally:
+            cancellation_registry.unregister(request_id, cancel_token, connection)
+            with in_flight_lock: # Only now may the id be reused
+                in_flight.pop(request_id, None)
+
+    try:
+        while True:
+            try:
+                payload = json.loads(ws.receive())
+            except (TypeError, ValueError):
+                payload = None
+            if not isinstance(payload, dict):
+                send({'request_id': None, 'reply': None, 'error': "Invalid request: Expected a JSON object.", 'done': True})
+                continue
+            request_id = payload.get('request_id')
+            if payload.get('type') == 'cancel':
+                with in_flight_lock:
+                    cancel_token = in_flight.get(request_id)
+                if cancel_token is not None:
+                    logging.info(f"/ws: Request '{request_id}' cancelled by the client.")
+                    cancel_token.cancel()
+                continue
+
+            error = None
+            with in_flight_lock:
+                if not request_id or not isinstance(request_id, str):
+                    error = "Invalid request: No request_id provided."
+                elif request_id in in_flight:
+                    error = f"Request '{request_id}' is already in progress."
+                elif len(in_flight) >= SOCKET_MAX_IN_FLIGHT:
+                    error = f"Please wait for an answer: at most {SOCKET_MAX_IN_FLIGHT} questions can be in progress at once."
+                else:
+                    cancel_token = cancellation_registry.register(request_id, connection)
+                    in_flight[request_id] = cancel_token
+            if error:
+                send({'request_id': request_id, 'reply': None, 'error': error, 'done': True})
+                continue
+            socket_question_executor.submit(_with_app_context(answer), request_id, payload, cancel_token)
+    finally:
+        with in_flight_lock:
+            cancel_tokens = list(in_flight.values())
+        if cancel_tokens:
+            logging.info(f"/ws: Connection closed; cancelling {len(cancel_tokens)} questions in progress.")
+        for cancel_token in cancel_tokens:
+            cancel_token.cancel()
+
+@bp.route('/cancel', methods=['POST'])
+def cancel_request():
+    """
+    Cancels an in-flight /send_message or /send_messages request.
+
+    Expects a JSON payload with the 'request_id' the request was sent with.
+    Only requests sent from the same client address can be cancelled.
+    Returns {'cancelled': bool}; False means the request was unknown, had
+    already finished or belongs to another client.
+    """
+    # force=True: navigator.sendBeacon may not send an application/json content type
+    data = request.get_json(silent=True, force=True) or {}
+    request_id = data.get('request_id')
+    if not request_id:
+        return jsonify({'cancelled': False, 'error': "Invalid request: No request_id provided."}), 400
+    cancelled = cancellation_registry.cancel(request_id, _request_owner())
+    logging.info(f"/cancel: request '{request_id}' cancelled={cancelled}.")
+    return jsonify({'cancelled': cancelled, 'error': None})
+
+@bp.route('/metrics')
+def metrics_snapshot():
+    """
+    Returns a JSON snapshot of the server's internal metrics
+    (e.g., LLM batch-size and queue-wait histograms): the process-wide ones
+    plus this app's.
+    """
+    return jsonify({**metrics.snapshot(), **current_state().metrics.snapshot()})
+
+@bp.route('/search')
+def search():
+    """
+    Full-text searches the local corpus of ingested posts and comments.
+
+    Query parameters:
+        q: The search text (required).
+        subreddit: Restricts results to one subreddit (optional).
+        limit: Maximum number of results (default 10, at most 50).
+
+    Returns a JSON response with 'results' (each with a 'snippet', the
+    HTML-escaped post text with matched terms wrapped in <mark> tags, plus
+    plain-text 'title', 'permalink', 'score'...) and an 'error' key.
+    """
+    query = request.args.get('q', '').strip()
+    subreddit = request.args.get('subreddit', '').strip() or None
+    if not query:
+        return jsonify({'results': [], 'error': "Invalid request: No search query provided."}), 400
+    store = _resolve(corpus_store)
+    if store is None:
+        return jsonify({'results': [], 'error': "Search is not available: no corpus store is configured."}), 503
+    limit = min(request.args.get('limit', 10, type=int) or 10, SEARCH_MAX_LIMIT)
+
+    try:
+        results = store.search(query, subreddit=subreddit, limit=limit)
+    except Exception:
+        logging.exception("An unexpected error occurred in the /search route:")
+        return jsonify({'results': [], 'error': "An unexpected error occurred on the server. Please try again later."}), 500
+    return jsonify({'results': results, 'error': None})
+
+@bp.route('/analytics/<subreddit>')
+def subreddit_analytics(subreddit):
+    """
+    Returns activity statistics for a subreddit, computed from the
+    incrementally maintained hourly/daily rollups.
+
+    Query parameters:
+        days: Window length in days, ending today (default 30).
+
+    Returns a JSON response with 'analytics' (activity histograms per UTC hour
+    and weekday, a daily series, growth, score percentiles and top
+    contributors) and an 'error' key.
+    """
+    days = min(max(request.args.get('days', 30, type=int) or 30, 1), RETENTION_DAYS)
+    report = analytics.report(subreddit, days=days)
+    if report is None:
+        return jsonify({'analytics': None, 'error': f"No activity has been recorded for r/{subreddit} yet."}), 404
+    return jsonify({'analytics': report, 'error': None})
+
+@bp.route('/trends/<subreddit>')
+def subreddit_trends(subreddit):
+    """
+    Returns the terms trending in a subreddit right now: terms whose count in
+    the last few hours is well above their decayed baseline.
+
+    Query parameters:
+        limit: Maximum number of terms (default 10, at most 50).
+
+    Returns a JSON response with 'trends' ('window_hours', 'baseline_hours' and
+    'terms', each with 'term', 'count', 'expected' and 'score') and an 'error' key.
+    """
+    limit = min(request.args.get('limit', 10, type=int) or 10, TRENDS_MAX_TERMS)
+    trends = trend_detector.trending(subreddit, k=limit)
+    if trends is None:
+        return jsonify({'trends': None, 'error': f"No posts from r/{subreddit} have been seen yet."}), 404
+    return jsonify({'trends': trends, 'error': None})
+
+@bp.route('/sentiment/<subreddit>')
+def subreddit_sentiment(subreddit):
+    """
+    Returns the sentiment of a subreddit's posts and comments, from the
+    incrementally maintained aggregates.
+
+    Query parameters:
+        thread: A submission id; returns only that thread's aggregate.
+        limit: Maximum number of threads listed (default 10, at most 50).
+
+    Returns a JSON response with 'sentiment' (the overall aggregate under
+    'subreddit' and the busiest 'threads', each with 'items', 'mean' compound
+    score and the 'positive'/'negative'/'neutral' shares) and an 'error' key.
+    """
+    thread_id = request.args.get('thread', '').strip()
+    if thread_id:
+        summary = sentiment.thread(subreddit, thread_id)
+        if summary is None:
+            return jsonify({'sentiment': None, 'error': f"No posts or comments of thread {thread_id} in r/{subreddit} have been scored yet."}), 404
+        return jsonify({'sentiment': dict(summary, id=thread_id), 'error': None})
+    limit = min(request.args.get('limit', 10, type=int) or 10, SENTIMENT_MAX_THREADS)
+    report = sentiment.report(subreddit, threads=limit)
+    if report is None:
+        return jsonify({'sentiment': None, 'error': f"No posts or comments from r/{subreddit} have been scored yet."}), 404
+    return jsonify({'sentiment': report, 'error': None})
+
+@bp.route('/autocomplete')
+def autocomplete():
+    """
+    Suggests subreddit names for what the user has typed after "@r/", so a typo
+    is caught before it costs a Reddit round trip.
+
+    Query parameters:
+        prefix: The partial name ("py", "r/py" and "@r/py" are equivalent).
+        limit: Maximum number of suggestions (default 8, at most 20).
+
+    Returns a JSON response with 'suggestions' (each with 'name' and
+    'subscribers', most subscribers first) and an 'error' key.
+    """
+    prefix = request.args.get('prefix', '').strip()
+    limit = min(request.args.get('limit', 8, type=int) or 8, AUTOCOMPLETE_MAX_LIMIT)
+    if subreddit_name_index is None or not prefix:
+        return jsonify({'suggestions': [], 'error': None})
+    return jsonify({'suggestions': subreddit_name_index.complete(prefix, k=limit), 'error': None})
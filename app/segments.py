@@ -0,0 +1,534 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from app import metrics
+from app.bm25 import BM25Index, bm25_idf, tokenize
+from app.embeddings import HashingEmbedder, _top_k
+
+# Documents buffered in the mutable segment before it is sealed.
+DEFAULT_SEAL_THRESHOLD = 1000
+
+# Number of similarly sized sealed segments merged together.
+DEFAULT_MERGE_FACTOR = 4
+
+# Sealed segments with more than this fraction of deleted rows are rewritten.
+EXPUNGE_DELETES_RATIO = 0.3
+
+
+class Segment:
+    """
+    An immutable batch of documents with its own BM25 index and vector matrix.
+
+    Only the tombstone bitmap changes after a segment is built: deleting (or
+    replacing) a document sets its bit, and searches skip rows whose bit is set.
+    """
+
+    def __init__(self, item_ids, texts, subreddits, vectors):
+        """
+        Args:
+            item_ids (list): Document ids (str), one per row.
+            texts (list): Document texts, indexed with BM25.
+            subreddits (list): Lowercased subreddit name per row (or '').
+            vectors (numpy.ndarray): (rows, dim) float32 unit-length embeddings
+                ((rows, 0) for an index without vectors).
+        """
+        self.item_ids = list(item_ids)
+        self.texts = list(texts)
+        self.subreddits = np.array(subreddits, dtype=str)
+        self.vectors = vectors
+        self.text_index = BM25Index(self.texts)
+        self.rows = {item_id: row for row, item_id in enumerate(self.item_ids)}
+        self.tombstones = np.zeros(len(self.item_ids), dtype=bool)
+
+    def __len__(self):
+        return len(self.item_ids)
+
+    @property
+    def live_count(self):
+        return len(self) - int(np.count_nonzero(self.tombstones))
+
+    @property
+    def deleted_ratio(self):
+        return 1.0 - self.live_count / len(self) if len(self) else 0.0
+
+    def live_mask(self, subreddit=None, item_ids=None):
+        """Returns a boolean mask of rows that are not deleted (and in `subreddit` and `item_ids`)."""
+        mask = ~self.tombstones
+        if subreddit:
+            mask &= self.subreddits == subreddit.lower()
+        if item_ids is not None:
+            allowed = np.zeros(len(self), dtype=bool)
+            allowed[[row for row in map(self.rows.get, item_ids) if row is not None]] = True
+            mask &= allowed
+        return mask
+
+    def doc_freq(self, token):
+        """Number of rows (including deleted ones) containing `token`."""
+        term_id = self.text_index.vocabulary.get(token)
+        if term_id is None:
+            return 0
+        return int(self.text_index.indptr[term_id + 1] - self.text_index.indptr[term_id])
+
+
+class SegmentedIndex:
+    """
+    An incrementally updated text (BM25) and vector index.
+
+    New documents are embedded and appended to a small mutable buffer. When the
+    buffer reaches `seal_threshold` documents it is sealed into an immutable
+    `Segment`. A merge policy compacts sealed segments: `merge_factor` segments
+    of the same size tier are merged into one, and segments with many deleted
+    rows are rewritten without them. Merges run on a background thread and build
+    the new segment without holding the index lock; the segment list is then
+    swapped in one step. Queries work on a snapshot of the segment list, so they
+    never wait for a merge.
+
+    Deletes and updates never modify a sealed segment's rows: they set a bit in
+    its tombstone bitmap (an update is a delete followed by an add).
+    """
+
+    def __init__(self, embedder=None, seal_threshold=DEFAULT_SEAL_THRESHOLD, merge_factor=DEFAULT_MERGE_FACTOR,
+                 background_merge=True, name='segments', vectors=True, max_documents=None):
+        """
+        Args:
+            embedder (HashingEmbedder, optional): Embeds document texts.
+            seal_threshold (int): Buffered documents before sealing a segment.
+            merge_factor (int): Segments per size tier that trigger a merge.
+            background_merge (bool): Run merges on a background thread. When
+                False, call `maybe_merge()` explicitly.
+            name (str): Prefix of the exported metrics, or None to keep them
+                out of the process-wide registry.
+            vectors (bool): Embed documents for `search_vectors`. A text-only
+                index (False) skips embedding on every add.
+            max_documents (int, optional): Keeps at most this many documents;
+                beyond it, the least recently added (or re-added) ones are
+                deleted.
+        """
+        self.embedder = (embedder or HashingEmbedder()) if vectors else None
+        self.max_documents = max_documents
+        self.seal_threshold = seal_threshold
+        self.merge_factor = merge_factor
+        self.background_merge = background_merge
+        self._lock = threading.Lock()
+        self._merge_lock = threading.Lock()
+        self._segments = ()  # Sealed segments; replaced, never mutated in place.
+        self._buffer = {}  # item_id -> (text, subreddit, vector), in insertion order.
+        self._buffer_segment = None  # Searchable snapshot of the buffer.
+        self._live = OrderedDict()  # item_id -> (text, subreddit) of live documents, least recently added first.
+        self._merge_wakeup = threading.Event()
+        self._merge_thread = None
+        self._closed = False
+        if name is None:
+            self.segments_gauge = metrics.Gauge('segments', "Sealed index segments.")
+            self.merges = metrics.Counter('merges', "Segment merges completed.")
+            self.merge_ms = metrics.Histogram('merge_ms', metrics.LATENCY_MS_BUCKETS,
+                                              description="Time spent building a merged segment.")
+        else:
+            self.segments_gauge = metrics.gauge(f'{name}_segments', "Sealed index segments.")
+            self.merges = metrics.counter(f'{name}_merges', "Segment merges completed.")
+            self.merge_ms = metrics.histogram(f'{name}_merge_ms', description="Time spent building a merged segment.")
+
+    def __len__(self):
+        with self._lock:
+            return len(self._live)
+
+    @property
+    def segments(self):
+        """The current tuple of sealed segments."""
+        return self._segments
+
+    def add(self, item_id, text, subreddit=None):
+        """Adds (or replaces) one document."""
+        self.add_many([{'id': item_id, 'text': text, 'subreddit': subreddit}])
+
+    def add_many(self, documents):
+        """
+        Adds (or replaces) documents. Documents already indexed with the same
+        text and subreddit are left as they are, so re-adding an unchanged
+        listing costs neither an embedding nor a tombstone (it only marks the
+        documents as recently added, for `max_documents`).
+
+        Args:
+            documents (list): Dicts with 'id', 'text' and optional 'subreddit'.
+        """
+        with self._lock:
+            changed = []
+            for document in documents:
+                live = self._live.get(document['id'])
+                if live == (document['text'], (document.get('subreddit') or '').lower()):
+                    self._live.move_to_end(document['id'])
+                else:
+                    changed.append(document)
+            documents = changed
+        if not documents:
+            return
+        if self.embedder is not None:
+            vectors = self.embedder.embed_batch([document['text'] for document in documents])
+        else:
+            vectors = np.empty((len(documents), 0), dtype=np.float32)
+        with self._lock:
+            for document, vector in zip(documents, vectors):
+                self._delete_locked(document['id'])
+                subreddit = (document.get('subreddit') or '').lower()
+                self._buffer[document['id']] = (document['text'], subreddit, vector)
+                self._live[document['id']] = (document['text'], subreddit)
+            if self.max_documents is not None:
+                while len(self._live) > self.max_documents:
+                    self._delete_locked(next(iter(self._live)))
+            self._buffer_segment = None
+            if len(self._buffer) >= self.seal_threshold:
+                self._seal_locked()
+
+    def delete(self, item_id):
+        """
+        Deletes a document.
+
+        Returns:
+            bool: True if a live document with this id existed.
+        """
+        with self._lock:
+            return self._delete_locked(item_id)
+
+    def flush(self):
+        """Seals the mutable buffer into a segment, even if it is not full."""
+        with self._lock:
+            if self._buffer:
+                self._seal_locked()
+
+    def _delete_locked(self, item_id):
+        if self._live.pop(item_id, None) is None:
+            return False
+        if self._buffer.pop(item_id, None) is not None:
+            self._buffer_segment = None
+            return True
+        for segment in self._segments:
+            row = segment.rows.get(item_id)
+            if row is not None and not segment.tombstones[row]:
+                segment.tombstones[row] = True
+                return True
+        return False
+
+    def _buffer_as_segment(self):
+        item_ids = list(self._buffer)
+        texts, subreddits, vectors = zip(*self._buffer.values()) if self._buffer else ((), (), ())
+        dim = self.embedder.dim if self.embedder is not None else 0
+        matrix = np.vstack(vectors) if vectors else np.empty((0, dim), dtype=np.float32)
+        return Segment(item_ids, texts, subreddits, matrix)
+
+    def _seal_locked(self):
+        self._segments = self._segments + (self._buffer_as_segment(),)
+        self._buffer = {}
+        self._buffer_segment = None
+        self.segments_gauge.set(len(self._segments))
+        if self.background_merge:
+            self._ensure_merge_thread()
+            self._merge_wakeup.set()
+
+    def _snapshot(self):
+        """Returns the segments a query should search, including the buffer."""
+        with self._lock:
+            if not self._buffer:
+                return self._segments
+            if self._buffer_segment is None:
+                self._buffer_segment = self._buffer_as_segment()
+            return self._segments + (self._buffer_segment,)
+
+    def _pick_merge(self, segments):
+        """Merge policy: returns the segments to merge next, or None."""
+        for segment in segments:
+            if segment.deleted_ratio > EXPUNGE_DELETES_RATIO:
+                return [segment]
+        tiers = {}
+        for segment in segments:
+            # Tier t holds segments of [seal_threshold * merge_factor**t, seal_threshold * merge_factor**(t+1)) rows.
+            tier = 0
+            while segment.live_count >= self.seal_threshold * self.merge_factor ** (tier + 1):
+                tier += 1
+            tiers.setdefault(tier, []).append(segment)
+        for tier in sorted(tiers):
+            if len(tiers[tier]) >= self.merge_factor:
+                return tiers[tier][:self.merge_factor]
+        return None
+
+    def maybe_merge(self):
+        """
+        Runs merges until the merge policy has nothing left to do.
+
+        Returns:
+            int: The number of merges performed.
+        """
+        return self._merge_until_done(self._pick_merge)
+
+    def force_merge(self):
+        """
+        Merges all sealed segments into one, dropping deleted rows.
+
+        Returns:
+            int: The number of merges performed (0 or 1).
+        """
+        return self._merge_until_done(lambda segments: list(segments) if len(segments) > 1 else None, once=True)
+
+    def _merge_until_done(self, pick, once=False):
+        merged_count = 0
+        with self._merge_lock:
+            while not (once and merged_count):
+                with self._lock:
+                    sources = pick(self._segments)
+                    if not sources:
+                        return merged_count
+                    live_rows = [np.flatnonzero(~source.tombstones) for source in sources]
+
+                started = time.perf_counter()
+                merged = Segment(
+                    [source.item_ids[row] for source, rows in zip(sources, live_rows) for row in rows],
+                    [source.texts[row] for source, rows in zip(sources, live_rows) for row in rows],
+                    np.concatenate([source.subreddits[rows] for source, rows in zip(sources, live_rows)]),
+                    np.vstack([source.vectors[rows] for source, rows in zip(sources, live_rows)]),
+                )
+                self.merge_ms.observe((time.perf_counter() - started) * 1000.0)
+
+                with self._lock:
+                    # Carry over deletes that happened while the merge was running.
+                    offset = 0
+                    for source, rows in zip(sources, live_rows):
+                        merged.tombstones[offset:offset + len(rows)] |= source.tombstones[rows]
+                        offset += len(rows)
+                    remaining = [segment for segment in self._segments if not any(segment is s for s in sources)]
+                    self._segments = tuple(remaining + ([merged] if len(merged) else []))
+                    self.segments_gauge.set(len(self._segments))
+                self.merges.inc()
+                merged_count += 1
+        return merged_count
+
+    def _ensure_merge_thread(self):
+        if self._merge_thread is None and not self._closed:
+            self._merge_thread = threading.Thread(target=self._merge_loop, name='segment-merge', daemon=True)
+            self._merge_thread.start()
+
+    def _merge_loop(self):
+        while True:
+            self._merge_wakeup.wait()
+            self._merge_wakeup.clear()
+            if self._closed:
+                return
+            try:
+                self.maybe_merge()
+            except Exception as e:
+                logging.error(f"Segment merge failed: {e}", exc_info=True)
+
+    def close(self):
+        """Stops the background merge thread."""
+        self._closed = True
+        self._merge_wakeup.set()
+        if self._merge_thread is not None:
+            self._merge_thread.join()
+            self._merge_thread = None
+
+    def search_text(self, query, k=10, subreddit=None, item_ids=None):
+        """
+        BM25 search over all segments.
+
+        Inverse document frequencies are computed over the whole collection at
+        query time (summing each segment's document frequencies), so scores from
+        different segments are comparable.
+
+        Args:
+            query (str): The query text.
+            k (int): Number of results.
+            subreddit (str, optional): Only return documents from this subreddit.
+            item_ids (collection, optional): Only return documents with these ids.
+
+        Returns:
+            list: (item_id, score) tuples with a positive score, best first.
+        """
+        segments = self._snapshot()
+        tokens = sorted(set(tokenize(query)))
+        if not tokens or not segments:
+            return []
+        num_docs = sum(len(segment) for segment in segments)
+        idf = dict(zip(tokens, bm25_idf(num_docs, [sum(s.doc_freq(t) for s in segments) for t in tokens])))
+
+        results = []
+        for segment in segments:
+            known = [token for token in tokens if token in segment.text_index.vocabulary]
+            if not known:
+                continue
+            term_ids = np.array([segment.text_index.vocabulary[token] for token in known], dtype=np.int64)
+            scores = segment.text_index.score_terms(term_ids, np.array([idf[token] for token in known]))
+            scores[~segment.live_mask(subreddit, item_ids)] = 0.0
+            rows, top_scores = _top_k(scores, k)
+            results.extend((float(score), segment.item_ids[row]) for row, score in zip(rows, top_scores) if score > 0)
+        results.sort(key=lambda result: -result[0])
+        return [(item_id, score) for score, item_id in results[:k]]
+
+    def search_vectors(self, query_vector, k=10, subreddit=None):
+        """
+        Exact inner-product search over all segments.
+
+        Args:
+            query_vector (numpy.ndarray): A (dim,) unit-length query embedding.
+            k (int): Number of results.
+            subreddit (str, optional): Only return documents from this subreddit.
+
+        Returns:
+            list: (item_id, score) tuples, best first.
+        """
+        if self.embedder is None:
+            raise ValueError("This index was built without vectors (vectors=False).")
+        query_vector = np.asarray(query_vector, dtype=np.float32)
+        results = []
+        for segment in self._snapshot():
+            if not len(segment):
+                continue
+            scores = segment.vectors @ query_vector
+            scores[~segment.live_mask(subreddit)] = -np.inf
+            rows, top_scores = _top_k(scores, k)
+            results.extend((float(score), segment.item_ids[row])
+                           for row, score in zip(rows, top_scores) if np.isfinite(score))
+        results.sort(key=lambda result: -result[0])
+        return [(item_id, score) for score, item_id in results[:k]]
+
+    def search(self, query, k=10, subreddit=None):
+        """Vector search for the embedding of the query text."""
+        if self.embedder is None:
+            raise ValueError("This index was built without vectors (vectors=False).")
+        return self.search_vectors(self.embedder.embed(query), k=k, subreddit=subreddit)
+
+    def stats(self):
+        """Returns a dict with segment, buffer and deletion counts."""
+        with self._lock:
+            segments = self._segments
+            buffered = len(self._buffer)
+        return {
+            'segments': len(segments),
+            'segment_sizes': [len(segment) for segment in segments],
+            'buffered': buffered,
+            'documents': buffered + sum(segment.live_count for segment in segments),
+            'deleted': sum(len(segment) - segment.live_count for segment in segments),
+        }
+
+
+class SegmentedIndexCache:
+    """
+    Keeps one text-only SegmentedIndex per subreddit, for ranking the candidate
+    posts of a question.
+
+    Each index holds at most `max_documents` posts (the least recently added
+    are deleted, and merges drop them), and at most `capacity` subreddits are
+    kept (the least recently used is dropped). Memory and ranking time stay
+    bounded however many posts the server sees. `max_documents` should exceed
+    the number of candidates ranked at once.
+
+    The indexes are merged by one background thread shared by all of them.
+    """
+
+    def __init__(self, capacity=256, max_documents=1000, seal_threshold=64, merge_factor=DEFAULT_MERGE_FACTOR,
+                 name='segment_cache', registry=None):
+        """
+        Args:
+            capacity (int): Subreddits kept.
+            max_documents (int): Documents kept per subreddit.
+            seal_threshold (int): Seal threshold of each subreddit's index.
+            merge_factor (int): Merge factor of each subreddit's index.
+            name (str): Prefix of the exported metrics.
+            registry (metrics.Registry, optional): Where the metrics are
+                registered; the process-wide registry by default.
+        """
+        self.capacity = capacity
+        self.max_documents = max_documents
+        self.seal_threshold = seal_threshold
+        self.merge_factor = merge_factor
+        self._indexes = OrderedDict()  # subreddit -> SegmentedIndex
+        self._lock = threading.Lock()
+        self._to_merge = OrderedDict()  # Indexes that sealed a segment since their last merge (keyed by id)
+        self._merge_wakeup = threading.Event()
+        self._merge_thread = None
+        self._closed = False
+        registry = metrics if registry is None else registry
+        self.subreddits_gauge = registry.gauge(f'{name}_subreddits', "Subreddits with a live index.")
+        self.merge_ms = registry.histogram(f'{name}_merge_ms', description="Time spent merging segments.")
+
+    def get(self, subreddit):
+        """Returns the index of `subreddit`, creating it (and dropping the least recently used) if needed."""
+        subreddit = subreddit.lower()
+        with self._lock:
+            index = self._indexes.get(subreddit)
+            if index is None:
+                # Merged by this cache's thread: one merge thread per subreddit would be too many.
+                index = SegmentedIndex(seal_threshold=self.seal_threshold, merge_factor=self.merge_factor,
+                                       background_merge=False, name=None, vectors=False,
+                                       max_documents=self.max_documents)
+                self._indexes[subreddit] = index
+                while len(self._indexes) > self.capacity:
+                    _, dropped = self._indexes.popitem(last=False)
+                    self._to_merge.pop(id(dropped), None)
+                self.subreddits_gauge.set(len(self._indexes))
+            self._indexes.move_to_end(subreddit)
+            return index
+
+    def rank(self, subreddit, documents, query, k):
+        """
+        Adds a subreddit's candidate documents to its index and returns the ids
+        of the `k` best matches among them for `query` (BM25), best first.
+
+        Args:
+            subreddit (str): The subreddit name.
+            documents (list): Dicts with 'id' and 'text'.
+            query (str): The query text.
+            k (int): Number of results.
+        """
+        index = self.get(subreddit)
+        sealed = len(index.segments)
+        index.add_many(documents)
+        if len(index.segments) != sealed:
+            with self._lock:
+                self._to_merge[id(index)] = index
+                if self._merge_thread is None and not self._closed:
+                    self._merge_thread = threading.Thread(target=self._merge_loop, name='segment-cache-merge',
+                                                          daemon=True)
+                    self._merge_thread.start()
+            self._merge_wakeup.set()
+        return [item_id for item_id, _ in index.search_text(query, k=k,
+                                                            item_ids={document['id'] for document in documents})]
+
+    def _merge_loop(self):
+        while True:
+            self._merge_wakeup.wait()
+            self._merge_wakeup.clear()
+            while not self._closed:
+                with self._lock:
+                    if not self._to_merge:
+                        break
+                    _, index = self._to_merge.popitem(last=False)
+                started = time.perf_counter()
+                try:
+                    merged = index.maybe_merge()
+                except Exception as e:
+                    logging.error(f"Segment merge failed: {e}", exc_info=True)
+                    continue
+                if merged:
+                    self.merge_ms.observe((time.perf_counter() - started) * 1000.0)
+            if self._closed:
+                return
+
+    def close(self):
+        """Stops the background merge thread."""
+        self._closed = True
+        self._merge_wakeup.set()
+        if self._merge_thread is not None:
+            self._merge_thread.join()
+            self._merge_thread = None
+
+    def __len__(self):
+        with self._lock:
+            return len(self._indexes)
+
+    def stats(self):
+        """Returns a dict with the number of subreddits and indexed documents."""
+        with self._lock:
+            indexes = list(self._indexes.values())
+        return {'subreddits': len(indexes), 'documents': sum(len(index) for index in indexes)}
@@ -0,0 +1,266 @@
+import threading
+
+import numpy as np
+
+from app.dedup import word_hashes
+
+# Valence of common sentiment-bearing words on a -4..4 scale (in the spirit of
+# the VADER lexicon). Words are matched lower-cased; contractions are split on
+# the apostrophe, so "don't" is the two words "don" and "t".
+LEXICON = {
+    # Positive
+    'good': 1.9, 'great': 3.1, 'excellent': 3.2, 'amazing': 2.8, 'awesome': 3.1, 'fantastic': 2.6,
+    'wonderful': 2.7, 'best': 3.2, 'better': 1.9, 'love': 3.2, 'loved': 2.9, 'loving': 2.9, 'loves': 2.7,
+    'like': 1.5, 'liked': 1.8, 'likes': 1.8, 'enjoy': 2.2, 'enjoyed': 2.3, 'nice': 1.8, 'cool': 1.3,
+    'happy': 2.7, 'glad': 2.0, 'thanks': 1.9, 'thank': 1.5, 'helpful': 1.8, 'useful': 1.9, 'easy': 1.9,
+    'recommend': 1.5, 'recommended': 1.7, 'perfect': 2.7, 'beautiful': 2.9, 'brilliant': 2.8, 'fun': 2.3,
+    'impressive': 2.3, 'interesting': 1.7, 'solid': 1.2, 'fast': 1.0, 'clean': 1.7, 'elegant': 2.1,
+    'favorite': 2.0, 'favourite': 2.0, 'win': 2.8, 'wins': 2.7, 'winning': 2.4, 'success': 2.7,
+    'successful': 2.8, 'works': 1.0, 'worked': 1.0, 'fixed': 1.0, 'support': 1.7, 'agree': 1.5,
+    'appreciate': 1.7, 'appreciated': 2.3, 'excited': 1.4, 'exciting': 2.2, 'incredible': 2.7, 'super': 2.9,
+    'worth': 0.9, 'hope': 1.9, 'hopeful': 1.6, 'yes': 1.7, 'lol': 1.9, 'haha': 2.0, 'wow': 2.8,
+    'safe': 1.9, 'stable': 1.2, 'smooth': 1.2, 'friendly': 2.2, 'kind': 2.4, 'welcome': 2.0, 'praise': 2.6,
+    'satisfied': 1.8, 'pleased': 1.9, 'positive': 2.6, 'fair': 1.3, 'reliable': 1.9, 'improved': 2.1,
+    'improvement': 2.0, 'upgrade': 1.3, 'clever': 2.0, 'smart': 1.7, 'superb': 3.1, 'outstanding': 3.0,
+    # Negative
+    'bad': -2.5, 'worse': -2.1, 'worst': -3.1, 'terrible': -2.1, 'awful': -2.0, 'horrible': -2.5,
+    'hate': -2.7, 'hated': -3.2, 'hates': -1.9, 'dislike': -1.6, 'poor': -2.1, 'sucks': -1.5,
+    'suck': -1.9, 'crap': -1.6, 'garbage': -2.1, 'trash': -1.6, 'useless': -1.8, 'broken': -2.1,
+    'bug': -1.1, 'buggy': -1.8, 'bugs': -1.1, 'crash': -1.7, 'crashes': -1.7, 'slow': -1.0,
+    'annoying': -1.7, 'annoyed': -1.6, 'angry': -2.3, 'sad': -2.1, 'disappointed': -1.9,
+    'disappointing': -2.2, 'frustrating': -1.9, 'frustrated': -1.5, 'confusing': -1.3, 'confused': -1.3,
+    'hard': -0.4, 'difficult': -1.5, 'problem': -1.7, 'problems': -1.7, 'issue': -0.6, 'issues': -0.6,
+    'fail': -2.5, 'failed': -2.3, 'fails': -1.8, 'failure': -2.3, 'wrong': -2.1, 'stupid': -2.4,
+    'scam': -2.6, 'toxic': -1.9, 'ugly': -2.3, 'boring': -1.3, 'waste': -1.8, 'wasted': -2.2,
+    'avoid': -1.2, 'overpriced': -1.5, 'expensive': -0.9, 'worried': -1.2, 'worry': -1.9,
+    'fear': -2.2, 'scared': -1.9, 'pain': -2.3, 'painful': -1.9, 'nightmare': -2.4, 'disaster': -3.1,
+    'mess': -1.5, 'lost': -1.3, 'lose': -1.7, 'losing': -1.6, 'unfortunately': -1.4, 'sorry': -0.3,
+    'no': -1.2, 'against': -1.0, 'ridiculous': -1.5, 'insane': -1.7, 'dead': -3.3, 'die': -2.9,
+    'kill': -3.7, 'killed': -3.5, 'bias': -0.4, 'biased': -1.1, 'unfair': -2.1, 'negative': -2.7,
+    'complain': -1.5, 'complaint': -1.2, 'regret': -1.8, 'unstable': -1.5, 'outdated': -1.0,
+    'deprecated': -0.8, 'bloated': -1.2, 'meh': -0.5, 'lame': -1.8, 'weak': -1.9, 'risky': -0.8,
+}
+
+# Words that flip the valence of the NEGATION_WINDOW words after them.
+NEGATIONS = ('not', 'no', 'never', 'nothing', 'nobody', 'none', 'neither', 'nor', 'without', 'cannot',
+             'don', 'doesn', 'didn', 'isn', 'wasn', 'aren', 'weren', 'won', 'wouldn', 'shouldn', 'couldn',
+             'hasn', 'haven', 'hadn', 'ain', 't')
+NEGATION_WINDOW = 3
+NEGATION_SCALAR = -0.74
+
+# Normalizes a text's summed valence into [-1, 1]: s / sqrt(s^2 + ALPHA).
+NORMALIZATION_ALPHA = 15.0
+
+# Compound scores at or beyond these bounds are labelled positive / negative.
+POSITIVE_THRESHOLD = 0.05
+NEGATIVE_THRESHOLD = -0.05
+
+
+class EncodedTexts:
+    """
+    Sparse lexicon encoding of a batch of texts (CSR layout): the lexicon term
+    ids of text i are `term_ids[indptr[i]:indptr[i + 1]]`, and `negated` marks
+    the occurrences that follow a negation.
+    """
+
+    def __init__(self, indptr, term_ids, negated):
+        self.indptr = indptr
+        self.term_ids = term_ids
+        self.negated = negated
+
+    def __len__(self):
+        return len(self.indptr) - 1
+
+
+class SentimentLexicon:
+    """
+    Lexicon-based sentiment scorer for batches of texts.
+
+    Texts are encoded once into sparse arrays of lexicon term ids (words are
+    hashed with `app.dedup.word_hashes` and looked up with a binary search over
+    the sorted lexicon hashes, without a Python loop over words), and a batch
+    is scored with one gather of the lexicon weights and one `bincount`.
+    """
+
+    def __init__(self, lexicon=None, negations=NEGATIONS):
+        lexicon = LEXICON if lexicon is None else lexicon
+        words = list(lexicon)
+        hashes, _ = word_hashes(words)
+        if len(hashes) != len(words):
+            raise ValueError("Lexicon entries must be single words.")
+        order = np.argsort(hashes)
+        self.words = [words[i] for i in order]
+        self._hashes = hashes[order]
+        self.weights = np.array([lexicon[word] for word in self.words], dtype=np.float32)
+        self._negation_hashes = np.sort(word_hashes(list(negations))[0])
+
+    def encode(self, texts):
+        """
+        Args:
+            texts (list): The texts.
+
+        Returns:
+            EncodedTexts: The lexicon words of each text.
+        """
+        hashes, text_of_word = word_hashes(texts)
+        positions = np.minimum(np.searchsorted(self._hashes, hashes), len(self._hashes) - 1)
+        in_lexicon = self._hashes[positions] == hashes
+        is_negation = np.isin(hashes, self._negation_hashes)
+        negated = np.zeros(len(hashes), dtype=bool)
+        for distance in range(1, NEGATION_WINDOW + 1):
+            negated[distance:] |= is_negation[:-distance] & (text_of_word[:-distance] == text_of_word[distance:])
+        counts = np.bincount(text_of_word[in_lexicon], minlength=len(texts))
+        indptr = np.concatenate(([0], np.cumsum(counts)))
+        return EncodedTexts(indptr, positions[in_lexicon], negated[in_lexicon])
+
+    def score_encoded(self, encoded):
+        """Returns the compound score in [-1, 1] of each encoded text."""
+        valence = self.weights[encoded.term_ids] * np.where(encoded.negated, NEGATION_SCALAR, 1.0)
+        text_of_term = np.repeat(np.arange(len(encoded)), np.diff(encoded.indptr))
+        totals = np.bincount(text_of_term, weights=valence, minlength=len(encoded))
+        return totals / np.sqrt(totals * totals + NORMALIZATION_ALPHA)
+
+    def score(self, texts):
+        """Returns the compound score in [-1, 1] of each text."""
+        return self.score_encoded(self.encode(texts))
+
+
+class SentimentAggregate:
+    """Running sentiment totals of a set of texts."""
+
+    def __init__(self):
+        self.items = 0
+        self.total = 0.0
+        self.positive = 0
+        self.negative = 0
+
+    def add(self, score, sign=1):
+        self.items += sign
+        self.total += sign * score
+        if score >= POSITIVE_THRESHOLD:
+            self.positive += sign
+        elif score <= NEGATIVE_THRESHOLD:
+            self.negative += sign
+
+    def summary(self):
+        """
+        Returns:
+            dict: 'items', 'mean' (compound score) and the 'positive',
+                'negative' and 'neutral' shares of the items.
+        """
+        if not self.items:
+            return {'items': 0, 'mean': None, 'positive': None, 'negative': None, 'neutral': None}
+        neutral = self.items - self.positive - self.negative
+        return {'items': self.items, 'mean': round(self.total / self.items, 3),
+                'positive': round(self.positive / self.items, 3), 'negative': round(self.negative / self.items, 3),
+                'neutral': round(neutral / self.items, 3)}
+
+
+def summarize_scores(scores):
+    """Summarizes an array of compound scores like `SentimentAggregate.summary`."""
+    aggregate = SentimentAggregate()
+    for score in np.asarray(scores, dtype=np.float64).tolist():
+        aggregate.add(score)
+    return aggregate.summary()
+
+
+class _SubredditSentiment:
+    def __init__(self):
+        self.overall = SentimentAggregate()
+        self.threads = {}  # submission id -> SentimentAggregate
+        self.items = {}    # item id -> (thread id, score)
+
+
+class SentimentStore:
+    """
+    Incrementally maintained sentiment aggregates per subreddit and per thread
+    (a submission plus its comments).
+
+    Batches are scored vectorized outside the lock; each item then updates its
+    thread's and subreddit's aggregate once. An item seen again (re-fetched or
+    edited) replaces its old score instead of being counted twice.
+    """
+
+    def __init__(self, lexicon=None):
+        self.lexicon = lexicon or SentimentLexicon()
+        self._lock = threading.Lock()
+        self._subreddits = {}
+
+    @classmethod
+    def from_corpus(cls, corpus_store, batch_size=5000):
+        """Builds aggregates from every submission and comment of a `CorpusStore`."""
+        sentiment = cls()
+        for items in corpus_store.iter_texts(batch_size=batch_size):
+            by_subreddit = {}
+            for item in items:
+                by_subreddit.setdefault(item['subreddit'], []).append(
+                    (item['id'], item['submission_id'], item['text']))
+            for subreddit, entries in by_subreddit.items():
+                sentiment._add(subreddit, entries)
+        return sentiment
+
+    def __contains__(self, subreddit):
+        return subreddit.lower() in self._subreddits
+
+    def add_submissions(self, subreddit_name, submissions):
+        """
+        Scores submissions (dicts with 'id', 'title' and 'selftext'); each one
+        starts its own thread.
+
+        Returns:
+            numpy.ndarray: The compound score of each submission.
+        """
+        return self._add(subreddit_name, [(item['id'], item['id'], f"{item.get('title', '')}\n{item.get('selftext') or ''}")
+                                          for item in submissions])
+
+    def add_comments(self, subreddit_name, comments):
+        """Scores comments (dicts with 'id', 'submission_id' and 'body') into their threads."""
+        return self._add(subreddit_name, [(item['id'], item.get('submission_id'), item.get('body') or '')
+                                          for item in comments])
+
+    def _add(self, subreddit_name, entries):
+        scores = self.lexicon.score([text for _, _, text in entries])
+        with self._lock:
+            state = self._subreddits.setdefault(subreddit_name.lower(), _SubredditSentiment())
+            for (item_id, thread_id, _), score in zip(entries, scores.tolist()):
+                previous = state.items.get(item_id)
+                if previous is not None:
+                    state.overall.add(previous[1], sign=-1)
+                    state.threads[previous[0]].add(previous[1], sign=-1)
+                state.items[item_id] = (thread_id, score)
+                state.overall.add(score)
+                state.threads.setdefault(thread_id, SentimentAggregate()).add(score)
+        return scores
+
+    def summary(self, subreddit_name):
+        """The subreddit's aggregate (see `SentimentAggregate.summary`), or None."""
+        with self._lock:
+            state = self._subreddits.get(subreddit_name.lower())
+            return state.overall.summary() if state and state.overall.items else None
+
+    def thread(self, subreddit_name, thread_id):
+        """A thread's aggregate, or None if nothing of it was scored."""
+        with self._lock:
+            state = self._subreddits.get(subreddit_name.lower())
+            aggregate = state.threads.get(thread_id) if state else None
+            return aggregate.summary() if aggregate and aggregate.items else None
+
+    def report(self, subreddit_name, threads=10):
+        """
+        Args:
+            subreddit_name (str): The subreddit.
+            threads (int): Number of threads listed (the ones with most items).
+
+        Returns:
+            dict or None: 'subreddit' (the overall aggregate) and 'threads'
+                (dicts with 'id' plus the aggregate); None if nothing of the
+                subreddit was scored.
+        """
+        with self._lock:
+            state = self._subreddits.get(subreddit_name.lower())
+            if state is None or not state.overall.items:
+                return None
+            busiest = sorted(((thread_id, aggregate) for thread_id, aggregate in state.threads.items() if aggregate.items),
+                             key=lambda entry: -entry[1].items)[:threads]
+            return {'subreddit': state.overall.summary(),
+                    'threads': [dict(aggregate.summary(), id=thread_id) for thread_id, aggregate in busiest]}
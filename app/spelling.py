@@ -0,0 +1,399 @@
+import os
+import re
+
+import numpy as np
+
+# File names inside a subreddit name index directory (see app.autocomplete).
+PREFIX_HASHES_FILE = 'spelling_prefix_length_hashes.npy'
+PREFIX_ROWS_FILE = 'spelling_prefix_length_rows.npy'
+SUFFIX_HASHES_FILE = 'spelling_suffix_length_hashes.npy'
+SUFFIX_ROWS_FILE = 'spelling_suffix_length_rows.npy'
+
+# Suggestions are names within this Damerau-Levenshtein (optimal string
+# alignment) distance of the typed name, and within one edit per
+# CHARACTERS_PER_EDIT typed characters, so short names are not "corrected" into
+# unrelated ones.
+MAX_EDIT_DISTANCE = 2
+CHARACTERS_PER_EDIT = 3
+
+# A SymSpell deletion dictionary with the prefix trick, kept twice: once for the
+# first AFFIX_LENGTH characters of each name and once for the last AFFIX_LENGTH
+# (indexed reversed). Each holds the affix and every single-character deletion
+# of it. If a typed name is one edit away from a known name, its prefix shares a
+# variant with the name's prefix and its suffix with the name's suffix, so the
+# candidates are the names found in both dictionaries: a popular prefix
+# ("askreddit...") no longer makes every name starting with it a candidate.
+# Candidates are verified with the full edit distance. Every name one edit away
+# is found (unless it is past MAX_BUCKET_ROWS, below), and names two edits away
+# when the edits are at different ends.
+AFFIX_LENGTH = 7
+
+# Variants are stored as 64-bit polynomial hashes: sum(byte[i] * BASE**i) mod 2**64.
+# Deleting character j only re-weights the characters after j, so the variants
+# of all names are computed at once from prefix sums.
+_BASE = np.uint64(0x100000001B3)
+_BASE_INVERSE = np.uint64(pow(int(_BASE), -1, 1 << 64))
+_POWERS = np.cumprod(np.concatenate(([1], np.full(AFFIX_LENGTH - 1, _BASE))).astype(np.uint64), dtype=np.uint64)
+_INT_MASK = (1 << 64) - 1
+_INT_POWERS = [int(power) for power in _POWERS]
+_INT_BASE_INVERSE = int(_BASE_INVERSE)
+
+# The stored keys replace the top LENGTH_BITS bits of a variant hash with the
+# length of the name (the low bits are kept: the first character only reaches
+# those), so a lookup only reads the names whose length is within the edit
+# distance of the typed one.
+LENGTH_BITS = 5
+_MAX_STORED_LENGTH = (1 << LENGTH_BITS) - 1
+_LENGTH_SHIFT = np.uint64(64 - LENGTH_BITS)
+_HASH_MASK = np.uint64((1 << (64 - LENGTH_BITS)) - 1)
+
+# Entries sharing a key are stored most subscribed name first, and a lookup
+# reads at most MAX_BUCKET_ROWS of them per key. A variant shared by tens of
+# thousands of names (a prefix made of popular words) then costs about the same
+# as a rare one, and the names it drops are the least popular ones.
+MAX_BUCKET_ROWS = 128
+
+# Up to this many entries on the other side are read and intersected with the
+# candidates instead of hashing each candidate's other affix.
+INTERSECT_MAX_ROWS = 16384
+
+# The vectorized filters (other affix, bag distance) pay a fixed numpy
+# overhead; fewer candidates than this go straight to `edit_distance`, which
+# rejects them just as fast.
+VECTORIZED_FILTER_MIN_CANDIDATES = 32
+
+# Every candidate is checked for one edit, but only this many of the others
+# (the most subscribed) for more edits.
+MAX_DISTANT_CANDIDATES = 16
+
+NAME_RE = re.compile(r'\w{1,21}', re.ASCII)
+
+
+def _byte_matrix(keys):
+    """Returns fixed-width byte string keys as an (n, itemsize) uint8 matrix."""
+    keys = np.ascontiguousarray(keys)
+    return keys.view(np.uint8).reshape(len(keys), keys.itemsize)
+
+
+def _affix_matrices(matrix):
+    """
+    Returns the (n, AFFIX_LENGTH) prefixes and reversed suffixes of a zero
+    padded (n, width) name matrix, both zero padded.
+    """
+    if matrix.shape[1] < AFFIX_LENGTH:
+        matrix = np.pad(matrix, ((0, 0), (0, AFFIX_LENGTH - matrix.shape[1])))
+    lengths = np.count_nonzero(matrix, axis=1)
+    # Column i of a reversed suffix is character (length - 1 - i) of the name.
+    positions = lengths[:, None] - 1 - np.arange(AFFIX_LENGTH)
+    suffixes = np.take_along_axis(matrix, np.maximum(positions, 0), axis=1)
+    suffixes[positions < 0] = 0
+    return matrix[:, :AFFIX_LENGTH], suffixes
+
+
+def _variant_hashes(affixes):
+    """
+    Hashes the deletion variants of affixes.
+
+    Args:
+        affixes (numpy.ndarray): (n, AFFIX_LENGTH) uint8 affixes, zero padded.
+
+    Returns:
+        tuple: (hashes, valid) - (n, AFFIX_LENGTH + 1) uint64 hashes where column
+            0 is the affix itself and column j + 1 the affix without character
+            j, and a boolean mask of the columns that exist (j < affix length).
+    """
+    weighted = affixes.astype(np.uint64) * _POWERS
+    prefix_sums = np.cumsum(weighted, axis=1, dtype=np.uint64)
+    full = prefix_sums[:, -1:]
+    before = np.concatenate((np.zeros((len(weighted), 1), dtype=np.uint64), prefix_sums[:, :-1]), axis=1)
+    after = full - prefix_sums # Characters after j, still weighted by their old positions
+    hashes = np.concatenate((full, before + after * _BASE_INVERSE), axis=1)
+    valid = np.concatenate((np.ones((len(weighted), 1), dtype=bool), affixes != 0), axis=1)
+    return hashes, valid
+
+
+def _key_variants(affix):
+    """
+    The variant hashes of one typed affix (bytes), as `_variant_hashes` computes
+    them for a stored one, in plain integer arithmetic: for a single affix that
+    is faster than the numpy version.
+    """
+    weighted = [character * _INT_POWERS[i] & _INT_MASK for i, character in enumerate(affix)]
+    full = sum(weighted) & _INT_MASK
+    variants, before = [full], 0
+    for weight in weighted:
+        after = (full - before - weight) & _INT_MASK
+        variants.append((before + after * _INT_BASE_INVERSE) & _INT_MASK)
+        before = (before + weight) & _INT_MASK
+    return variants
+
+
+def _deletion_entries(affixes, lengths, ranks):
+    """
+    Returns the (keys, rows) entries of one deletion dictionary, sorted by key
+    (variant hash and name length) and, within a key, by `ranks` (the
+    popularity rank of each row).
+    """
+    hashes, valid = _variant_hashes(affixes)
+    rows = np.broadcast_to(np.arange(len(affixes), dtype=np.int32)[:, None], hashes.shape)[valid]
+    hashes = (hashes[valid] & _HASH_MASK) | (lengths[rows].astype(np.uint64) << _LENGTH_SHIFT)
+    order = np.lexsort((ranks[rows], hashes))
+    hashes, rows = hashes[order], rows[order]
+    # Repeated letters ("reddit") produce the same variant more than once.
+    distinct = np.ones(len(hashes), dtype=bool)
+    distinct[1:] = (hashes[1:] != hashes[:-1]) | (rows[1:] != rows[:-1])
+    return hashes[distinct], rows[distinct]
+
+
+def build_deletion_dictionaries(keys, subscribers=None):
+    """
+    Builds the prefix and suffix deletion dictionaries of a name index.
+
+    Args:
+        keys (numpy.ndarray): The lowercase names of a `SubredditNameIndex`
+            (fixed-width byte strings).
+        subscribers (numpy.ndarray, optional): Subscriber count per name. The
+            rows stored under one variant are ordered by it (most first), so
+            the MAX_BUCKET_ROWS a lookup reads are the most popular; without
+            it they are in name order.
+
+    Returns:
+        dict: Arrays keyed by file name - for each dictionary, uint64 keys
+              (variant hash and name length, see LENGTH_BITS) in ascending
+              order and the int32 name row of each.
+    """
+    ranks = np.arange(len(keys))
+    if subscribers is not None:
+        ranks[np.lexsort((ranks, -np.asarray(subscribers)))] = np.arange(len(keys))
+    matrix = _byte_matrix(keys)
+    prefixes, suffixes = _affix_matrices(matrix)
+    lengths = np.count_nonzero(matrix, axis=1)
+    prefix_hashes, prefix_rows = _deletion_entries(prefixes, lengths, ranks)
+    suffix_hashes, suffix_rows = _deletion_entries(suffixes, lengths, ranks)
+    return {
+        PREFIX_HASHES_FILE: prefix_hashes,
+        PREFIX_ROWS_FILE: prefix_rows,
+        SUFFIX_HASHES_FILE: suffix_hashes,
+        SUFFIX_ROWS_FILE: suffix_rows,
+    }
+
+
+def bag_distances(key, candidates):
+    """
+    Bag distance between `key` and each candidate: the larger of the number of
+    characters only in the key and only in the candidate (as multisets). It is
+    a lower bound of the edit distance, computed for all candidates at once, so
+    most candidates are rejected without running `edit_distance`.
+
+    Args:
+        key (bytes): The typed name (lowercase ASCII).
+        candidates (numpy.ndarray): Fixed-width byte string names.
+
+    Returns:
+        numpy.ndarray: int64 distances, one per candidate.
+    """
+    matrix = _byte_matrix(candidates)
+    characters, key_counts = np.unique(np.frombuffer(key, dtype=np.uint8), return_counts=True)
+    # (candidates, key characters): how often each character of the key occurs in each candidate.
+    counts = (matrix[:, :, None] == characters).sum(axis=1)
+    lengths = np.count_nonzero(matrix, axis=1)
+    surplus = counts - key_counts
+    only_in_key = np.maximum(-surplus, 0).sum(axis=1)
+    only_in_candidate = np.maximum(surplus, 0).sum(axis=1) + lengths - counts.sum(axis=1)
+    return np.maximum(only_in_key, only_in_candidate)
+
+
+def edit_distance(a, b, max_distance=MAX_EDIT_DISTANCE):
+    """
+    Optimal string alignment distance (Levenshtein plus adjacent
+    transpositions) between two strings, or max_distance + 1 once it is
+    certain to exceed `max_distance`. The common prefix and suffix are skipped
+    (candidates mostly share them with the typed name); at the first
+    difference each edit is tried (substitution, deletion, insertion,
+    transposition) with one less edit left, so the work is bounded by
+    4 ** max_distance short string scans instead of a DP matrix.
+    """
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    start, shorter = 0, min(len(a), len(b))
+    while start < shorter and a[start] == b[start]:
+        start += 1
+    end_a, end_b = len(a), len(b)
+    while end_a > start and end_b > start and a[end_a - 1] == b[end_b - 1]:
+        end_a -= 1
+        end_b -= 1
+    if start == end_a or start == end_b:
+        return min(end_a + end_b - 2 * start, max_distance + 1)
+    if not max_distance:
+        return 1
+    a, b = a[start:end_a], b[start:end_b]
+    if max_distance == 1: # The rest must be equal after one edit
+        if a[1:] == b[1:] or a[1:] == b or a == b[1:] or (a[:2] == b[1::-1] and a[2:] == b[2:]):
+            return 1
+        return 2
+    rest = max_distance - 1
+    best = edit_distance(a[1:], b[1:], rest)
+    if best:
+        best = min(best, edit_distance(a[1:], b, rest), edit_distance(a, b[1:], rest))
+    if best and a[1:2] == b[:1] and a[:1] == b[1:2]:
+        best = min(best, edit_distance(a[2:], b[2:], rest))
+    return best + 1
+
+
+def _read_rows(rows, starts, ends):
+    """
+    Returns the distinct rows stored in the given ranges of a deletion
+    dictionary, sorted. Sorting and dropping repeats is over an order of
+    magnitude faster than np.unique on the tens of thousands of rows a popular
+    affix can match.
+    """
+    rows = np.sort(np.concatenate([rows[start:end] for start, end in zip(starts.tolist(), ends.tolist())
+                                   if end > start]))
+    keep = np.empty(len(rows), dtype=bool)
+    keep[:1] = True
+    np.not_equal(rows[1:], rows[:-1], out=keep[1:])
+    return rows[keep]
+
+
+def _ranges(hashes, variants, lengths):
+    """
+    Returns the (starts, ends) of the entries stored under each of `variants`
+    in one deletion dictionary, for each name length in `lengths`.
+    """
+    keys = ((variants & _HASH_MASK)[:, None] | (lengths << _LENGTH_SHIFT)).ravel()
+    return np.searchsorted(hashes, keys, side='left'), np.searchsorted(hashes, keys, side='right')
+
+
+class SubredditSpeller:
+    """
+    Offline spelling correction of subreddit names: SymSpell deletion
+    dictionaries over a `SubredditNameIndex`.
+
+    Each dictionary is two parallel arrays sorted by key (variant hash and name
+    length, memory-mapped when opened from disk), so a lookup is a binary
+    search for the at most AFFIX_LENGTH + 1 variants of the typed prefix and of
+    the typed suffix at each close length, a bounded read of the names on the
+    smaller side, vectorized affix and bag-distance filters, and an
+    edit-distance check of the few remaining candidates.
+    """
+
+    def __init__(self, name_index, prefix_hashes, prefix_rows, suffix_hashes, suffix_rows):
+        self.name_index = name_index
+        self.prefix_hashes = prefix_hashes
+        self.prefix_rows = prefix_rows
+        self.suffix_hashes = suffix_hashes
+        self.suffix_rows = suffix_rows
+
+    @classmethod
+    def open(cls, directory, name_index, mmap=True):
+        """Opens the dictionaries written next to a name index by `build_name_index`."""
+        mode = 'r' if mmap else None
+        return cls(name_index, *(np.load(os.path.join(directory, file_name), mmap_mode=mode)
+                                 for file_name in (PREFIX_HASHES_FILE, PREFIX_ROWS_FILE,
+                                                   SUFFIX_HASHES_FILE, SUFFIX_ROWS_FILE)))
+
+    @classmethod
+    def from_name_index(cls, name_index):
+        """Builds the deletion dictionaries of an in-memory name index."""
+        arrays = build_deletion_dictionaries(name_index.keys, name_index.subscribers)
+        return cls(name_index, arrays[PREFIX_HASHES_FILE], arrays[PREFIX_ROWS_FILE],
+                   arrays[SUFFIX_HASHES_FILE], arrays[SUFFIX_ROWS_FILE])
+
+    def __len__(self):
+        return len(self.prefix_hashes) + len(self.suffix_hashes)
+
+    def candidates(self, key, max_distance=MAX_EDIT_DISTANCE):
+        """
+        Rows of the names sharing a prefix variant and a suffix variant with
+        `key` (lowercase ASCII bytes), at most `max_distance` characters longer
+        or shorter. Fewer than VECTORIZED_FILTER_MIN_CANDIDATES rows sharing
+        one of them are returned without checking the other. At most
+        MAX_BUCKET_ROWS rows are read per variant and length.
+        """
+        lengths = np.arange(max(len(key) - max_distance, 1), min(len(key) + max_distance, _MAX_STORED_LENGTH) + 1,
+                            dtype=np.uint64)
+        sides = []
+        for side, (hashes, rows, affix) in enumerate(((self.prefix_hashes, self.prefix_rows, key[:AFFIX_LENGTH]),
+                                                      (self.suffix_hashes, self.suffix_rows,
+                                                       key[::-1][:AFFIX_LENGTH]))):
+            variants = np.array(_key_variants(affix), dtype=np.uint64)
+            starts, ends = _ranges(hashes, variants, lengths)
+            sides.append((int((ends - starts).sum()), side, variants, starts, ends, rows))
+        # The entries of the side with fewer matches are read (a popular prefix
+        # or suffix can match hundreds of thousands of names); those names are
+        # kept if their other affix shares a variant with the typed one. When
+        # the other side matches few entries too, they are read and intersected;
+        # otherwise the other affix of each name is hashed.
+        (count, side, _, starts, ends, rows), (other_count, other_side, other_variants, other_starts, other_ends,
+                                               other_rows) = sorted(sides, key=lambda entry: entry[:2])
+        if not count:
+            return np.zeros(0, dtype=np.int32)
+        found = _read_rows(rows, starts, np.minimum(ends, starts + MAX_BUCKET_ROWS))
+        if len(found) < VECTORIZED_FILTER_MIN_CANDIDATES:
+            return found
+        if other_count <= INTERSECT_MAX_ROWS:
+            other_found = _read_rows(other_rows, other_starts, other_ends)
+            if not len(other_found):
+                return other_found
+            positions = np.minimum(np.searchsorted(other_found, found), len(other_found) - 1)
+            return found[other_found[positions] == found]
+        other_affixes = _affix_matrices(_byte_matrix(self.name_index.keys[found]))[other_side]
+        other_hashes, other_valid = _variant_hashes(other_affixes)
+        shared = np.isin(other_hashes, other_variants) & other_valid
+        return found[shared.any(axis=1)]
+
+    def suggest(self, name, k=3, max_distance=MAX_EDIT_DISTANCE):
+        """
+        Returns known subreddits whose names are close to `name`.
+
+        Args:
+            name (str): A subreddit name as typed (an "r/" prefix is allowed).
+            k (int): Maximum number of suggestions.
+            max_distance (int): Maximum edit distance (lowered for short names,
+                see CHARACTERS_PER_EDIT).
+
+        Returns:
+            list: Dicts with 'name', 'subscribers' and 'distance', closest first
+                  (then most subscribers). A known name is returned as its own
+                  only suggestion, with distance 0.
+        """
+        name = (name or '').strip()
+        if name.lower().startswith('r/'):
+            name = name[2:]
+        if not NAME_RE.fullmatch(name):
+            return []
+        key = name.lower()
+        encoded = key.encode('ascii')
+        row = int(np.searchsorted(self.name_index.keys, encoded))
+        if row < len(self.name_index.keys) and self.name_index.keys[row] == encoded:
+            return [{'name': self.name_index.names[row].decode('ascii'),
+                     'subscribers': int(self.name_index.subscribers[row]), 'distance': 0}]
+        max_distance = min(max_distance, len(key) // CHARACTERS_PER_EDIT)
+        if not max_distance:
+            return []
+        rows = self.candidates(encoded, max_distance)
+        if len(rows) >= VECTORIZED_FILTER_MIN_CANDIDATES:
+            rows = rows[bag_distances(encoded, self.name_index.keys[rows]) <= max_distance]
+        # Candidates are checked most subscribed first for one edit, the closest
+        # an unknown name can be (a cheap check). Once k are one edit away the
+        # rest cannot rank higher; otherwise the MAX_DISTANT_CANDIDATES most
+        # subscribed of the others are checked for more edits.
+        subscribers = np.asarray(self.name_index.subscribers[rows])
+        order = np.argsort(-subscribers, kind='stable')
+        matches, distant = [], []
+        for row, count in zip(rows[order].tolist(), subscribers[order].tolist()):
+            candidate = self.name_index.keys[row].decode('ascii')
+            if edit_distance(key, candidate, 1) == 1:
+                matches.append((1, -count, row))
+                if len(matches) == k:
+                    break
+            elif len(distant) < MAX_DISTANT_CANDIDATES:
+                distant.append((row, count, candidate))
+        if len(matches) < k and max_distance > 1:
+            for row, count, candidate in distant:
+                distance = edit_distance(key, candidate, max_distance)
+                if distance <= max_distance:
+                    matches.append((distance, -count, row))
+        matches.sort()
+        return [{'name': self.name_index.names[row].decode('ascii'), 'subscribers': -negative_subscribers,
+                 'distance': distance} for distance, negative_subscribers, row in matches[:k]]
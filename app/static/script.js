@@ -2,6 +2,49 @@ document.addEventListener('DOMContentLoaded', () => {
     const chatBox = document.getElementById('chat-box');
     const userInput = document.getElementById('user-input');
     const sendButton = document.getElementById('send-button');
+    const suggestionList = document.getElementById('subreddit-suggestions');
+
+    // The request currently being answered: { id, controller }.
+    // Sending a new message (or leaving the page) cancels it, both locally via
+    // its AbortController and on the server via /cancel, so the server stops
+    // fetching from Reddit and generating the old answer.
+    let currentRequest = null;
+
+    function newRequestId() {
+        if (window.crypto && typeof window.crypto.randomUUID === 'function') {
+            return window.crypto.randomUUID();
+        }
+        return `${Date.now()}-${Math.random().toString(16).slice(2)}`;
+    }
+
+    function cancelCurrentRequest() {
+        if (!currentRequest) {
+            return;
+        }
+        const { id, controller } = currentRequest;
+        currentRequest = null;
+        const socketHandler = socketHandlers.get(id);
+        if (socketHandler) { // Asked over the WebSocket: cancel it there
+            socketHandlers.delete(id);
+            socketHandler.onDone();
+            if (socket) {
+                socket.send(JSON.stringify({ type: 'cancel', request_id: id }));
+            }
+            return;
+        }
+        controller.abort();
+        const payload = JSON.stringify({ request_id: id });
+        if (navigator.sendBeacon) {
+            navigator.sendBeacon('/cancel', new Blob([payload], { type: 'application/json' }));
+        } else {
+            fetch('/cancel', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: payload,
+                keepalive: true,
+            }).catch(() => {});
+        }
+    }
 
     function addMessageToChatbox(message, type) { // type can be 'user', 'bot', or 'error'
         const messageElement = document.createElement('div');
@@ -16,6 +59,116 @@ document.addEventListener('DOMContentLoaded', () => {
         messageElement.textContent = message;
         chatBox.appendChild(messageElement);
         chatBox.scrollTop = chatBox.scrollHeight; // Auto-scroll to the bottom
+        return messageElement;
+    }
+
+    // Returns a handler that renders reply events ({delta} chunks, a whole
+    // {reply}, or an {error}) into a single bot message that grows as chunks arrive.
+    function createReplyRenderer() {
+        let botMessage = null;
+        return (event) => {
+            if (event.error) {
+                addMessageToChatbox(event.error, 'error');
+            } else if (event.delta) {
+                if (!botMessage) {
+                    botMessage = addMessageToChatbox('', 'bot');
+                }
+                botMessage.textContent += event.delta;
+                chatBox.scrollTop = chatBox.scrollHeight;
+            } else if (event.reply) {
+                addMessageToChatbox(event.reply, 'bot');
+            }
+        };
+    }
+
+    // Reads an NDJSON reply stream ({delta} chunks, then {done} or {error}).
+    async function readStreamedReply(response) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        const renderEvent = createReplyRenderer();
+
+        const handleLine = (line) => {
+            if (!line.trim()) {
+                return;
+            }
+            renderEvent(JSON.parse(line));
+        };
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) {
+                break;
+            }
+            buffer += decoder.decode(value, { stream: true });
+            const lines = buffer.split('\n');
+            buffer = lines.pop(); // Keep any incomplete trailing line for the next read
+            lines.forEach(handleLine);
+        }
+        handleLine(buffer);
+    }
+
+    // --- WebSocket chat channel ---
+    // Questions go over one persistent WebSocket (/ws) while it is open. The
+    // answers come back as events tagged with the question's request_id, so
+    // several questions can be in flight on one connection. A lost connection
+    // is reopened automatically, with exponential backoff; until then,
+    // messages are sent over HTTP (/send_message).
+    const SOCKET_RECONNECT_MIN_MS = 500;
+    const SOCKET_RECONNECT_MAX_MS = 10000;
+    const SOCKET_TRY_AGAIN_LATER = 1013; // Close code of a connection the server has no slot for
+    const socketHandlers = new Map(); // request_id -> { onEvent, onDone }
+    let socket = null; // The open WebSocket, or null
+    let socketReconnectDelay = SOCKET_RECONNECT_MIN_MS;
+
+    function connectSocket() {
+        if (!('WebSocket' in window)) {
+            return;
+        }
+        const scheme = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
+        const ws = new WebSocket(`${scheme}//${window.location.host}/ws`);
+        ws.addEventListener('open', () => {
+            socket = ws;
+            socketReconnectDelay = SOCKET_RECONNECT_MIN_MS;
+        });
+        ws.addEventListener('message', (message) => {
+            const event = JSON.parse(message.data);
+            const handler = socketHandlers.get(event.request_id);
+            if (!handler) {
+                return; // A cancelled question
+            }
+            handler.onEvent(event);
+            if (event.done) {
+                socketHandlers.delete(event.request_id);
+                handler.onDone();
+            }
+        });
+        ws.addEventListener('close', (event) => {
+            if (socket === ws) {
+                socket = null;
+            }
+            if (event.code === SOCKET_TRY_AGAIN_LATER) {
+                // The server has no free connection slot; keep using HTTP for a while.
+                socketReconnectDelay = SOCKET_RECONNECT_MAX_MS;
+            }
+            // The server cancels the questions that were in flight on the lost connection.
+            socketHandlers.forEach((handler) => {
+                handler.onEvent({ error: 'Error: The connection to the server was lost. Please try again.' });
+                handler.onDone();
+            });
+            socketHandlers.clear();
+            const delay = socketReconnectDelay * (0.5 + Math.random() / 2); // Jitter spreads out reconnecting tabs
+            socketReconnectDelay = Math.min(socketReconnectDelay * 2, SOCKET_RECONNECT_MAX_MS);
+            setTimeout(connectSocket, delay);
+        });
+    }
+
+    // Asks a question over the WebSocket; resolves when its answer is complete.
+    function askOverSocket(id, messageText, onEvent) {
+        return new Promise((resolve) => {
+            socketHandlers.set(id, { onEvent, onDone: resolve });
+            socket.send(JSON.stringify({ type: 'ask', request_id: id, message: messageText }));
+        });
     }
 
     async function handleSendMessage() {
@@ -23,14 +176,25 @@ document.addEventListener('DOMContentLoaded', () => {
         if (messageText) {
             addMessageToChatbox(messageText, 'user');
             userInput.value = '';
+            hideSuggestions();
+
+            cancelCurrentRequest(); // A new message supersedes any answer still in progress
+            const thisRequest = { id: newRequestId(), controller: new AbortController() };
+            currentRequest = thisRequest;
 
             try {
+                if (socket && socket.readyState === WebSocket.OPEN) {
+                    await askOverSocket(thisRequest.id, messageText, createReplyRenderer());
+                    return;
+                }
+
                 const response = await fetch('/send_message', {
                     method: 'POST',
                     headers: {
                         'Content-Type': 'application/json',
                     },
-                    body: JSON.stringify({ message: messageText }),
+                    body: JSON.stringify({ message: messageText, request_id: thisRequest.id, stream: true }),
+                    signal: thisRequest.controller.signal,
                 });
 
                 if (!response.ok) {
@@ -50,6 +214,13 @@ document.addEventListener('DOMContentLoaded', () => {
                     return;
                 }
 
+                const contentType = response.headers.get('Content-Type') || '';
+                if (contentType.includes('application/x-ndjson')) {
+                    await readStreamedReply(response);
+                    return;
+                }
+
+                // Validation and Reddit errors (and extractive answers) arrive as plain JSON.
                 const data = await response.json();
                 if (data.error) {
                     addMessageToChatbox(data.error, 'error');
@@ -60,6 +231,9 @@ document.addEventListener('DOMContentLoaded', () => {
                 }
 
             } catch (error) { // Catches network errors (e.g., server down) or JS errors in try block
+                if (error.name === 'AbortError') {
+                    return; // Superseded by a newer message; nothing to show
+                }
                 console.error('Error sending message:', error);
                 if (error instanceof TypeError && error.message.includes('NetworkError')) {
                      addMessageToChatbox('Error: Could not connect to the server. Please check your network or try again later.', 'error');
@@ -69,6 +243,10 @@ document.addEventListener('DOMContentLoaded', () => {
                 else {
                     addMessageToChatbox('An unexpected error occurred. Please try again.', 'error');
                 }
+            } finally {
+                if (currentRequest === thisRequest) {
+                    currentRequest = null;
+                }
             }
         } else {
             // Optionally, provide feedback if the user tries to send an empty message,
@@ -77,10 +255,142 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
 
+    // --- Subreddit autocomplete ---
+    // While the word being typed is an "@r/..." tag, /autocomplete is queried
+    // (debounced, so a burst of keystrokes costs one request) and the most
+    // popular matching subreddits are offered. Arrow keys move the selection;
+    // Enter or Tab inserts it.
+    const AUTOCOMPLETE_DEBOUNCE_MS = 150;
+    const AUTOCOMPLETE_LIMIT = 8;
+    const suggestionCache = new Map(); // prefix -> suggestions
+    let autocompleteTimer = null;
+    let autocompleteController = null;
+    let suggestions = [];
+    let activeSuggestion = -1;
+
+    // Returns the "@r/..." tag ending at the caret as { start, prefix }, or null.
+    function tagAtCaret() {
+        const caret = userInput.selectionStart;
+        const match = /(^|[\s,])@r\/(\w*)$/.exec(userInput.value.slice(0, caret));
+        if (!match) {
+            return null;
+        }
+        return { start: caret - match[2].length, prefix: match[2] };
+    }
+
+    function hideSuggestions() {
+        suggestions = [];
+        activeSuggestion = -1;
+        suggestionList.hidden = true;
+        suggestionList.replaceChildren();
+    }
+
+    function renderSuggestions(items) {
+        suggestions = items;
+        activeSuggestion = items.length ? 0 : -1;
+        suggestionList.replaceChildren(...items.map((item, index) => {
+            const option = document.createElement('li');
+            option.setAttribute('role', 'option');
+            option.classList.toggle('active', index === activeSuggestion);
+            const name = document.createElement('span');
+            name.textContent = `r/${item.name}`;
+            const subscribers = document.createElement('span');
+            subscribers.classList.add('subscribers');
+            subscribers.textContent = item.subscribers.toLocaleString();
+            option.append(name, subscribers);
+            // mousedown (not click) so the input does not lose focus first
+            option.addEventListener('mousedown', (event) => {
+                event.preventDefault();
+                acceptSuggestion(index);
+            });
+            return option;
+        }));
+        suggestionList.hidden = items.length === 0;
+    }
+
+    function moveSuggestion(step) {
+        activeSuggestion = (activeSuggestion + step + suggestions.length) % suggestions.length;
+        Array.from(suggestionList.children).forEach((option, index) => {
+            option.classList.toggle('active', index === activeSuggestion);
+        });
+    }
+
+    function acceptSuggestion(index) {
+        const tag = tagAtCaret();
+        if (!tag || !suggestions[index]) {
+            hideSuggestions();
+            return;
+        }
+        const caret = userInput.selectionStart;
+        const inserted = `${suggestions[index].name} `;
+        userInput.value = userInput.value.slice(0, tag.start) + inserted + userInput.value.slice(caret).replace(/^\w*\s?/, '');
+        const position = tag.start + inserted.length;
+        userInput.setSelectionRange(position, position);
+        hideSuggestions();
+    }
+
+    async function fetchSuggestions(prefix) {
+        const key = prefix.toLowerCase();
+        if (suggestionCache.has(key)) {
+            return suggestionCache.get(key);
+        }
+        if (autocompleteController) {
+            autocompleteController.abort(); // A newer keystroke supersedes the pending lookup
+        }
+        autocompleteController = new AbortController();
+        const params = new URLSearchParams({ prefix, limit: AUTOCOMPLETE_LIMIT });
+        const response = await fetch(`/autocomplete?${params}`, { signal: autocompleteController.signal });
+        const data = await response.json();
+        const items = data.suggestions || [];
+        suggestionCache.set(key, items);
+        return items;
+    }
+
+    userInput.addEventListener('input', () => {
+        clearTimeout(autocompleteTimer);
+        const tag = tagAtCaret();
+        if (!tag || !tag.prefix) {
+            hideSuggestions();
+            return;
+        }
+        autocompleteTimer = setTimeout(async () => {
+            try {
+                const items = await fetchSuggestions(tag.prefix);
+                const current = tagAtCaret();
+                if (current && current.prefix === tag.prefix) { // Still typing the same tag
+                    renderSuggestions(items);
+                }
+            } catch (error) {
+                if (error.name !== 'AbortError') {
+                    console.error('Error fetching subreddit suggestions:', error);
+                }
+            }
+        }, AUTOCOMPLETE_DEBOUNCE_MS);
+    });
+
+    userInput.addEventListener('keydown', (event) => {
+        if (suggestionList.hidden) {
+            return;
+        }
+        if (event.key === 'ArrowDown' || event.key === 'ArrowUp') {
+            event.preventDefault();
+            moveSuggestion(event.key === 'ArrowDown' ? 1 : -1);
+        } else if (event.key === 'Enter' || event.key === 'Tab') {
+            event.preventDefault(); // Insert the suggestion instead of sending the message
+            acceptSuggestion(activeSuggestion);
+        } else if (event.key === 'Escape') {
+            hideSuggestions();
+        }
+    });
+    userInput.addEventListener('blur', hideSuggestions);
+
     sendButton.addEventListener('click', handleSendMessage);
     userInput.addEventListener('keypress', (event) => {
         if (event.key === 'Enter') {
             handleSendMessage();
         }
     });
+    // Closing or navigating away from the tab cancels the pending answer.
+    window.addEventListener('pagehide', cancelCurrentRequest);
+    connectSocket();
 });
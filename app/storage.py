@@ -0,0 +1,568 @@
+import html
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from app.dedup import DEFAULT_THRESHOLD, band_keys, estimate_similarity
+
+# --- Schema ---
+# Submissions and comments live in normalized tables keyed by their Reddit ids.
+# The full-text index is an FTS5 table whose rowids match `search_documents`,
+# which maps each indexed row back to the submission or comment it came from.
+# MinHash signatures of ingested items and the LSH band keys of the items that
+# are not near-duplicates live in `minhash_signatures` / `minhash_bands`; a
+# near-duplicate keeps its row but is taken out of the full-text index.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS subreddits (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE COLLATE NOCASE,
+    display_name TEXT,
+    public_description TEXT,
+    subscribers INTEGER,
+    updated_utc REAL
+);
+
+CREATE TABLE IF NOT EXISTS submissions (
+    id TEXT PRIMARY KEY,
+    subreddit_id INTEGER NOT NULL REFERENCES subreddits(id),
+    author TEXT,
+    title TEXT NOT NULL,
+    selftext TEXT,
+    score INTEGER,
+    num_comments INTEGER,
+    created_utc REAL,
+    permalink TEXT,
+    flair TEXT,
+    domain TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_submissions_subreddit_score ON submissions(subreddit_id, score DESC);
+
+CREATE TABLE IF NOT EXISTS comments (
+    id TEXT PRIMARY KEY,
+    submission_id TEXT NOT NULL REFERENCES submissions(id),
+    subreddit_id INTEGER NOT NULL REFERENCES subreddits(id),
+    parent_id TEXT,
+    author TEXT,
+    body TEXT,
+    score INTEGER,
+    created_utc REAL,
+    permalink TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_comments_submission ON comments(submission_id);
+
+CREATE TABLE IF NOT EXISTS search_documents (
+    rowid INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,          -- 'submission' or 'comment'
+    item_id TEXT NOT NULL,
+    subreddit_id INTEGER NOT NULL REFERENCES subreddits(id),
+    UNIQUE (kind, item_id)
+);
+
+CREATE TABLE IF NOT EXISTS minhash_signatures (
+    kind TEXT NOT NULL,          -- 'submission' or 'comment'
+    item_id TEXT NOT NULL,
+    signature BLOB NOT NULL,     -- uint32 MinHash values
+    duplicate_of TEXT,           -- id of the item this one is a near-duplicate of
+    PRIMARY KEY (kind, item_id)
+);
+
+CREATE TABLE IF NOT EXISTS minhash_bands (
+    subreddit_id INTEGER NOT NULL REFERENCES subreddits(id),
+    band_key INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    item_id TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_minhash_bands_key ON minhash_bands(subreddit_id, band_key);
+CREATE INDEX IF NOT EXISTS idx_minhash_bands_item ON minhash_bands(kind, item_id);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS search_fts USING fts5(
+    title,
+    body,
+    tokenize = 'porter unicode61'
+);
+"""
+
+# Markers wrapped around matched terms in search snippets. FTS5 inserts
+# control characters, which are swapped for the tags once the post text has
+# been HTML-escaped; any control characters already in the text are dropped.
+HIGHLIGHT_START = '<mark>'
+HIGHLIGHT_END = '</mark>'
+_SNIPPET_START = '\x02'
+_SNIPPET_END = '\x03'
+_SNIPPET_MATCH_PATTERN = re.compile(f'{_SNIPPET_START}([^{_SNIPPET_START}{_SNIPPET_END}]*){_SNIPPET_END}')
+SNIPPET_TOKENS = 24
+
+# Title matches count double when ranking with bm25().
+TITLE_WEIGHT = 2.0
+BODY_WEIGHT = 1.0
+
+# Words are extracted from user queries and quoted, so FTS5 query syntax in the
+# raw text (quotes, NEAR, column filters, '*') can never cause a syntax error.
+QUERY_TERM_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+
+def highlight_snippet(snippet):
+    """
+    Turns a raw FTS5 snippet (matches between _SNIPPET_START and _SNIPPET_END)
+    into safe HTML: the text is escaped, then the matches are wrapped in
+    HIGHLIGHT_START and HIGHLIGHT_END.
+    """
+    if snippet is None:
+        return None
+    escaped = html.escape(snippet)
+    highlighted = _SNIPPET_MATCH_PATTERN.sub(f'{HIGHLIGHT_START}\\1{HIGHLIGHT_END}', escaped)
+    return highlighted.replace(_SNIPPET_START, '').replace(_SNIPPET_END, '')
+
+def build_fts_query(text, match_any=False):
+    """
+    Converts free text into a safe FTS5 MATCH expression.
+
+    Args:
+        text (str): The user's query.
+        match_any (bool): If True, documents matching any term are returned
+            (useful for context retrieval); otherwise all terms must match.
+
+    Returns:
+        str or None: The MATCH expression, or None if the text has no terms.
+    """
+    terms = QUERY_TERM_PATTERN.findall(text or '')
+    if not terms:
+        return None
+    joiner = ' OR ' if match_any else ' '
+    return joiner.join(f'"{term}"' for term in terms)
+
+
+
+def _submission_filter_sql(filters, prefix=''):
+    """
+    Translates the flair and age filters of a `QueryFilters` into extra
+    WHERE conditions on the submissions table.
+
+    Returns:
+        tuple: (sql, params) - conditions starting with ' AND ' (or '' if no
+               filter applies) and their parameters.
+    """
+    if not filters:
+        return '', []
+    conditions, params = [], []
+    if filters.flair is not None:
+        conditions.append(f'{prefix}flair = ? COLLATE NOCASE')
+        params.append(filters.flair)
+    cutoff = filters.cutoff()
+    if cutoff is not None:
+        conditions.append(f'{prefix}created_utc >= ?')
+        params.append(cutoff)
+    return ''.join(f' AND {condition}' for condition in conditions), params
+
+class CorpusStore:
+    """
+    A local SQLite store of ingested subreddit posts and comments with an FTS5
+    full-text index.
+
+    Each thread gets its own connection (SQLite connections must not be shared
+    across threads), opened lazily on first use. A process forked after the
+    store was used (a preforked server worker) opens new connections instead
+    of using the ones it inherited, which SQLite does not allow across fork.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._pid = os.getpid()
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+
+    @property
+    def connection(self):
+        if self._pid != os.getpid():
+            self._local = threading.local() # The parent's connections are left untouched
+            self._pid = os.getpid()
+        conn = getattr(self._local, 'connection', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path)
+            conn.row_factory = sqlite3.Row
+            if self.path != ':memory:':
+                conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA foreign_keys=ON')
+            self._local.connection = conn
+            self._ensure_schema(conn)
+        return conn
+
+    def _ensure_schema(self, conn):
+        with self._schema_lock:
+            if not self._schema_ready or self.path == ':memory:':
+                conn.executescript(SCHEMA)
+                self._schema_ready = True
+
+    def close(self):
+        """Closes this thread's connection, if open."""
+        conn = getattr(self._local, 'connection', None)
+        if conn is not None:
+            conn.close()
+            self._local.connection = None
+
+    # --- Writes ---
+
+    def upsert_subreddit(self, subreddit_info):
+        """
+        Inserts or updates a subreddit's details.
+
+        Args:
+            subreddit_info (dict): Must contain 'name'; may contain 'display_name',
+                'public_description' and 'subscribers'.
+
+        Returns:
+            int: The subreddit's row id.
+        """
+        conn = self.connection
+        with conn:
+            conn.execute(
+                """INSERT INTO subreddits (name, display_name, public_description, subscribers, updated_utc)
+                   VALUES (:name, :display_name, :public_description, :subscribers, :updated_utc)
+                   ON CONFLICT(name) DO UPDATE SET
+                       display_name = COALESCE(excluded.display_name, display_name),
+                       public_description = COALESCE(excluded.public_description, public_description),
+                       subscribers = COALESCE(excluded.subscribers, subscribers),
+                       updated_utc = excluded.updated_utc""",
+                {
+                    'name': subreddit_info['name'],
+                    'display_name': subreddit_info.get('display_name'),
+                    'public_description': subreddit_info.get('public_description'),
+                    'subscribers': subreddit_info.get('subscribers'),
+                    'updated_utc': time.time(),
+                })
+        return self._subreddit_id(subreddit_info['name'])
+
+    def add_submissions(self, subreddit_name, submissions):
+        """
+        Inserts (or updates) submissions of a subreddit and indexes them.
+
+        Args:
+            subreddit_name (str): The subreddit the submissions belong to.
+            submissions (list): Dicts as produced by `app.ingest.normalize_submission`.
+
+        Returns:
+            int: The number of submissions written.
+        """
+        subreddit_id = self._subreddit_id(subreddit_name) or self.upsert_subreddit({'name': subreddit_name})
+        conn = self.connection
+        with conn:
+            for submission in submissions:
+                row = dict(submission, subreddit_id=subreddit_id)
+                for key in ('author', 'selftext', 'score', 'num_comments', 'created_utc', 'permalink', 'flair', 'domain'):
+                    row.setdefault(key, None)
+                conn.execute(
+                    """INSERT INTO submissions
+                       (id, subreddit_id, author, title, selftext, score, num_comments, created_utc, permalink, flair, domain)
+                       VALUES (:id, :subreddit_id, :author, :title, :selftext, :score, :num_comments,
+                               :created_utc, :permalink, :flair, :domain)
+                       ON CONFLICT(id) DO UPDATE SET
+                           title = excluded.title, selftext = excluded.selftext, score = excluded.score,
+                           num_comments = excluded.num_comments, flair = excluded.flair""", row)
+                self._index_document(conn, 'submission', row['id'], subreddit_id, row['title'], row['selftext'] or '')
+        return len(submissions)
+
+    def add_comments(self, subreddit_name, comments):
+        """
+        Inserts (or updates) comments of a subreddit and indexes them.
+
+        Args:
+            subreddit_name (str): The subreddit the comments belong to.
+            comments (list): Dicts as produced by `app.ingest.normalize_comment`.
+
+        Returns:
+            int: The number of comments written.
+        """
+        subreddit_id = self._subreddit_id(subreddit_name) or self.upsert_subreddit({'name': subreddit_name})
+        conn = self.connection
+        with conn:
+            for comment in comments:
+                row = dict(comment, subreddit_id=subreddit_id)
+                for key in ('parent_id', 'author', 'score', 'created_utc', 'permalink'):
+                    row.setdefault(key, None)
+                conn.execute(
+                    """INSERT INTO comments
+                       (id, submission_id, subreddit_id, parent_id, author, body, score, created_utc, permalink)
+                       VALUES (:id, :submission_id, :subreddit_id, :parent_id, :author, :body, :score,
+                               :created_utc, :permalink)
+                       ON CONFLICT(id) DO UPDATE SET body = excluded.body, score = excluded.score""", row)
+                self._index_document(conn, 'comment', row['id'], subreddit_id, '', row['body'] or '')
+        return len(comments)
+
+    def _index_document(self, conn, kind, item_id, subreddit_id, title, body):
+        existing = conn.execute('SELECT rowid FROM search_documents WHERE kind = ? AND item_id = ?',
+                                (kind, item_id)).fetchone()
+        if existing:
+            conn.execute('DELETE FROM search_fts WHERE rowid = ?', (existing[0],))
+            rowid = existing[0]
+        else:
+            rowid = conn.execute('INSERT INTO search_documents (kind, item_id, subreddit_id) VALUES (?, ?, ?)',
+                                 (kind, item_id, subreddit_id)).lastrowid
+        conn.execute('INSERT INTO search_fts (rowid, title, body) VALUES (?, ?, ?)', (rowid, title, body))
+
+    def _unindex_document(self, conn, kind, item_id):
+        existing = conn.execute('SELECT rowid FROM search_documents WHERE kind = ? AND item_id = ?',
+                                (kind, item_id)).fetchone()
+        if existing:
+            conn.execute('DELETE FROM search_fts WHERE rowid = ?', (existing[0],))
+            conn.execute('DELETE FROM search_documents WHERE rowid = ?', (existing[0],))
+
+    def collapse_near_duplicates(self, subreddit_name, kind, item_ids, signatures, threshold=DEFAULT_THRESHOLD):
+        """
+        Records the MinHash signatures of just written items and collapses the
+        near-duplicates among them: an item whose estimated Jaccard similarity
+        to an earlier item of the same subreddit and kind reaches `threshold`
+        is marked as a duplicate of it and removed from the full-text index,
+        so searches and store-backed contexts return only the first copy.
+
+        Candidates are found through the LSH band keys stored for every item
+        that is not itself a duplicate.
+
+        Args:
+            subreddit_name (str): The subreddit the items belong to.
+            kind (str): 'submission' or 'comment'.
+            item_ids (list): Ids of the items, in ingestion order.
+            signatures (numpy.ndarray): Their signatures (see `app.dedup.MinHasher`).
+            threshold (float): Minimum estimated similarity of a duplicate.
+
+        Returns:
+            dict: item id -> id of the item it duplicates, for the collapsed items.
+        """
+        subreddit_id = self._subreddit_id(subreddit_name)
+        if subreddit_id is None or not len(item_ids):
+            return {}
+        keys = band_keys(signatures)
+        placeholders = ','.join('?' * keys.shape[1])
+        duplicates = {}
+        conn = self.connection
+        with conn:
+            for item_id, signature, item_keys in zip(item_ids, signatures, keys.tolist()):
+                conn.execute('DELETE FROM minhash_bands WHERE kind = ? AND item_id = ?', (kind, item_id))
+                candidates = conn.execute(
+                    f"""SELECT DISTINCT s.item_id, s.signature FROM minhash_bands b
+                        JOIN minhash_signatures s ON s.kind = b.kind AND s.item_id = b.item_id
+                        WHERE b.subreddit_id = ? AND b.kind = ? AND b.band_key IN ({placeholders})""",
+                    [subreddit_id, kind] + item_keys).fetchall()
+                duplicate_of = None
+                if candidates:
+                    similarities = estimate_similarity(
+                        signature, np.stack([np.frombuffer(row[1], dtype=np.uint32) for row in candidates]))
+                    best = int(np.argmax(similarities))
+                    if similarities[best] >= threshold:
+                        duplicate_of = candidates[best][0]
+                conn.execute(
+                    """INSERT INTO minhash_signatures (kind, item_id, signature, duplicate_of) VALUES (?, ?, ?, ?)
+                       ON CONFLICT(kind, item_id) DO UPDATE SET
+                           signature = excluded.signature, duplicate_of = excluded.duplicate_of""",
+                    (kind, item_id, signature.astype(np.uint32).tobytes(), duplicate_of))
+                if duplicate_of is None:
+                    conn.executemany('INSERT INTO minhash_bands (subreddit_id, band_key, kind, item_id) VALUES (?, ?, ?, ?)',
+                                     [(subreddit_id, key, kind, item_id) for key in item_keys])
+                else:
+                    self._unindex_document(conn, kind, item_id)
+                    duplicates[item_id] = duplicate_of
+        return duplicates
+
+    def _subreddit_id(self, name):
+        row = self.connection.execute('SELECT id FROM subreddits WHERE name = ?', (name,)).fetchone()
+        return row[0] if row else None
+
+    # --- Reads ---
+
+    def subreddit_names(self):
+        """Returns (display name, subscribers) for every stored subreddit."""
+        rows = self.connection.execute(
+            'SELECT COALESCE(display_name, name) AS name, COALESCE(subscribers, 0) AS subscribers FROM subreddits').fetchall()
+        return [(row['name'], row['subscribers']) for row in rows]
+
+    def search(self, query, subreddit=None, limit=10, match_any=False):
+        """
+        Full-text searches the stored posts and comments.
+
+        Args:
+            query (str): Free-text query.
+            subreddit (str, optional): Restricts results to this subreddit.
+            limit (int): Maximum number of results.
+            match_any (bool): Match documents containing any (instead of all) terms.
+
+        Returns:
+            list: Result dicts, best match first, with 'kind', 'id', 'subreddit',
+                  'title', 'snippet', 'permalink', 'score' and 'created_utc'.
+                  The snippet is HTML: the post text, HTML-escaped, with
+                  matched terms wrapped in <mark> tags. Every other field
+                  (including 'title') is plain, unescaped text.
+        """
+        fts_query = build_fts_query(query, match_any=match_any)
+        if not fts_query:
+            return []
+        sql = f"""
+            SELECT d.kind, d.item_id, s.name AS subreddit,
+                   COALESCE(sub.title, parent.title) AS title,
+                   snippet(search_fts, -1, ?, ?, '...', {SNIPPET_TOKENS}) AS snippet,
+                   COALESCE(sub.permalink, c.permalink) AS permalink,
+                   COALESCE(sub.score, c.score) AS score,
+                   COALESCE(sub.created_utc, c.created_utc) AS created_utc
+            FROM search_fts
+            JOIN search_documents d ON d.rowid = search_fts.rowid
+            JOIN subreddits s ON s.id = d.subreddit_id
+            LEFT JOIN submissions sub ON d.kind = 'submission' AND sub.id = d.item_id
+            LEFT JOIN comments c ON d.kind = 'comment' AND c.id = d.item_id
+            LEFT JOIN submissions parent ON parent.id = c.submission_id
+            WHERE search_fts MATCH ? {'AND s.name = ?' if subreddit else ''}
+            ORDER BY bm25(search_fts, {TITLE_WEIGHT}, {BODY_WEIGHT})
+            LIMIT ?"""
+        params = [_SNIPPET_START, _SNIPPET_END, fts_query]
+        if subreddit:
+            params.append(subreddit)
+        params.append(limit)
+        try:
+            rows = self.connection.execute(sql, params).fetchall()
+        except sqlite3.OperationalError as e:
+            logging.error(f"CorpusStore: FTS query {fts_query!r} failed: {e}")
+            return []
+        return [{
+            'kind': row['kind'],
+            'id': row['item_id'],
+            'subreddit': row['subreddit'],
+            'title': row['title'],
+            'snippet': highlight_snippet(row['snippet']),
+            'permalink': row['permalink'],
+            'score': row['score'],
+            'created_utc': row['created_utc'],
+        } for row in rows]
+
+    def get_submissions(self, subreddit, limit=None, filters=None):
+        """
+        Returns a subreddit's stored submissions (except collapsed
+        near-duplicates), highest score first (newest first for a 'new'
+        query), as dicts in the same shape the live fetch produces.
+        `filters` (a `QueryFilters`) narrows them by flair and age.
+        """
+        filter_sql, filter_params = _submission_filter_sql(filters, 'sub.')
+        order = 'sub.created_utc DESC' if filters is not None and filters.sort == 'new' else 'sub.score DESC'
+        sql = f"""SELECT sub.id, sub.title, sub.selftext, sub.score, sub.num_comments, sub.permalink,
+                        sub.author, sub.created_utc, sub.flair, sub.domain
+                 FROM submissions sub JOIN subreddits s ON s.id = sub.subreddit_id
+                 WHERE s.name = ? AND sub.id NOT IN (SELECT item_id FROM minhash_signatures
+                                                     WHERE kind = 'submission' AND duplicate_of IS NOT NULL){filter_sql}
+                 ORDER BY {order}"""
+        params = [subreddit] + filter_params
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(limit)
+        return [dict(row) for row in self.connection.execute(sql, params).fetchall()]
+
+    def _get_submissions_by_id(self, subreddit_id, ids, filters=None):
+        """Returns the submissions with these ids, ignoring ids that belong to another subreddit."""
+        if not ids:
+            return []
+        placeholders = ','.join('?' * len(ids))
+        filter_sql, filter_params = _submission_filter_sql(filters)
+        rows = self.connection.execute(
+            f"""SELECT id, title, selftext, score, num_comments, permalink, author, created_utc, flair, domain
+                FROM submissions WHERE subreddit_id = ? AND id IN ({placeholders}) AND id NOT IN (
+                    SELECT item_id FROM minhash_signatures WHERE kind = 'submission' AND duplicate_of IS NOT NULL){filter_sql}""",
+            [subreddit_id] + list(ids) + filter_params).fetchall()
+        return [dict(row) for row in rows]
+
+    def iter_texts(self, batch_size=5000, since=None):
+        """
+        Yields every stored submission and comment in batches, for building
+        derived aggregates (e.g. sentiment) without loading the whole corpus.
+
+        Args:
+            batch_size (int): Items per batch.
+            since (float, optional): Only items created at or after this Unix time.
+
+        Yields:
+            list: Dicts with 'kind', 'id', 'submission_id' (a submission's own
+                id for submissions), 'subreddit', 'created_utc' and 'text'.
+        """
+        since_sql = ' AND {}created_utc >= ?' if since is not None else ''
+        queries = {
+            'submission': f"""SELECT sub.rowid, sub.id, sub.id AS submission_id, s.name AS subreddit, sub.created_utc,
+                                     sub.title || char(10) || COALESCE(sub.selftext, '') AS text
+                              FROM submissions sub JOIN subreddits s ON s.id = sub.subreddit_id
+                              WHERE sub.rowid > ?{since_sql.format('sub.')} ORDER BY sub.rowid LIMIT ?""",
+            'comment': f"""SELECT c.rowid, c.id, c.submission_id, s.name AS subreddit, c.created_utc,
+                                  COALESCE(c.body, '') AS text
+                           FROM comments c JOIN subreddits s ON s.id = c.subreddit_id
+                           WHERE c.rowid > ?{since_sql.format('c.')} ORDER BY c.rowid LIMIT ?""",
+        }
+        for kind, sql in queries.items():
+            last_rowid = 0
+            while True:
+                params = (last_rowid, since, batch_size) if since is not None else (last_rowid, batch_size)
+                rows = self.connection.execute(sql, params).fetchall()
+                if not rows:
+                    break
+                last_rowid = rows[-1]['rowid']
+                yield [{'kind': kind, 'id': row['id'], 'submission_id': row['submission_id'],
+                        'subreddit': row['subreddit'], 'created_utc': row['created_utc'], 'text': row['text']}
+                       for row in rows]
+
+    def get_subreddit_context(self, subreddit, question=None, post_limit=25, preferred_ids=None, filters=None):
+        """
+        Builds the subreddit context dict used by `send_message` from the store,
+        so the chat pipeline can answer without calling the Reddit API.
+
+        Posts listed in `preferred_ids` (e.g., semantic search hits) come first,
+        then posts matching the question (any term); the remaining slots are
+        filled with the highest-scoring posts. Preferred ids of posts from
+        other subreddits (e.g., from a stale index) are ignored.
+
+        Args:
+            subreddit (str): The subreddit name.
+            question (str, optional): The user's question.
+            post_limit (int): Maximum number of posts in the context.
+            preferred_ids (list, optional): Submission ids to include first.
+            filters (QueryFilters, optional): Inline query filters; only posts
+                passing the flair and age filters are included.
+
+        Returns:
+            dict or None: The context dict ('display_name', 'public_description',
+                          'subscribers', 'name', 'posts'), or None if the
+                          subreddit has not been ingested.
+        """
+        row = self.connection.execute(
+            'SELECT id, name, display_name, public_description, subscribers FROM subreddits WHERE name = ?',
+            (subreddit,)).fetchone()
+        if row is None:
+            return None
+
+        matched_ids = list(preferred_ids or [])
+        if question:
+            for result in self.search(question, subreddit=subreddit, limit=post_limit * 2, match_any=True):
+                if result['kind'] == 'submission' and result['id'] not in matched_ids:
+                    matched_ids.append(result['id'])
+
+        posts_by_id = {post['id']: post for post in self._get_submissions_by_id(row['id'], matched_ids, filters=filters)}
+        posts = [posts_by_id[post_id] for post_id in matched_ids if post_id in posts_by_id][:post_limit]
+        if len(posts) < post_limit:
+            for post in self.get_submissions(subreddit, limit=post_limit, filters=filters):
+                if len(posts) >= post_limit:
+                    break
+                if post['id'] not in posts_by_id:
+                    posts.append(post)
+
+        return {
+            'display_name': row['display_name'] or row['name'],
+            'public_description': row['public_description'],
+            'subscribers': row['subscribers'],
+            'name': subreddit,
+            'posts': [{
+                'id': post['id'],
+                'title': post['title'],
+                'selftext': post['selftext'] or '',
+                'score': post['score'],
+                'num_comments': post['num_comments'],
+                'permalink': post['permalink'],
+                'flair': post['flair'],
+                'created_utc': post['created_utc'],
+            } for post in posts],
+        }
@@ -0,0 +1,266 @@
+import heapq
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from numbers import Real
+
+import numpy as np
+
+from app.bm25 import tokenize
+
+# Count-Min Sketch shape: DEPTH rows of WIDTH int32 counters per time bucket.
+# The estimate of a term's count exceeds the true count by at most
+# 2 * total / WIDTH with probability 1 - 2**-DEPTH.
+CMS_WIDTH = 1024
+CMS_DEPTH = 4
+
+BUCKET_SECONDS = 3600
+# Number of most recent buckets kept as separate sketches (the trend window).
+RECENT_BUCKETS = 6
+# Weight of the old baseline when a bucket leaves the window: each older hour
+# counts for 0.9 times the next one, so the baseline averages roughly the last day.
+BASELINE_DECAY = 0.9
+
+# Hours of stored items replayed by `TrendDetector.from_corpus`: the window plus
+# enough older buckets for the baseline (their weight has decayed below 1%).
+BOOTSTRAP_HOURS = 48
+
+# Space-Saving capacity (candidate terms tracked per bucket).
+HEAVY_HITTERS = 64
+# Recently seen item ids remembered per subreddit, so re-fetched listings are not counted twice.
+SEEN_ITEMS = 4096
+# Subreddits tracked at once (least recently updated evicted).
+MAX_SUBREDDITS = 256
+
+# A trending term needs at least this many occurrences in the window and a
+# burst score (standard deviations above its baseline) of at least MIN_BURST_SCORE.
+MIN_TREND_COUNT = 3
+MIN_BURST_SCORE = 2.0
+
+_SEEDS = np.arange(1, CMS_DEPTH + 1, dtype=np.uint64)
+
+
+def extract_terms(text):
+    """Returns the unigrams and bigrams of `text` (stopwords removed)."""
+    tokens = tokenize(text)
+    return tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+
+
+def _sketch_columns(terms, width=CMS_WIDTH):
+    """
+    Returns a (DEPTH, len(terms)) array of counter columns, one row per hash
+    function, derived from two 32-bit hashes (h1 + i * h2).
+    """
+    encoded = [term.encode('utf-8') for term in terms]
+    h1 = np.fromiter((zlib.crc32(term) for term in encoded), dtype=np.uint64, count=len(encoded))
+    h2 = np.fromiter((zlib.adler32(term) for term in encoded), dtype=np.uint64, count=len(encoded)) | np.uint64(1)
+    return ((h1[None, :] + _SEEDS[:, None] * h2[None, :]) % np.uint64(width)).astype(np.int64)
+
+
+class SpaceSaving:
+    """
+    Space-Saving heavy hitters: tracks at most `capacity` terms. When a new term
+    arrives and the summary is full, it replaces the term with the smallest
+    count and inherits that count (which becomes its maximum overestimate).
+    """
+
+    def __init__(self, capacity=HEAVY_HITTERS):
+        self.capacity = capacity
+        self.counts = {}
+        self._heap = []  # (count, term); entries are stale when the count has changed
+
+    def add(self, term, count=1):
+        if term in self.counts:
+            self.counts[term] += count
+        elif len(self.counts) < self.capacity:
+            self.counts[term] = count
+        else:
+            while True:
+                smallest, victim = heapq.heappop(self._heap)
+                if self.counts.get(victim) == smallest:
+                    break
+            del self.counts[victim]
+            self.counts[term] = smallest + count
+        heapq.heappush(self._heap, (self.counts[term], term))
+        if len(self._heap) > 4 * self.capacity:
+            self._heap = [(count, term) for term, count in self.counts.items()]
+            heapq.heapify(self._heap)
+
+    def top(self, k):
+        return sorted(self.counts.items(), key=lambda item: -item[1])[:k]
+
+
+class _SubredditTrends:
+    """Fixed-size trend state of one subreddit."""
+
+    def __init__(self):
+        self.sketches = np.zeros((RECENT_BUCKETS, CMS_DEPTH, CMS_WIDTH), dtype=np.int32)
+        self.heavy_hitters = [SpaceSaving() for _ in range(RECENT_BUCKETS)]
+        self.baseline = np.zeros((CMS_DEPTH, CMS_WIDTH), dtype=np.float32)  # Decayed count per bucket
+        self.baseline_buckets = 0
+        self.current_bucket = None
+        self.first_bucket = None
+        self.seen = OrderedDict()
+
+    def advance(self, bucket):
+        """Rolls the ring forward so that `bucket` is the newest slot."""
+        if self.current_bucket is None:
+            self.current_bucket = self.first_bucket = bucket
+            return
+        gap = bucket - self.current_bucket
+        if gap <= 0:
+            return
+        # Buckets leaving the window: those still in the ring are folded into the
+        # baseline; buckets skipped entirely were empty and only decay it.
+        # Nothing was recorded before the first bucket, so those are ignored.
+        leaving_start = max(self.current_bucket + 1 - RECENT_BUCKETS, self.first_bucket)
+        leaving_end = bucket + 1 - RECENT_BUCKETS
+        for leaving in range(leaving_start, min(leaving_end, self.current_bucket + 1)):
+            self.baseline *= BASELINE_DECAY
+            self.baseline += (1 - BASELINE_DECAY) * self.sketches[leaving % RECENT_BUCKETS]
+            self.baseline_buckets += 1
+        empty = leaving_end - max(leaving_start, self.current_bucket + 1)
+        if empty > 0:
+            self.baseline *= BASELINE_DECAY ** empty
+            self.baseline_buckets += empty
+        for step in range(1, min(gap, RECENT_BUCKETS) + 1):
+            slot = (self.current_bucket + step) % RECENT_BUCKETS
+            self.sketches[slot] = 0
+            self.heavy_hitters[slot] = SpaceSaving()
+        self.current_bucket = bucket
+
+    def expected_per_bucket(self, rows, columns):
+        """Bias-corrected baseline estimate (the decayed average starts at zero)."""
+        if not self.baseline_buckets:
+            return np.zeros(columns.shape[1], dtype=np.float32)
+        return self.baseline[rows, columns].min(axis=0) / (1 - BASELINE_DECAY ** self.baseline_buckets)
+
+
+class TrendDetector:
+    """
+    Streaming trending-term detection per subreddit in fixed memory.
+
+    Terms of ingested items are counted in a Count-Min Sketch per hourly bucket
+    (a ring of RECENT_BUCKETS sketches), and a Space-Saving summary per bucket
+    keeps the candidate heavy hitters. When a bucket leaves the window it is
+    folded into an exponentially decayed baseline sketch of the expected count
+    per bucket. A term's burst score compares its count in the window with its
+    baseline: (observed - expected) / sqrt(expected + 1).
+    """
+
+    def __init__(self, max_subreddits=MAX_SUBREDDITS):
+        self.max_subreddits = max_subreddits
+        self._lock = threading.Lock()
+        self._subreddits = OrderedDict()
+
+    @classmethod
+    def from_corpus(cls, corpus_store, now=None, hours=BOOTSTRAP_HOURS, max_subreddits=MAX_SUBREDDITS):
+        """
+        Rebuilds the recent buckets and the baseline from the items of a
+        `CorpusStore` created in the last `hours` hours (replayed oldest first).
+        """
+        detector = cls(max_subreddits=max_subreddits)
+        since = (time.time() if now is None else now) - hours * BUCKET_SECONDS
+        by_subreddit = {}
+        for items in corpus_store.iter_texts(since=since):
+            for item in items:
+                by_subreddit.setdefault(item['subreddit'], []).append((item['id'], item['created_utc'], item['text']))
+        for subreddit, entries in by_subreddit.items():
+            detector._add(subreddit, sorted(entries, key=lambda entry: entry[1]))
+        return detector
+
+    def __contains__(self, subreddit):
+        return subreddit.lower() in self._subreddits
+
+    def add_submissions(self, subreddit_name, submissions):
+        """
+        Counts the terms of submissions (dicts with 'id', 'title', 'selftext'
+        and 'created_utc').
+
+        Returns:
+            int: The number of items counted (already seen ids are skipped).
+        """
+        return self._add(subreddit_name, [(item.get('id'), item.get('created_utc'),
+                                           f"{item.get('title', '')}\n{item.get('selftext') or ''}")
+                                          for item in submissions])
+
+    def add_comments(self, subreddit_name, comments):
+        """Counts the terms of comments (dicts with 'id', 'body' and 'created_utc')."""
+        return self._add(subreddit_name, [(item.get('id'), item.get('created_utc'), item.get('body') or '')
+                                          for item in comments])
+
+    def _add(self, subreddit_name, items):
+        counted = 0
+        with self._lock:
+            state = self._state(subreddit_name.lower(), create=True)
+            for item_id, created, text in items:
+                if not isinstance(created, Real) or item_id in state.seen:
+                    continue
+                state.seen[item_id] = None
+                if len(state.seen) > SEEN_ITEMS:
+                    state.seen.popitem(last=False)
+                bucket = int(created // BUCKET_SECONDS)
+                state.advance(bucket)
+                if bucket <= state.current_bucket - RECENT_BUCKETS:
+                    continue  # Older than the window
+                terms = extract_terms(text)
+                if not terms:
+                    continue
+                slot = bucket % RECENT_BUCKETS
+                columns = _sketch_columns(terms)
+                for row in range(CMS_DEPTH):
+                    np.add.at(state.sketches[slot, row], columns[row], 1)
+                for term in terms:
+                    state.heavy_hitters[slot].add(term)
+                counted += 1
+        return counted
+
+    def _state(self, subreddit, create=False):
+        state = self._subreddits.get(subreddit)
+        if state is None and create:
+            state = self._subreddits[subreddit] = _SubredditTrends()
+            while len(self._subreddits) > self.max_subreddits:
+                self._subreddits.popitem(last=False)
+        if state is not None:
+            self._subreddits.move_to_end(subreddit)
+        return state
+
+    def trending(self, subreddit_name, k=10, now=None):
+        """
+        Returns the most bursty terms of a subreddit in the current window.
+
+        Args:
+            subreddit_name (str): The subreddit.
+            k (int): Maximum number of terms.
+            now (float, optional): Unix time treated as "now".
+
+        Returns:
+            dict or None: 'window_hours', 'baseline_hours' and 'terms' (dicts
+                with 'term', 'count', 'expected' and 'score', most bursty
+                first); None if the subreddit was never seen.
+        """
+        with self._lock:
+            state = self._state(subreddit_name.lower())
+            if state is None:
+                return None
+            state.advance(int((time.time() if now is None else now) // BUCKET_SECONDS))
+            candidates = sorted({term for summary in state.heavy_hitters for term in summary.counts})
+            columns = _sketch_columns(candidates)
+            rows = np.arange(CMS_DEPTH)[:, None]
+            # Count-Min estimate per bucket (min over rows), summed over the window.
+            observed = state.sketches[:, rows, columns].min(axis=1).sum(axis=0)
+            expected = state.expected_per_bucket(rows, columns) * RECENT_BUCKETS
+            baseline_buckets = state.baseline_buckets
+
+        terms = []
+        scores = (observed - expected) / np.sqrt(expected + 1.0)
+        for index in np.argsort(-scores, kind='stable'):
+            if observed[index] < MIN_TREND_COUNT or scores[index] < MIN_BURST_SCORE:
+                continue
+            terms.append({'term': candidates[index], 'count': int(observed[index]),
+                          'expected': round(float(expected[index]), 2), 'score': round(float(scores[index]), 2)})
+            if len(terms) == k:
+                break
+        return {'window_hours': RECENT_BUCKETS * BUCKET_SECONDS // 3600,
+                'baseline_hours': baseline_buckets, 'terms': terms}
@@ -0,0 +1,109 @@
+"""
+Latency versus recall of the IVF approximate nearest neighbour index.
+
+Synthetic clustered unit-length vectors are indexed once with exact
+(brute-force) search and once with IVF. For each probe count the benchmark
+reports recall@k against exact search, the median query latency and the
+fraction of vectors scanned.
+
+Usage:
+    python benchmarks/bench_ann.py --size 1000000 --dim 128 --nprobe 1 4 16 64 128 256
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import ann, embeddings  # noqa: E402
+
+CHUNK_ROWS = 250000
+NUM_CLUSTERS = 1000
+
+
+def clustered_vectors(rng, count, centroids, spread):
+    assignments = rng.integers(0, len(centroids), size=count)
+    block = centroids[assignments] + spread * rng.standard_normal((count, centroids.shape[1]), dtype=np.float32)
+    block /= np.linalg.norm(block, axis=1, keepdims=True)
+    return block
+
+
+def write_synthetic_index(directory, size, dim, spread, rng):
+    """Writes a float32 embedding index chunk by chunk (all rows in one subreddit)."""
+    centroids = rng.standard_normal((NUM_CLUSTERS, dim), dtype=np.float32)
+    centroids /= np.linalg.norm(centroids, axis=1, keepdims=True)
+    vectors = np.lib.format.open_memmap(os.path.join(directory, embeddings.VECTORS_FILE),
+                                        mode='w+', dtype=np.float32, shape=(size, dim))
+    for start in range(0, size, CHUNK_ROWS):
+        end = min(start + CHUNK_ROWS, size)
+        vectors[start:end] = clustered_vectors(rng, end - start, centroids, spread)
+    vectors.flush()
+    np.save(os.path.join(directory, embeddings.ITEM_IDS_FILE), np.char.mod('%d', np.arange(size)))
+    np.save(os.path.join(directory, embeddings.CREATED_UTC_FILE), np.zeros(size))
+    np.save(os.path.join(directory, embeddings.SUBREDDIT_OFFSETS_FILE), np.array([0, size], dtype=np.int64))
+    with open(os.path.join(directory, embeddings.SUBREDDITS_FILE), 'w') as f:
+        json.dump(['bench'], f)
+    return centroids
+
+
+def run_queries(search, queries):
+    results, latencies = [], []
+    for query in queries:
+        started = time.perf_counter()
+        results.append({item_id for item_id, _ in search(query)})
+        latencies.append((time.perf_counter() - started) * 1000.0)
+    return results, float(np.percentile(latencies, 50))
+
+
+def recall(results, truth):
+    return float(np.mean([len(found & expected) / len(expected) for found, expected in zip(results, truth)]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', type=int, default=1000000)
+    parser.add_argument('--dim', type=int, default=128)
+    parser.add_argument('--lists', type=int, default=None, help="Inverted lists (default ~4*sqrt(size)).")
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[1, 4, 16, 64, 128, 256])
+    parser.add_argument('--spread', type=float, default=0.15,
+                        help="Per-dimension noise around the mixture centres. IVF relies on the data "
+                             "being clustered; with large spreads the vectors become isotropic noise.")
+    parser.add_argument('--queries', type=int, default=100)
+    parser.add_argument('--k', type=int, default=10)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as directory:
+        centroids = write_synthetic_index(directory, args.size, args.dim, args.spread, rng)
+        queries = clustered_vectors(rng, args.queries, centroids, args.spread)
+        exact = embeddings.EmbeddingIndex.open(directory)
+
+        started = time.perf_counter()
+        ann.build_ivf(directory, exact.vectors, exact.item_ids, num_lists=args.lists)
+        build_seconds = time.perf_counter() - started
+        index = ann.IVFIndex.open(directory)
+
+        exact.search(queries[0], args.k)  # Warm the page cache
+        index.search(queries[0], args.k, nprobe=index.num_lists)
+        truth, exact_ms = run_queries(lambda q: exact.search(q, args.k), queries)
+
+        print(f"vectors={args.size} dim={args.dim} lists={index.num_lists} k={args.k} "
+              f"queries={args.queries} build={build_seconds:.1f}s")
+        print(f"{'nprobe':>7} {'scanned':>8} {'p50 ms':>8} {'recall@k':>9} {'speedup':>8}")
+        print(f"{'exact':>7} {1:>8.1%} {exact_ms:>8.2f} {1:>9.3f} {1:>7.1f}x")
+        list_sizes = np.diff(index.offsets)
+        for nprobe in args.nprobe:
+            results, ivf_ms = run_queries(lambda q: index.search(q, args.k, nprobe=nprobe), queries)
+            scanned = nprobe * float(np.mean(list_sizes)) / args.size
+            print(f"{nprobe:>7} {min(scanned, 1.0):>8.1%} {ivf_ms:>8.2f} {recall(results, truth):>9.3f} "
+                  f"{exact_ms / ivf_ms:>7.1f}x")
+        del index, exact
+
+
+if __name__ == '__main__':
+    main()
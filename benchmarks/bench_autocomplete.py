@@ -0,0 +1,88 @@
+"""
+Subreddit autocomplete over millions of names: memory-mapped sorted index
+versus a linear scan.
+
+Synthetic subreddit names with Zipf-distributed subscriber counts are written
+to a name index (`build_name_index`). The benchmark reports the build time and
+size on disk, the time to open the index memory-mapped, and the latency of
+`SubredditNameIndex.complete` for prefixes of 1-6 characters taken from real
+names, compared with filtering a Python list of names with `startswith` and
+sorting the matches by subscribers.
+
+Usage:
+    python benchmarks/bench_autocomplete.py --names 2000000 --queries 2000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.autocomplete import SubredditNameIndex, build_name_index  # noqa: E402
+
+SYLLABLES = ['py', 'th', 'on', 'ask', 're', 'dd', 'it', 'pic', 'gam', 'ing', 'news', 'art', 'lea', 'rn', 'co',
+             'de', 'my', 'sto', 'ck', 'bit', 'ai', 'ml', 'web', 'dev', 'fun', 'ny', 'cat', 's', 'x', '_', '2', '0']
+
+
+def synthetic_names(rng, count):
+    lengths = rng.integers(2, 8, size=count)
+    parts = rng.integers(0, len(SYLLABLES), size=(count, 7))
+    names = [''.join(SYLLABLES[p] for p in row[:length])[:21] for row, length in zip(parts, lengths)]
+    subscribers = rng.zipf(1.5, size=count).astype(np.int64)
+    return names, subscribers
+
+
+def percentiles(latencies):
+    latencies = np.array(latencies) * 1e6
+    return f"p50 {np.percentile(latencies, 50):8.1f} us   p99 {np.percentile(latencies, 99):8.1f} us"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--names', type=int, default=2000000)
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--scan-queries', type=int, default=20, help="Queries timed for the linear scan.")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    names, subscribers = synthetic_names(rng, args.names)
+    with tempfile.TemporaryDirectory() as directory:
+        started = time.perf_counter()
+        count = build_name_index(directory, names, subscribers)
+        build = time.perf_counter() - started
+        size = sum(os.path.getsize(os.path.join(directory, f)) for f in os.listdir(directory)) / 1e6
+
+        started = time.perf_counter()
+        index = SubredditNameIndex.open(directory)
+        opened = time.perf_counter() - started
+        print(f"{count} distinct names: build {build:.1f} s, {size:.0f} MB on disk, open {opened * 1000:.2f} ms")
+
+        lowered = [name.lower() for name in names]
+        sample = rng.choice(len(names), size=args.queries)
+        for length in (1, 2, 3, 4, 6):
+            prefixes = [lowered[i][:length] for i in sample]
+            latencies = []
+            for prefix in prefixes:
+                started = time.perf_counter()
+                index.complete(prefix, k=8)
+                latencies.append(time.perf_counter() - started)
+            matches = np.mean([np.subtract(*index.prefix_range(p.encode())[::-1]) for p in prefixes[:200]])
+            print(f"prefix length {length}: {percentiles(latencies)}   (~{matches:,.0f} matching names)")
+
+        latencies = []
+        for i in sample[:args.scan_queries]:
+            prefix = lowered[i][:3]
+            started = time.perf_counter()
+            hits = [row for row, name in enumerate(lowered) if name.startswith(prefix)]
+            sorted(hits, key=lambda row: -subscribers[row])[:8]
+            latencies.append(time.perf_counter() - started)
+        print(f"linear scan, length 3: {percentiles(latencies)}")
+        del index
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""
+Offline batch answering: throughput of `app.batch.run_batch` by parallelism.
+
+A synthetic corpus store (subreddits of short posts) is written to a temporary
+directory and used as the context source (CONTEXT_SOURCE=store), so every
+message runs parsing, store retrieval, context preparation (BM25, activity,
+sentiment) and the mock LLM. Each configuration answers the same JSONL file
+of questions; the benchmark reports messages per second, the context cache
+hit rate and per-stage p50 latency.
+
+Usage:
+    python benchmarks/bench_batch.py --messages 3000 --configs 1x0 8x0 4x2
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+WORDS = ('python', 'async', 'decorator', 'generator', 'pandas', 'numpy', 'flask', 'django', 'typing', 'testing',
+         'packaging', 'virtualenv', 'performance', 'memory', 'threads', 'closures', 'classes', 'regex', 'unicode')
+
+
+def write_corpus(path, rng, subreddits, posts):
+    from app.storage import CorpusStore
+    store = CorpusStore(path)
+    now = time.time()
+    for s in range(subreddits):
+        name = f"bench{s}"
+        store.upsert_subreddit({'name': name, 'display_name': name, 'public_description': f"About {name}",
+                                'subscribers': int(rng.integers(1000, 100000))})
+        store.add_submissions(name, [{
+            'id': f"{name}_{p}", 'title': ' '.join(rng.choice(WORDS, size=6)),
+            'selftext': ' '.join(rng.choice(WORDS, size=40)), 'score': int(rng.integers(0, 500)),
+            'num_comments': int(rng.integers(0, 50)), 'created_utc': now - float(rng.integers(0, 30 * 86400)),
+            'permalink': f"https://www.reddit.com/r/{name}/comments/{p}", 'author': f"user{rng.integers(200)}",
+        } for p in range(posts)])
+    store.close()
+
+
+def write_questions(path, rng, messages, subreddits):
+    with open(path, 'w', encoding='utf-8') as f:
+        for i in range(messages):
+            words = ' '.join(rng.choice(WORDS, size=3))
+            f.write(json.dumps({'id': i, 'message': f"@r/bench{rng.integers(subreddits)} how do I use {words}?"}) + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=3000)
+    parser.add_argument('--subreddits', type=int, default=20)
+    parser.add_argument('--posts', type=int, default=300, help="Posts per subreddit.")
+    parser.add_argument('--configs', nargs='+', default=['1x0', '8x0', '4x2'],
+                        help="THREADSxPROCESSES configurations to run.")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ['CORPUS_DB_PATH'] = os.path.join(directory, 'corpus.db')
+        os.environ['CONTEXT_SOURCE'] = 'store'
+        write_corpus(os.environ['CORPUS_DB_PATH'], rng, args.subreddits, args.posts)
+        questions = os.path.join(directory, 'questions.jsonl')
+        write_questions(questions, rng, args.messages, args.subreddits)
+
+        from app.batch import run_batch  # Reads the environment above at import
+        for config in args.configs:
+            threads, processes = (int(part) for part in config.split('x'))
+            summary = run_batch(questions, os.path.join(directory, 'answers.jsonl'), threads=threads,
+                                processes=processes)
+            stages = '   '.join(f"{stage} {latency['p50']:.2f} ms" for stage, latency in summary['stages'].items())
+            lookups = summary['cache_hits'] + summary['cache_misses']
+            print(f"{threads} threads x {processes} processes: {summary['messages_per_second']:7.1f} messages/s   "
+                  f"cache hits {summary['cache_hits'] / max(lookups, 1):.0%}   p50 {stages}")
+
+
+if __name__ == '__main__':
+    main()
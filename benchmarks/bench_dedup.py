@@ -0,0 +1,84 @@
+"""
+MinHash signature throughput and LSH near-duplicate detection quality.
+
+Synthetic posts are generated, and a fraction of them get a near-duplicate
+copy (a few words changed, as in a repost or a copy-pasted comment). The
+benchmark reports signature throughput when a batch is hashed in one call
+(the vectorized path) versus one call per text, then collapses the corpus
+with the LSH banding index and reports how many planted copies were caught
+and how many distinct posts were wrongly collapsed.
+
+Usage:
+    python benchmarks/bench_dedup.py --docs 20000 --words 120
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.dedup import MinHasher, collapse_near_duplicates  # noqa: E402
+
+VOCABULARY_SIZE = 20000
+
+
+def synthetic_corpus(rng, count, words, duplicate_fraction, edits):
+    """Returns (texts, original_of) where original_of maps a planted copy's index to its source."""
+    ids = np.minimum(rng.zipf(1.2, size=(count, words)), VOCABULARY_SIZE)
+    texts = [' '.join(f"w{i}" for i in row) for row in ids]
+    original_of = {}
+    for source in rng.choice(count, size=int(count * duplicate_fraction), replace=False).tolist():
+        row = ids[source].copy()
+        row[rng.choice(words, size=edits, replace=False)] = rng.integers(1, VOCABULARY_SIZE, size=edits)
+        original_of[len(texts)] = source
+        texts.append(' '.join(f"w{i}" for i in row))
+    order = rng.permutation(len(texts))
+    position = {old: new for new, old in enumerate(order.tolist())}
+    return [texts[i] for i in order], {position[copy]: position[source] for copy, source in original_of.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--docs', type=int, default=20000)
+    parser.add_argument('--words', type=int, default=120)
+    parser.add_argument('--duplicates', type=float, default=0.1, help="Fraction of posts that get a copy.")
+    parser.add_argument('--edits', type=int, default=3, help="Words changed in each copy.")
+    parser.add_argument('--threshold', type=float, default=0.8)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    texts, original_of = synthetic_corpus(rng, args.docs, args.words, args.duplicates, args.edits)
+    hasher = MinHasher()
+    megabytes = sum(len(text) for text in texts) / 1e6
+
+    started = time.perf_counter()
+    signatures = hasher.signatures(texts)
+    batched = time.perf_counter() - started
+
+    sample = texts[:2000]
+    started = time.perf_counter()
+    for text in sample:
+        hasher.signature(text)
+    per_text = (time.perf_counter() - started) * len(texts) / len(sample)
+
+    started = time.perf_counter()
+    kept, duplicates = collapse_near_duplicates(list(range(len(texts))), texts, threshold=args.threshold, hasher=hasher)
+    collapse = time.perf_counter() - started - batched  # Signatures are recomputed inside
+
+    planted = {frozenset(pair) for pair in original_of.items()}
+    caught = sum(1 for pair in duplicates.items() if frozenset(pair) in planted)
+    print(f"{len(texts)} texts, {megabytes:.1f} MB, {hasher.num_permutations} permutations")
+    print(f"signatures, one batch   : {batched * 1000:8.0f} ms  ({len(texts) / batched:9.0f} texts/s, "
+          f"{megabytes / batched:5.1f} MB/s)")
+    print(f"signatures, per text    : {per_text * 1000:8.0f} ms  ({len(texts) / per_text:9.0f} texts/s)")
+    print(f"LSH collapse            : {collapse * 1000:8.0f} ms")
+    print(f"planted copies caught   : {caught}/{len(planted)}")
+    print(f"wrongly collapsed       : {len(duplicates) - caught}")
+    print(f"signature matrix        : {signatures.nbytes / 1e6:.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
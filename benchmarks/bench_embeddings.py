@@ -0,0 +1,94 @@
+"""
+Query-latency benchmark for the memory-mapped embedding index.
+
+Synthetic unit-length vectors are written chunk by chunk (so the benchmark
+itself never holds the whole matrix in RAM), the index is opened with memory
+mapping, and query latency is measured for unfiltered, per-subreddit and
+per-subreddit + time-window searches.
+
+Usage:
+    python benchmarks/bench_embeddings.py --sizes 100000 1000000 5000000 --dim 128
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import embeddings  # noqa: E402
+
+CHUNK_ROWS = 500000
+DAY_SECONDS = 86400
+
+
+def write_synthetic_index(directory, size, dim, num_subreddits, rng):
+    """Writes `size` random vectors spread evenly over `num_subreddits` subreddits."""
+    vectors = np.lib.format.open_memmap(os.path.join(directory, embeddings.VECTORS_FILE),
+                                        mode='w+', dtype=np.float32, shape=(size, dim))
+    created = np.lib.format.open_memmap(os.path.join(directory, embeddings.CREATED_UTC_FILE),
+                                        mode='w+', dtype=np.float64, shape=(size,))
+    per_subreddit = size // num_subreddits
+    counts = np.full(num_subreddits, per_subreddit)
+    counts[-1] += size - per_subreddit * num_subreddits
+    offsets = np.concatenate([[0], np.cumsum(counts)])
+    for start in range(0, size, CHUNK_ROWS):
+        end = min(start + CHUNK_ROWS, size)
+        block = rng.standard_normal((end - start, dim), dtype=np.float32)
+        block /= np.linalg.norm(block, axis=1, keepdims=True)
+        vectors[start:end] = block
+    for i in range(num_subreddits):
+        # One year of posts per subreddit, in time order (as write_index sorts them).
+        created[offsets[i]:offsets[i + 1]] = np.linspace(0, 365 * DAY_SECONDS, counts[i])
+    vectors.flush()
+    created.flush()
+    np.save(os.path.join(directory, embeddings.ITEM_IDS_FILE), np.char.mod('t3_%d', np.arange(size)))
+    np.save(os.path.join(directory, embeddings.SUBREDDIT_OFFSETS_FILE), offsets.astype(np.int64))
+    with open(os.path.join(directory, embeddings.SUBREDDITS_FILE), 'w') as f:
+        json.dump([f'sub{i:04d}' for i in range(num_subreddits)], f)
+
+
+def time_queries(search, queries):
+    latencies = []
+    for query in queries:
+        started = time.perf_counter()
+        search(query)
+        latencies.append((time.perf_counter() - started) * 1000.0)
+    return np.percentile(latencies, 50), np.percentile(latencies, 95)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100000, 1000000, 5000000])
+    parser.add_argument('--dim', type=int, default=128)
+    parser.add_argument('--subreddits', type=int, default=100)
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--k', type=int, default=10)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    queries = rng.standard_normal((args.queries, args.dim), dtype=np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    print(f"dim={args.dim} k={args.k} subreddits={args.subreddits} queries={args.queries}")
+    print(f"{'vectors':>10} {'scan p50/p95 ms':>18} {'subreddit p50/p95 ms':>22} {'sub+30d p50/p95 ms':>20}")
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            write_synthetic_index(directory, size, args.dim, args.subreddits, rng)
+            index = embeddings.EmbeddingIndex.open(directory)
+            index.search(queries[0], args.k)  # Warm the page cache
+            scan = time_queries(lambda q: index.search(q, args.k), queries)
+            sub = time_queries(lambda q: index.search(q, args.k, subreddit='sub0042'), queries)
+            window = time_queries(lambda q: index.search(q, args.k, subreddit='sub0042',
+                                                         since=300 * DAY_SECONDS), queries)
+            print(f"{size:>10} {scan[0]:>8.2f} / {scan[1]:<8.2f} {sub[0]:>10.3f} / {sub[1]:<9.3f} "
+                  f"{window[0]:>8.3f} / {window[1]:<8.3f}")
+            del index
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""
+Retrieval stage: a BM25 index built per question versus the live
+SegmentedIndexCache the server ranks candidate posts with.
+
+A synthetic subreddit listing of --candidates posts is asked about --questions
+times. Every --shift-every questions the listing moves on by 10 posts (new
+posts enter the hot listing, old ones leave it). The benchmark reports the
+p50/p99 time of selecting LLM_CONTEXT_POST_LIMIT posts for a question, for a
+listing that changes with every question and for one that changes every 20.
+
+It then reports the ranking time after the server has seen many posts, in one
+subreddit and across many, to show that the bounded live index stays flat.
+
+Usage:
+    python benchmarks/bench_live_index.py --questions 400 --candidates 100
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.bm25 import select_context_posts  # noqa: E402
+from app.segments import SegmentedIndexCache  # noqa: E402
+
+CONTEXT_LIMIT = 10
+
+
+def synthetic_posts(rng, count, vocabulary=3000, prefix='p'):
+    return [{'id': f"{prefix}{i}", 'title': ' '.join(f"w{w}" for w in rng.integers(vocabulary, size=10)),
+             'selftext': ' '.join(f"w{w}" for w in rng.integers(vocabulary, size=80))} for i in range(count)]
+
+
+def documents(listing):
+    return [{'id': post['id'], 'text': f"{post['title']}\n{post['selftext']}"} for post in listing]
+
+
+def run(select, posts, questions, candidates, shift_every):
+    latencies = []
+    for i, question in enumerate(questions):
+        offset = (i // shift_every) * 10
+        listing = posts[offset:offset + candidates]
+        started = time.perf_counter()
+        select(question, listing)
+        latencies.append((time.perf_counter() - started) * 1000)
+    return np.percentile(latencies, 50), np.percentile(latencies, 99)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--questions', type=int, default=400)
+    parser.add_argument('--candidates', type=int, default=100, help="Posts in the listing.")
+    parser.add_argument('--seal', type=int, default=64, help="Seal threshold of the live index.")
+    parser.add_argument('--max-posts', type=int, default=1000, help="Posts kept per subreddit.")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    posts = synthetic_posts(rng, args.questions * 10 + args.candidates)
+    questions = [' '.join(f"w{w}" for w in rng.integers(3000, size=5)) for _ in range(args.questions)]
+
+    for shift_every in (1, 20):
+        live_index = SegmentedIndexCache(max_documents=args.max_posts, seal_threshold=args.seal,
+                                         name=f'bench_live_index_{shift_every}')
+
+        def per_question(question, listing):
+            select_context_posts(question, listing, CONTEXT_LIMIT)
+
+        def live(question, listing):
+            ranked_ids = live_index.rank('bench', documents(listing), question, CONTEXT_LIMIT)
+            select_context_posts(question, listing, CONTEXT_LIMIT, ranked_ids=ranked_ids)
+
+        for label, select in (("per-question BM25", per_question), ("live index", live)):
+            p50, p99 = run(select, posts, questions, args.candidates, shift_every)
+            print(f"listing changes every {shift_every:>2} questions  {label:<18} p50 {p50:6.2f} ms   p99 {p99:6.2f} ms")
+
+    # Ranking one listing after the server has seen `seen` posts.
+    listing = posts[:args.candidates]
+    for seen, subreddits in ((100, 1), (20000, 1), (100000, 1), (100000, 100)):
+        live_index = SegmentedIndexCache(max_documents=args.max_posts, seal_threshold=args.seal,
+                                         name=f'bench_live_index_seen_{seen}_{subreddits}')
+        history = synthetic_posts(rng, seen, prefix='h')
+        for start in range(0, seen, args.candidates):
+            live_index.rank(f"sub{(start // args.candidates) % subreddits}",
+                            documents(history[start:start + args.candidates]), "w1", CONTEXT_LIMIT)
+        live_index.rank('sub0', documents(listing), "w1", CONTEXT_LIMIT)
+        latencies = []
+        for question in questions:
+            started = time.perf_counter()
+            live_index.rank('sub0', documents(listing), question, CONTEXT_LIMIT)
+            latencies.append((time.perf_counter() - started) * 1000)
+        stats = live_index.stats()
+        print(f"after {seen:>6} posts in {subreddits:>3} subreddits ({stats['documents']:>6} kept)  "
+              f"rank p50 {np.percentile(latencies, 50):5.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
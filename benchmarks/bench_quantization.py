@@ -0,0 +1,109 @@
+"""
+Recall, latency and memory of int8-quantized embedding search.
+
+Synthetic clustered unit-length vectors (a Gaussian mixture, closer to real
+sentence embeddings than isotropic noise) are indexed with float32 and with
+int8 codes. For each size the benchmark reports recall@k of int8 search (with
+and without full-precision re-scoring) against exact float32 search, the query
+latency of each mode, and the bytes a full scan touches.
+
+Usage:
+    python benchmarks/bench_quantization.py --sizes 100000 1000000 --dim 128 --k 10
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import embeddings  # noqa: E402
+
+CHUNK_ROWS = 250000
+NUM_CLUSTERS = 1000
+
+
+def clustered_vectors(rng, count, centroids, spread=0.35):
+    assignments = rng.integers(0, len(centroids), size=count)
+    block = centroids[assignments] + spread * rng.standard_normal((count, centroids.shape[1]), dtype=np.float32)
+    block /= np.linalg.norm(block, axis=1, keepdims=True)
+    return block
+
+
+def write_synthetic_index(directory, size, dim, rng):
+    """Writes float32 and int8 matrices chunk by chunk (all rows in one subreddit)."""
+    centroids = rng.standard_normal((NUM_CLUSTERS, dim), dtype=np.float32)
+    centroids /= np.linalg.norm(centroids, axis=1, keepdims=True)
+    vectors = np.lib.format.open_memmap(os.path.join(directory, embeddings.VECTORS_FILE),
+                                        mode='w+', dtype=np.float32, shape=(size, dim))
+    codes = np.lib.format.open_memmap(os.path.join(directory, embeddings.INT8_VECTORS_FILE),
+                                      mode='w+', dtype=np.int8, shape=(size, dim))
+    scales = np.lib.format.open_memmap(os.path.join(directory, embeddings.SCALES_FILE),
+                                       mode='w+', dtype=np.float32, shape=(size,))
+    for start in range(0, size, CHUNK_ROWS):
+        end = min(start + CHUNK_ROWS, size)
+        block = clustered_vectors(rng, end - start, centroids)
+        vectors[start:end] = block
+        codes[start:end], scales[start:end] = embeddings.quantize_int8(block)
+    for array in (vectors, codes, scales):
+        array.flush()
+    np.save(os.path.join(directory, embeddings.ITEM_IDS_FILE), np.char.mod('%d', np.arange(size)))
+    np.save(os.path.join(directory, embeddings.CREATED_UTC_FILE), np.zeros(size))
+    np.save(os.path.join(directory, embeddings.SUBREDDIT_OFFSETS_FILE), np.array([0, size], dtype=np.int64))
+    with open(os.path.join(directory, embeddings.SUBREDDITS_FILE), 'w') as f:
+        json.dump(['bench'], f)
+    return centroids
+
+
+def run_queries(search, queries):
+    results, latencies = [], []
+    for query in queries:
+        started = time.perf_counter()
+        results.append({item_id for item_id, _ in search(query)})
+        latencies.append((time.perf_counter() - started) * 1000.0)
+    return results, float(np.percentile(latencies, 50))
+
+
+def recall(results, truth):
+    return float(np.mean([len(found & expected) / len(expected) for found, expected in zip(results, truth)]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100000, 1000000])
+    parser.add_argument('--dim', type=int, default=128)
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--k', type=int, default=10)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"dim={args.dim} k={args.k} queries={args.queries}")
+    print(f"{'vectors':>10} {'float32 MB':>10} {'int8 MB':>8} {'saved':>6} "
+          f"{'f32 ms':>7} {'int8 ms':>8} {'int8 R@k':>9} {'+rescore ms':>12} {'+rescore R@k':>13}")
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            centroids = write_synthetic_index(directory, size, args.dim, rng)
+            queries = clustered_vectors(rng, args.queries, centroids)
+            index = embeddings.EmbeddingIndex.open(directory)
+            exact = embeddings.EmbeddingIndex(index.vectors, index.item_ids, index.created_utc,
+                                              index.subreddit_offsets, index.subreddits)
+            exact.search(queries[0], args.k)  # Warm the page cache
+            index.search(queries[0], args.k)
+
+            truth, f32_ms = run_queries(lambda q: exact.search(q, args.k), queries)
+            int8_only, int8_ms = run_queries(lambda q: index.search(q, args.k, rescore=False), queries)
+            rescored, rescore_ms = run_queries(lambda q: index.search(q, args.k), queries)
+
+            f32_mb, int8_mb = exact.scan_nbytes / 1e6, index.scan_nbytes / 1e6
+            print(f"{size:>10} {f32_mb:>10.1f} {int8_mb:>8.1f} {1 - int8_mb / f32_mb:>6.0%} "
+                  f"{f32_ms:>7.2f} {int8_ms:>8.2f} {recall(int8_only, truth):>9.3f} "
+                  f"{rescore_ms:>12.2f} {recall(rescored, truth):>13.3f}")
+            del index, exact
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""
+Query parsing: the original two-`re.match` parser versus `parse_query`.
+
+Each kind of chat message (one tag, several tags, inline filters, no tag) is
+parsed repeatedly with:
+- the original `parse_subreddit_and_question` (uncompiled string patterns, one
+  match for the split and one for the name), reproduced here as a reference;
+- the single-tag parser of the previous release (one precompiled match),
+  also reproduced here;
+- `parse_query` (one pass of one precompiled tokenizer over the tags, filters
+  and question), which `parse_subreddit_and_question` now wraps.
+The original parsers only split off the first tag; for several tags or filters
+they leave the rest in the question.
+
+Usage:
+    python benchmarks/bench_query_parser.py --rounds 20000 --repeat 5
+"""
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core_utils import parse_query, parse_subreddit_and_question  # noqa: E402
+
+MESSAGES = [
+    ("one tag", "@r/learnpython What is a decorator?"),
+    ("one tag", "  @r/python   how do I package an app for Windows and macOS?  "),
+    ("several tags", "@r/python, @r/golang which is better for command line tools?"),
+    ("filters", '@r/rust top:week flair:"Help" why does the borrow checker reject this?'),
+    ("filters", "@r/django new, since:24h did the 5.1 upgrade break anything for you?"),
+    ("no tag", "What is the best subreddit for learning statistics?"),
+]
+KINDS = ("one tag", "several tags", "filters", "no tag")
+# The patterns of the original parser.
+MESSAGE_SPLIT_PATTERN = r'(@r/\w+\b)\s*(.*)'
+SUBREDDIT_NAME_EXTRACTOR_PATTERN = r'@r/(\w+)'
+MESSAGE_SPLIT_RE = re.compile(r'@r/(\w+)\b\s*(.*)')
+
+
+def original_parse(user_message):
+    """The parser as it was before it used compiled patterns."""
+    user_message = user_message.strip()
+    match = re.match(MESSAGE_SPLIT_PATTERN, user_message)
+    if match:
+        subreddit_tag_full = match.group(1)
+        question_text = match.group(2).strip()
+        subreddit_name_match = re.match(SUBREDDIT_NAME_EXTRACTOR_PATTERN, subreddit_tag_full)
+        if subreddit_name_match:
+            return subreddit_name_match.group(1), question_text
+        return None, user_message
+    return None, user_message
+
+
+def precompiled_parse(user_message):
+    """The single-tag parser of the previous release (one precompiled match)."""
+    user_message = user_message.strip()
+    match = MESSAGE_SPLIT_RE.match(user_message)
+    if match:
+        return match.group(1), match.group(2).strip()
+    return None, user_message
+
+
+def measure(parse, messages, rounds):
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for message in messages:
+            parse(message)
+    return (time.perf_counter() - started) / (rounds * len(messages))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rounds', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=5,
+                        help="Runs of every parser and kind; the fastest is reported.")
+    args = parser.parse_args()
+
+    for kind, message in MESSAGES:
+        if kind in ("one tag", "no tag"):
+            assert original_parse(message) == parse_subreddit_and_question(message), message
+
+    parsers = [("original (re.match x2, uncompiled)", original_parse),
+               ("previous (one precompiled match)", precompiled_parse),
+               ("parse_query (tags + filters)", parse_query)]
+    groups = [[message for message_kind, message in MESSAGES if message_kind == kind] for kind in KINDS]
+    groups.append([message for _, message in MESSAGES])
+    # The parsers take turns within each run, so background load slows them
+    # alike; the fastest run of each is the least disturbed.
+    best = [[float('inf')] * len(groups) for _ in parsers]
+    for _ in range(args.repeat):
+        for times, (_, parse) in zip(best, parsers):
+            for i, messages in enumerate(groups):
+                times[i] = min(times[i], measure(parse, messages, args.rounds))
+
+    print(f"{len(MESSAGES)} messages x {args.rounds} rounds, best of {args.repeat}, us/message")
+    print(f"{'':36s}" + "".join(f"{kind:>14s}" for kind in KINDS) + f"{'all':>10s}")
+    for (label, _), times in zip(parsers, best):
+        print(f"{label:36s}" + "".join(f"{seconds * 1e6:14.2f}" for seconds in times[:-1]) + f"{times[-1] * 1e6:10.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""
+Incremental (segmented) indexing versus full rebuilds.
+
+Synthetic documents arrive in crawl-sized batches. The benchmark reports the
+total indexing time when every batch triggers a full BM25 + embedding rebuild,
+the time spent adding the same batches to a `SegmentedIndex`, and the BM25
+query latency while the index is idle versus while a merge of every segment
+runs on a background thread.
+
+Usage:
+    python benchmarks/bench_segments.py --docs 50000 --batch 500
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.bm25 import BM25Index  # noqa: E402
+from app.embeddings import HashingEmbedder  # noqa: E402
+from app.segments import SegmentedIndex  # noqa: E402
+
+VOCABULARY_SIZE = 20000
+
+
+def synthetic_documents(rng, count, words_per_doc=40):
+    # Zipf-distributed word ids, roughly like natural text.
+    ids = np.minimum(rng.zipf(1.2, size=(count, words_per_doc)), VOCABULARY_SIZE)
+    return [' '.join(f"w{i}" for i in row) for row in ids]
+
+
+def full_rebuild_seconds(texts, batch, embedder, max_rebuilds):
+    """Time of rebuilding everything after each of the last `max_rebuilds` batches, extrapolated."""
+    ends = list(range(batch, len(texts) + 1, batch))
+    measured = ends[-max_rebuilds:]
+    started = time.perf_counter()
+    for end in measured:
+        BM25Index(texts[:end])
+        embedder.embed_batch(texts[:end])
+    elapsed = time.perf_counter() - started
+    # Rebuild cost grows linearly with the corpus, so extrapolate with the mean size.
+    return elapsed / sum(measured) * sum(ends)
+
+
+def query_latencies(index, queries):
+    latencies = []
+    for query in queries:
+        started = time.perf_counter()
+        index.search_text(query, k=10)
+        latencies.append((time.perf_counter() - started) * 1000.0)
+    return np.percentile(latencies, 50), np.percentile(latencies, 99)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--docs', type=int, default=50000)
+    parser.add_argument('--batch', type=int, default=500)
+    parser.add_argument('--seal', type=int, default=1000)
+    parser.add_argument('--queries', type=int, default=200)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    texts = synthetic_documents(rng, args.docs)
+    queries = [' '.join(text.split()[:3]) for text in synthetic_documents(rng, args.queries)]
+    embedder = HashingEmbedder(dim=128)
+
+    rebuild = full_rebuild_seconds(texts, args.batch, embedder, max_rebuilds=5)
+
+    index = SegmentedIndex(embedder=embedder, seal_threshold=args.seal, name='bench_segments')
+    started = time.perf_counter()
+    for start in range(0, len(texts), args.batch):
+        index.add_many([{'id': str(i), 'text': texts[i]} for i in range(start, min(start + args.batch, len(texts)))])
+    incremental = time.perf_counter() - started
+
+    index.maybe_merge()  # Let pending background merges finish.
+    idle_p50, idle_p99 = query_latencies(index, queries)
+
+    # Force one merge of every segment and query while it runs.
+    segments_before = len(index.segments)
+    merging = threading.Thread(target=index.force_merge)
+    merge_started = time.perf_counter()
+    merging.start()
+    during_p50, during_p99 = query_latencies(index, queries)
+    queries_done = time.perf_counter() - merge_started
+    merging.join()
+    merge_seconds = time.perf_counter() - merge_started
+    index.close()
+
+    print(f"docs={args.docs} batch={args.batch} seal={args.seal}")
+    print(f"full rebuild per batch: {rebuild:8.1f} s total")
+    print(f"segmented adds:         {incremental:8.1f} s total ({rebuild / incremental:.0f}x less)")
+    print(f"query p50/p99, idle ({segments_before} segments): {idle_p50:.2f} / {idle_p99:.2f} ms")
+    print(f"query p50/p99 during a {merge_seconds:.1f} s merge (queries done after {queries_done:.1f} s): "
+          f"{during_p50:.2f} / {during_p99:.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
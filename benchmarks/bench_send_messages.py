@@ -0,0 +1,89 @@
+"""
+Bulk questions: one /send_message round trip per message versus /send_messages.
+
+The app is served on a local threaded HTTP server. Subreddit fetches are
+replaced by a stub that sleeps for --fetch-ms (the latency of a Reddit call)
+and returns a small context; answers come from the mock LLM. Each message asks
+about one of --subreddits subreddits. The benchmark sends the same messages
+one request at a time through /send_message, then as one /send_messages
+request (buffered and streamed), and reports messages per second and the
+time to the first streamed result.
+
+Usage:
+    python benchmarks/bench_send_messages.py --messages 50 --subreddits 5 --fetch-ms 150
+"""
+import argparse
+import http.client
+import json
+import os
+import sys
+import threading
+import time
+from unittest.mock import patch
+
+from werkzeug.serving import make_server
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app  # noqa: E402
+
+
+def stub_fetch(fetch_seconds):
+    def fetch(subreddit_name, question, cancel_token=None, filters=None):
+        time.sleep(fetch_seconds)
+        return {'display_name': subreddit_name, 'public_description': f"About {subreddit_name}", 'subscribers': 1000,
+                'name': subreddit_name, 'posts': [{'title': f"{subreddit_name} tips", 'selftext': "Read the docs.",
+                                                   'score': 10, 'num_comments': 2,
+                                                   'permalink': f"https://www.reddit.com/r/{subreddit_name}/1"}]}
+    return fetch
+
+
+def post(port, path, payload):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+    connection.request('POST', path, body=json.dumps(payload), headers={'Content-Type': 'application/json'})
+    return connection.getresponse()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=50)
+    parser.add_argument('--subreddits', type=int, default=5)
+    parser.add_argument('--fetch-ms', type=float, default=150, help="Simulated latency of one subreddit fetch.")
+    args = parser.parse_args()
+
+    messages = [f"@r/bench{i % args.subreddits} how do I get started? ({i})" for i in range(args.messages)]
+    server = make_server('127.0.0.1', 0, create_app(), threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_port
+
+    with patch('app.routes.praw_available', True), \
+            patch('app.routes.fetch_subreddit_context', stub_fetch(args.fetch_ms / 1000)):
+        started = time.perf_counter()
+        for message in messages:
+            response = post(port, '/send_message', {'message': message})
+            assert json.loads(response.read())['reply']
+        sequential = time.perf_counter() - started
+
+        started = time.perf_counter()
+        results = json.loads(post(port, '/send_messages', {'messages': messages}).read())['results']
+        assert all(result['reply'] for result in results)
+        buffered = time.perf_counter() - started
+
+        started = time.perf_counter()
+        response = post(port, '/send_messages', {'messages': messages, 'stream': True})
+        response.readline()
+        first = time.perf_counter() - started
+        lines = 1 + len(response.read().splitlines())
+        streamed = time.perf_counter() - started
+        assert lines == args.messages + 1
+    server.shutdown()
+
+    print(f"{args.messages} messages, {args.subreddits} subreddits, {args.fetch_ms:.0f} ms per fetch")
+    for label, seconds in ((f"/send_message x {args.messages}", sequential), ("/send_messages", buffered),
+                           ("/send_messages (stream)", streamed)):
+        print(f"{label:<24} {args.messages / seconds:8.1f} messages/s   total {seconds * 1000:8.0f} ms")
+    print(f"{'':<24} first streamed result after {first * 1000:.0f} ms")
+
+
+if __name__ == '__main__':
+    main()
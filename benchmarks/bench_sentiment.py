@@ -0,0 +1,85 @@
+"""
+Batch sentiment scoring versus scoring one comment at a time.
+
+Synthetic comments mix lexicon words, negations and filler words. The
+benchmark scores them with a plain per-comment Python loop (regex split, dict
+lookups, negation window), with `SentimentLexicon.score` called once per
+comment, and with one `SentimentLexicon.score` call per batch, and checks that
+the loop and the batch agree.
+
+Usage:
+    python benchmarks/bench_sentiment.py --comments 200000 --batch 10000
+"""
+import argparse
+import math
+import os
+import re
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.sentiment import (LEXICON, NEGATION_SCALAR, NEGATION_WINDOW, NEGATIONS,  # noqa: E402
+                           NORMALIZATION_ALPHA, SentimentLexicon)
+
+WORD = re.compile(r'[a-z0-9_\x80-\U0010ffff]+')
+
+
+def synthetic_comments(rng, count, words_per_comment=40):
+    vocabulary = list(LEXICON) + list(NEGATIONS) + [f"filler{i}" for i in range(2000)]
+    weights = np.array([4.0] * len(LEXICON) + [4.0] * len(NEGATIONS) + [1.0] * 2000)
+    ids = rng.choice(len(vocabulary), size=(count, words_per_comment), p=weights / weights.sum())
+    return [' '.join(vocabulary[i] for i in row) for row in ids]
+
+
+def score_one(text, negations=frozenset(NEGATIONS)):
+    """Reference implementation: one comment at a time in pure Python."""
+    words = WORD.findall(text.lower())
+    total = 0.0
+    for position, word in enumerate(words):
+        valence = LEXICON.get(word)
+        if valence is None:
+            continue
+        if any(w in negations for w in words[max(0, position - NEGATION_WINDOW):position]):
+            valence *= NEGATION_SCALAR
+        total += valence
+    return total / math.sqrt(total * total + NORMALIZATION_ALPHA)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--comments', type=int, default=200000)
+    parser.add_argument('--batch', type=int, default=10000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    comments = synthetic_comments(rng, args.comments)
+    lexicon = SentimentLexicon()
+
+    started = time.perf_counter()
+    expected = [score_one(comment) for comment in comments]
+    loop = time.perf_counter() - started
+
+    sample = comments[:5000]
+    started = time.perf_counter()
+    for comment in sample:
+        lexicon.score([comment])
+    per_call = (time.perf_counter() - started) * len(comments) / len(sample)
+
+    started = time.perf_counter()
+    scores = np.concatenate([lexicon.score(comments[start:start + args.batch])
+                             for start in range(0, len(comments), args.batch)])
+    batched = time.perf_counter() - started
+
+    np.testing.assert_allclose(scores, expected, atol=1e-5)
+    print(f"{len(comments)} comments of 40 words, batches of {args.batch}")
+    for label, seconds in [("Python loop, one comment at a time", loop),
+                           ("SentimentLexicon.score per comment", per_call),
+                           ("SentimentLexicon.score per batch", batched)]:
+        print(f"{label:36s}: {seconds * 1000:8.0f} ms  ({len(comments) / seconds:9.0f} comments/s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+Requests per second: Flask development server versus the production server.
+
+Starts `python run.py` (development server, debug mode, port 5000) and
+`python run.py --production` (Gunicorn, gthread workers) in turn and drives
+each with keep-alive HTTP clients for a fixed time per endpoint:
+GET /autocomplete (a cheap JSON lookup) and POST /send_message (parsing plus
+the mock LLM behind the micro-batcher). Reports requests per second and
+p50/p99 latency.
+
+Usage:
+    python benchmarks/bench_server.py --clients 32 --seconds 10 --workers 4 --threads 8
+"""
+import argparse
+import http.client
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+REQUESTS = {
+    'GET /autocomplete': ('GET', '/autocomplete?prefix=py&limit=8', None),
+    'POST /send_message': ('POST', '/send_message', json.dumps({'message': "what is a decorator?"})),
+}
+
+
+def wait_until_up(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            connection.request('GET', '/')
+            connection.getresponse().read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Server on port {port} did not start.")
+
+
+def drive(port, method, path, body, clients, seconds):
+    latencies, failures = [], [0]
+    lock = threading.Lock()
+    deadline = time.monotonic() + seconds
+    headers = {'Content-Type': 'application/json'} if body else {}
+
+    def client():
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        own = []
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            try:
+                connection.request(method, path, body=body, headers=headers)
+                response = connection.getresponse()
+                response.read()
+                if response.status != 200:
+                    raise OSError(response.status)
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                with lock:
+                    failures[0] += 1
+                continue
+            own.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(own)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    latencies = np.array(latencies) * 1000
+    return len(latencies) / elapsed, np.percentile(latencies, 50), np.percentile(latencies, 99), failures[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=32, help="Concurrent keep-alive clients.")
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--workers', type=int, default=4, help="Gunicorn worker processes.")
+    parser.add_argument('--threads', type=int, default=8, help="Threads per Gunicorn worker.")
+    parser.add_argument('--port', type=int, default=8123, help="Port of the production server.")
+    args = parser.parse_args()
+
+    servers = [
+        ('development server', [sys.executable, 'run.py'], {}, 5000),
+        (f"gunicorn {args.workers} workers x {args.threads} threads", [sys.executable, 'run.py', '--production'],
+         {'WEB_CONCURRENCY': str(args.workers), 'GUNICORN_THREADS': str(args.threads), 'PORT': str(args.port)},
+         args.port),
+    ]
+    for label, command, env, port in servers:
+        process = subprocess.Popen(command, cwd=ROOT, env={**os.environ, **env},
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_until_up(port)
+            for name, (method, path, body) in REQUESTS.items():
+                rps, p50, p99, failures = drive(port, method, path, body, args.clients, args.seconds)
+                print(f"{label:<32} {name:<20} {rps:8.0f} req/s   p50 {p50:7.1f} ms   p99 {p99:7.1f} ms"
+                      f"   failures {failures}")
+        finally:
+            process.terminate()
+            process.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""
+Chat transport: HTTP POSTs to /send_message versus the /ws WebSocket channel.
+
+The app is served on a local threaded HTTP server and answers with the mock
+LLM, streamed (as the web UI asks). The same questions are sent:
+- over HTTP, one POST per message (the development server closes each
+  connection, as a browser without keep-alive would see it),
+- over one WebSocket, one question at a time,
+- over one WebSocket with up to --in-flight questions multiplexed.
+The benchmark reports messages per second and p50/p99 latency from sending a
+question to its last streamed chunk.
+
+Usage:
+    python benchmarks/bench_socket.py --messages 500 --in-flight 8
+"""
+import argparse
+import http.client
+import json
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+import websocket
+from werkzeug.serving import make_server
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app  # noqa: E402
+
+
+def over_http(port, messages):
+    latencies = []
+    for i, message in enumerate(messages):
+        started = time.perf_counter()
+        connection = http.client.HTTPConnection('127.0.0.1', port)
+        connection.request('POST', '/send_message', headers={'Content-Type': 'application/json'},
+                           body=json.dumps({'message': message, 'request_id': f"h{i}", 'stream': True}))
+        lines = connection.getresponse().read().splitlines()
+        assert json.loads(lines[-1]).get('done')
+        latencies.append(time.perf_counter() - started)
+        connection.close()
+    return latencies
+
+
+def over_socket(port, messages, in_flight):
+    ws = websocket.create_connection(f"ws://127.0.0.1:{port}/ws")
+    sent_at, latencies = {}, []
+    next_message = 0
+    while len(latencies) < len(messages):
+        while next_message < len(messages) and len(sent_at) < in_flight:
+            request_id = f"w{next_message}"
+            sent_at[request_id] = time.perf_counter()
+            ws.send(json.dumps({'type': 'ask', 'request_id': request_id, 'message': messages[next_message]}))
+            next_message += 1
+        event = json.loads(ws.recv())
+        if event.get('done'):
+            assert not event.get('error'), event
+            latencies.append(time.perf_counter() - sent_at.pop(event['request_id']))
+    ws.close()
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=500)
+    parser.add_argument('--in-flight', type=int, default=8, help="Questions multiplexed on the WebSocket.")
+    args = parser.parse_args()
+
+    messages = [f"what is the best way to learn python? ({i})" for i in range(args.messages)]
+    server = make_server('127.0.0.1', 0, create_app(), threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_port
+
+    runs = [
+        ("HTTP POST /send_message", lambda: over_http(port, messages)),
+        ("WebSocket, 1 in flight", lambda: over_socket(port, messages, 1)),
+        (f"WebSocket, {args.in_flight} in flight", lambda: over_socket(port, messages, args.in_flight)),
+    ]
+    for label, run in runs:
+        started = time.perf_counter()
+        latencies = np.array(run()) * 1000
+        elapsed = time.perf_counter() - started
+        print(f"{label:<28} {len(latencies) / elapsed:8.1f} messages/s   p50 {np.percentile(latencies, 50):6.2f} ms"
+              f"   p99 {np.percentile(latencies, 99):6.2f} ms")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
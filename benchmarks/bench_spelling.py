@@ -0,0 +1,103 @@
+"""
+Offline subreddit-name correction at millions of names.
+
+Synthetic subreddit names (one to three pronounceable words, Zipf-distributed
+subscriber counts) are indexed with `SubredditNameIndex` and
+`SubredditSpeller`. Queries are real names with one random typo (deleted,
+inserted, substituted or transposed character), drawn uniformly. The benchmark
+reports the deletion dictionaries' build time and size, lookup latency, how
+many candidates each lookup verifies, and how often the original name is the
+top suggestion, for those queries and for names drawn by subscribers (as users
+would type them).
+
+Usage:
+    python benchmarks/bench_spelling.py --names 2000000 --queries 2000
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.autocomplete import SubredditNameIndex  # noqa: E402
+from app.spelling import SubredditSpeller  # noqa: E402
+
+CONSONANTS = list('bcdfghjklmnprstvwz') + ['ch', 'sh', 'th', 'st', 'tr', 'pl', 'gr', 'br']
+VOWELS = list('aeiouy') + ['ea', 'oo', 'ai']
+LETTERS = 'abcdefghijklmnopqrstuvwxyz'
+
+
+def synthetic_names(rng, count, vocabulary_size=50000):
+    syllables = [c + v for c in CONSONANTS for v in VOWELS]
+    word_lengths = rng.integers(1, 4, size=vocabulary_size)
+    word_parts = rng.integers(0, len(syllables), size=(vocabulary_size, 3))
+    words = [''.join(syllables[p] for p in row[:length]) for row, length in zip(word_parts, word_lengths)]
+    # Popular words are reused across names, as in "ask*", "*memes", "learn*".
+    word_ids = np.minimum(rng.zipf(1.3, size=(count, 3)), vocabulary_size) - 1
+    name_lengths = rng.integers(1, 4, size=count)
+    names = [''.join(words[w] for w in row[:length])[:21] for row, length in zip(word_ids, name_lengths)]
+    return names, rng.zipf(1.5, size=count).astype(np.int64)
+
+
+def with_typo(rng, name):
+    position = int(rng.integers(len(name)))
+    kind = rng.integers(4)
+    letter = LETTERS[rng.integers(len(LETTERS))]
+    if kind == 0 and len(name) > 3:
+        return name[:position] + name[position + 1:]
+    if kind == 1:
+        return name[:position] + letter + name[position:]
+    if kind == 2:
+        return name[:position] + letter + name[position + 1:]
+    if position < len(name) - 1:
+        return name[:position] + name[position + 1] + name[position] + name[position + 2:]
+    return name + letter
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--names', type=int, default=2000000)
+    parser.add_argument('--queries', type=int, default=2000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    names, subscribers = synthetic_names(rng, args.names)
+    index = SubredditNameIndex.from_entries(names, subscribers)
+    started = time.perf_counter()
+    speller = SubredditSpeller.from_name_index(index)
+    build = time.perf_counter() - started
+    size = sum(a.nbytes for a in (speller.prefix_hashes, speller.prefix_rows, speller.suffix_hashes, speller.suffix_rows)) / 1e6
+    print(f"{len(index)} distinct names: deletion dictionaries of {len(speller)} entries "
+          f"({size:.0f} MB), built in {build:.1f} s")
+
+    rows = rng.choice(len(index), size=args.queries)
+    originals = [index.keys[row].decode('ascii') for row in rows]
+    queries = [with_typo(rng, name) for name in originals]
+    latencies, candidates, corrected = [], [], 0
+    for original, query in zip(originals, queries):
+        started = time.perf_counter()
+        suggestions = speller.suggest(query)
+        latencies.append(time.perf_counter() - started)
+        candidates.append(len(speller.candidates(query.encode('ascii'))))
+        corrected += bool(suggestions) and suggestions[0]['name'].lower() == original
+    latencies = np.array(latencies) * 1e6
+    print(f"lookup latency   : p50 {np.percentile(latencies, 50):7.1f} us   p90 {np.percentile(latencies, 90):7.1f} us"
+          f"   p99 {np.percentile(latencies, 99):7.1f} us")
+    print(f"candidates       : p50 {np.percentile(candidates, 50):7.0f}      p90 {np.percentile(candidates, 90):7.0f}"
+          f"      p99 {np.percentile(candidates, 99):7.0f}")
+    print(f"top suggestion is the intended name: {corrected / len(queries):.1%}")
+
+    rows = rng.choice(len(index), size=args.queries, p=index.subscribers / index.subscribers.sum())
+    originals = [index.keys[row].decode('ascii') for row in rows]
+    corrected = 0
+    for original in originals:
+        suggestions = speller.suggest(with_typo(rng, original))
+        corrected += bool(suggestions) and suggestions[0]['name'].lower() == original
+    print(f"  ... for names drawn by subscribers: {corrected / len(originals):.1%}")
+
+
+if __name__ == '__main__':
+    main()
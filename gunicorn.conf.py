@@ -0,0 +1,39 @@
+# Gunicorn settings for the production server (`python run.py --production`,
+# or `gunicorn --config gunicorn.conf.py run:app`). Every setting can be
+# overridden with the environment variable next to it.
+import multiprocessing
+import os
+
+bind = os.getenv('BIND', f"0.0.0.0:{os.getenv('PORT', '8000')}")
+
+# Preforked worker processes, each serving requests from a pool of threads
+# (gthread). Requests mostly wait on Reddit and the LLM, so threads give
+# concurrency cheaply; processes add CPU parallelism for retrieval and ranking.
+workers = int(os.getenv('WEB_CONCURRENCY', str(multiprocessing.cpu_count() * 2 + 1)))
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', '8'))
+
+# An open WebSocket (/ws) holds one of these threads until it closes. A worker
+# accepts at most SOCKET_MAX_CONNECTIONS of them (default: one less than
+# `threads`) and closes the others with code 1013 ("try again later"), so a
+# thread is always left for HTTP requests such as /send_message and /metrics.
+# The app reads it when it is loaded, after this file.
+os.environ.setdefault('SOCKET_MAX_CONNECTIONS', str(threads - 1))
+
+# Idle keep-alive connections are held this many seconds, so the browser's
+# /autocomplete and /send_message calls reuse one connection.
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', '5'))
+# Streamed LLM replies can take a while; a worker is restarted only if it
+# stops responding to the arbiter for this long.
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '60'))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+
+# The app (name index, embedding index, rollups built from the corpus store) is
+# loaded once in the arbiter and shared copy-on-write by the workers.
+# Per-process resources are not shared: each worker creates its own PRAW client
+# and fetch pool after the fork (see app.create_app), SQLite connections are
+# reopened per process, and the LLM batch dispatcher starts lazily.
+preload_app = os.getenv('GUNICORN_PRELOAD', '1') != '0'
+
+accesslog = os.getenv('GUNICORN_ACCESS_LOG') or None
+errorlog = '-'
@@ -1,14 +1,27 @@
-from app import app # Import the Flask application instance from the app package
+import os
+import sys
+
+from app import app # The default Flask application, built by app.create_app()
+
+GUNICORN_CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gunicorn.conf.py')
 
 if __name__ == '__main__':
-    # This block ensures that the Flask development server is started only when
-    # this script (run.py) is executed directly (not when imported as a module).
-    #
-    # app.run() starts the development server:
-    # - debug=True: Enables debug mode, which provides helpful error messages
-    #               and automatically reloads the server when code changes.
-    #               This should be False in a production environment.
-    # - host='0.0.0.0': (Optional) Makes the server accessible externally.
-    #                   Default is '127.0.0.1' (localhost).
-    # - port=5000: (Optional) Specifies the port. Default is 5000.
-    app.run(debug=True)
+    # This block ensures that a server is started only when this script
+    # (run.py) is executed directly (not when imported as a module).
+    if '--production' in sys.argv[1:]:
+        # Production server: Gunicorn with preforked, multi-threaded workers.
+        # Workers, threads, keep-alive and the bind address are read from
+        # gunicorn.conf.py (WEB_CONCURRENCY, GUNICORN_THREADS,
+        # GUNICORN_KEEPALIVE, PORT, ...).
+        from gunicorn.app.wsgiapp import run
+        sys.argv = ['gunicorn', '--config', GUNICORN_CONFIG, '--chdir', os.path.dirname(GUNICORN_CONFIG), 'run:app']
+        run()
+    else:
+        # app.run() starts the development server:
+        # - debug=True: Enables debug mode, which provides helpful error messages
+        #               and automatically reloads the server when code changes.
+        #               This should be False in a production environment.
+        # - host='0.0.0.0': (Optional) Makes the server accessible externally.
+        #                   Default is '127.0.0.1' (localhost).
+        # - port=5000: (Optional) Specifies the port. Default is 5000.
+        app.run(debug=True)
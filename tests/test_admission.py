@@ -0,0 +1,79 @@
+import unittest
+import threading
+from app import metrics
+from app.admission import AdmissionController, AdmissionRejected
+
+class TestAdmissionController(unittest.TestCase):
+
+    def test_admits_up_to_max_in_flight(self):
+        controller = AdmissionController(max_in_flight=2, max_queue=0, queue_timeout=0.1, name='test_admit')
+        with controller.admit():
+            with controller.admit():
+                self.assertEqual(controller.stats()['in_flight'], 2)
+        self.assertEqual(controller.stats()['in_flight'], 0)
+
+    def test_sheds_when_queue_full(self):
+        controller = AdmissionController(max_in_flight=1, max_queue=0, queue_timeout=1.0, name='test_queue_full')
+        with controller.admit():
+            with self.assertRaises(AdmissionRejected) as ctx:
+                with controller.admit():
+                    pass
+        self.assertEqual(ctx.exception.reason, 'queue_full')
+        self.assertEqual(controller.stats()['shed'], 1)
+
+    def test_sheds_after_queue_deadline(self):
+        controller = AdmissionController(max_in_flight=1, max_queue=4, queue_timeout=0.05, name='test_queue_timeout')
+        with controller.admit():
+            with self.assertRaises(AdmissionRejected) as ctx:
+                with controller.admit():
+                    pass
+        self.assertEqual(ctx.exception.reason, 'queue_timeout')
+        self.assertEqual(controller.stats()['queue_length'], 0)
+
+    def test_queued_request_admitted_when_slot_frees(self):
+        controller = AdmissionController(max_in_flight=1, max_queue=4, queue_timeout=2.0, name='test_handoff')
+        admitted = threading.Event()
+        release_first = threading.Event()
+
+        def first():
+            with controller.admit():
+                release_first.wait(timeout=2)
+
+        def second():
+            with controller.admit():
+                admitted.set()
+
+        t1 = threading.Thread(target=first)
+        t1.start()
+        while controller.stats()['in_flight'] == 0:
+            pass
+        t2 = threading.Thread(target=second)
+        t2.start()
+        self.assertFalse(admitted.wait(timeout=0.05))
+        release_first.set()
+        self.assertTrue(admitted.wait(timeout=2))
+        t1.join()
+        t2.join()
+        self.assertEqual(controller.wait_histogram.count, 2)
+
+    def test_slot_released_on_exception(self):
+        controller = AdmissionController(max_in_flight=1, max_queue=0, name='test_release')
+        with self.assertRaises(ValueError):
+            with controller.admit():
+                raise ValueError("backend error")
+        self.assertEqual(controller.stats()['in_flight'], 0)
+
+    def test_metrics_go_to_the_given_registry(self):
+        registry = metrics.Registry()
+        controller = AdmissionController(max_in_flight=1, max_queue=0, name='test_registry', registry=registry)
+        other = AdmissionController(max_in_flight=1, max_queue=0, name='test_registry', registry=metrics.Registry())
+        with controller.admit():
+            with self.assertRaises(AdmissionRejected):
+                with controller.admit():
+                    pass
+        self.assertEqual(registry.snapshot()['test_registry_shed']['value'], 1)
+        self.assertEqual(other.stats()['shed'], 0)
+        self.assertNotIn('test_registry_shed', metrics.snapshot())
+
+if __name__ == '__main__':
+    unittest.main()
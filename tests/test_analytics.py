@@ -0,0 +1,78 @@
+import tempfile
+import unittest
+import numpy as np
+from app.analytics import AnalyticsStore, score_percentiles, SCORE_BUCKET_EDGES
+from app.columnar import ColumnarStore
+
+DAY = 86400
+MONDAY = 1700438400.0  # 2023-11-20 00:00 UTC, a Monday
+
+class TestAnalyticsStore(unittest.TestCase):
+
+    def setUp(self):
+        self.analytics = AnalyticsStore()
+        self.analytics.add_submissions('Python', [
+            {'id': 's1', 'created_utc': MONDAY + 14 * 3600, 'score': 10, 'author': 'alice'},
+            {'id': 's2', 'created_utc': MONDAY + 14 * 3600 + 60, 'score': 20, 'author': 'alice'},
+            {'id': 's3', 'created_utc': MONDAY + DAY + 3 * 3600, 'score': 1, 'author': 'bob'},
+        ])
+        self.analytics.add_comments('python', [{'id': 'c1', 'created_utc': MONDAY + 14 * 3600, 'score': 5, 'author': 'bob'}])
+
+    def test_report_activity_histograms(self):
+        report = self.analytics.report('python', days=7, now=MONDAY + 2 * DAY)
+        self.assertEqual(report['totals'], {'submissions': 3, 'comments': 1})
+        self.assertEqual(report['activity']['hour_of_day_utc'][14], 3)
+        self.assertEqual(report['activity']['peak_hour_utc'], 14)
+        self.assertEqual(report['activity']['peak_weekday'], 'Monday')
+        self.assertEqual(report['activity']['day_of_week']['Tuesday'], 1)
+        self.assertEqual(report['activity']['daily'][0], {'date': '2023-11-20', 'submissions': 2, 'comments': 1})
+        self.assertEqual(report['top_contributors'][0], {'author': 'alice', 'items': 2})
+        self.assertAlmostEqual(report['scores']['mean'], 9.0)
+
+    def test_window_excludes_old_days(self):
+        report = self.analytics.report('python', days=1, now=MONDAY + DAY + 60)
+        self.assertEqual(report['totals'], {'submissions': 1, 'comments': 0})
+        self.assertIsNone(self.analytics.report('rust'))
+
+    def test_refetched_items_update_scores_without_double_counting(self):
+        added = self.analytics.add_submissions('python', [{'id': 's1', 'created_utc': MONDAY + 14 * 3600, 'score': 40}])
+        self.assertEqual(added, 0)
+        report = self.analytics.report('python', days=7, now=MONDAY + 2 * DAY)
+        self.assertEqual(report['totals']['submissions'], 3)
+        self.assertAlmostEqual(report['scores']['mean'], 66 / 4)
+
+    def test_non_numeric_timestamps_are_skipped(self):
+        self.assertEqual(self.analytics.add_submissions('python', [{'id': 'x', 'created_utc': object(), 'score': 1}]), 0)
+
+    def test_growth(self):
+        for day in range(14):
+            self.analytics.record_subscribers('growing', 1000 + 10 * day, timestamp=MONDAY + day * DAY)
+            self.analytics.add_submissions('growing', [{'id': f"g{day}-{i}", 'created_utc': MONDAY + day * DAY, 'score': 1}
+                                                       for i in range(1 if day < 7 else 2)])
+        growth = self.analytics.report('growing', days=14, now=MONDAY + 13 * DAY)['growth']
+        self.assertEqual((growth['items_last_7_days'], growth['items_previous_7_days']), (14, 7))
+        self.assertAlmostEqual(growth['activity_change'], 1.0)
+        self.assertEqual(growth['subscribers'], 1130)
+        self.assertAlmostEqual(growth['subscribers_per_day'], 10.0)
+
+    def test_score_percentiles(self):
+        histogram = np.zeros(len(SCORE_BUCKET_EDGES) + 1, dtype=np.int64)
+        for score in range(100):
+            histogram[np.searchsorted(SCORE_BUCKET_EDGES, score, side='right')] += 1
+        p50, p99 = score_percentiles(histogram, [0.5, 0.99])
+        self.assertTrue(20 <= p50 <= 100)
+        self.assertTrue(50 <= p99 <= 100)
+        self.assertEqual(score_percentiles(np.zeros(3), [0.5]), [None])
+
+    def test_from_columnar(self):
+        with tempfile.TemporaryDirectory() as directory:
+            store = ColumnarStore(directory)
+            store.add_submissions('python', [{'id': 's1', 'created_utc': MONDAY, 'score': 3, 'author': 'alice'}])
+            store.add_comments('python', [{'id': 'c1', 'created_utc': MONDAY + 60, 'score': 1, 'author': None}])
+            store.flush()
+            report = AnalyticsStore.from_columnar(store).report('python', days=1, now=MONDAY)
+        self.assertEqual(report['totals'], {'submissions': 1, 'comments': 1})
+        self.assertEqual(report['top_contributors'], [{'author': 'alice', 'items': 1}])
+
+if __name__ == '__main__':
+    unittest.main()
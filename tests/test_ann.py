@@ -0,0 +1,84 @@
+import tempfile
+import unittest
+import numpy as np
+from app.ann import IVFIndex, build_ivf, train_kmeans, assign_to_centroids
+
+class TestIVFIndex(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(1)
+        centres = rng.standard_normal((8, 32)).astype(np.float32)
+        centres /= np.linalg.norm(centres, axis=1, keepdims=True)
+        self.vectors = centres[rng.integers(0, 8, size=400)] + 0.05 * rng.standard_normal((400, 32)).astype(np.float32)
+        self.vectors /= np.linalg.norm(self.vectors, axis=1, keepdims=True)
+        self.item_ids = np.char.mod('%d', np.arange(400))
+        self.tmpdir = tempfile.TemporaryDirectory()
+        build_ivf(self.tmpdir.name, self.vectors, self.item_ids, num_lists=8)
+        self.index = IVFIndex.open(self.tmpdir.name)
+
+    def tearDown(self):
+        del self.index
+        self.tmpdir.cleanup()
+
+    def test_kmeans_centroids_are_unit_length(self):
+        centroids = train_kmeans(self.vectors, 8)
+        self.assertEqual(centroids.shape, (8, 32))
+        np.testing.assert_allclose(np.linalg.norm(centroids, axis=1), 1.0, rtol=1e-5)
+
+    def test_inverted_lists_are_contiguous(self):
+        self.assertIsInstance(self.index.vectors, np.memmap)
+        self.assertEqual((len(self.index), self.index.num_lists), (400, 8))
+        self.assertEqual(self.index.offsets[-1], 400)
+        assignments = assign_to_centroids(self.index.vectors, self.index.centroids)
+        self.assertTrue(np.all(np.diff(assignments) >= 0))
+        # Every stored row is still paired with its own item id.
+        rows = self.index.item_ids.astype(int)
+        np.testing.assert_allclose(self.index.vectors, self.vectors[rows])
+
+    def test_all_lists_probed_is_exact(self):
+        query = self.vectors[7]
+        expected = np.sort(self.vectors @ query)[::-1][:5]
+        results = self.index.search(query, k=5, nprobe=self.index.num_lists)
+        np.testing.assert_allclose([score for _, score in results], expected, rtol=1e-5)
+        self.assertEqual(self.index.search(query, k=1, nprobe=1)[0][0], '7')
+
+    def test_recall_grows_with_nprobe(self):
+        queries = self.vectors[:20]
+        truth = [set(np.char.mod('%d', np.argsort(-(self.vectors @ q))[:10])) for q in queries]
+        def recall(nprobe):
+            return np.mean([len({i for i, _ in self.index.search(q, 10, nprobe)} & t) / 10 for q, t in zip(queries, truth)])
+        self.assertLessEqual(recall(1), recall(8))
+        self.assertEqual(recall(8), 1.0)
+
+    def test_source_range_filters_rows(self):
+        # Rows 100-199 of the source index, e.g. one subreddit's rows
+        results = self.index.search(self.vectors[150], k=5, nprobe=self.index.num_lists, source_range=(100, 200))
+        self.assertEqual(results[0][0], '150')
+        self.assertTrue(all(100 <= int(item_id) < 200 for item_id, _ in results))
+        self.assertEqual(self.index.search(self.vectors[150], k=5, source_range=(0, 0)), [])
+
+    def test_built_from_detects_a_rebuilt_source(self):
+        from app.embeddings import EmbeddingIndex, write_index
+        with tempfile.TemporaryDirectory() as directory:
+            subreddits = ['a'] * 200 + ['b'] * 200
+            write_index(directory, self.vectors, self.item_ids, subreddits, np.arange(400.0))
+            source = EmbeddingIndex.open(directory)
+            build_ivf(directory, source.vectors, source.item_ids, num_lists=4)
+            self.assertTrue(IVFIndex.open(directory).built_from(source))
+            # Same vectors, one more subreddit: the rows shift
+            write_index(directory, np.vstack([self.vectors[:1], self.vectors]), np.append('new', self.item_ids),
+                        ['aardvark'] + subreddits, np.arange(401.0))
+            self.assertFalse(IVFIndex.exists(directory)) # Rewriting the source deletes the IVF files
+            self.assertFalse(self.index.built_from(EmbeddingIndex.open(directory)))
+            del source
+
+    def test_empty_index_returns_no_results(self):
+        with tempfile.TemporaryDirectory() as directory:
+            build_ivf(directory, np.empty((0, 32), dtype=np.float32), np.empty(0, dtype=str))
+            index = IVFIndex.open(directory)
+            self.assertEqual((len(index), index.num_lists), (0, 0))
+            self.assertEqual(index.search(self.vectors[0], k=5), [])
+            del index
+
+if __name__ == '__main__':
+    unittest.main()
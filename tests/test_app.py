@@ -1,6 +1,6 @@
 import unittest
 import json
-from unittest.mock import patch, MagicMock
+from unittest.mock import ANY, patch, MagicMock
 from app import app as flask_app # Import the Flask app instance from app package
 from app.routes import praw_available as routes_praw_available # To check initial state
 import os
@@ -172,6 +172,516 @@ class TestApp(unittest.TestCase):
         self.assertEqual(data['error'], "Sorry, Reddit API access is not configured correctly on the server.")
         mock_get_llm_response.assert_not_called()
 
+    def test_metrics_endpoint_exports_llm_batch_histograms(self):
+        """Test /metrics exposes the LLM batch-size and queue-wait histograms."""
+        payload = {"message": "what is python?"}
+        self.client.post('/send_message', data=json.dumps(payload), content_type='application/json')
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertEqual(data['llm_batch_size']['type'], 'histogram')
+        self.assertGreaterEqual(data['llm_batch_size']['count'], 1)
+        self.assertIn('+Inf', data['llm_queue_wait_ms']['buckets'])
+
+    @patch('app.routes.llm_admission')
+    def test_send_message_busy_when_shed(self, mock_admission):
+        """Test /send_message returns a fast 503 when admission control sheds the request."""
+        from app.admission import AdmissionRejected
+        mock_admission.admit.side_effect = AdmissionRejected('queue_full')
+        payload = {"message": "what is python?"}
+        response = self.client.post('/send_message', data=json.dumps(payload), content_type='application/json')
+        self.assertEqual(response.status_code, 503)
+        data = json.loads(response.data)
+        self.assertIsNone(data['reply'])
+        self.assertEqual(data['error'], "The assistant is busy right now. Please try again in a moment.")
+
+    def _configure_subreddit_with_posts(self):
+        """Configures the patched PRAW client to return a subreddit with two hot posts."""
+        posts = []
+        for post_id, title, selftext in [("p1", "How to learn decorators", "Read the docs on decorators."),
+                                         ("p2", "Weekly thread", "Ask anything.")]:
+            post = MagicMock()
+            post.id, post.title, post.selftext = post_id, title, selftext
+            post.score, post.num_comments = 10, 2
+            post.permalink = f"/r/learnpython/comments/{post_id}/"
+            posts.append(post)
+        mock_subreddit = MagicMock()
+        mock_subreddit.display_name = "learnpython"
+        mock_subreddit.public_description = "Learn Python here!"
+        mock_subreddit.subscribers = 12345
+        mock_subreddit.hot.return_value = posts
+        self.mock_reddit_instance.subreddit.return_value = mock_subreddit
+
+    @patch('app.llm_utils.get_llm_response')
+    def test_send_message_applies_inline_filters(self, mock_get_llm_response):
+        """Test /send_message reads the listing named by the query's filters and drops posts outside them."""
+        import time
+        self._configure_subreddit_with_posts()
+        mock_subreddit = self.mock_reddit_instance.subreddit.return_value
+        posts = mock_subreddit.hot.return_value
+        posts[0].link_flair_text, posts[1].link_flair_text = "Help", "Meta"
+        for post in posts:
+            post.created_utc = time.time()
+        mock_subreddit.top.return_value = posts
+        mock_get_llm_response.return_value = "reply"
+        payload = {"message": '@r/learnpython top:week flair:"help" decorators?'}
+        self.client.post('/send_message', data=json.dumps(payload), content_type='application/json')
+        mock_subreddit.top.assert_called_once_with(time_filter='week', limit=ANY)
+        mock_subreddit.hot.assert_not_called()
+        question, context = mock_get_llm_response.call_args[0][:2]
+        self.assertEqual(question, "decorators?")
+        self.assertEqual([post['id'] for post in context['posts']], ['p1'])
+        self.assertEqual(context['filters'], {'sort': 'top', 'time_filter': 'week', 'flair': 'help'})
+
+    @patch('app.routes.llm_batcher')
+    def test_send_message_extractive_fast_path(self, mock_batcher):
+        """Test /send_message with mode=extractive answers from posts without calling the LLM."""
+        self._configure_subreddit_with_posts()
+        payload = {"message": "@r/learnpython decorators?", "mode": "extractive"}
+        response = self.client.post('/send_message', data=json.dumps(payload), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertIsNone(data['error'])
+        self.assertIn("https://www.reddit.com/r/learnpython/comments/p1/", data['reply'])
+        self.assertEqual(data['sources'][0]['title'], "How to learn decorators")
+        mock_batcher.submit.assert_not_called()
+
+    @patch('app.routes.LLM_DEADLINE_SECONDS', 0.01)
+    @patch('app.routes.llm_batcher')
+    def test_send_message_falls_back_to_extractive_on_llm_deadline(self, mock_batcher):
+        """Test /send_message returns the extractive answer when the LLM misses its deadline."""
+        from concurrent.futures import Future
+        self._configure_subreddit_with_posts()
+        never_resolved = Future()
+        mock_batcher.submit.return_value = never_resolved
+        payload = {"message": "@r/learnpython decorators?"}
+        response = self.client.post('/send_message', data=json.dumps(payload), content_type='application/json')
+        data = json.loads(response.data)
+        self.assertIsNone(data['error'])
+        self.assertEqual(data['sources'][0]['permalink'], "https://www.reddit.com/r/learnpython/comments/p1/")
+        self.assertTrue(never_resolved.cancelled())
+
+    def test_send_message_streams_ndjson(self):
+        """Test /send_message with stream=true returns NDJSON deltas followed by a done marker."""
+        payload = {"message": "what is python?", "stream": True, "request_id": "stream-1"}
+        response = self.client.post('/send_message', data=json.dumps(payload), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        events = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        response.close() # WSGI servers close the response once it is sent
+        self.assertTrue(events[-1]['done'])
+        self.assertIn("what is python?", "".join(event.get('delta', '') for event in events))
+        self.assertTrue(all(event['request_id'] == "stream-1" for event in events))
+
+    def test_stream_disconnect_cancels_request(self):
+        """Test closing a streamed response early cancels the request's token."""
+        from app.routes import cancellation_registry, llm_admission
+        payload = {"message": "what is python?", "stream": True, "request_id": "stream-2"}
+        response = self.client.post('/send_message', data=json.dumps(payload), content_type='application/json',
+                                    buffered=False)
+        token = cancellation_registry._tokens[('127.0.0.1', "stream-2")]
+        next(response.response) # Client reads one chunk...
+        response.close()        # ...then disconnects
+        self.assertTrue(token.cancelled)
+        self.assertNotIn(('127.0.0.1', "stream-2"), cancellation_registry._tokens)
+        self.assertEqual(llm_admission.stats()['in_flight'], 0)
+
+    def test_apps_have_separate_state(self):
+        """Test each app built by create_app has its own registry, LLM limits, sentiment and metrics."""
+        from app import create_app
+        from app.routes import cancellation_registry
+        other_app = create_app({'TESTING': True, 'LLM_MAX_IN_FLIGHT': 1})
+        self.assertEqual(other_app.extensions['chat'].llm_admission.max_in_flight, 1)
+        self.assertIsNot(other_app.extensions['chat'].llm_admission, flask_app.extensions['chat'].llm_admission)
+        self.assertIsNot(other_app.extensions['chat'].live_index, flask_app.extensions['chat'].live_index)
+        self.assertIsNot(other_app.extensions['chat'].sentiment, flask_app.extensions['chat'].sentiment)
+        self.assertIsNot(other_app.extensions['chat'].llm_admission.shed_counter,
+                         flask_app.extensions['chat'].llm_admission.shed_counter)
+        other_app.extensions['chat'].llm_admission.shed_counter.inc()
+        other_metrics = json.loads(other_app.test_client().get('/metrics').data)
+        metrics = json.loads(self.client.get('/metrics').data)
+        self.assertEqual(other_metrics['llm_admission_shed']['value'], 1)
+        self.assertEqual(metrics['llm_admission_shed']['value'],
+                         flask_app.extensions['chat'].llm_admission.shed_counter.value)
+        token = cancellation_registry.register("other-1", '127.0.0.1') # The default app's registry
+        response = other_app.test_client().post('/cancel', data=json.dumps({"request_id": "other-1"}),
+                                                content_type='application/json')
+        self.assertFalse(json.loads(response.data)['cancelled'])
+        self.assertFalse(token.cancelled)
+        cancellation_registry.unregister("other-1", token, '127.0.0.1')
+
+    def test_cancel_endpoint(self):
+        """Test /cancel cancels a registered request and reports unknown ids."""
+        from app.routes import cancellation_registry
+        token = cancellation_registry.register("pending-1", '127.0.0.1')
+        response = self.client.post('/cancel', data=json.dumps({"request_id": "pending-1"}), content_type='application/json')
+        self.assertTrue(json.loads(response.data)['cancelled'])
+        self.assertTrue(token.cancelled)
+        response = self.client.post('/cancel', data=json.dumps({"request_id": "pending-1"}), content_type='application/json')
+        self.assertFalse(json.loads(response.data)['cancelled'])
+        response = self.client.post('/cancel', data=json.dumps({}), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_cancel_is_scoped_to_the_client(self):
+        """Test /cancel cannot cancel another client's request, and in-flight ids are not reused."""
+        from app.routes import cancellation_registry
+        token = cancellation_registry.register("pending-2", '10.0.0.7')
+        response = self.client.post('/cancel', data=json.dumps({"request_id": "pending-2"}), content_type='application/json')
+        self.assertFalse(json.loads(response.data)['cancelled'])
+        self.assertFalse(token.cancelled)
+        cancellation_registry.unregister("pending-2", token, '10.0.0.7')
+        mine = cancellation_registry.register("pending-3", '127.0.0.1')
+        payload = {"message": "what is python?", "request_id": "pending-3"}
+        response = self.client.post('/send_message', data=json.dumps(payload), content_type='application/json')
+        self.assertEqual(response.status_code, 409)
+        self.assertIs(cancellation_registry._tokens[('127.0.0.1', "pending-3")], mine)
+        cancellation_registry.unregister("pending-3", mine, '127.0.0.1')
+
+    def test_cancelled_request_stops_reddit_fetch(self):
+        """Test a request cancelled during the Reddit fetch returns without calling the LLM."""
+        from app.routes import cancellation_registry
+        def hot_then_cancel(limit):
+            cancellation_registry.cancel("fetch-1", '127.0.0.1') # E.g. the user sent a newer message
+            yield MagicMock()
+        self.mock_reddit_instance.subreddit.return_value.hot.side_effect = hot_then_cancel
+        with patch('app.routes.llm_batcher') as mock_batcher:
+            payload = {"message": "@r/learnpython decorators?", "request_id": "fetch-1"}
+            response = self.client.post('/send_message', data=json.dumps(payload), content_type='application/json')
+            mock_batcher.submit.assert_not_called()
+        self.assertEqual(response.status_code, 499)
+        self.assertEqual(json.loads(response.data)['error'], "Request was cancelled.")
+
+    @patch('app.routes.corpus_store')
+    def test_search_endpoint(self, mock_store):
+        """Test /search returns snippets from the corpus store."""
+        mock_store.search.return_value = [{'kind': 'submission', 'id': 's1', 'snippet': '<mark>decorators</mark>'}]
+        response = self.client.get('/search?subreddit=learnpython&q=decorators&limit=500')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertEqual(data['results'][0]['snippet'], '<mark>decorators</mark>')
+        mock_store.search.assert_called_once_with('decorators', subreddit='learnpython', limit=50)
+
+    def test_search_endpoint_requires_query(self):
+        """Test /search without q is rejected."""
+        response = self.client.get('/search?subreddit=learnpython')
+        self.assertEqual(response.status_code, 400)
+
+    @patch('app.routes.CONTEXT_SOURCE', 'store')
+    @patch('app.routes.corpus_store')
+    def test_send_message_uses_store_context(self, mock_store):
+        """Test /send_message reads context from the corpus store without calling Reddit."""
+        mock_store.get_subreddit_context.return_value = {'display_name': 'learnpython', 'name': 'learnpython', 'posts': []}
+        payload = {"message": "@r/learnpython decorators?"}
+        response = self.client.post('/send_message', data=json.dumps(payload), content_type='application/json')
+        data = json.loads(response.data)
+        self.assertIsNone(data['error'])
+        self.assertIn("r/learnpython", data['reply'])
+        self.mock_reddit_instance.subreddit.assert_not_called()
+
+    @patch('app.routes.CONTEXT_SOURCE', 'store')
+    @patch('app.routes.corpus_store')
+    @patch('app.llm_utils.get_llm_response')
+    def test_send_message_collapses_near_duplicate_posts(self, mock_get_llm_response, mock_store):
+        """Test /send_message keeps only the first copy of reposted posts in the LLM context."""
+        text = "Is it worth learning Rust if I already know C++ and Python well enough for my job"
+        mock_store.get_subreddit_context.return_value = {'display_name': 'learnpython', 'name': 'learnpython', 'posts': [
+            {'id': 'p1', 'title': text, 'selftext': ''},
+            {'id': 'p2', 'title': text.lower() + "?", 'selftext': ''},
+            {'id': 'p3', 'title': "Weekly thread", 'selftext': "Ask anything."},
+        ]}
+        mock_get_llm_response.return_value = "reply"
+        payload = {"message": "@r/learnpython rust?"}
+        self.client.post('/send_message', data=json.dumps(payload), content_type='application/json')
+        context = mock_get_llm_response.call_args[0][1]
+        self.assertEqual(sorted(post['id'] for post in context['posts']), ['p1', 'p3'])
+        self.assertEqual(context['sentiment']['posts']['items'], 2)
+
+    def test_prepared_contexts_share_the_prompt_prefix(self):
+        """Test two questions about one subreddit get different posts but the same cacheable prefix."""
+        from app.llm_utils import build_prompt
+        from app.routes import prepare_subreddit_context
+        posts = [{'id': 'p1', 'title': "Decorators explained", 'selftext': "wrapping functions"},
+                 {'id': 'p2', 'title': "Generators and yield", 'selftext': "lazy iteration"}]
+        prompts = []
+        for question in ("how do decorators work?", "what does yield do?"):
+            context = {'display_name': 'learnpython', 'name': 'learnpython', 'subscribers': 10,
+                       'posts': [dict(post) for post in posts]}
+            with patch('app.routes.LLM_CONTEXT_POST_LIMIT', 1):
+                prepare_subreddit_context('learnpython', question, context)
+            prompts.append(build_prompt(question, context))
+        (prefix_a, prompt_a), (prefix_b, prompt_b) = prompts
+        self.assertEqual(prefix_a, prefix_b)
+        self.assertIn("Decorators explained", prompt_a[len(prefix_a):])
+        self.assertIn("Generators and yield", prompt_b[len(prefix_b):])
+
+    def test_prepared_context_posts_are_ranked_by_the_live_index(self):
+        """Test the retrieval stage adds the candidate posts to the subreddit's live index and ranks them with it."""
+        from app.routes import prepare_subreddit_context
+        from app.segments import SegmentedIndexCache
+        live_index = SegmentedIndexCache(max_documents=3, name='test_live_index')
+        live_index.get('learnpython').add('old', "asyncio event loops explained") # No longer a candidate
+        live_index.get('python').add('other', "asyncio in another subreddit")
+        context = {'name': 'learnpython', 'posts': [
+            {'id': 'p1', 'title': "Decorators explained", 'selftext': ""},
+            {'id': 'p2', 'title': "Event loops in asyncio", 'selftext': "asyncio tasks"},
+            {'id': 'p3', 'title': "Virtual environments", 'selftext': ""}]}
+        with patch('app.routes.live_index', live_index), patch('app.routes.LLM_CONTEXT_POST_LIMIT', 1):
+            prepare_subreddit_context('LearnPython', "how does asyncio work?", context)
+        self.assertEqual([post['id'] for post in context['posts']], ['p2'])
+        self.assertEqual(len(live_index.get('learnpython')), 3) # 'old' was evicted by the candidates
+        self.assertEqual(live_index.stats(), {'subreddits': 2, 'documents': 4})
+
+    @patch('app.routes.CONTEXT_SOURCE', 'store')
+    @patch('app.routes.corpus_store')
+    @patch('app.llm_utils.get_llm_response')
+    def test_send_message_multiple_subreddits_fail_independently(self, mock_get_llm_response, mock_store):
+        """Test /send_message answers from the subreddits that could be fetched and lists the others."""
+        mock_store.get_subreddit_context.side_effect = lambda name, *args, **kwargs: (
+            {'display_name': name, 'name': name, 'posts': []} if name == 'learnpython' else None)
+        self.mock_reddit_instance.subreddit.side_effect = Exception("403 Forbidden")
+        mock_get_llm_response.return_value = "reply"
+        payload = {"message": "@r/learnpython @r/secretclub which is friendlier?"}
+        response = self.client.post('/send_message', data=json.dumps(payload), content_type='application/json')
+        data = json.loads(response.data)
+        self.assertEqual(data['reply'], "reply")
+        question, context = mock_get_llm_response.call_args[0][:2]
+        self.assertEqual(question, "which is friendlier?")
+        self.assertEqual([entry['name'] for entry in context['subreddits']], ['learnpython'])
+        self.assertEqual(context['unavailable'], [{'name': 'secretclub',
+                                                   'error': "An unexpected error occurred while fetching data for r/secretclub."}])
+
+    @patch('app.routes.CONTEXT_SOURCE', 'store')
+    @patch('app.routes.corpus_store')
+    def test_send_message_multiple_subreddits_all_unavailable(self, mock_store):
+        """Test /send_message reports every subreddit's error when none could be fetched."""
+        mock_store.get_subreddit_context.return_value = None
+        self.mock_reddit_instance.subreddit.side_effect = Exception("403 Forbidden")
+        payload = {"message": "@r/a, @r/b compare?"}
+        data = json.loads(self.client.post('/send_message', data=json.dumps(payload), content_type='application/json').data)
+        self.assertIsNone(data['reply'])
+        self.assertIn("r/a", data['error'])
+        self.assertIn("r/b", data['error'])
+
+    def test_autocomplete_endpoint(self):
+        """Test /autocomplete suggests the most popular subreddits starting with the prefix."""
+        from app.autocomplete import SubredditNameIndex
+        index = SubredditNameIndex.from_entries(['Python', 'pytorch', 'pics'], [1000, 800, 3000])
+        with patch('app.routes.subreddit_name_index', index):
+            data = json.loads(self.client.get('/autocomplete?prefix=@r/py&limit=1').data)
+            self.assertEqual(data['suggestions'], [{'name': 'Python', 'subscribers': 1000}])
+            self.assertEqual(json.loads(self.client.get('/autocomplete?prefix=').data)['suggestions'], [])
+        with patch('app.routes.subreddit_name_index', None):
+            self.assertEqual(json.loads(self.client.get('/autocomplete?prefix=py').data)['suggestions'], [])
+
+    @patch('app.routes.reddit', new_callable=MagicMock)
+    @patch('app.llm_utils.get_llm_response')
+    def test_send_message_misspelled_subreddit_suggests_names(self, mock_get_llm_response, mock_reddit_obj_in_routes):
+        """Test /send_message answers a misspelled subreddit with suggestions, without calling Reddit."""
+        from app.autocomplete import SubredditNameIndex
+        from app.spelling import SubredditSpeller
+        self.mock_praw_available = True
+        index = SubredditNameIndex.from_entries(['learnpython', 'Python', 'pics'], [500, 1000, 3000])
+        with patch('app.routes.subreddit_name_index', index), \
+                patch('app.routes.subreddit_speller', SubredditSpeller.from_name_index(index)), \
+                patch('app.routes.check_names_before_fetch', True):
+            payload = {"message": "@r/lernpython how do I start?"}
+            data = json.loads(self.client.post('/send_message', data=json.dumps(payload), content_type='application/json').data)
+        self.assertIsNone(data['reply'])
+        self.assertEqual(data['error'], "Sorry, the subreddit r/lernpython could not be found. Did you mean r/learnpython?")
+        self.assertEqual(data['suggestions'], ['learnpython'])
+        mock_reddit_obj_in_routes.subreddit.assert_not_called()
+        mock_get_llm_response.assert_not_called()
+
+    def test_analytics_endpoint(self):
+        """Test /analytics/<subreddit> serves rollups and 404s for unknown subreddits."""
+        import time
+        from app.analytics import AnalyticsStore
+        rollups = AnalyticsStore()
+        rollups.add_submissions('learnpython', [{'id': 's1', 'created_utc': time.time(), 'score': 3, 'author': 'alice'}])
+        with patch('app.routes.analytics', rollups):
+            response = self.client.get('/analytics/LearnPython?days=7')
+            self.assertEqual(response.status_code, 200)
+            data = json.loads(response.data)
+            self.assertEqual(data['analytics']['totals']['submissions'], 1)
+            self.assertEqual(data['analytics']['top_contributors'][0]['author'], 'alice')
+            self.assertEqual(self.client.get('/analytics/unknown').status_code, 404)
+
+    def test_trends_endpoint(self):
+        """Test /trends/<subreddit> reports bursty terms and 404s for unseen subreddits."""
+        import time
+        from app.trends import TrendDetector
+        detector = TrendDetector()
+        detector.add_submissions('learnpython', [{'id': f"p{i}", 'title': "decorators explained", 'created_utc': time.time()}
+                                                 for i in range(4)])
+        with patch('app.routes.trend_detector', detector):
+            response = self.client.get('/trends/learnpython?limit=2')
+            self.assertEqual(response.status_code, 200)
+            terms = json.loads(response.data)['trends']['terms']
+            self.assertEqual(len(terms), 2)
+            self.assertTrue(all(term['count'] == 4 for term in terms))
+            self.assertEqual(self.client.get('/trends/unknown').status_code, 404)
+
+    def test_sentiment_endpoint(self):
+        """Test /sentiment/<subreddit> serves subreddit and thread aggregates."""
+        from app.sentiment import SentimentStore
+        store = SentimentStore()
+        store.add_submissions('learnpython', [{'id': 's1', 'title': "I love decorators", 'selftext': ''}])
+        store.add_comments('learnpython', [{'id': 'c1', 'submission_id': 's1', 'body': "They are awful"}])
+        with patch('app.routes.sentiment', store):
+            data = json.loads(self.client.get('/sentiment/learnpython').data)
+            self.assertEqual(data['sentiment']['subreddit']['items'], 2)
+            self.assertEqual(data['sentiment']['threads'][0]['id'], 's1')
+            data = json.loads(self.client.get('/sentiment/learnpython?thread=s1').data)
+            self.assertEqual(data['sentiment']['positive'], 0.5)
+            self.assertEqual(self.client.get('/sentiment/learnpython?thread=zz').status_code, 404)
+            self.assertEqual(self.client.get('/sentiment/unknown').status_code, 404)
+
+    def test_send_messages_answers_in_order_and_shares_fetches(self):
+        """Test /send_messages returns per-item results in order, fetching each subreddit once."""
+        context = {'display_name': 'learnpython', 'public_description': 'Learn Python', 'subscribers': 1000,
+                   'name': 'learnpython', 'posts': [{'title': "Start with the tutorial", 'selftext': '', 'score': 5,
+                                                      'num_comments': 1, 'permalink': 'https://www.reddit.com/r/learnpython/1'}]}
+        with patch('app.routes.fetch_subreddit_context', return_value=context) as mock_fetch:
+            response = self.client.post('/send_messages', json={'messages': [
+                "@r/learnpython how do I start?",
+                {'id': 'x', 'message': "@r/learnpython which book?"},
+                {'id': 'y', 'message': ""},
+                42,
+            ]})
+        self.assertEqual(response.status_code, 200)
+        results = json.loads(response.data)['results']
+        self.assertEqual([result['index'] for result in results], [0, 1, 2, 3])
+        self.assertIn("r/learnpython", results[0]['reply'])
+        self.assertEqual((results[1]['id'], results[1]['error']), ('x', None))
+        self.assertEqual(results[2], {'index': 2, 'id': 'y', 'reply': None, 'error': "Please enter a question."})
+        self.assertEqual(results[3]['error'], "Invalid request: No message provided.")
+        mock_fetch.assert_called_once()
+
+    def test_send_messages_invalid_requests(self):
+        """Test /send_messages rejects a missing, empty or oversized message list."""
+        self.assertEqual(self.client.post('/send_messages', json={}).status_code, 400)
+        self.assertEqual(self.client.post('/send_messages', json={'messages': []}).status_code, 400)
+        with patch('app.routes.SEND_MESSAGES_MAX', 2):
+            response = self.client.post('/send_messages', json={'messages': ["a", "b", "c"]})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(json.loads(response.data)['error'], "Please send at most 2 messages per request.")
+
+    def test_send_messages_stream(self):
+        """Test /send_messages with 'stream' yields one NDJSON line per message, then done."""
+        response = self.client.post('/send_messages', json={'messages': ["what is python?", ""],
+                                                            'stream': True, 'request_id': 'b1'})
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        self.assertEqual(sorted(line['index'] for line in lines[:-1]), [0, 1])
+        self.assertEqual(lines[-1], {'request_id': 'b1', 'done': True})
+
+    def test_create_app_builds_isolated_apps(self):
+        """Test create_app returns a new, separately configured app each time."""
+        from app import create_app
+        first, second = create_app({'TESTING': True, 'SECRET': 'a'}), create_app()
+        self.assertIsNot(first, second)
+        self.assertEqual((first.config['SECRET'], second.config.get('SECRET')), ('a', None))
+        self.assertEqual(first.test_client().get('/autocomplete?prefix=py').status_code, 200)
+
+    @unittest.skipUnless(hasattr(os, 'fork'), "requires os.fork")
+    def test_forked_worker_gets_its_own_resources(self):
+        """Test a forked worker does not reuse its parent's PRAW client or fetch pool."""
+        from app import routes
+        parent_executor = routes.subreddit_fetch_executor
+        pid = os.fork()
+        if pid == 0: # Child: must have created its own fetch pool
+            ok = routes.subreddit_fetch_executor is not parent_executor
+            ok = ok and routes.subreddit_fetch_executor.submit(lambda: 1).result(timeout=5) == 1
+            os._exit(0 if ok else 1)
+        _, status = os.waitpid(pid, 0)
+        self.assertEqual(os.waitstatus_to_exitcode(status), 0)
+        self.assertIs(routes.subreddit_fetch_executor, parent_executor)
+
+
+class TestChatSocket(unittest.TestCase):
+    """The /ws channel, served by a local threaded server (the test client cannot speak WebSocket)."""
+
+    def setUp(self):
+        import threading
+        import websocket
+        from werkzeug.serving import make_server
+        self.server = make_server('127.0.0.1', 0, flask_app, threaded=True)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.ws = websocket.create_connection(f"ws://127.0.0.1:{self.server.server_port}/ws", timeout=5)
+
+    def tearDown(self):
+        self.ws.close()
+        self.server.shutdown()
+
+    def ask(self, request_id, message):
+        self.ws.send(json.dumps({'type': 'ask', 'request_id': request_id, 'message': message}))
+
+    def receive_until_done(self, count):
+        events = {}
+        while sum(1 for received in events.values() if received[-1].get('done')) < count:
+            event = json.loads(self.ws.recv())
+            events.setdefault(event['request_id'], []).append(event)
+        return events
+
+    def test_multiplexes_questions_on_one_connection(self):
+        """Test several questions in flight at once each get their own streamed answer."""
+        for i in range(3):
+            self.ask(f"q{i}", f"what is python {i}?")
+        self.ask('empty', "")
+        events = self.receive_until_done(4)
+        for i in range(3):
+            reply = ''.join(event.get('delta', '') for event in events[f"q{i}"])
+            self.assertIn(f"what is python {i}?", reply)
+            self.assertEqual(events[f"q{i}"][-1], {'request_id': f"q{i}", 'done': True})
+        self.assertEqual(events['empty'], [{'request_id': 'empty', 'reply': None, 'error': "Please enter a question.",
+                                            'done': True}])
+
+    def test_cancel_stops_a_question(self):
+        """Test a 'cancel' message stops generation of that question."""
+        import time
+        def endless_stream(question, subreddit_info=None, praw_available_for_llm=True, cancel_token=None):
+            while True:
+                cancel_token.raise_if_cancelled()
+                yield "more "
+                time.sleep(0.01)
+        with patch('app.routes.llm_utils.stream_llm_response', endless_stream):
+            self.ask('slow', "tell me everything")
+            self.assertEqual(json.loads(self.ws.recv())['delta'], "more ")
+            self.ws.send(json.dumps({'type': 'cancel', 'request_id': 'slow'}))
+            events = self.receive_until_done(1)
+        self.assertEqual(events['slow'][-1]['error'], "Request was cancelled.")
+
+    def test_rejects_connections_beyond_the_cap(self):
+        """Test connections beyond SOCKET_MAX_CONNECTIONS are closed with code 1013 and free their slot."""
+        import struct
+        import threading
+        import time
+        import websocket
+        url = f"ws://127.0.0.1:{self.server.server_port}/ws"
+        self.ask('ready', "") # The setUp connection is served (uncapped) before the cap is patched in
+        self.receive_until_done(1)
+        with patch('app.routes.SOCKET_MAX_CONNECTIONS', 1), patch('app.routes._socket_slots', threading.BoundedSemaphore(1)):
+            admitted = websocket.create_connection(url, timeout=5)
+            rejected = websocket.create_connection(url, timeout=5)
+            opcode, data = rejected.recv_data(control_frame=True)
+            self.assertEqual(opcode, websocket.ABNF.OPCODE_CLOSE)
+            self.assertEqual(struct.unpack('!H', data[:2])[0], 1013)
+            rejected.close()
+            admitted.close()
+            for _ in range(50): # The server notices the close on its next receive
+                retry = websocket.create_connection(url, timeout=5)
+                retry.send(json.dumps({'type': 'ask', 'request_id': 'r', 'message': ""}))
+                try:
+                    if retry.recv(): # Empty once the server closed the connection
+                        break
+                except websocket.WebSocketConnectionClosedException:
+                    pass
+                finally:
+                    retry.close()
+                time.sleep(0.05)
+            else:
+                self.fail("The slot of the closed connection was not released.")
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,42 @@
+import tempfile
+import unittest
+from app.autocomplete import SubredditNameIndex, build_name_index
+
+NAMES = ['Python', 'r/learnpython', 'pytorch', 'PYTHON', 'pics', 'AskReddit', 'not a name!', 'p']
+SUBSCRIBERS = [1000, 500, 800, 5, 3000, 9000, 7, 2]
+
+class TestSubredditNameIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.index = SubredditNameIndex.from_entries(NAMES, SUBSCRIBERS)
+
+    def test_deduplicates_and_skips_invalid_names(self):
+        self.assertEqual(len(self.index), 6)
+        self.assertTrue(self.index.contains('python'))
+        self.assertTrue(self.index.contains('@r/LearnPython'))
+        self.assertFalse(self.index.contains('pyth'))
+
+    def test_complete_ranks_by_subscribers(self):
+        # One- and two-letter prefixes come from the precomputed table, longer ones are ranked on the fly.
+        self.assertEqual([s['name'] for s in self.index.complete('p', k=3)], ['pics', 'Python', 'pytorch'])
+        self.assertEqual(self.index.complete('py'), [{'name': 'Python', 'subscribers': 1000},
+                                                     {'name': 'pytorch', 'subscribers': 800}])
+        self.assertEqual([s['name'] for s in self.index.complete('@r/PYT')], ['Python', 'pytorch'])
+        self.assertEqual([s['name'] for s in self.index.complete('r/learn')], ['learnpython'])
+
+    def test_complete_without_matches(self):
+        self.assertEqual(self.index.complete('zz'), [])
+        self.assertEqual(self.index.complete('xyz'), [])
+        self.assertEqual(self.index.complete(''), [])
+        self.assertEqual(self.index.complete('py thon'), [])
+
+    def test_memory_mapped_index_matches_in_memory_index(self):
+        with tempfile.TemporaryDirectory() as directory:
+            self.assertEqual(build_name_index(directory, NAMES, SUBSCRIBERS), 6)
+            mapped = SubredditNameIndex.open(directory)
+            for prefix in ('p', 'py', 'pyt', 'ask', 'q'):
+                self.assertEqual(mapped.complete(prefix), self.index.complete(prefix))
+            del mapped
+
+if __name__ == '__main__':
+    unittest.main()
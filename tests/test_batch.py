@@ -0,0 +1,115 @@
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from app.batch import ContextCache, answer_message, resume_offset, run_batch
+
+MESSAGES = [{'id': 'a', 'message': "@r/learnpython how do I start?"},
+            {'id': 'b', 'message': "@r/learnpython"},
+            {'message': "what is python?", 'mode': 'extractive'},
+            {'message': ""}]
+
+class TestBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.input_path = os.path.join(self.directory.name, 'questions.jsonl')
+        self.output_path = os.path.join(self.directory.name, 'answers.jsonl')
+        with open(self.input_path, 'w') as f:
+            for payload in MESSAGES:
+                f.write(json.dumps(payload) + "\n")
+            f.write("not json\n\n")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def read_output(self):
+        with open(self.output_path) as f:
+            return [json.loads(line) for line in f]
+
+    def test_answers_every_line_in_order(self):
+        summary = run_batch(self.input_path, self.output_path, threads=3, chunk_size=2)
+        results = self.read_output()
+        self.assertEqual([result['line'] for result in results], [0, 1, 2, 3, 4])
+        self.assertEqual(results[0]['id'], 'a')
+        self.assertIn("LLM mock response", results[0]['reply'])
+        self.assertEqual(set(results[0]['timings']), {'parse', 'context', 'answer'})
+        self.assertEqual(results[1]['error'], "You mentioned r/learnpython, but what is your question?")
+        self.assertEqual(results[3]['error'], "Please enter a question.")
+        self.assertEqual(results[4]['error'], "Invalid request: No message provided.")
+        self.assertEqual((summary['messages'], summary['errors']), (5, 3))
+        self.assertIn('answer', summary['stages'])
+
+    def test_resume_continues_after_last_answered_line(self):
+        run_batch(self.input_path, self.output_path, threads=2)
+        with open(self.output_path) as f:
+            first_two = f.readlines()[:2]
+        with open(self.output_path, 'w') as f:
+            f.writelines(first_two)
+            f.write('{"line": 2, "rep') # Interrupted mid-write
+        self.assertEqual(resume_offset(self.output_path), 2)
+        summary = run_batch(self.input_path, self.output_path, threads=2, resume=True)
+        self.assertEqual(summary['messages'], 3)
+        self.assertEqual([result['line'] for result in self.read_output()], [0, 1, 2, 3, 4])
+
+    def test_context_cache_fetches_once_and_returns_copies(self):
+        cache = ContextCache(capacity=2)
+        calls = []
+        def fetch():
+            calls.append(1)
+            time.sleep(0.05)
+            return {'posts': [{'id': 'p1'}]}
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.get('key', fetch))) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual((cache.hits, cache.misses), (3, 1))
+        results[0]['posts'].clear() # Preparing one copy must not affect the others
+        self.assertEqual(cache.get('key', fetch), {'posts': [{'id': 'p1'}]})
+        def failing_fetch():
+            raise ValueError("Reddit is down")
+        with self.assertRaises(ValueError):
+            cache.get('failing', failing_fetch)
+        self.assertEqual(cache.get('failing', lambda: None), None) # Failures are not cached
+
+    def test_context_cache_cancellation_only_ends_own_wait(self):
+        from concurrent.futures import TimeoutError as FutureTimeoutError
+        from app.cancellation import CancellationToken, RequestCancelled
+        cache = ContextCache()
+        release = threading.Event()
+        def fetch():
+            release.wait(5)
+            return {'posts': []}
+        first_token = CancellationToken()
+        first_token.add_callback(release.set) # The fetch finishes only after the first caller gave up
+        threading.Timer(0.05, first_token.cancel).start()
+        with self.assertRaises(RequestCancelled):
+            cache.get('key', fetch, first_token)
+        self.assertEqual(cache.get('key', fetch, CancellationToken(), timeout=5), {'posts': []})
+        self.assertEqual(cache.misses, 1)
+        release.clear()
+        with self.assertRaises(FutureTimeoutError):
+            cache.get('slow', fetch, CancellationToken(), timeout=0.01)
+        release.set()
+
+    def test_answer_message_reports_stage_timings(self):
+        answer = answer_message("what is python?")
+        self.assertIsNone(answer['error'])
+        self.assertEqual(set(answer['timings']), {'parse', 'context', 'answer'})
+
+    def test_answer_message_reports_shed_llm_call(self):
+        from unittest.mock import MagicMock
+        from app.admission import AdmissionRejected
+        admission = MagicMock()
+        admission.admit.side_effect = AdmissionRejected('queue_full')
+        answer = answer_message("what is python?", admission=admission)
+        self.assertEqual(answer['error'], "The assistant is busy right now. Please try again in a moment.")
+        self.assertEqual(set(answer['timings']), {'parse', 'context', 'answer'})
+
+if __name__ == '__main__':
+    unittest.main()
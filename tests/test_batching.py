@@ -0,0 +1,114 @@
+import unittest
+import threading
+from app.batching import MicroBatcher
+from app.llm_utils import get_llm_responses
+
+class TestMicroBatcher(unittest.TestCase):
+
+    def test_results_are_routed_back_to_each_caller(self):
+        batcher = MicroBatcher(lambda items: [item * 2 for item in items], max_batch_size=4, max_wait_ms=20, name='test_routing')
+        futures = [batcher.submit(i) for i in range(10)]
+        self.assertEqual([f.result(timeout=2) for f in futures], [i * 2 for i in range(10)])
+        batcher.close()
+
+    def test_batches_respect_max_batch_size(self):
+        seen_sizes = []
+        release = threading.Event()
+
+        def batch_fn(items):
+            release.wait(timeout=2)
+            seen_sizes.append(len(items))
+            return items
+
+        batcher = MicroBatcher(batch_fn, max_batch_size=3, max_wait_ms=50, name='test_size')
+        futures = [batcher.submit(i) for i in range(7)]
+        release.set()
+        for f in futures:
+            f.result(timeout=2)
+        batcher.close()
+        self.assertEqual(sum(seen_sizes), 7)
+        self.assertTrue(all(size <= 3 for size in seen_sizes))
+
+    def test_concurrent_submits_are_grouped(self):
+        seen_sizes = []
+        batcher = MicroBatcher(lambda items: seen_sizes.append(len(items)) or items,
+                               max_batch_size=16, max_wait_ms=200, name='test_grouping')
+        futures = [batcher.submit(i) for i in range(5)]
+        for f in futures:
+            f.result(timeout=2)
+        batcher.close()
+        self.assertEqual(seen_sizes, [5])
+        self.assertEqual(batcher.batch_size_histogram.snapshot()['buckets']['8'], 1)
+
+    def test_per_item_exception_only_fails_that_item(self):
+        def batch_fn(items):
+            return [ValueError("bad item") if item == 'bad' else item.upper() for item in items]
+
+        batcher = MicroBatcher(batch_fn, max_batch_size=8, max_wait_ms=20, name='test_item_error')
+        good, bad = batcher.submit('good'), batcher.submit('bad')
+        self.assertEqual(good.result(timeout=2), 'GOOD')
+        with self.assertRaises(ValueError):
+            bad.result(timeout=2)
+        batcher.close()
+
+    def test_batch_function_failure_fails_whole_batch(self):
+        def batch_fn(items):
+            raise RuntimeError("backend down")
+
+        batcher = MicroBatcher(batch_fn, max_batch_size=8, max_wait_ms=0, name='test_batch_error')
+        with self.assertRaises(RuntimeError):
+            batcher.submit('anything').result(timeout=2)
+        batcher.close()
+
+    def test_batches_are_dispatched_concurrently(self):
+        # Each batch waits until two batches are running at once; with a single
+        # in-flight batch the barrier would time out.
+        barrier = threading.Barrier(2, timeout=2)
+
+        def batch_fn(items):
+            barrier.wait()
+            return items
+
+        batcher = MicroBatcher(batch_fn, max_batch_size=1, max_wait_ms=0, max_concurrent_batches=2, name='test_overlap')
+        futures = [batcher.submit(i) for i in range(2)]
+        self.assertEqual([f.result(timeout=3) for f in futures], [0, 1])
+        batcher.close()
+
+    def test_in_flight_batches_are_bounded(self):
+        running, peak = [0], [0]
+        lock = threading.Lock()
+
+        def batch_fn(items):
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            threading.Event().wait(0.02)
+            with lock:
+                running[0] -= 1
+            return items
+
+        batcher = MicroBatcher(batch_fn, max_batch_size=1, max_wait_ms=0, max_concurrent_batches=2, name='test_bound')
+        for f in [batcher.submit(i) for i in range(8)]:
+            f.result(timeout=3)
+        batcher.close()
+        self.assertEqual(peak[0], 2)
+
+    def test_invalid_settings_rejected(self):
+        with self.assertRaises(ValueError):
+            MicroBatcher(lambda items: items, max_batch_size=0)
+        with self.assertRaises(ValueError):
+            MicroBatcher(lambda items: items, max_wait_ms=-1)
+        with self.assertRaises(ValueError):
+            MicroBatcher(lambda items: items, max_concurrent_batches=0)
+
+    def test_get_llm_responses_keeps_order(self):
+        responses = get_llm_responses([
+            ("first?", None, True),
+            ("second?", None, False),
+        ])
+        self.assertEqual(len(responses), 2)
+        self.assertIn("first?", responses[0])
+        self.assertIn("PRAW was INACTIVE", responses[1])
+
+if __name__ == '__main__':
+    unittest.main()
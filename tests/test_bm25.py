@@ -0,0 +1,80 @@
+import math
+import unittest
+from collections import Counter
+import numpy as np
+from app.bm25 import BM25Index, select_context_posts, tokenize, BM25_K1, BM25_B
+
+DOCS = [
+    "Python decorators explained with examples",
+    "How to write a decorator that takes arguments in Python",
+    "Rust ownership and borrowing",
+    "Python python python list comprehension",
+    "",
+]
+
+def reference_bm25(query, docs, k1=BM25_K1, b=BM25_B):
+    """Straightforward per-document BM25, used to check the vectorized index."""
+    tokenized = [Counter(tokenize(doc)) for doc in docs]
+    lengths = [sum(doc.values()) for doc in tokenized]
+    avg_length = sum(lengths) / len(docs)
+    scores = []
+    for doc, length in zip(tokenized, lengths):
+        score = 0.0
+        for term in set(tokenize(query)):
+            if term not in doc:
+                continue
+            df = sum(1 for other in tokenized if term in other)
+            idf = math.log(1 + (len(docs) - df + 0.5) / (df + 0.5))
+            tf = doc[term]
+            score += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * length / avg_length))
+        scores.append(score)
+    return scores
+
+class TestBM25Index(unittest.TestCase):
+
+    def test_scores_match_reference_implementation(self):
+        index = BM25Index(DOCS)
+        for query in ["python decorator", "rust", "comprehension python python", "nothing matches"]:
+            np.testing.assert_allclose(index.score(query), reference_bm25(query, DOCS), rtol=1e-5, atol=1e-6)
+
+    def test_csr_layout(self):
+        index = BM25Index(DOCS)
+        self.assertEqual(index.indptr[-1], len(index.postings_docs))
+        python_id = index.vocabulary['python']
+        postings = index.postings_docs[index.indptr[python_id]:index.indptr[python_id + 1]]
+        self.assertEqual(sorted(postings.tolist()), [0, 1, 3])
+
+    def test_top_k_orders_and_limits(self):
+        index = BM25Index(DOCS)
+        results = index.top_k("python decorator", k=2)
+        self.assertEqual(len(results), 2)
+        self.assertIn(results[0][0], (0, 1))
+        self.assertGreaterEqual(results[0][1], results[1][1])
+        self.assertEqual(index.top_k("kubernetes"), [])
+
+    def test_top_k_tie_breaker(self):
+        index = BM25Index(["same words", "same words", "same words"])
+        results = index.top_k("same", k=2, tie_breaker=np.array([1, 50, 10]))
+        self.assertEqual([doc for doc, _ in results], [1, 2])
+
+    def test_empty_index(self):
+        index = BM25Index([])
+        self.assertEqual(index.score("python").shape, (0,))
+        self.assertEqual(index.top_k("python"), [])
+
+    def test_select_context_posts_keeps_listing_order(self):
+        posts = [{'id': str(i), 'title': title, 'selftext': ''} for i, title in enumerate(DOCS)]
+        selected = select_context_posts("rust borrowing", posts, limit=2)
+        self.assertEqual(len(selected), 2)
+        self.assertIn(posts[2], selected)
+        self.assertEqual(selected, sorted(selected, key=lambda post: int(post['id'])))
+        self.assertEqual(select_context_posts("anything", posts[:2], limit=5), posts[:2])
+
+    def test_select_context_posts_from_ranked_ids(self):
+        posts = [{'id': str(i), 'title': title, 'selftext': ''} for i, title in enumerate(DOCS)]
+        selected = select_context_posts("ignored", posts, limit=2, ranked_ids=['3', 'unknown'])
+        # The ranked post comes first; the free slot is filled in listing order.
+        self.assertEqual(selected, [posts[0], posts[3]])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import unittest
+from app.cancellation import CancellationToken, CancellationRegistry, DuplicateRequest, RequestCancelled
+from app.llm_utils import stream_llm_response
+
+class TestCancellation(unittest.TestCase):
+
+    def test_token_cancel_runs_callbacks_once(self):
+        token = CancellationToken()
+        calls = []
+        token.add_callback(lambda: calls.append('a'))
+        self.assertFalse(token.cancelled)
+        token.cancel()
+        token.cancel()
+        self.assertTrue(token.cancelled)
+        self.assertEqual(calls, ['a'])
+
+    def test_callback_added_after_cancel_runs_immediately(self):
+        token = CancellationToken()
+        token.cancel()
+        calls = []
+        token.add_callback(lambda: calls.append('late'))
+        self.assertEqual(calls, ['late'])
+        with self.assertRaises(RequestCancelled):
+            token.raise_if_cancelled()
+
+    def test_registry_cancel_by_id(self):
+        registry = CancellationRegistry()
+        token = registry.register('req-1')
+        self.assertTrue(registry.cancel('req-1'))
+        self.assertTrue(token.cancelled)
+        self.assertFalse(registry.cancel('req-1')) # Already removed
+        self.assertFalse(registry.cancel('unknown'))
+
+    def test_registry_without_id_is_unreachable(self):
+        registry = CancellationRegistry()
+        token = registry.register(None)
+        self.assertEqual(len(registry), 0)
+        self.assertFalse(token.cancelled)
+        token = registry.register('req-2')
+        registry.unregister('req-2', token)
+        self.assertEqual(len(registry), 0)
+
+    def test_registry_rejects_ids_in_flight(self):
+        registry = CancellationRegistry()
+        first = registry.register('req-3')
+        with self.assertRaises(DuplicateRequest):
+            registry.register('req-3')
+        registry.cancel('req-3')
+        second = registry.register('req-3') # The id is free again once cancelled
+        registry.unregister('req-3', first) # The cancelled request finishes later...
+        self.assertTrue(registry.cancel('req-3')) # ...without unregistering the newer one
+        self.assertTrue(second.cancelled)
+
+    def test_registry_scopes_ids_by_owner(self):
+        registry = CancellationRegistry()
+        mine = registry.register('req-4', owner='10.0.0.1')
+        theirs = registry.register('req-4', owner='10.0.0.2')
+        self.assertFalse(registry.cancel('req-4')) # Without an owner
+        self.assertTrue(registry.cancel('req-4', owner='10.0.0.2'))
+        self.assertTrue(theirs.cancelled)
+        self.assertFalse(mine.cancelled)
+
+    def test_stream_llm_response_concatenates_to_full_reply(self):
+        chunks = list(stream_llm_response("What is the GIL?", None, praw_available_for_llm=False, words_per_chunk=3))
+        self.assertGreater(len(chunks), 1)
+        self.assertIn("What is the GIL?", "".join(chunks))
+
+    def test_stream_llm_response_stops_when_cancelled(self):
+        token = CancellationToken()
+        stream = stream_llm_response("What is the GIL?", None, cancel_token=token, words_per_chunk=1)
+        next(stream)
+        token.cancel()
+        with self.assertRaises(RequestCancelled):
+            next(stream)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,154 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+import numpy as np
+from app.columnar import ColumnarStore, KIND_SUBMISSION, KIND_COMMENT
+
+DAY = 86400
+T0 = 1700006400.0  # 2023-11-15 00:00 UTC
+
+class TestColumnarStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.store = ColumnarStore(self.tmpdir.name)
+        self.store.add_submissions('Python', [
+            {'id': 's1', 'created_utc': T0 + 10, 'score': 5, 'num_comments': 2, 'author': 'alice', 'flair': 'Help', 'domain': 'self.python'},
+            {'id': 's2', 'created_utc': T0 + DAY + 10, 'score': 7, 'num_comments': 0, 'author': 'bob', 'flair': None, 'domain': 'github.com'},
+        ])
+        self.store.add_comments('python', [
+            {'id': 'c1', 'created_utc': T0 + 20, 'score': 3, 'author': 'bob'},
+            {'id': 'c2', 'created_utc': T0 + 30, 'score': 1, 'author': None},
+        ])
+        self.store.add_submissions('rust', [{'id': 'r1', 'created_utc': T0, 'score': 9, 'author': 'alice'}])
+        self.assertEqual(self.store.flush(), 2)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_partitions_by_subreddit_and_month(self):
+        self.assertEqual([(p.subreddit, p.start.isoformat(), p.end.isoformat(), len(p)) for p in self.store.partitions()],
+                         [('python', '2023-11-01', '2023-12-01', 4), ('rust', '2023-11-01', '2023-12-01', 1)])
+        self.assertEqual(len(self.store), 5)
+        self.assertEqual(self.store.partitions(since=T0 + 30 * DAY), [])
+
+    def write_day_partition(self, subreddit, day, ids, created, scores):
+        """Writes a partition the way older versions of the store did (one per day)."""
+        directory = os.path.join(self.tmpdir.name, subreddit, day)
+        os.makedirs(directory)
+        count = len(ids)
+        for name, values in {'id': np.array(ids), 'kind': np.full(count, KIND_SUBMISSION, dtype=np.int8),
+                             'created_utc': np.array(created), 'score': np.array(scores, dtype=np.int32),
+                             'num_comments': np.zeros(count, dtype=np.int32),
+                             **{column: np.full(count, -1, dtype=np.int32) for column in ('author', 'flair', 'domain')}}.items():
+            np.save(os.path.join(directory, f'{name}.npy'), values)
+        return directory
+
+    def test_day_partitions_are_merged_into_months(self):
+        november = self.write_day_partition('golang', '2023-11-16', ['g2', 'g1'], [T0 + DAY + 5, T0 + DAY], [2, 1])
+        december = self.write_day_partition('golang', '2023-12-01', ['g3'], [T0 + 16 * DAY], [3])
+        store = ColumnarStore(self.tmpdir.name)
+        self.assertEqual([p.start.isoformat() for p in store.partitions('golang')], ['2023-11-16', '2023-12-01'])
+        # A flush of the month folds its day partitions in.
+        store.add_submissions('golang', [{'id': 'g1', 'created_utc': T0 + DAY, 'score': 10}])
+        store.flush()
+        self.assertFalse(os.path.exists(november))
+        self.assertEqual(store.compact(), 1)
+        self.assertFalse(os.path.exists(december))
+        self.assertEqual(store.compact(), 0)
+        reopened = ColumnarStore(self.tmpdir.name)
+        self.assertEqual([p.start.isoformat() for p in reopened.partitions('golang')], ['2023-11-01', '2023-12-01'])
+        columns = reopened.scan(['id', 'score'], subreddit='golang')
+        self.assertEqual(list(columns['id']), ['g1', 'g2', 'g3'])
+        self.assertEqual(columns['score'].tolist(), [10, 2, 3])
+
+    def test_columns_are_typed_and_memory_mapped(self):
+        partition = self.store.partitions('python')[0]
+        self.assertNotIsInstance(partition.column('score'), np.memmap)
+        with patch('app.columnar.MMAP_MIN_BYTES', 0):
+            partition = ColumnarStore(self.tmpdir.name).partitions('python')[0]
+            self.assertIsInstance(partition.column('score'), np.memmap)
+        self.assertEqual(partition.column('score').dtype, np.int32)
+        self.assertEqual(partition.column('author').dtype, np.int32)
+
+    def test_dictionary_encoding(self):
+        columns = self.store.scan(['id', 'author', 'flair'], subreddit='PYTHON')
+        self.assertEqual(list(columns['id']), ['s1', 'c1', 'c2', 's2'])
+        self.assertEqual(self.store.decode('author', columns['author']), ['alice', 'bob', None, 'bob'])
+        self.assertEqual(self.store.decode('flair', columns['flair']), ['Help', None, None, None])
+
+    def test_scan_filters(self):
+        self.assertEqual(list(self.store.scan(['id'], since=T0 + DAY)['id']), ['s2'])
+        self.assertEqual(list(self.store.scan(['id'], subreddit='python', until=T0 + 25)['id']), ['s1', 'c1'])
+        self.assertEqual(list(self.store.scan(['id'], subreddit='python', kind=KIND_COMMENT)['id']), ['c1', 'c2'])
+        self.assertEqual(len(self.store.scan(['score'], subreddit='golang')['score']), 0)
+
+    def test_flush_replaces_items_with_same_id(self):
+        self.store.add_submissions('python', [{'id': 's1', 'created_utc': T0 + 10, 'score': 50, 'author': 'alice'}])
+        self.store.flush()
+        columns = self.store.scan(['id', 'score'], subreddit='python', kind=KIND_SUBMISSION)
+        self.assertEqual(dict(zip(columns['id'], columns['score'].tolist())), {'s1': 50, 's2': 7})
+
+    def test_reopen_from_disk(self):
+        reopened = ColumnarStore(self.tmpdir.name)
+        self.assertEqual(len(reopened), 5)
+        self.assertEqual(reopened.decode('author', reopened.scan(['author'], subreddit='rust')['author']), ['alice'])
+        # New strings continue the persisted dictionary.
+        self.assertEqual(reopened.dictionaries['author'].encode('carol'), 2)
+
+    def test_refresh_reads_another_writers_codes(self):
+        reader = ColumnarStore(self.tmpdir.name)
+        writer = ColumnarStore(self.tmpdir.name)
+        writer.add_submissions('go', [{'id': 'g1', 'created_utc': T0, 'author': 'carol', 'flair': 'Show'}])
+        writer.flush()
+        reader.refresh()
+        columns = reader.scan(['author', 'flair'], subreddit='go')
+        self.assertEqual(reader.decode('author', columns['author']), ['carol'])
+        self.assertEqual(reader.decode('flair', columns['flair']), ['Show'])
+        # Codes missing from a stale dictionary are read on decode.
+        writer.add_submissions('go', [{'id': 'g2', 'created_utc': T0, 'author': 'dave'}])
+        writer.flush()
+        self.assertEqual(reader.decode('author', writer.scan(['author'], subreddit='go')['author']), ['carol', 'dave'])
+
+    def test_writers_share_one_dictionary(self):
+        first = ColumnarStore(self.tmpdir.name)
+        second = ColumnarStore(self.tmpdir.name)
+        first.add_submissions('go', [{'id': 'g1', 'created_utc': T0, 'author': 'carol'}])
+        second.add_submissions('zig', [{'id': 'z1', 'created_utc': T0, 'author': 'dave'}])
+        first.flush()
+        second.flush()
+        reopened = ColumnarStore(self.tmpdir.name)
+        self.assertEqual(reopened.decode('author', reopened.scan(['author'], subreddit='go')['author']), ['carol'])
+        self.assertEqual(reopened.decode('author', reopened.scan(['author'], subreddit='zig')['author']), ['dave'])
+        self.assertEqual(reopened.dictionaries['author'].values, ['alice', 'bob', 'carol', 'dave'])
+
+    def test_flush_publishes_a_new_partition_version(self):
+        old = self.store.partitions('rust')[0]
+        reader = ColumnarStore(self.tmpdir.name)
+        self.store.add_submissions('rust', [{'id': 'r2', 'created_utc': T0 + 5, 'score': 1}])
+        self.store.flush()
+        new = self.store.partitions('rust')[0]
+        self.assertEqual((old.version, new.version), (1, 2))
+        self.assertFalse(os.path.exists(old.directory))
+        self.assertEqual(os.listdir(os.path.dirname(new.directory)), [os.path.basename(new.directory)])
+        # A reader still holding the old partition list re-reads it.
+        self.assertEqual(list(reader.scan(['id'], subreddit='rust')['id']), ['r1', 'r2'])
+
+    def test_reads_legacy_dictionaries(self):
+        directory = os.path.join(self.tmpdir.name, '_dictionaries')
+        for name in ('author', 'flair', 'domain'):
+            values = self.store.dictionaries[name].values
+            os.remove(os.path.join(directory, f'{name}.jsonl'))
+            with open(os.path.join(directory, f'{name}.json'), 'w') as f:
+                json.dump(values, f)
+        store = ColumnarStore(self.tmpdir.name)
+        self.assertEqual(store.decode('author', store.scan(['author'], subreddit='rust')['author']), ['alice'])
+        store.add_submissions('go', [{'id': 'g1', 'created_utc': T0, 'author': 'carol'}])
+        store.flush()
+        self.assertFalse(os.path.exists(os.path.join(directory, 'author.json')))
+        self.assertEqual(ColumnarStore(self.tmpdir.name).dictionaries['author'].values, ['alice', 'bob', 'carol'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,6 @@
 import unittest
-from app.core_utils import parse_subreddit_and_question
+from app.core_utils import (QueryFilters, describe_subreddits, parse_query, parse_subreddit_and_question,
+                            parse_subreddits_and_question)
 
 class TestCoreUtils(unittest.TestCase):
 
@@ -69,5 +70,71 @@ class TestCoreUtils(unittest.TestCase):
         self.assertEqual(subreddit, "ask")
         self.assertEqual(question, "")
 
+    def test_parse_multiple_subreddits(self):
+        message = "@r/python, @r/golang @r/Python which is better for CLIs?"
+        subreddits, question = parse_subreddits_and_question(message)
+        self.assertEqual(subreddits, ["python", "golang"])
+        self.assertEqual(question, "which is better for CLIs?")
+
+    def test_parse_multiple_subreddits_without_tags(self):
+        subreddits, question = parse_subreddits_and_question("  what about @r/python? ")
+        self.assertEqual(subreddits, [])
+        self.assertEqual(question, "what about @r/python?")
+
+    def test_describe_subreddits(self):
+        self.assertEqual(describe_subreddits({'name': 'python'}), "r/python")
+        contexts = {'subreddits': [{'display_name': 'a'}, {'display_name': 'b'}, {'name': 'c'}]}
+        self.assertEqual(describe_subreddits(contexts), "r/a, r/b and r/c")
+
+    def test_parse_query_with_inline_filters(self):
+        query = parse_query('@r/python, @r/golang top:week flair:"Help Wanted" since:24h which is easier to deploy?')
+        self.assertEqual(query.subreddits, ["python", "golang"])
+        self.assertEqual(query.question, "which is easier to deploy?")
+        self.assertEqual(query.filters, QueryFilters(sort='top', time_filter='week', flair='Help Wanted', since_seconds=86400))
+
+    def test_parse_query_bare_sort_word_only_in_header(self):
+        self.assertEqual(parse_query("@r/rust new, what broke?").filters.sort, "new")
+        query = parse_query("@r/python new features in 3.13?")
+        self.assertEqual(query.question, "new features in 3.13?")
+        self.assertFalse(query.filters)
+
+    def test_parse_query_filters_in_question_and_invalid_values(self):
+        query = parse_query("@r/django what changed since:2d in the ORM?")
+        self.assertEqual(query.question, "what changed in the ORM?")
+        self.assertEqual(query.filters.since_seconds, 2 * 86400)
+        query = parse_query("@r/django top:fortnight what changed?")
+        self.assertEqual(query.question, "top:fortnight what changed?")
+        self.assertIsNone(query.filters.sort)
+        self.assertEqual(parse_query("what about @r/python?").subreddits, [])
+
+    def test_parse_query_sort_words_need_a_tag(self):
+        for message in ("new", "top", "hot, cold?", "rising prices?"):
+            query = parse_query(message)
+            self.assertEqual((query.subreddits, query.question), ([], message))
+            self.assertFalse(query.filters)
+        query = parse_query("@r/python top")
+        self.assertEqual((query.question, query.filters.sort), ("", "top"))
+
+    def test_parse_query_header_filters_are_not_modified_by_question_filters(self):
+        self.assertEqual(parse_query("@r/go top:week what changed since:2d here?").filters,
+                         QueryFilters(sort='top', time_filter='week', since_seconds=2 * 86400))
+        self.assertEqual(parse_query("@r/rust top:week what changed?").filters, QueryFilters(sort='top', time_filter='week'))
+
+    def test_parse_query_tags_come_first(self):
+        query = parse_query("@R/python top:week new, @r/golang what changed?")
+        self.assertEqual(query.subreddits, ["python"])
+        self.assertEqual(query.question, "@r/golang what changed?")
+        self.assertEqual(query.filters, QueryFilters(sort='new', time_filter='week'))
+        query = parse_query("@r/rust new top:day since:\"3mo\" FLAIR:Help,\nwhy?")
+        self.assertEqual(query.question, "why?")
+        self.assertEqual(query.filters, QueryFilters(sort='top', time_filter='day', flair='Help',
+                                                     since_seconds=3 * 30 * 86400))
+
+    def test_query_filters_match_posts(self):
+        filters = QueryFilters(sort='top', time_filter='day', flair='help')
+        self.assertTrue(filters.matches({'flair': 'Help', 'created_utc': 1000.0}, now=1000.0 + 3600))
+        self.assertFalse(filters.matches({'flair': 'Help', 'created_utc': 1000.0}, now=1000.0 + 2 * 86400))
+        self.assertFalse(filters.matches({'flair': None, 'created_utc': 1000.0}, now=1000.0))
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,78 @@
+import unittest
+import numpy as np
+from app.dedup import (MinHasher, LSHIndex, band_keys, collapse_near_duplicates, estimate_similarity,
+                       shingle_hashes, word_hashes, NUM_BANDS)
+
+POST = ("Is it worth learning Rust in 2024 if I already know C++ and Python well enough "
+        "for my job as a backend developer at a small startup")
+REPOST = POST.upper() + " thanks"
+OTHER = "What is the cheapest way to deploy a Flask app with nginx and gunicorn on a small VPS"
+
+def jaccard(a, b):
+    a, b = set(a), set(b)
+    return len(a & b) / len(a | b)
+
+class TestMinHash(unittest.TestCase):
+
+    def setUp(self):
+        self.hasher = MinHasher()
+
+    def test_word_hashes_split_texts_and_ignore_case(self):
+        hashes, text_of_word = word_hashes(["Hello, world", "", "hello café"])
+        self.assertEqual(text_of_word.tolist(), [0, 0, 2, 2])
+        self.assertEqual(hashes[0], hashes[2])
+        self.assertEqual(len(set(hashes.tolist())), 3)
+
+    def test_short_texts_are_one_shingle(self):
+        shingles, text_of_shingle = shingle_hashes(*word_hashes(["a b", "c d e f"]))
+        self.assertEqual(text_of_shingle.tolist(), [0, 1, 1])
+
+    def test_batch_matches_single_signatures(self):
+        texts = [POST, "", REPOST, OTHER, "hi"]
+        signatures = self.hasher.signatures(texts)
+        self.assertEqual(signatures.shape, (5, self.hasher.num_permutations))
+        for text, row in zip(texts, signatures):
+            np.testing.assert_array_equal(self.hasher.signature(text), row)
+
+    def test_similarity_estimates_jaccard(self):
+        rng = np.random.default_rng(0)
+        words = [f"w{i}" for i in range(3000)]
+        base = rng.permutation(words).tolist()
+        first, second = ' '.join(base[:2000]), ' '.join(base[1000:])
+        truth = jaccard(shingle_hashes(*word_hashes([first]))[0].tolist(),
+                        shingle_hashes(*word_hashes([second]))[0].tolist())
+        estimate = estimate_similarity(*self.hasher.signatures([first, second]))[0]
+        self.assertAlmostEqual(estimate, truth, delta=0.12)
+
+    def test_empty_texts_match_nothing(self):
+        signatures = self.hasher.signatures(["", ""])
+        self.assertEqual(estimate_similarity(signatures[0], signatures)[1], 0.0)
+
+    def test_band_keys_shape(self):
+        keys = band_keys(self.hasher.signatures([POST, REPOST]))
+        self.assertEqual(keys.shape, (2, NUM_BANDS))
+        self.assertEqual(keys.dtype, np.int64)
+        self.assertGreater(len(set(keys[0].tolist()) & set(keys[1].tolist())), 0)
+
+class TestLSH(unittest.TestCase):
+
+    def test_index_finds_near_duplicates_only(self):
+        hasher = MinHasher()
+        index = LSHIndex(threshold=0.8)
+        post, other, repost = hasher.signatures([POST, OTHER, REPOST])
+        index.add('post', post)
+        index.add('other', other)
+        self.assertEqual([item_id for item_id, _ in index.query(repost)], ['post'])
+        self.assertEqual(index.query(post, exclude='post'), [])
+        index.remove('post')
+        self.assertEqual(index.query(repost), [])
+        self.assertEqual(len(index), 1)
+
+    def test_collapse_keeps_first_copy(self):
+        posts = [{'id': 'a', 'text': POST}, {'id': 'b', 'text': OTHER}, {'id': 'c', 'text': REPOST}]
+        kept, duplicates = collapse_near_duplicates(posts, [post['text'] for post in posts])
+        self.assertEqual([post['id'] for post in kept], ['a', 'b'])
+        self.assertEqual(duplicates, {2: 0})
+
+if __name__ == '__main__':
+    unittest.main()
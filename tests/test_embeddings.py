@@ -0,0 +1,135 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+from app.embeddings import HashingEmbedder, EmbeddingIndex, write_index, build_from_corpus, quantize_int8
+from app.storage import CorpusStore
+
+class TestEmbeddingIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.embedder = HashingEmbedder(dim=64)
+        self.texts = ["python decorators", "rust ownership", "python web frameworks", "go concurrency", "python packaging"]
+        self.subreddits = ["Python", "rust", "python", "golang", "python"]
+        self.created = [300.0, 100.0, 100.0, 50.0, 200.0]
+        self.item_ids = ["p1", "r1", "p2", "g1", "p3"]
+        write_index(self.tmpdir.name, self.embedder.embed_batch(self.texts), self.item_ids, self.subreddits, self.created)
+        self.index = EmbeddingIndex.open(self.tmpdir.name)
+
+    def tearDown(self):
+        del self.index
+        self.tmpdir.cleanup()
+
+    def test_embedder_is_unit_length_and_deterministic(self):
+        vector = self.embedder.embed("Python decorators explained")
+        self.assertAlmostEqual(float(np.linalg.norm(vector)), 1.0, places=5)
+        np.testing.assert_array_equal(vector, self.embedder.embed("python DECORATORS explained"))
+        self.assertFalse(self.embedder.embed("the a of").any())
+
+    def test_index_is_memory_mapped(self):
+        self.assertIsInstance(self.index.vectors, np.memmap)
+        self.assertEqual((len(self.index), self.index.dim), (5, 64))
+
+    def test_search_exact_match_first(self):
+        results = self.index.search(self.embedder.embed("rust ownership"), k=2)
+        self.assertEqual(results[0][0], "r1")
+        self.assertAlmostEqual(results[0][1], 1.0, places=5)
+        self.assertEqual(len(results), 2)
+
+    def test_search_matches_brute_force(self):
+        query = self.embedder.embed("python frameworks")
+        vectors = self.embedder.embed_batch(self.texts)
+        expected_scores = np.sort(vectors @ query)[::-1][:3]
+        np.testing.assert_allclose([score for _, score in self.index.search(query, k=3)], expected_scores, rtol=1e-5)
+
+    def test_subreddit_and_time_filters(self):
+        query = self.embedder.embed("python")
+        self.assertEqual({i for i, _ in self.index.search(query, k=10, subreddit="PYTHON")}, {"p1", "p2", "p3"})
+        in_window = self.index.search(query, k=10, subreddit="python", since=150.0, until=300.0)
+        self.assertEqual([i for i, _ in in_window], ["p3"])
+        self.assertEqual({i for i, _ in self.index.search(query, k=10, since=200.0)}, {"p1", "p3"})
+        self.assertEqual(self.index.search(query, k=10, subreddit="unknown"), [])
+
+    def test_build_from_corpus(self):
+        store = CorpusStore(os.path.join(self.tmpdir.name, 'corpus.db'))
+        store.add_submissions('learnpython', [{'id': 's1', 'title': 'Decorators', 'selftext': 'wrap functions'},
+                                              {'id': 's2', 'title': 'Packaging', 'selftext': None}])
+        out = os.path.join(self.tmpdir.name, 'index')
+        self.assertEqual(build_from_corpus(store, out, self.embedder), 2)
+        index = EmbeddingIndex.open(out)
+        self.assertEqual(index.search(self.embedder.embed("decorators wrap functions"), k=1, subreddit='learnpython')[0][0], 's1')
+        store.close()
+    def test_quantize_int8_reconstruction_error(self):
+        vectors = self.embedder.embed_batch(self.texts)
+        codes, scales = quantize_int8(vectors)
+        self.assertEqual((codes.dtype, scales.dtype), (np.int8, np.float32))
+        self.assertEqual(int(np.abs(codes).max()), 127)
+        error = np.abs(codes * scales[:, None] - vectors).max(axis=1)
+        self.assertTrue(np.all(error <= scales / 2 + 1e-7))
+        codes, scales = quantize_int8(np.zeros((1, 4), dtype=np.float32)) # All-zero vector
+        self.assertFalse(codes.any())
+
+    def test_quantized_index_search_and_rescore(self):
+        out = os.path.join(self.tmpdir.name, 'quantized')
+        vectors = self.embedder.embed_batch(self.texts)
+        write_index(out, vectors, self.item_ids, self.subreddits, self.created, quantize=True)
+        index = EmbeddingIndex.open(out)
+        self.assertTrue(index.quantized)
+        self.assertLess(index.scan_nbytes, self.index.scan_nbytes)
+        query = self.embedder.embed("python web frameworks")
+        exact = self.index.search(query, k=3)
+        rescored = index.search(query, k=3)
+        self.assertEqual(rescored[0][0], "p2")
+        np.testing.assert_allclose([score for _, score in rescored], [score for _, score in exact], rtol=1e-5)
+        approximate = index.search(query, k=3, rescore=False)
+        self.assertEqual(approximate[0][0], "p2")
+        self.assertAlmostEqual(approximate[0][1], exact[0][1], places=2)
+        self.assertEqual({i for i, _ in index.search(query, k=10, subreddit='python', rescore=False)}, {"p1", "p2", "p3"})
+
+    def test_quantized_index_without_float32(self):
+        out = os.path.join(self.tmpdir.name, 'int8_only')
+        write_index(out, self.embedder.embed_batch(self.texts), self.item_ids, self.subreddits, self.created,
+                    quantize=True, keep_float32=False)
+        index = EmbeddingIndex.open(out)
+        self.assertIsNone(index.vectors)
+        self.assertEqual(index.search(self.embedder.embed("go concurrency"), k=1)[0][0], "g1")
+        with self.assertRaises(ValueError):
+            write_index(out, np.zeros((1, 4)), ["x"], ["s"], [0.0], quantize=False, keep_float32=False)
+    def test_semantic_search_uses_ivf_with_exact_fallback(self):
+        from unittest.mock import patch
+        from app import routes
+        from app.ann import IVFIndex, build_ivf
+        build_ivf(self.tmpdir.name, self.index.vectors, self.index.item_ids, num_lists=2)
+        ivf = IVFIndex.open(self.tmpdir.name)
+        with patch('app.routes.embedding_index', self.index), patch('app.routes.embedder', self.embedder), \
+                patch('app.routes.ivf_index', ivf), patch('app.routes.IVF_NPROBE', 2):
+            with patch.object(ivf, 'search', wraps=ivf.search) as ivf_search:
+                self.assertEqual(routes.semantic_search("python packaging", 'python', k=1), ['p3'])
+                ivf_search.assert_called_once()
+            # Fewer than k rows of the subreddit in the probed lists: scans the subreddit exactly
+            self.assertEqual(sorted(routes.semantic_search("python", 'python', k=5)), ['p1', 'p2', 'p3'])
+        del ivf
+
+    def test_stale_ivf_index_falls_back_to_exact_search(self):
+        import shutil
+        from app import routes
+        from app.ann import IVF_META_FILE, build_ivf
+        build_ivf(self.tmpdir.name, self.index.vectors, self.index.item_ids, num_lists=2)
+        self.assertIsNotNone(routes.open_embedding_index(self.tmpdir.name)[1])
+        with tempfile.TemporaryDirectory() as saved:
+            for name in os.listdir(self.tmpdir.name):
+                if name.startswith('ivf_'):
+                    shutil.copy(os.path.join(self.tmpdir.name, name), saved)
+            write_index(self.tmpdir.name, self.embedder.embed_batch(self.texts + ["aardvark animals"]),
+                        self.item_ids + ["a1"], self.subreddits + ["aardvark"], self.created + [0.0])
+            for name in os.listdir(saved): # An IVF index left over from before the rebuild
+                shutil.copy(os.path.join(saved, name), self.tmpdir.name)
+        self.assertTrue(os.path.exists(os.path.join(self.tmpdir.name, IVF_META_FILE)))
+        index, ivf, _ = routes.open_embedding_index(self.tmpdir.name)
+        self.assertIsNone(ivf)
+        self.assertEqual(index.search(self.embedder.embed("aardvark animals"), k=1, subreddit='aardvark')[0][0], 'a1')
+        del index
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import unittest
+from app.extractive import tokenize, rank_passages, best_snippet, extractive_answer, passages_from_subreddit_info
+
+SUBREDDIT_INFO = {
+    'display_name': 'learnpython',
+    'posts': [
+        {'title': 'What is a decorator?', 'selftext': 'A decorator wraps a function. It returns a new function.',
+         'permalink': 'https://www.reddit.com/r/learnpython/comments/a1/', 'score': 120},
+        {'title': 'Best resources for beginners', 'selftext': 'Automate the Boring Stuff is great.',
+         'permalink': 'https://www.reddit.com/r/learnpython/comments/a2/', 'score': 300},
+        {'title': 'List comprehension vs map', 'selftext': '',
+         'permalink': 'https://www.reddit.com/r/learnpython/comments/a3/', 'score': 50},
+    ],
+}
+
+class TestExtractive(unittest.TestCase):
+
+    def test_tokenize_lowercases_and_drops_stopwords(self):
+        self.assertEqual(tokenize("What is a Python decorator?"), ["python", "decorator"])
+        self.assertEqual(tokenize(None), [])
+
+    def test_passages_from_subreddit_info(self):
+        passages = passages_from_subreddit_info(SUBREDDIT_INFO)
+        self.assertEqual(len(passages), 3)
+        self.assertEqual(passages[2]['text'], 'List comprehension vs map')
+        self.assertEqual(passages_from_subreddit_info(None), [])
+
+    def test_rank_passages_best_match_first(self):
+        ranked = rank_passages("how do decorators wrap a function", passages_from_subreddit_info(SUBREDDIT_INFO))
+        self.assertEqual(ranked[0][1]['permalink'], 'https://www.reddit.com/r/learnpython/comments/a1/')
+        self.assertTrue(all(score > 0 for score, _ in ranked))
+
+    def test_rank_passages_no_overlap(self):
+        self.assertEqual(rank_passages("rust borrow checker", passages_from_subreddit_info(SUBREDDIT_INFO)), [])
+
+    def test_best_snippet_picks_matching_sentence(self):
+        text = "Intro sentence. Decorators wrap functions! Unrelated ending."
+        self.assertEqual(best_snippet("what do decorators wrap", text), "Decorators wrap functions!")
+        self.assertTrue(best_snippet("x", "word " * 100, max_chars=20).endswith("..."))
+
+    def test_extractive_answer_includes_permalinks(self):
+        answer = extractive_answer("good beginner resources", SUBREDDIT_INFO, top_k=1)
+        self.assertIn("r/learnpython", answer['reply'])
+        self.assertIn("https://www.reddit.com/r/learnpython/comments/a2/", answer['reply'])
+        self.assertEqual(len(answer['sources']), 1)
+        self.assertEqual(answer['sources'][0]['title'], 'Best resources for beginners')
+
+    def test_extractive_answer_none_without_match(self):
+        self.assertIsNone(extractive_answer("kubernetes", SUBREDDIT_INFO))
+        self.assertIsNone(extractive_answer("decorator", {'display_name': 'empty'}))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,5 @@
 import unittest
-from app.llm_utils import get_llm_response
+from app.llm_utils import get_llm_response, build_prompt, PrefixCacheTracker, QUESTION_HEADER, SYSTEM_PROMPT
 
 class TestLlmUtils(unittest.TestCase):
 
@@ -56,5 +56,57 @@ class TestLlmUtils(unittest.TestCase):
         self.assertNotIn("r/django", response) # Should not use subreddit_info if PRAW is marked inactive
         self.assertIn(question, response)
 
+    def test_build_prompt_prefix_is_canonical_and_question_last(self):
+        info_a = {'display_name': 'django', 'subscribers': 50000, 'public_description': 'Web framework.'}
+        info_b = {'public_description': 'Web framework.', 'subscribers': 50000, 'display_name': 'django'}
+        prefix_a, prompt_a = build_prompt("How do I migrate?", info_a)
+        prefix_b, prompt_b = build_prompt("What is an ORM?", info_b)
+        self.assertEqual(prefix_a, prefix_b) # Key order must not change the prefix bytes
+        self.assertTrue(prefix_a.startswith(SYSTEM_PROMPT))
+        self.assertTrue(prompt_a.startswith(prefix_a))
+        self.assertTrue(prompt_a.endswith("How do I migrate?"))
+        self.assertTrue(prompt_b.endswith("What is an ORM?"))
+
+    def test_build_prompt_questions_about_a_subreddit_share_the_prefix(self):
+        about = {'display_name': 'django', 'subscribers': 50000, 'activity': {'posts_per_day': 12.5}}
+        info_a = {**about, 'posts': [{'id': 'p1', 'title': 'Migrations'}],
+                  'sentiment': {'posts': {'items': 1, 'mean': 0.4}, 'subreddit': {'items': 90, 'mean': 0.1}}}
+        info_b = {**about, 'posts': [{'id': 'p2', 'title': 'ORM joins'}], 'filters': {'sort': 'top'},
+                  'sentiment': {'posts': {'items': 1, 'mean': -0.2}, 'subreddit': {'items': 90, 'mean': 0.1}}}
+        prefix_a, prompt_a = build_prompt("How do I migrate?", info_a)
+        prefix_b, prompt_b = build_prompt("How do I join?", info_b)
+        self.assertEqual(prefix_a, prefix_b)
+        self.assertIn('"subreddit":{"items":90', prefix_a) # Subreddit-wide sentiment is per subreddit
+        for prefix, prompt, post_id in ((prefix_a, prompt_a, 'p1'), (prefix_b, prompt_b, 'p2')):
+            retrieved = prompt[len(prefix):prompt.index(QUESTION_HEADER)]
+            self.assertIn(post_id, retrieved)
+            self.assertIn('posts_sentiment', retrieved)
+        prefix_c, _ = build_prompt("Compare?", {'subreddits': [info_a, {'display_name': 'flask'}]})
+        prefix_d, _ = build_prompt("Which?", {'subreddits': [info_b, {'display_name': 'flask'}]})
+        self.assertEqual(prefix_c, prefix_d)
+
+    def test_build_prompt_without_subreddit_info(self):
+        prefix, prompt = build_prompt("Hello?")
+        self.assertEqual(prefix, SYSTEM_PROMPT)
+        self.assertTrue(prompt.endswith("Hello?"))
+
+    def test_prefix_cache_tracker_hits_and_eviction(self):
+        # Own metric names, so the counters do not see other tests' prompts
+        tracker = PrefixCacheTracker(capacity=2, name='test_prefix_cache_eviction')
+        self.assertFalse(tracker.record("prefix-a"))
+        self.assertTrue(tracker.record("prefix-a"))
+        tracker.record("prefix-b")
+        tracker.record("prefix-c") # Evicts prefix-a (least recently used)
+        self.assertFalse(tracker.record("prefix-a"))
+        self.assertTrue(tracker.record("prefix-c"))
+        self.assertEqual((tracker.hits.value, tracker.misses.value), (2, 4))
+        self.assertAlmostEqual(tracker.hit_rate.value, 2 / 6)
+
+    def test_prefix_cache_tracker_uses_backend_report(self):
+        tracker = PrefixCacheTracker(name='test_prefix_cache_backend')
+        self.assertTrue(tracker.record("never seen", backend_cached_tokens=128))
+        self.assertFalse(tracker.record("never seen", backend_cached_tokens=0))
+        self.assertEqual((tracker.hits.value, tracker.misses.value), (1, 1))
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,143 @@
+import time
+import unittest
+from unittest.mock import patch
+import numpy as np
+from app.bm25 import BM25Index
+from app.segments import SegmentedIndex, SegmentedIndexCache
+
+class TestSegmentedIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.index = SegmentedIndex(seal_threshold=2, merge_factor=2, background_merge=False, name='test_segments')
+
+    def add_docs(self, count, start=0, subreddit='python'):
+        for i in range(start, start + count):
+            self.index.add(f"d{i}", f"document number{i} about topic{i % 3}", subreddit)
+
+    def test_buffer_seals_at_threshold(self):
+        self.add_docs(3)
+        stats = self.index.stats()
+        self.assertEqual((stats['segments'], stats['buffered'], stats['documents']), (1, 1, 3))
+        # Buffered documents are searchable before they are sealed.
+        self.assertEqual(self.index.search_text("number2")[0][0], "d2")
+
+    def test_unchanged_documents_are_not_replaced(self):
+        self.add_docs(3)
+        with patch.object(self.index.embedder, 'embed_batch', wraps=self.index.embedder.embed_batch) as embed_batch:
+            self.add_docs(3)
+            embed_batch.assert_not_called()
+            self.index.add("d0", "an edited document", 'python')
+        self.assertEqual(embed_batch.call_count, 1)
+        self.assertEqual(self.index.stats()['deleted'], 1)
+        self.assertEqual(self.index.search_text("edited")[0][0], "d0")
+
+    def test_search_text_restricted_to_item_ids(self):
+        self.add_docs(6)
+        results = self.index.search_text("document", k=10, item_ids={"d1", "d4", "missing"})
+        self.assertEqual(sorted(item_id for item_id, _ in results), ["d1", "d4"])
+
+    def test_merge_policy_compacts_segments(self):
+        self.add_docs(8)
+        self.assertEqual(self.index.stats()['segments'], 4)
+        self.assertGreater(self.index.maybe_merge(), 0)
+        stats = self.index.stats()
+        self.assertEqual(stats['segment_sizes'], [8])
+        self.assertEqual(len(self.index), 8)
+        self.assertEqual(self.index.search_text("number5")[0][0], "d5")
+
+    def test_force_merge(self):
+        self.add_docs(6)
+        self.index.delete("d3")
+        self.assertEqual(self.index.force_merge(), 1)
+        self.assertEqual(self.index.stats()['segment_sizes'], [5])
+        self.assertEqual(self.index.force_merge(), 0)
+
+    def test_deletes_and_updates_use_tombstones(self):
+        self.add_docs(4)
+        self.assertTrue(self.index.delete("d1"))
+        self.assertFalse(self.index.delete("d1"))
+        self.assertEqual(self.index.search_text("number1"), [])
+        self.index.add("d0", "completely rewritten text")
+        self.assertEqual(self.index.search_text("number0"), [])
+        self.assertEqual(self.index.search_text("rewritten")[0][0], "d0")
+        self.assertEqual(len(self.index), 3)
+        self.assertEqual(self.index.stats()['deleted'], 2)
+        # Segments with mostly deleted rows are rewritten without them.
+        self.index.maybe_merge()
+        self.assertEqual(self.index.stats()['deleted'], 0)
+        self.assertEqual(len(self.index), 3)
+
+    def test_scores_match_a_single_index(self):
+        texts = [f"document number{i} about topic{i % 3}" for i in range(6)]
+        self.add_docs(6)
+        expected = BM25Index(texts).top_k("topic1 number4", 3)
+        results = self.index.search_text("topic1 number4", k=3)
+        self.assertEqual([item_id for item_id, _ in results], [f"d{i}" for i, _ in expected])
+        np.testing.assert_allclose([score for _, score in results], [score for _, score in expected], rtol=1e-4)
+
+    def test_vector_search_and_subreddit_filter(self):
+        self.add_docs(3)
+        self.add_docs(3, start=3, subreddit='Rust')
+        results = self.index.search("document number4 about topic1", k=2)
+        self.assertEqual(results[0][0], "d4")
+        self.assertAlmostEqual(results[0][1], 1.0, places=5)
+        filtered = self.index.search("document number4 about topic1", k=10, subreddit="python")
+        self.assertEqual({item_id for item_id, _ in filtered}, {"d0", "d1", "d2"})
+        self.assertEqual({i for i, _ in self.index.search_text("document", k=10, subreddit="rust")}, {"d3", "d4", "d5"})
+
+    def test_deletes_during_merge_are_carried_over(self):
+        self.add_docs(4)
+        # observe() runs after the merged segment is built, before it is swapped in.
+        with patch.object(self.index.merge_ms, 'observe', side_effect=lambda _: self.index.delete("d0")):
+            self.assertGreater(self.index.maybe_merge(), 0)
+        self.assertEqual(self.index.search_text("number0"), [])
+        self.assertEqual(len(self.index), 3)
+
+    def test_background_merge(self):
+        index = SegmentedIndex(seal_threshold=1, merge_factor=2, name='test_segments_bg')
+        try:
+            for i in range(4):
+                index.add(f"d{i}", f"text {i}")
+            for _ in range(100):
+                if index.stats()['segments'] == 1:
+                    break
+                index._merge_wakeup.set()
+                time.sleep(0.01)
+            self.assertEqual(index.stats()['segment_sizes'], [4])
+        finally:
+            index.close()
+
+    def test_max_documents_evicts_least_recently_added(self):
+        index = SegmentedIndex(seal_threshold=2, background_merge=False, name=None, vectors=False, max_documents=3)
+        index.add_many([{'id': f"d{i}", 'text': f"number{i}"} for i in range(3)])
+        index.add('d0', "number0") # Unchanged, but seen again
+        index.add('d3', "number3")
+        self.assertEqual(index.search_text("number1"), [])
+        self.assertEqual(len(index), 3)
+        self.assertEqual(index.search_text("number0")[0][0], "d0")
+        with self.assertRaises(ValueError):
+            index.search("number0")
+
+    def test_text_only_index_does_not_embed(self):
+        with patch('app.segments.HashingEmbedder.embed_batch') as embed_batch:
+            index = SegmentedIndex(seal_threshold=2, background_merge=False, name=None, vectors=False)
+            index.add_many([{'id': f"d{i}", 'text': f"number{i} topic"} for i in range(5)])
+            index.force_merge()
+        embed_batch.assert_not_called()
+        self.assertEqual(index.search_text("number4")[0][0], "d4")
+
+    def test_index_cache_is_bounded(self):
+        cache = SegmentedIndexCache(capacity=2, max_documents=4, seal_threshold=2, merge_factor=2, name='test_cache')
+        for round_ in range(10):
+            documents = [{'id': f"r{round_}d{i}", 'text': f"round{round_} number{i}"} for i in range(3)]
+            self.assertEqual(cache.rank('Python', documents, f"number1 round{round_}", 1), [f"r{round_}d1"])
+        self.assertEqual(len(cache.get('python')), 4)
+        cache.close()
+        cache.get('python').maybe_merge()
+        self.assertLessEqual(sum(len(segment) for segment in cache.get('python').segments), 8) # Merges drop evicted rows
+        cache.rank('rust', documents, "number1", 1)
+        cache.rank('golang', documents, "number1", 1) # Drops python, the least recently used
+        self.assertEqual(cache.stats(), {'subreddits': 2, 'documents': 6})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+from app.sentiment import SentimentLexicon, SentimentStore, summarize_scores
+from app.storage import CorpusStore
+
+class TestSentimentLexicon(unittest.TestCase):
+
+    def setUp(self):
+        self.lexicon = SentimentLexicon()
+
+    def test_scores_polarity(self):
+        scores = self.lexicon.score(["I love this, it's great!", "Terrible, buggy mess.", "The sky is blue", ""])
+        self.assertGreater(scores[0], 0.5)
+        self.assertLess(scores[1], -0.5)
+        self.assertEqual(scores[2], 0.0)
+        self.assertEqual(scores[3], 0.0)
+        self.assertTrue(np.all(np.abs(scores) <= 1.0))
+
+    def test_negation_flips_valence(self):
+        positive, negated, contraction = self.lexicon.score(["this is good", "this is not good", "I don't like it"])
+        self.assertGreater(positive, 0)
+        self.assertLess(negated, 0)
+        self.assertLess(contraction, 0)
+
+    def test_encoding_is_sparse_per_text(self):
+        encoded = self.lexicon.encode(["great great", "nothing here", "not bad"])
+        self.assertEqual(len(encoded), 3)
+        self.assertEqual(encoded.indptr.tolist(), [0, 2, 2, 3])
+        self.assertEqual([self.lexicon.words[i] for i in encoded.term_ids], ['great', 'great', 'bad'])
+        self.assertEqual(encoded.negated.tolist(), [False, False, True])
+        np.testing.assert_allclose(self.lexicon.score_encoded(encoded),
+                                   self.lexicon.score(["great great", "nothing here", "not bad"]))
+
+    def test_rejects_multi_word_entries(self):
+        with self.assertRaises(ValueError):
+            SentimentLexicon({'very good': 2.0})
+
+class TestSentimentStore(unittest.TestCase):
+
+    def setUp(self):
+        self.store = SentimentStore()
+        self.store.add_submissions('Python', [{'id': 's1', 'title': 'Python 3.13 is great', 'selftext': ''}])
+        self.store.add_comments('python', [
+            {'id': 'c1', 'submission_id': 's1', 'body': 'I love the new REPL'},
+            {'id': 'c2', 'submission_id': 's1', 'body': 'The upgrade broke everything, awful'},
+            {'id': 'c3', 'submission_id': 's2', 'body': 'What time is it?'},
+        ])
+
+    def test_aggregates_per_thread_and_subreddit(self):
+        overall = self.store.summary('python')
+        self.assertEqual(overall['items'], 4)
+        self.assertEqual((overall['positive'], overall['negative'], overall['neutral']), (0.5, 0.25, 0.25))
+        self.assertEqual(self.store.thread('python', 's1')['items'], 3)
+        report = self.store.report('python')
+        self.assertEqual([thread['id'] for thread in report['threads']], ['s1', 's2'])
+        self.assertIsNone(self.store.report('rust'))
+
+    def test_rescored_items_replace_their_old_score(self):
+        self.store.add_comments('python', [{'id': 'c2', 'submission_id': 's1', 'body': 'Edit: works great now'}])
+        overall = self.store.summary('python')
+        self.assertEqual(overall['items'], 4)
+        self.assertEqual(overall['negative'], 0.0)
+
+    def test_summarize_scores(self):
+        self.assertEqual(summarize_scores([0.5, -0.5, 0.0, 0.9])['positive'], 0.5)
+        self.assertIsNone(summarize_scores([])['mean'])
+
+    def test_from_corpus(self):
+        with tempfile.TemporaryDirectory() as directory:
+            corpus = CorpusStore(os.path.join(directory, 'corpus.db'))
+            corpus.add_submissions('python', [{'id': 's1', 'title': 'Great release', 'selftext': ''}])
+            corpus.add_comments('python', [{'id': 'c1', 'submission_id': 's1', 'body': 'This is bad'}])
+            store = SentimentStore.from_corpus(corpus, batch_size=1)
+            corpus.close()
+        self.assertEqual(store.thread('python', 's1')['items'], 2)
+        self.assertEqual(store.summary('python')['negative'], 0.5)
+
+if __name__ == '__main__':
+    unittest.main()
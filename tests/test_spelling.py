@@ -0,0 +1,73 @@
+import random
+import tempfile
+import unittest
+from unittest.mock import patch
+from app.autocomplete import SubredditNameIndex, build_name_index
+from app.spelling import SubredditSpeller, edit_distance
+
+NAMES = ['Python', 'learnpython', 'pytorch', 'pics', 'AskReddit', 'AskScience', 'programming',
+         'learnprogramming', 'askredditafterdark', 'r']
+SUBSCRIBERS = [1000, 500, 800, 3000, 9000, 800, 2000, 700, 100, 1]
+
+class TestSubredditSpeller(unittest.TestCase):
+
+    def setUp(self):
+        self.speller = SubredditSpeller.from_name_index(SubredditNameIndex.from_entries(NAMES, SUBSCRIBERS))
+
+    def test_corrects_single_edits(self):
+        for typo, name in [('lernpython', 'learnpython'), ('learnpyhton', 'learnpython'), ('pyhton', 'Python'),
+                           ('askredit', 'AskReddit'), ('r/pcis', 'pics'), ('progamming', 'programming'),
+                           ('askredditaftrdark', 'askredditafterdark')]:
+            suggestions = self.speller.suggest(typo)
+            self.assertEqual(suggestions[0]['name'], name, typo)
+            self.assertEqual(suggestions[0]['distance'], 1)
+
+    def test_known_name_and_unrelated_input(self):
+        self.assertEqual(self.speller.suggest('askreddit'), [{'name': 'AskReddit', 'subscribers': 9000, 'distance': 0}])
+        self.assertEqual(self.speller.suggest('x'), []) # Too short to correct
+        self.assertEqual(self.speller.suggest('gardening'), [])
+        self.assertEqual(self.speller.suggest('not a name'), [])
+
+    def test_finds_every_name_one_edit_away(self):
+        rng = random.Random(0)
+        names = [''.join(rng.choice('abc') for _ in range(rng.randint(3, 12))) for _ in range(2000)]
+        speller = SubredditSpeller.from_name_index(SubredditNameIndex.from_entries(names, [1] * len(names)))
+        keys = [key.decode('ascii') for key in speller.name_index.keys]
+        for _ in range(100):
+            query = ''.join(rng.choice('abc') for _ in range(rng.randint(3, 12)))
+            expected = {row for row, key in enumerate(keys) if edit_distance(query, key, 1) <= 1}
+            self.assertLessEqual(expected, set(speller.candidates(query.encode('ascii')).tolist()), query)
+
+    def test_edit_distance_matches_full_matrix(self):
+        def full_matrix(a, b):
+            rows = [list(range(len(b) + 1))] + [[i] + [0] * len(b) for i in range(1, len(a) + 1)]
+            for i in range(1, len(a) + 1):
+                for j in range(1, len(b) + 1):
+                    rows[i][j] = min(rows[i - 1][j] + 1, rows[i][j - 1] + 1, rows[i - 1][j - 1] + (a[i - 1] != b[j - 1]))
+                    if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                        rows[i][j] = min(rows[i][j], rows[i - 2][j - 2] + 1)
+            return rows[-1][-1]
+
+        rng = random.Random(0)
+        for _ in range(3000):
+            a, b = (''.join(rng.choice('abc') for _ in range(rng.randint(0, 7))) for _ in range(2))
+            for max_distance in (0, 1, 2):
+                self.assertEqual(edit_distance(a, b, max_distance), min(full_matrix(a, b), max_distance + 1), (a, b))
+
+    def test_crowded_variants_keep_most_subscribed_names(self):
+        names = [f"learn{letter}python" for letter in 'abcdefgh']
+        speller = SubredditSpeller.from_name_index(SubredditNameIndex.from_entries(names, range(1, 9)))
+        with patch('app.spelling.MAX_BUCKET_ROWS', 2):
+            suggestions = speller.suggest('learnpython')
+        self.assertEqual([s['name'] for s in suggestions], ['learnhpython', 'learngpython'])
+
+    def test_memory_mapped_dictionaries_match_in_memory_ones(self):
+        with tempfile.TemporaryDirectory() as directory:
+            build_name_index(directory, NAMES, SUBSCRIBERS)
+            mapped = SubredditSpeller.open(directory, SubredditNameIndex.open(directory))
+            for typo in ('lernpython', 'pyhton', 'askscence', 'python'):
+                self.assertEqual(mapped.suggest(typo), self.speller.suggest(typo))
+            del mapped
+
+if __name__ == '__main__':
+    unittest.main()
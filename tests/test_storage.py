@@ -0,0 +1,152 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+from app.core_utils import QueryFilters
+from app.dedup import MinHasher
+from app.storage import CorpusStore, build_fts_query
+from app.ingest import main as ingest_main, normalize_submission, normalize_comment
+from app.trends import TrendDetector
+
+SUBMISSIONS = [
+    {'id': 's1', 'title': 'How do decorators work?', 'selftext': 'I keep seeing @decorator syntax in Flask apps.',
+     'score': 120, 'num_comments': 2, 'permalink': 'https://www.reddit.com/r/learnpython/comments/s1/',
+     'author': 'alice', 'created_utc': 1700000000.0},
+    {'id': 's2', 'title': 'Beginner resources', 'selftext': 'Which books should I read first?',
+     'score': 300, 'num_comments': 0, 'permalink': 'https://www.reddit.com/r/learnpython/comments/s2/',
+     'author': 'bob', 'created_utc': 1700003600.0},
+]
+COMMENTS = [
+    {'id': 'c1', 'submission_id': 's1', 'parent_id': 't3_s1', 'author': 'carol',
+     'body': 'A decorator is a function that wraps another function.', 'score': 40,
+     'created_utc': 1700000100.0, 'permalink': 'https://www.reddit.com/r/learnpython/comments/s1/_/c1/'},
+]
+
+class TestCorpusStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.store = CorpusStore(os.path.join(self.tmpdir.name, 'corpus.db'))
+        self.store.upsert_subreddit({'name': 'learnpython', 'display_name': 'learnpython',
+                                     'public_description': 'Learn Python', 'subscribers': 100})
+        self.store.add_submissions('learnpython', SUBMISSIONS)
+        self.store.add_comments('learnpython', COMMENTS)
+
+    def tearDown(self):
+        self.store.close()
+        self.tmpdir.cleanup()
+
+    def test_build_fts_query_quotes_terms(self):
+        self.assertEqual(build_fts_query('decorators "NEAR" *'), '"decorators" "NEAR"')
+        self.assertEqual(build_fts_query('a b', match_any=True), '"a" OR "b"')
+        self.assertIsNone(build_fts_query('?!'))
+
+    def test_search_finds_submissions_and_comments_with_highlights(self):
+        results = self.store.search('decorator', subreddit='learnpython')
+        kinds = {result['kind'] for result in results}
+        self.assertEqual(kinds, {'submission', 'comment'})
+        self.assertTrue(all('<mark>' in result['snippet'] for result in results))
+        comment = next(result for result in results if result['kind'] == 'comment')
+        self.assertEqual(comment['title'], 'How do decorators work?') # Title of the parent submission
+
+    def test_search_snippet_escapes_post_html(self):
+        self.store.add_submissions('learnpython', [{'id': 'x1', 'title': 'Unsafe post',
+                                                    'selftext': 'decorator <script>alert(1)</script> \x02 & more'}])
+        result = next(r for r in self.store.search('alert') if r['id'] == 'x1')
+        self.assertNotIn('<script>', result['snippet'])
+        self.assertIn('&lt;script&gt;', result['snippet'])
+        self.assertIn('<mark>alert</mark>', result['snippet'])
+        self.assertNotIn('\x02', result['snippet'])
+        self.assertEqual(result['title'], 'Unsafe post') # Plain text
+
+    def test_search_filters_by_subreddit(self):
+        self.store.add_submissions('python', [{'id': 'p1', 'title': 'Decorator patterns', 'selftext': ''}])
+        self.assertEqual({r['subreddit'] for r in self.store.search('decorator')}, {'learnpython', 'python'})
+        self.assertEqual([r['id'] for r in self.store.search('decorator', subreddit='python')], ['p1'])
+
+    def test_search_handles_query_syntax_and_no_match(self):
+        self.assertEqual(self.store.search('kubernetes'), [])
+        self.assertEqual(self.store.search('"unbalanced'), [])
+
+    def test_update_reindexes_document(self):
+        self.store.add_submissions('learnpython', [dict(SUBMISSIONS[1], title='Advanced resources')])
+        self.assertEqual(self.store.search('beginner'), [])
+        self.assertEqual(len(self.store.search('advanced')), 1)
+
+    def test_subreddit_context_prefers_matching_posts(self):
+        context = self.store.get_subreddit_context('learnpython', 'decorators', post_limit=1)
+        self.assertEqual(context['subscribers'], 100)
+        self.assertEqual([post['id'] for post in context['posts']], ['s1'])
+        context = self.store.get_subreddit_context('learnpython', None, post_limit=5)
+        self.assertEqual([post['id'] for post in context['posts']], ['s2', 's1']) # By score
+        self.assertIsNone(self.store.get_subreddit_context('unknown', 'anything'))
+
+    def test_subreddit_context_ignores_preferred_ids_from_other_subreddits(self):
+        self.store.add_submissions('python', [{'id': 'p1', 'title': 'Decorators in depth', 'selftext': '', 'score': 999}])
+        context = self.store.get_subreddit_context('learnpython', None, post_limit=2, preferred_ids=['p1', 's1'])
+        self.assertEqual([post['id'] for post in context['posts']], ['s1', 's2'])
+
+    def test_subreddit_context_applies_query_filters(self):
+        self.store.add_submissions('learnpython', [dict(SUBMISSIONS[0], id='s3', title='Decorators with arguments',
+                                                        flair='Help', created_utc=time.time() - 60)])
+        context = self.store.get_subreddit_context('learnpython', 'decorators', post_limit=5,
+                                                   filters=QueryFilters(flair='help'))
+        self.assertEqual([post['id'] for post in context['posts']], ['s3'])
+        recent = self.store.get_submissions('learnpython', filters=QueryFilters(since_seconds=3600))
+        self.assertEqual([post['id'] for post in recent], ['s3'])
+        newest_first = self.store.get_submissions('learnpython', filters=QueryFilters(sort='new'))
+        self.assertEqual([post['id'] for post in newest_first], ['s3', 's2', 's1'])
+
+    def test_near_duplicates_are_collapsed(self):
+        repost = dict(SUBMISSIONS[0], id='s3', title='how do decorators work??', score=5)
+        self.store.add_submissions('learnpython', [repost])
+        texts = [f"{post['title']}\n{post['selftext']}" for post in SUBMISSIONS + [repost]]
+        duplicates = self.store.collapse_near_duplicates('learnpython', 'submission', ['s1', 's2', 's3'],
+                                                         MinHasher().signatures(texts))
+        self.assertEqual(duplicates, {'s3': 's1'})
+        self.assertEqual([r['id'] for r in self.store.search('decorators') if r['kind'] == 'submission'], ['s1'])
+        context = self.store.get_subreddit_context('learnpython', None, post_limit=5, preferred_ids=['s3'])
+        self.assertEqual([post['id'] for post in context['posts']], ['s2', 's1'])
+        # Re-ingesting the original does not turn it into a duplicate of its repost.
+        self.assertEqual(self.store.collapse_near_duplicates('learnpython', 'submission', ['s1'],
+                                                             MinHasher().signatures(texts[:1])), {})
+
+    @unittest.skipUnless(hasattr(os, 'fork'), "requires os.fork")
+    def test_iter_texts_since(self):
+        items = [item for batch in self.store.iter_texts(batch_size=1, since=1700000050.0) for item in batch]
+        self.assertEqual([(item['kind'], item['id'], item['created_utc']) for item in items],
+                         [('submission', 's2', 1700003600.0), ('comment', 'c1', 1700000100.0)])
+
+    @patch('app.ingest.praw.Reddit')
+    @patch('app.ingest.crawl_subreddit')
+    def test_ingest_streams_items_into_sinks(self, mock_crawl, mock_reddit):
+        extra_sink = MagicMock()
+        ingest_main(['--db', os.path.join(self.tmpdir.name, 'ingest.db'), 'learnpython'], sinks=[extra_sink])
+        sinks = mock_crawl.call_args.kwargs['sinks']
+        self.assertTrue(any(isinstance(sink, TrendDetector) for sink in sinks))
+        self.assertIn(extra_sink, sinks)
+
+    def test_forked_process_opens_its_own_connection(self):
+        parent_connection = self.store.connection
+        pid = os.fork()
+        if pid == 0: # Child: must not reuse the inherited connection
+            ok = self.store.connection is not parent_connection and bool(self.store.search('decorator'))
+            os._exit(0 if ok else 1)
+        _, status = os.waitpid(pid, 0)
+        self.assertEqual(os.waitstatus_to_exitcode(status), 0)
+        self.assertIs(self.store.connection, parent_connection)
+
+    def test_normalize_praw_objects(self):
+        submission = MagicMock(id='abc', title='T', selftext=None, score=1, num_comments=0,
+                               permalink='/r/x/comments/abc/', created_utc=1.0, link_flair_text='Help', domain='self.x')
+        submission.author.name = 'dave'
+        row = normalize_submission(submission)
+        self.assertEqual(row['permalink'], 'https://www.reddit.com/r/x/comments/abc/')
+        self.assertEqual((row['selftext'], row['author'], row['flair']), ('', 'dave', 'Help'))
+        comment = MagicMock(id='c', parent_id='t3_abc', body='hi', score=2, created_utc=2.0, permalink='/r/x/comments/abc/_/c/')
+        comment.author = None # Deleted account
+        self.assertIsNone(normalize_comment(comment, 'abc')['author'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+from app.storage import CorpusStore
+from app.trends import TrendDetector, SpaceSaving, BUCKET_SECONDS, CMS_DEPTH, CMS_WIDTH, RECENT_BUCKETS
+
+HOUR0 = 1700000000 - 1700000000 % BUCKET_SECONDS
+
+def posts(prefix, hour, titles):
+    return [{'id': f"{prefix}{i}", 'title': title, 'selftext': '', 'created_utc': HOUR0 + hour * BUCKET_SECONDS + i}
+            for i, title in enumerate(titles)]
+
+class TestSpaceSaving(unittest.TestCase):
+
+    def test_keeps_heavy_hitters_within_capacity(self):
+        summary = SpaceSaving(capacity=3)
+        for term in ["a"] * 10 + ["b"] * 5 + ["c", "d", "e", "f"] + ["a"] * 3:
+            summary.add(term)
+        self.assertEqual(len(summary.counts), 3)
+        self.assertEqual(summary.top(2)[0], ("a", 13))
+        self.assertIn("b", summary.counts)
+
+class TestTrendDetector(unittest.TestCase):
+
+    def setUp(self):
+        self.detector = TrendDetector()
+        # A steady background: "python" and "help" every hour for a day.
+        for hour in range(24):
+            self.detector.add_submissions('python', posts(f"h{hour}-", hour, ["python help"] * 5))
+
+    def test_burst_is_detected_against_baseline(self):
+        self.detector.add_submissions('Python', posts("burst-", 24, ["python 3.14 released"] * 6 + ["python help"] * 5))
+        trends = self.detector.trending('python', now=HOUR0 + 24 * BUCKET_SECONDS)
+        terms = [entry['term'] for entry in trends['terms']]
+        self.assertIn("released", terms)
+        self.assertNotIn("help", terms)
+        self.assertEqual(trends['window_hours'], RECENT_BUCKETS)
+        released = next(entry for entry in trends['terms'] if entry['term'] == "released")
+        self.assertEqual(released['count'], 6)
+        self.assertEqual(released['expected'], 0.0)
+
+    def test_refetched_items_are_not_counted_twice(self):
+        batch = posts("dup-", 24, ["rust release"] * 4)
+        self.assertEqual(self.detector.add_submissions('python', batch), 4)
+        self.assertEqual(self.detector.add_submissions('python', batch), 0)
+        trends = self.detector.trending('python', now=HOUR0 + 24 * BUCKET_SECONDS)
+        self.assertEqual(next(e['count'] for e in trends['terms'] if e['term'] == "rust release"), 4)
+
+    def test_trend_fades_after_window(self):
+        self.detector.add_submissions('python', posts("burst-", 24, ["python 3.14 released"] * 6))
+        trends = self.detector.trending('python', now=HOUR0 + (24 + RECENT_BUCKETS + 1) * BUCKET_SECONDS)
+        self.assertEqual(trends['terms'], [])
+
+    def test_memory_is_fixed_per_subreddit(self):
+        state = self.detector._subreddits['python']
+        self.assertEqual(state.sketches.shape, (RECENT_BUCKETS, CMS_DEPTH, CMS_WIDTH))
+        self.detector.add_submissions('python', posts("many-", 24, [f"word{i} other{i}" for i in range(2000)]))
+        self.assertEqual(state.sketches.shape, (RECENT_BUCKETS, CMS_DEPTH, CMS_WIDTH))
+        self.assertTrue(all(len(summary.counts) <= summary.capacity for summary in state.heavy_hitters))
+        self.assertEqual(int(np.count_nonzero(state.baseline < 0)), 0)
+
+    def test_rebuilt_from_corpus_store(self):
+        with tempfile.TemporaryDirectory() as directory:
+            store = CorpusStore(os.path.join(directory, 'corpus.db'))
+            store.upsert_subreddit({'name': 'python'})
+            store.add_submissions('python', [dict(post, author=None) for hour in range(24)
+                                             for post in posts(f"h{hour}-", hour, ["python help"] * 5)])
+            store.add_submissions('python', [dict(post, author=None)
+                                             for post in posts("burst-", 24, ["python 3.14 released"] * 6)])
+            store.add_submissions('python', [dict(post, author=None)
+                                             for post in posts("old-", -100, ["ancient history"] * 6)])
+            detector = TrendDetector.from_corpus(store, now=HOUR0 + 24 * BUCKET_SECONDS)
+            store.close()
+        trends = detector.trending('python', now=HOUR0 + 24 * BUCKET_SECONDS)
+        terms = [entry['term'] for entry in trends['terms']]
+        self.assertIn("released", terms)
+        self.assertNotIn("help", terms)
+        self.assertEqual(trends['baseline_hours'], self.detector.trending('python', now=HOUR0 + 24 * BUCKET_SECONDS)['baseline_hours'])
+
+    def test_unknown_subreddit(self):
+        self.assertIsNone(self.detector.trending('rust'))
+
+if __name__ == '__main__':
+    unittest.main()